@@ -14,17 +14,45 @@
 """
 
 import socket
+import select
+import errno
 import time
 import sys
 import threading
 import datetime
+import heapq
+import Queue
 import serialize
 
 # This is the dictionary which holds advertisement associations. Entries will 
 # be of the form:
-# KEY : [(advertise_val, expiration_time), (")]
+# KEY : {advertise_val : expiration_time, ...}
 data_table = {}
 
+# The keys of data_table and the values of each key, in the order they were 
+# added (GET returns the oldest values first). Entries are of the form:
+# KEY : [advertise_val, ...]
+key_order = []
+value_order = {}
+
+# The key which returns the values of all keys. This is a view of data_table 
+# rather than a key of its own.
+ALL_KEY = '%all'
+
+# A heap with an (expiration_time, key, advertise_val) entry for each time a 
+# value was added or had its expiration time extended. Entries for values 
+# whose expiration time was extended are left in the heap and skipped when 
+# they come up.
+expiration_heap = []
+
+# The number of values in data_table. Once the heap has many more entries 
+# than this, it is rebuilt without the skipped entries.
+live_entries = 0
+
+# Protects the above (requests are handled and entries purged in different 
+# threads).
+data_lock = threading.Lock()
+
 # If enabled at runtime, the server will provide verbose information to stdout.
 verbose = False
 
@@ -46,6 +74,19 @@ tcp_port = 10102
 # How often should we flush logging data?
 logging_frequency = 300 # How about every five minutes?
 
+# Limits for each TCP client. A client is disconnected if a request is larger 
+# than max_request_size or it is idle for client_timeout seconds, and it isn't 
+# read from while more than max_pending_output bytes of responses wait to be 
+# sent to it.
+max_request_size = 65536
+max_pending_output = 262144
+client_timeout = 10
+
+# The most connections accepted and UDP requests read for each event. (The 
+# requests read while handling the events are handled as one batch.)
+max_accepts_per_event = 64
+max_datagrams_per_event = 256
+
 # File objects
 error_log = open("log.errordata", "a")    # Errors that we can't fully resolve should be recorded here.
 volume_log = open("log.volume", "a")   # We should use this to record the server's query volume.
@@ -54,7 +95,15 @@ time_log = open("log.timedata", "a")     # Information about processing time goe
 # Companion variables for logging
 puts_so_far = 0 # The number of PUT queries since the last log.
 gets_so_far = 0 # The number of GET queries since the last log.
-query_times = [] # Store the query times here.
+query_count = 0 # The number of queries that were timed since the last log.
+query_time_total = 0.0 # The time these queries took...
+query_time_max = 0.0 # ... and the longest one.
+
+# Log entries are written by a separate thread so that handling requests 
+# never waits for the disk (or the console). Entries are (output, string). 
+# If the thread falls far behind, entries are dropped and counted.
+log_queue = Queue.Queue(10000)
+dropped_log_entries = 0
 
 
 
@@ -62,7 +111,9 @@ query_times = [] # Store the query times here.
 def _purge_expired_items():
   """
   <Purpose>
-    Iterates through the data table and removes all exired entries.
+    Removes all expired entries from the data table. Only the entries at 
+    the top of the expiration heap are looked at, so this takes 
+    O(log n) per expired entry rather than a pass over every entry.
 
   <Arguments>
     None
@@ -76,29 +127,46 @@ def _purge_expired_items():
   <Returns>
     None
   """
+  global live_entries
+
   now = time.time()
-  keys = data_table.keys()
-
-  for key in keys:
-    num_unique_vals = len(data_table[key])
-
-    # We iterate through in reverse, because otherwise deleting an 
-    # entry will cause frivolous edge cases.
-    iteration_scheme = range(num_unique_vals)
-    iteration_scheme.reverse()
-
-    # value format: (value variable, expiration time)
-    for value in iteration_scheme:
-      expiration_time = data_table[key][value][1]
-      temp_value = data_table[key][value][0] # For logging purposese only.
-      if now > expiration_time:
-        # The entry is expired.
-        del data_table[key][value]
-        if len(data_table[key]) == 0:
-          del data_table[key]
-        if (verbose):
-          logstring = str("Entry purged: " + str(key) + ": " + str(temp_value) + "\n")
-          _log_with_timestamp(logstring)
+  purged = []
+
+  data_lock.acquire()
+  try:
+    while expiration_heap and expiration_heap[0][0] < now:
+      expiration_time, key, value = heapq.heappop(expiration_heap)
+
+      # Skip entries for values that were extended (or already removed).
+      if key not in data_table or \
+          data_table[key].get(value) != expiration_time:
+        continue
+
+      # The entry is expired.
+      del data_table[key][value]
+      live_entries -= 1
+      purged.append((key, value))
+
+    # Remove the purged values from the orders (once for each key).
+    removed_keys = False
+    for key in set([key for key, value in purged]):
+      if len(data_table[key]) == 0:
+        del data_table[key]
+        del value_order[key]
+        removed_keys = True
+      else:
+        values = data_table[key]
+        value_order[key] = [value for value in value_order[key] if value in values]
+
+    if removed_keys:
+      key_order[:] = [key for key in key_order if key in data_table]
+  finally:
+    data_lock.release()
+
+  if (verbose):
+    for key, temp_value in purged:
+      logstring = str("Entry purged: " + str(key) + ": " + str(temp_value) + "\n")
+      _log_with_timestamp(logstring)
 
   return
 
@@ -135,8 +203,8 @@ def _maintenance_thread():
 def _log_with_timestamp(logstring, output = "stdout"):
   """
   <Purpose>
-    Appends a timestamp to the logging output and prints to the 
-    appropriate destination.
+    Appends a timestamp to the logging output and queues it to be written 
+    to the appropriate destination by the log writer thread.
 
   <Arguments>
     logstring (string object)
@@ -155,11 +223,13 @@ def _log_with_timestamp(logstring, output = "stdout"):
                known_output_types.
 
   <Side Effects>
-    None
+    The entry is dropped if the log queue is full.
 
   <Returns>
     None
   """
+  global dropped_log_entries
+
   known_output_types = ['stdout', 'volume', 'error', 'time']
 
   # Some type checking.
@@ -172,28 +242,57 @@ def _log_with_timestamp(logstring, output = "stdout"):
 
   timestamp = "[" + str(datetime.datetime.today())[:-4] + "]"
 
-  if output == "stdout":
-    sys.stdout.write(timestamp)
-    sys.stdout.write(logstring)
-    sys.stdout.flush()
-  elif output == "volume":
-    volume_log.write(timestamp)
-    volume_log.write(logstring)
-    volume_log.flush()
-  elif output == "error":
-    error_log.write(timestamp)
-    error_log.write(logstring)
-    error_log.flush()
-  elif output == "time":
-    time_log.write(timestamp)
-    time_log.write(logstring)
-    time_log.flush()
+  try:
+    log_queue.put_nowait((output, timestamp + logstring))
+  except Queue.Full:
+    dropped_log_entries += 1
 
   return
 
 
 
 
+def _log_writer_thread():
+  """
+  <Purpose>
+    Writes the entries queued by _log_with_timestamp. All of the entries 
+    that are waiting are written together and each file is flushed once 
+    for them.
+
+  <Arguments>
+    None
+
+  <Exceptions>
+    None
+
+  <Side Effects>
+    Writes to stdout and the log files.
+
+  <Returns>
+    None
+  """
+  outputs = {'stdout': sys.stdout, 'volume': volume_log, 'error': error_log,
+      'time': time_log}
+
+  while True:
+    entries = [log_queue.get()]
+    try:
+      while len(entries) < 1000:
+        entries.append(log_queue.get_nowait())
+    except Queue.Empty:
+      pass
+
+    written = set()
+    for output, logstring in entries:
+      outputs[output].write(logstring)
+      written.add(output)
+
+    for output in written:
+      outputs[output].flush()
+
+
+
+
 def _read_item(key, maxvals=100):
   """
   <Purpose>
@@ -201,7 +300,8 @@ def _read_item(key, maxvals=100):
 
   <Arguments>
     key (type-insensitive, usually string)
-      The advertisement key for which we're finding values.
+      The advertisement key for which we're finding values. ALL_KEY returns
+      the values of all keys.
 
     maxvals
       The maximum number of values to return.
@@ -216,22 +316,71 @@ def _read_item(key, maxvals=100):
 
   <Returns>
     An array of values taken from the dictionary entry under key. If 
-    there are no entries, this method will return an empty array.
+    there are no entries, this method will return an empty array. Values 
+    that expired (but haven't been purged yet) aren't returned.
   """
-  if not type(maxvals) == int:
+  if not type(maxvals) == int and not type(maxvals) == long:
     raise TypeError("Invalid Input! maxvals must be an integer!")
   if maxvals < 1:
     raise ValueError("Invalid Input! maxvals must be greater than zero!")
 
-  if not key in data_table:
-    return []
+  now = time.time()
+
+  data_lock.acquire()
+  try:
+    if key == ALL_KEY:
+      return _read_all_items(maxvals, now)
+
+    if not key in data_table:
+      return []
+
+    values = data_table[key]
+    answers = []
+    for value in value_order[key]:
+      if len(answers) >= maxvals:
+        break
+      if values[value] >= now:
+        answers.append(value)
+
+    return answers
+  finally:
+    data_lock.release()
 
-  values = data_table[key][:maxvals]
 
+
+
+def _read_all_items(maxvals, now):
+  """
+  <Purpose>
+    Returns the values of all keys (each value once), oldest keys first. 
+    The data lock must be held.
+
+  <Arguments>
+    maxvals
+      The maximum number of values to return.
+    now
+      The current time. Expired values aren't returned.
+
+  <Exceptions>
+    None
+
+  <Side Effects>
+    None
+
+  <Returns>
+    An array of values.
+  """
   answers = []
+  seen = set()
 
-  for entry in values:
-    answers.append(entry[0])
+  for key in key_order:
+    values = data_table[key]
+    for value in value_order[key]:
+      if values[value] >= now and value not in seen:
+        seen.add(value)
+        answers.append(value)
+        if len(answers) >= maxvals:
+          return answers
 
   return answers
 
@@ -249,8 +398,8 @@ def _insert_item(key, val, time_to_live):
       The advertisement key - this should match the dictionary key it is 
       stored under.
     val (type-insensitive)
-      The value associated with the advertisement key. A tuple of this and 
-      the time to live will be stored in the dictionary under the key.
+      The value associated with the advertisement key. It is stored in 
+      the dictionary under the key along with its expiration time.
     time_to_live (integer object)
       The time in seconds for the item to exist in the advertise 
       dictionary. Note that this is not the value stored, rather we store 
@@ -265,39 +414,72 @@ def _insert_item(key, val, time_to_live):
   <Returns>
     None
   """
-  if not type(time_to_live) == int:
+  global live_entries
+
+  if not type(time_to_live) == int and not type(time_to_live) == long:
     raise TypeError("Invalid Input! time_to_live must be an integer!")
 
-  duplicate_exists = False
-  val_index = -1
-
-  # If there's no key already, we're going to end up putting one in.
-  if not key in data_table:
-    data_table[key] = []
-
-  if len(data_table[key]) > 0:
-    # Then this key already exists. Does the value exist, too?
-    for entry in data_table[key]:
-      val_index += 1
-      # Format of entry is (value, expiration_time)
-      if entry[0] == val:
-        # We have a pretty clear duplicate.
-        duplicate_exists = True
-    
-
-  if duplicate_exists:
-    # Make sure the new TTL won't end up reducing the entry's lifetime.
-    if time.time() + time_to_live > data_table[key][val_index][1]:
-      # Update the time to live
-      data_table[key][val_index] = (val, time.time() + time_to_live)
-  else: # Entry does not exist, so add it.
-    data_table[key].append((val, time.time() + time_to_live))
+  expiration_time = time.time() + time_to_live
+
+  data_lock.acquire()
+  try:
+    # If there's no key already, we're going to end up putting one in.
+    if not key in data_table:
+      data_table[key] = {}
+      value_order[key] = []
+      key_order.append(key)
+
+    values = data_table[key]
+
+    if val in values:
+      # Make sure the new TTL won't end up reducing the entry's lifetime.
+      if expiration_time <= values[val]:
+        return
+    else: # Entry does not exist, so add it.
+      value_order[key].append(val)
+      live_entries += 1
+
+    values[val] = expiration_time
+    heapq.heappush(expiration_heap, (expiration_time, key, val))
+
+    # Drop the skipped entries once they're most of the heap.
+    if len(expiration_heap) > 2 * live_entries + 1000:
+      _rebuild_expiration_heap()
+  finally:
+    data_lock.release()
 
   return
 
 
 
 
+def _rebuild_expiration_heap():
+  """
+  <Purpose>
+    Rebuilds the expiration heap with one entry for each value in the data 
+    table. The data lock must be held.
+
+  <Arguments>
+    None
+
+  <Exceptions>
+    None
+
+  <Side Effects>
+    None
+
+  <Returns>
+    None
+  """
+  del expiration_heap[:]
+  for key, values in data_table.iteritems():
+    for value, expiration_time in values.iteritems():
+      expiration_heap.append((expiration_time, key, value))
+  heapq.heapify(expiration_heap)
+
+
+
+
 def _handle_request(data):
   """
   <Purpose>
@@ -316,17 +498,31 @@ def _handle_request(data):
     Quite a few are possible, these will be populated later.
 
   <Returns>
-    A packet ready for sending to the client who issued the original request.
+    A packet ready for sending to the client who issued the original request, 
+    or None if the request was invalid.
 
   <Side Effects>
     None
   """
   global puts_so_far
   global gets_so_far
-  global query_times
   # Format of requesttuple: ('PUT'/'GET', key, value, TTLval
   requesttuple = serialize.serialize_deserializedata(data)
 
+  if type(requesttuple) is not tuple or len(requesttuple) == 0:
+    _log_with_timestamp(' > ERROR: Request is ' + str(type(requesttuple)) + ' not tuple.\n')
+    return
+
+  # Requests in the format of udpadvertiseserver.repy end with a request id, 
+  # which is sent back at the end of the response:
+  #   ('PUT', key, value, TTLval, requestid) -> ('OK', requestid)
+  #   ('GET', key, maxvals, requestid) -> ('OK', [values], requestid)
+  requestid = ()
+  if (requesttuple[0] == 'PUT' and len(requesttuple) == 5) or \
+      (requesttuple[0] == 'GET' and len(requesttuple) == 4):
+    requestid = requesttuple[-1:]
+    requesttuple = requesttuple[:-1]
+
   if requesttuple[0] == 'PUT':
     puts_so_far += 1
 
@@ -354,9 +550,12 @@ def _handle_request(data):
       return
     ############# END Tons of type checking
 
+    # The values of all keys are returned for ALL_KEY, so they don't need to 
+    # be added to it.
     _insert_item(key, value, ttlval)
-    _insert_item('%all', value, ttlval)
 
+    if requestid:
+      return serialize.serialize_serializedata(("OK",) + requestid)
     return serialize.serialize_serializedata("OK")
 
   elif requesttuple[0] == 'GET':
@@ -366,19 +565,19 @@ def _handle_request(data):
     try:
       (key, maxvals) = requesttuple[1:]
     except ValueError, e:
-      log(' > ERROR: Incorrect format for request tuple: ' + str(requesttuple) + "\n")
+      _log_with_timestamp(' > ERROR: Incorrect format for request tuple: ' + str(requesttuple) + "\n")
       return
 
     if type(key) is not str:
-      log(' > ERROR: Key type for GET must be str, not' + str(type(key)) + "\n")
+      _log_with_timestamp(' > ERROR: Key type for GET must be str, not' + str(type(key)) + "\n")
       return
 
     if type(maxvals) is not int and type(maxvals) is not long:
-      log(' > ERROR: Maximum value type must be int or long, not' + str(type(maxvals)) + "\n")
+      _log_with_timestamp(' > ERROR: Maximum value type must be int or long, not' + str(type(maxvals)) + "\n")
       return
 
     if maxvals <=0:
-      log(' > ERROR: maxvals; Value type must be positive, not ' + str(maxvals) + "\n")
+      _log_with_timestamp(' > ERROR: maxvals; Value type must be positive, not ' + str(maxvals) + "\n")
       return
 
     ############# END Tons of type checking
@@ -389,7 +588,7 @@ def _handle_request(data):
     for entry in entries:
       readlist.append(entry)
 
-    return serialize.serialize_serializedata(("OK", readlist))
+    return serialize.serialize_serializedata(("OK", readlist) + requestid)
 
   return
 
@@ -397,149 +596,607 @@ def _handle_request(data):
 
 
 
-def _udp_callback():
-  # AF_INET - Internet socket
-  # SOCK_DGRAM - We're using UDP
-  sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-  sock.bind((local_ip, udp_port))
+class _Poller:
+  """
+  <Purpose>
+    Waits for sockets to become readable or writable. This uses epoll where 
+    it is available and select elsewhere.
+
+  <Side Effects>
+    None
+  """
 
-  # Slow it down a bit so it doesn't mess with debug output.
-  time.sleep(0.005)
+  def __init__(self):
+    self.epoll = None
+    if hasattr(select, 'epoll'):
+      self.epoll = select.epoll()
 
-  _log_with_timestamp("UDP Callback started, now listening on: " + str(local_ip) + ":" + str(udp_port) + "\n")
+    # fd : (readable, writable) for each registered socket
+    self.registered = {}
+
+
+  def register(self, fd, readable, writable):
+    # Registers the socket or changes what it is waited for.
+    if self.registered.get(fd) == (readable, writable):
+      return
+
+    if self.epoll is not None:
+      eventmask = 0
+      if readable:
+        eventmask |= select.EPOLLIN
+      if writable:
+        eventmask |= select.EPOLLOUT
+
+      if fd in self.registered:
+        self.epoll.modify(fd, eventmask)
+      else:
+        self.epoll.register(fd, eventmask)
+
+    self.registered[fd] = (readable, writable)
+
+
+  def unregister(self, fd, closing=False):
+    # Stops waiting for the socket. A socket that is about to be closed is 
+    # removed from epoll by closing it.
+    if fd not in self.registered:
+      return
+
+    if self.epoll is not None and not closing:
+      self.epoll.unregister(fd)
+    del self.registered[fd]
+
+
+  def poll(self, timeout):
+    """
+    <Purpose>
+      Waits until a registered socket is ready.
+
+    <Arguments>
+      timeout
+        The longest time to wait, in seconds.
+
+    <Exceptions>
+      None
+
+    <Side Effects>
+      None
+
+    <Returns>
+      A list of (fd, readable, writable) tuples. A socket with an error or 
+      that was closed by the other end is readable (so that the error is 
+      seen when it is read).
+    """
+    if self.epoll is not None:
+      try:
+        events = self.epoll.poll(timeout)
+      except IOError, e:
+        if e.errno == errno.EINTR:
+          return []
+        raise
+
+      ready = []
+      for fd, eventmask in events:
+        readable = bool(eventmask & (select.EPOLLIN | select.EPOLLERR | select.EPOLLHUP))
+        writable = bool(eventmask & select.EPOLLOUT)
+        ready.append((fd, readable, writable))
+      return ready
+
+    readers = []
+    writers = []
+    for fd, (readable, writable) in self.registered.iteritems():
+      if readable:
+        readers.append(fd)
+      if writable:
+        writers.append(fd)
 
-  while True:
     try:
-      # Perhaps 4096 is excessive. I wonder, is this vulnerable to 
-      # overflow attacks?
-      data, addr = sock.recvfrom(4096)
-  
-      _log_with_timestamp("Connection received from: " + str(addr[0]) + ":" + str(addr[1]) + "\n")
-
-      # We don't need to delimit TCP requests in raw python, this is a device of 
-      # repy.
-      session_request = False
-      if '\n' in data:
-        data = data.split('\n')[1]
-        session_request = True
-
-      # Parallelization is cool, but linearity is easy. Upgrade later.
-      # NOTE: addr is a tuple of (IP, port).
-      formatted_response = _handle_request(data)
+      readyreaders, readywriters, ignored = select.select(readers, writers, [], timeout)
+    except select.error, e:
+      if e.args[0] == errno.EINTR:
+        return []
+      raise
 
-      if session_request:
-        formatted_response = str(len(formatted_response)) + "\n" + formatted_response
+    readywriters = set(readywriters)
+    ready = []
+    for fd in readyreaders:
+      ready.append((fd, True, fd in readywriters))
+      readywriters.discard(fd)
+    for fd in readywriters:
+      ready.append((fd, False, True))
+    return ready
 
-      sock.sendto(formatted_response, addr)
 
-      _log_with_timestamp("Response sent to: " + str(addr[0]) + ":" + str(addr[1]) + "\n")
-    except Exception, e:
-      _log_with_timestamp("[UNKNOWN ERROR] " + str(e) + "\n", output='error')
 
 
+class _TCPClient:
+  """
+  <Purpose>
+    The state of a TCP connection to the event loop. A client may send many 
+    requests with session framing ("<length>\n<request>") over one 
+    connection. A request without session framing is answered and then the 
+    connection is closed (as the older servers did).
 
+  <Side Effects>
+    None
+  """
 
-def _tcp_callback():
-  # AF_INET - Internet socket
-  # SOCK_STREAM - Specify TCP
-  sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-  sock.bind((local_ip, tcp_port))
+  def __init__(self, sock, address):
+    self.sock = sock
+    self.address = address
+    self.fd = sock.fileno()
 
-  sock.listen(5)
+    # Data received that isn't a complete request yet.
+    self.inbuffer = ''
 
-  # Slow it down a bit to prevent messing up our debugging.
-  time.sleep(0.005)
+    # Responses waiting to be sent and their total length.
+    self.outbuffer = []
+    self.outsize = 0
 
-  _log_with_timestamp("TCP Callback started, now listening on: " + str(local_ip) + ":" + str(tcp_port) + "\n")
+    self.lastactive = time.time()
 
-  while True:
+    # Set once nothing more should be read. The connection is closed when 
+    # the responses have been sent.
+    self.closing = False
+
+
+
+
+def _would_block(e):
+  # Returns True if a socket.error means a non-blocking call should be tried
+  # again later.
+  return e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR)
+
+
+
+
+def _accept_clients(serversock, clients, poller):
+  """
+  <Purpose>
+    Accepts the connections that are waiting and registers them with the 
+    poller.
+
+  <Arguments>
+    serversock
+      The listening TCP socket.
+    clients
+      A dictionary of fd : _TCPClient which the new clients are added to.
+    poller
+      The _Poller of the event loop.
+
+  <Exceptions>
+    None
+
+  <Side Effects>
+    None
+
+  <Returns>
+    A list of the new clients.
+  """
+  newclients = []
+  for count in range(max_accepts_per_event):
     try:
-      connection_socket, addr = sock.accept()
+      sock, address = serversock.accept()
+    except socket.error, e:
+      if not _would_block(e):
+        _log_with_timestamp("[ACCEPT ERROR] " + str(e) + "\n", output='error')
+      break
 
-      start = time.time()
+    sock.setblocking(0)
+    client = _TCPClient(sock, address)
+    clients[client.fd] = client
+    poller.register(client.fd, True, False)
+    newclients.append(client)
 
-      connection_socket.settimeout(1.0)
+    if verbose:
+      _log_with_timestamp("Connection received from: " + str(address[0]) + ":" + str(address[1]) + "\n")
+
+  return newclients
 
-      # Again, 4096 may be excessive.
-      data = connection_socket.recv(4096)
 
-      session_request = False
-      if '\n' in data:
-        data = data.split('\n')[1]
-        session_request = True
 
-      formatted_response = _handle_request(data)
 
-      if session_request:
-        formatted_response = str(len(formatted_response)) + "\n" + formatted_response
+def _read_client(client, batch, now):
+  """
+  <Purpose>
+    Reads what a TCP client sent and adds its complete requests to the 
+    batch.
+
+  <Arguments>
+    client
+      The _TCPClient to read from.
+    batch
+      A list to add (client, address, request data, session framed, 
+      received time) tuples to.
+    now
+      The time the data was received.
+
+  <Exceptions>
+    None
+
+  <Side Effects>
+    Sets client.closing if the other end closed the connection or a request 
+    is invalid.
+
+  <Returns>
+    None
+  """
+  try:
+    data = client.sock.recv(max_request_size)
+  except socket.error, e:
+    if _would_block(e):
+      return
+    data = ''
+
+  if not data:
+    # The connection is closed (or broken). Any responses to the requests 
+    # already received are still sent.
+    client.closing = True
+    client.inbuffer = ''
+    return
+
+  client.lastactive = now
+  buf = client.inbuffer + data
+
+  if not buf[0].isdigit():
+    # A request without session framing. This is the whole request.
+    batch.append((client, client.address, buf, False, now))
+    client.inbuffer = ''
+    client.closing = True
+    return
+
+  # Take out the complete requests (keeping an offset rather than slicing 
+  # each one off).
+  position = 0
+  while position < len(buf):
+    newline = buf.find('\n', position, position + 21)
+    if newline == -1:
+      if len(buf) - position > 20:
+        client.closing = True
+        return
+      break
+
+    try:
+      length = int(buf[position:newline])
+    except ValueError:
+      length = -1
+    if length < 0 or length > max_request_size:
+      _log_with_timestamp("[REQUEST ERROR] Invalid request length from " + str(client.address[0]) + "\n", output='error')
+      client.closing = True
+      client.inbuffer = ''
+      return
 
-      connection_socket.send(formatted_response)
+    end = newline + 1 + length
+    if end > len(buf):
+      break
 
-      connection_socket.close()
+    batch.append((client, client.address, buf[newline + 1:end], True, now))
+    position = end
 
-      query_times.append(time.time() - start)
-    except socket.timeout, e:
-      _log_with_timestamp("[TIMEOUT ERROR] " + str(e) + "\n", output='error')
+  client.inbuffer = buf[position:]
+
+
+
+
+def _read_datagrams(udpsock, batch, now):
+  """
+  <Purpose>
+    Reads the UDP requests that are waiting and adds them to the batch.
+
+  <Arguments>
+    udpsock
+      The UDP socket.
+    batch
+      A list to add (None, address, request data, session framed, received 
+      time) tuples to.
+    now
+      The time the requests were received.
+
+  <Exceptions>
+    None
+
+  <Side Effects>
+    None
+
+  <Returns>
+    None
+  """
+  for count in range(max_datagrams_per_event):
+    try:
+      data, address = udpsock.recvfrom(max_request_size)
+    except socket.error, e:
+      if not _would_block(e):
+        _log_with_timestamp("[UDP ERROR] " + str(e) + "\n", output='error')
+      return
+
+    if verbose:
+      _log_with_timestamp("Connection received from: " + str(address[0]) + ":" + str(address[1]) + "\n")
+
+    # Clients of udpadvertiseserver.repy send the serialized request, 
+    # others may have used session framing.
+    session_request = False
+    newline = data.find('\n', 0, 21)
+    if data[:1].isdigit() and newline != -1:
+      data = data[newline + 1:]
+      session_request = True
+
+    batch.append((None, address, data, session_request, now))
+
+
+
+
+def _handle_batch(batch, udpsock):
+  """
+  <Purpose>
+    Handles the requests read in one pass of the event loop. Responses to 
+    TCP clients are added to their output (and sent together afterwards), 
+    responses to UDP requests are sent right away.
+
+  <Arguments>
+    batch
+      A list of (client, address, request data, session framed, received 
+      time) tuples. client is None for UDP requests.
+    udpsock
+      The UDP socket.
+
+  <Exceptions>
+    None
+
+  <Side Effects>
+    Sets client.closing for clients that sent an invalid request.
+
+  <Returns>
+    None
+  """
+  global query_count
+  global query_time_total
+  global query_time_max
+
+  for client, address, data, session_request, received in batch:
+    try:
+      formatted_response = _handle_request(data)
     except Exception, e:
       _log_with_timestamp("[UNKNOWN ERROR] " + str(e) + "\n", output='error')
+      formatted_response = None
+
+    if formatted_response is None:
+      # Nothing is sent for an invalid request, and its connection is 
+      # closed.
+      if client is not None:
+        client.closing = True
+      continue
+
+    if session_request:
+      formatted_response = str(len(formatted_response)) + "\n" + formatted_response
+
+    if client is None:
+      try:
+        udpsock.sendto(formatted_response, address)
+      except socket.error, e:
+        if not _would_block(e):
+          _log_with_timestamp("[UDP ERROR] " + str(e) + "\n", output='error')
+    else:
+      client.outbuffer.append(formatted_response)
+      client.outsize += len(formatted_response)
 
+    if verbose:
+      _log_with_timestamp("Response sent to: " + str(address[0]) + ":" + str(address[1]) + "\n")
 
+    query_time = time.time() - received
+    query_count += 1
+    query_time_total += query_time
+    if query_time > query_time_max:
+      query_time_max = query_time
 
-# helper function, records logging data at specified intervals.
-def _flush_logs():
+
+
+
+def _send_output(client):
+  """
+  <Purpose>
+    Sends as much of a TCP client's waiting responses as the socket takes.
+
+  <Arguments>
+    client
+      The _TCPClient.
+
+  <Exceptions>
+    None
+
+  <Side Effects>
+    Sets client.closing if the connection is broken.
+
+  <Returns>
+    None
+  """
+  if client.outsize == 0:
+    return
+
+  if len(client.outbuffer) == 1:
+    data = client.outbuffer[0]
+  else:
+    data = ''.join(client.outbuffer)
+
+  try:
+    sent = client.sock.send(data)
+  except socket.error, e:
+    if not _would_block(e):
+      # The responses can't be delivered.
+      client.closing = True
+      client.outbuffer = []
+      client.outsize = 0
+      return
+    sent = 0
+
+  if sent == len(data):
+    client.outbuffer = []
+  else:
+    client.outbuffer = [data[sent:]]
+  client.outsize = len(data) - sent
+
+
+
+
+def _update_client(client, clients, poller, now):
+  # Closes the client if it is finished or idle, otherwise registers it for
+  # what it is waiting on.
+  if (client.closing and client.outsize == 0) or \
+      client.lastactive + client_timeout < now:
+    poller.unregister(client.fd, closing=True)
+    del clients[client.fd]
+    try:
+      client.sock.close()
+    except socket.error:
+      pass
+    return
+
+  readable = not client.closing and client.outsize <= max_pending_output
+  poller.register(client.fd, readable, client.outsize > 0)
+
+
+
+
+def _log_stats():
+  # Queues the volume and timing statistics since the last call and resets
+  # them.
   global puts_so_far
   global gets_so_far
-  global query_times
+  global query_count
+  global query_time_total
+  global query_time_max
+
+  _log_with_timestamp("Total Queries: " + str(puts_so_far + gets_so_far) + "\n", 'volume')
+  _log_with_timestamp("  PUT Volume: " + str(puts_so_far) + "\n", 'volume')
+  _log_with_timestamp("  GET Volume: " + str(gets_so_far) + "\n", 'volume')
+
+  query_average = 0
+  if query_count > 0:
+    query_average = query_time_total / query_count
+  _log_with_timestamp("Query Average: " + str(query_average) + " seconds\n", 'time')
+  _log_with_timestamp("  Query Maximum: " + str(query_time_max) + " seconds\n", 'time')
+
+  if dropped_log_entries > 0:
+    _log_with_timestamp("Log entries dropped so far: " + str(dropped_log_entries) + "\n", 'error')
+
+  puts_so_far = 0
+  gets_so_far = 0
+  query_count = 0
+  query_time_total = 0.0
+  query_time_max = 0.0
+
+
+
+
+def _event_loop(tcpsock, udpsock):
+  """
+  <Purpose>
+    Serves TCP and UDP requests from a single thread. Sockets are 
+    non-blocking and waited on with a _Poller. The requests read while 
+    handling the ready sockets are handled as a batch, then the responses 
+    to each TCP client are sent with one call.
+
+  <Arguments>
+    tcpsock
+      A listening TCP socket.
+    udpsock
+      A bound UDP socket.
+
+  <Exceptions>
+    None
+
+  <Side Effects>
+    Also logs the volume and timing statistics every logging_frequency 
+    seconds.
+
+  <Returns>
+    Never returns.
+  """
+  tcpsock.setblocking(0)
+  udpsock.setblocking(0)
+
+  poller = _Poller()
+  poller.register(tcpsock.fileno(), True, False)
+  poller.register(udpsock.fileno(), True, False)
+
+  # fd : _TCPClient
+  clients = {}
+
+  next_stats_time = time.time() + logging_frequency
+  next_idle_check = time.time() + 1
+
   while True:
-    time.sleep(logging_frequency)
+    events = poller.poll(1.0)
+    now = time.time()
 
-    _log_with_timestamp("Total TCP Queries: " + str(puts_so_far + gets_so_far) + "\n", 'volume')
-    _log_with_timestamp("  PUT Volume: " + str(puts_so_far) + "\n", 'volume')
-    _log_with_timestamp("  GET Volume: " + str(gets_so_far) + "\n", 'volume')
+    batch = []
+    touched = []
+    for fd, readable, writable in events:
+      if fd == tcpsock.fileno():
+        # Clients usually send their request right after connecting, so 
+        # try to read it now rather than after waiting again.
+        for client in _accept_clients(tcpsock, clients, poller):
+          _read_client(client, batch, now)
+          touched.append(client)
+        continue
+      if fd == udpsock.fileno():
+        _read_datagrams(udpsock, batch, now)
+        continue
 
-    query_average = 0
-    if len(query_times) > 0:
-      query_average = sum(query_times) / len(query_times)
-    _log_with_timestamp("Query Average: " + str(query_average) + " seconds\n", 'time')
+      client = clients.get(fd)
+      if client is None:
+        continue
+      if readable and not client.closing:
+        _read_client(client, batch, now)
+      touched.append(client)
 
-    puts_so_far = 0
-    gets_so_far = 0
-    query_times = []
+    _handle_batch(batch, udpsock)
 
+    for client in touched:
+      if client.fd in clients:
+        _send_output(client)
+        _update_client(client, clients, poller, now)
 
+    if now > next_idle_check:
+      for client in clients.values():
+        _update_client(client, clients, poller, now)
+      next_idle_check = now + 1
 
+    if now > next_stats_time:
+      _log_stats()
+      next_stats_time = now + logging_frequency
 
-def main():
-  puts_so_far = 0
-  gets_so_far = 0
 
-  _log_with_timestamp("Starting logging thread . . . . . ")
-  log_thread = threading.Thread(group=None, target=_flush_logs, name="THREAD-LOG", args = (), kwargs = {})
+
+
+def _serve_forever():
+  # Creates the sockets and runs the event loop.
+  udpsock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+  udpsock.bind((local_ip, udp_port))
+
+  tcpsock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+  tcpsock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+  tcpsock.bind((local_ip, tcp_port))
+  tcpsock.listen(128)
+
+  _log_with_timestamp("Now listening on: " + str(local_ip) + ":" + str(tcp_port) + " (TCP) and " + str(local_ip) + ":" + str(udp_port) + " (UDP)\n")
+
+  _event_loop(tcpsock, udpsock)
+
+
+
+
+def main():
+  log_thread = threading.Thread(group=None, target=_log_writer_thread, name="THREAD-LOG", args = (), kwargs = {})
   log_thread.setDaemon(True)
   log_thread.start()
-  sys.stdout.write("[DONE]\n")
+  _log_with_timestamp("Started logging thread\n")
 
-  _log_with_timestamp("Creating maintenance thread . . . ")
   maintenance_thread = threading.Thread(group=None, target=_maintenance_thread, name="THREAD-MAINT", args = (), kwargs = {})
   maintenance_thread.setDaemon(True)
   maintenance_thread.start()
-  sys.stdout.write("[DONE]\n")
-
-  _log_with_timestamp("Starting UDP callback . . . . . . ")
-  udp_thread = threading.Thread(group=None, target=_udp_callback, name="THREAD-UDP", args = (), kwargs = {})
-  udp_thread.setDaemon(True)
-  udp_thread.start()
-  sys.stdout.write("[DONE]\n")
+  _log_with_timestamp("Started maintenance thread\n")
 
-  _log_with_timestamp("Starting TCP callback . . . . . . ")
-  tcp_thread = threading.Thread(group=None, target=_tcp_callback, name="THREAD-TCP", args = (), kwargs = {})
-  tcp_thread.setDaemon(True)
-  tcp_thread.start()
-  sys.stdout.write("[DONE]\n")
-
-  # Keep the main thread alive.
-  while True:
-    time.sleep(1)
+  # The main thread serves the requests.
+  _serve_forever()
 
 
 
@@ -0,0 +1,339 @@
+"""
+<Program Name>
+  advertiseserver_loadgenerator.py
+
+<Started>
+  October 18, 2026
+
+<Purpose>
+  Replays advertise client traffic against the python advertise server
+  (advertiseserver/advertiseserver.py) and reports the queries per second
+  and the latency of the queries.   The server is started in its own process
+  listening on localhost, and the clients run in several other processes.
+  Each client sends a request and waits for its response before sending the
+  next one.   Most of the requests are announces of a node's address under
+  its owner's key and the rest are lookups of a key (maxvals 100).
+
+  The kinds of traffic are:
+    - v2/v3: what centralizedadvertise_v2.repy and centralizedadvertise_v3.repy
+      send.   A connection is opened for each request, which is sent with
+      session framing.
+    - session: requests with session framing sent over one connection per
+      client (like a SessionSocket).
+    - udp: what udpcentralizedadvertise.repy sends.   Each request has a
+      request id and is sent in a datagram.   A request that isn't answered
+      within a second is counted as an error.
+    - v2/v3, slow: v2/v3 traffic while a few more clients (on slow links)
+      send their requests 0.2 seconds after connecting.   Their queries
+      aren't counted.
+
+  The server is restarted for each kind of traffic.   Besides the queries
+  per second and the latencies, the CPU time the server used for each query
+  is reported (on Linux).   When the clients and the server share a few
+  CPUs the queries per second mostly measure the clients, and the CPU time
+  shows how many queries the server could handle.
+
+  If the path of another advertiseserver.py is given (for example an older
+  version from git), it is measured too.
+
+<Usage>
+  Copy this into a directory prepared with preparetest.py and run it there
+  with the path of advertiseserver.py.   (The server's log files are
+  created in that directory.)
+
+    python advertiseserver_loadgenerator.py advertiseserver.py [seconds] [clients] [other advertiseserver.py]
+"""
+
+import os
+import sys
+import time
+import random
+import socket
+import struct
+import subprocess
+import multiprocessing
+
+import repyhelper
+
+SECONDS = 5.0
+CLIENTS = 16
+
+IP = '127.0.0.1'
+# The ports are changed for each server that is started (an older server
+# may not be able to bind a port that was just used).   They are below the
+# ephemeral ports, which the clients use up quickly.
+FIRST_PORT = 21910
+
+KEYS = 2000
+VALUES_PER_KEY = 10
+TTL = 240
+PUT_FRACTION = 0.8
+UDP_TIMEOUT = 1.0
+SLOW_CLIENTS = 3
+SLOW_CLIENT_DELAY = 0.2
+
+# Starts the server with serialize.repy translated and used as serialize
+# (which the server imports).
+SERVER_SCRIPT = """
+import sys
+import imp
+import repyhelper
+sys.modules['serialize'] = __import__(repyhelper.translate('serialize.repy'))
+server = imp.load_source('advertiseserver', %r)
+server.local_ip = %r
+server.tcp_port = %d
+server.udp_port = %d
+server.main()
+"""
+
+
+
+def load_serialize():
+  modulename = repyhelper.translate('serialize.repy')
+  return __import__(modulename)
+
+
+
+def percentile(values, fraction):
+  values = sorted(values)
+  return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+
+def start_server(path, ports):
+  devnull = open(os.devnull, 'w')
+  process = subprocess.Popen([sys.executable, '-c',
+      SERVER_SCRIPT % (os.path.abspath(path), IP, ports[0], ports[1])],
+      stdout=devnull, stderr=devnull)
+
+  # Wait until it accepts connections
+  for attempt in range(100):
+    time.sleep(0.1)
+    try:
+      sock = socket.create_connection((IP, ports[0]), 1)
+      sock.close()
+      return process
+    except socket.error:
+      pass
+
+  process.kill()
+  raise Exception("The server at " + path + " didn't start")
+
+
+
+def server_cpu_time(process):
+  # The CPU time (user and system) the server process has used so far, or
+  # None if it can't be read.
+  try:
+    fields = open('/proc/%d/stat' % process.pid).read().rsplit(')', 1)[1].split()
+  except (IOError, OSError):
+    return None
+  return (int(fields[11]) + int(fields[12])) / float(os.sysconf('SC_CLK_TCK'))
+
+
+
+def make_request(serialize, randomgen, requestid):
+  # An announce (most of the time) or a lookup, as a serialized tuple.
+  number = randomgen.randrange(KEYS * VALUES_PER_KEY)
+  key = 'owner' + str(number / VALUES_PER_KEY)
+  if randomgen.random() < PUT_FRACTION:
+    request = ('PUT', key, '10.%d.%d.1:1224' % (number / 256, number % 256),
+        TTL)
+  else:
+    request = ('GET', key, 100)
+
+  if requestid is not None:
+    request = request + (requestid,)
+  return serialize.serialize_serializedata(request)
+
+
+
+def connect(ports):
+  # Connects to the server.   The connection is reset when it is closed, so
+  # that the connections made for each request don't use up the ephemeral
+  # ports (by waiting in TIME_WAIT).
+  sock = socket.create_connection((IP, ports[0]), 10)
+  sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+  return sock
+
+
+
+def recv_session_message(sock, buffered):
+  # Returns (message, the data after it).
+  data = buffered
+  while '\n' not in data:
+    chunk = sock.recv(4096)
+    if not chunk:
+      raise socket.error("Connection closed")
+    data = data + chunk
+
+  header, data = data.split('\n', 1)
+  length = int(header)
+  while len(data) < length:
+    chunk = sock.recv(4096)
+    if not chunk:
+      raise socket.error("Connection closed")
+    data = data + chunk
+
+  return data[:length], data[length:]
+
+
+
+def run_slow_client(serialize, ports, seconds, clientnumber):
+  # Sends v2/v3 requests a while after connecting.
+  randomgen = random.Random(-1 - clientnumber)
+  endtime = time.time() + seconds
+  while time.time() < endtime:
+    request = make_request(serialize, randomgen, None)
+    try:
+      sock = connect(ports)
+      time.sleep(SLOW_CLIENT_DELAY)
+      sock.sendall(str(len(request)) + '\n' + request)
+      recv_session_message(sock, '')
+      sock.close()
+    except (socket.error, socket.timeout, ValueError):
+      pass
+
+
+
+def run_client(serialize, mode, ports, seconds, clientnumber, results):
+  randomgen = random.Random(clientnumber)
+  latencies = []
+  errors = 0
+
+  sock = None
+  buffered = ''
+  if mode == 'udp':
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((IP, 0))
+    sock.settimeout(UDP_TIMEOUT)
+
+  requestid = 0
+  endtime = time.time() + seconds
+  while time.time() < endtime:
+    requestid = requestid + 1
+    start = time.time()
+    try:
+      if mode in ['v2/v3', 'v2/v3, slow']:
+        request = make_request(serialize, randomgen, None)
+        sock = connect(ports)
+        sock.sendall(str(len(request)) + '\n' + request)
+        response, ignored = recv_session_message(sock, '')
+        sock.close()
+        sock = None
+
+      elif mode == 'session':
+        request = make_request(serialize, randomgen, None)
+        if sock is None:
+          sock = connect(ports)
+          buffered = ''
+        sock.sendall(str(len(request)) + '\n' + request)
+        response, buffered = recv_session_message(sock, buffered)
+
+      else:
+        request = make_request(serialize, randomgen, requestid)
+        sock.sendto(request, (IP, ports[1]))
+        while True:
+          response, address = sock.recvfrom(65536)
+          response = serialize.serialize_deserializedata(response)
+          # Skip the late responses to earlier requests
+          if response[-1] == requestid:
+            break
+
+      latencies.append(time.time() - start)
+
+    except (socket.error, socket.timeout, ValueError):
+      errors = errors + 1
+      if mode != 'udp' and sock is not None:
+        sock.close()
+        sock = None
+
+  if sock is not None:
+    sock.close()
+
+  results.put((latencies, errors))
+
+
+
+def run_load(serialize, mode, ports, seconds, clients):
+  results = multiprocessing.Queue()
+  processes = []
+  for clientnumber in range(clients):
+    process = multiprocessing.Process(target=run_client,
+        args=(serialize, mode, ports, seconds, clientnumber, results))
+    process.start()
+    processes.append(process)
+
+  slowprocesses = []
+  if mode == 'v2/v3, slow':
+    for clientnumber in range(SLOW_CLIENTS):
+      process = multiprocessing.Process(target=run_slow_client,
+          args=(serialize, ports, seconds, clientnumber))
+      process.start()
+      slowprocesses.append(process)
+
+  latencies = []
+  errors = 0
+  for process in processes:
+    clientlatencies, clienterrors = results.get()
+    latencies.extend(clientlatencies)
+    errors = errors + clienterrors
+
+  for process in processes + slowprocesses:
+    process.join()
+
+  return latencies, errors
+
+
+
+def main():
+  serverpath = sys.argv[1]
+  seconds = SECONDS
+  if len(sys.argv) > 2:
+    seconds = float(sys.argv[2])
+  clients = CLIENTS
+  if len(sys.argv) > 3:
+    clients = int(sys.argv[3])
+  paths = [serverpath]
+  if len(sys.argv) > 4:
+    paths.append(sys.argv[4])
+
+  serialize = load_serialize()
+
+  print "%d clients, %.1f seconds per test, %d%% announces" % (clients,
+      seconds, 100 * PUT_FRACTION)
+  print
+  print "%-24s %-12s %10s %9s %9s %9s %12s %8s" % ('server', 'traffic',
+      'queries/s', 'p50 (ms)', 'p99 (ms)', 'max (ms)', 'CPU (us/q)', 'errors')
+
+  port = FIRST_PORT
+  for path in paths:
+    for mode in ['v2/v3', 'session', 'udp', 'v2/v3, slow']:
+      ports = (port, port + 1)
+      port = port + 2
+      process = start_server(path, ports)
+      try:
+        startcpu = server_cpu_time(process)
+        latencies, errors = run_load(serialize, mode, ports, seconds, clients)
+        endcpu = server_cpu_time(process)
+      finally:
+        process.kill()
+        process.wait()
+
+      if latencies:
+        cpu = '-'
+        if startcpu is not None and endcpu is not None:
+          cpu = "%.1f" % (1000000 * (endcpu - startcpu) / len(latencies))
+        print "%-24s %-12s %10.1f %9.2f %9.2f %9.1f %12s %8d" % (path, mode,
+            len(latencies) / seconds, 1000 * percentile(latencies, 0.5),
+            1000 * percentile(latencies, 0.99), 1000 * max(latencies), cpu,
+            errors)
+      else:
+        print "%-24s %-12s %10s %9s %9s %9s %12s %8d" % (path, mode, '-', '-',
+            '-', '-', '-', errors)
+      sys.stdout.flush()
+
+
+
+if __name__ == '__main__':
+  main()
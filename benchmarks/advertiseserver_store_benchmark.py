@@ -0,0 +1,187 @@
+"""
+<Program Name>
+  advertiseserver_store_benchmark.py
+
+<Started>
+  October 18, 2026
+
+<Purpose>
+  Measures the throughput of the advertise server's data store
+  (advertiseserver/advertiseserver.py) with 1k, 10k and 100k live entries.
+  Requests are serialized ahead of time and passed to _handle_request, so
+  the time includes deserializing the request and serializing the answer
+  but not the network.
+
+  The store is filled with entries spread over keys with 10 values each
+  (like nodes announcing under their owners' keys).   Then it measures:
+    - PUT of a value that is already there (a node re-announcing)
+    - PUT of a new value
+    - GET of a key (maxvals 100)
+    - GET of '%all' (maxvals 100)
+    - a purge when 1% of the entries have expired
+
+  If the path of another advertiseserver.py is given (for example an older
+  version from git), it is measured too.   That version's store is filled
+  directly since filling it with PUTs takes too long.
+
+<Usage>
+  Copy this into a directory prepared with preparetest.py and run it there
+  with the path of advertiseserver.py.   (The server's log files are 
+  created in that directory.)
+
+    python advertiseserver_store_benchmark.py advertiseserver.py [seconds per test] [other advertiseserver.py]
+"""
+
+import os
+import sys
+import imp
+import time
+import random
+
+import repyhelper
+
+ENTRY_COUNTS = [1000, 10000, 100000]
+VALUES_PER_KEY = 10
+SECONDS = 1.0
+TTL = 600
+
+
+
+def load_serialize():
+  # The advertise server imports a python port of serialize.repy as
+  # serialize.   Translate serialize.repy and use it under that name.
+  modulename = repyhelper.translate('serialize.repy')
+  sys.modules['serialize'] = __import__(modulename)
+  return sys.modules['serialize']
+
+
+
+def load_server(path, name):
+  module = imp.load_source(name, path)
+  module.verbose = False
+  return module
+
+
+
+def new_store(server):
+  # Start with an empty store
+  server.data_table.clear()
+  if hasattr(server, 'expiration_heap'):
+    del server.key_order[:]
+    server.value_order.clear()
+    del server.expiration_heap[:]
+    server.live_entries = 0
+
+
+
+def fill(server, entrycount, direct):
+  new_store(server)
+  now = time.time()
+  for number in xrange(entrycount):
+    key = 'key' + str(number / VALUES_PER_KEY)
+    value = '10.0.%d.%d:1224' % (number / 256, number % 256)
+    if direct:
+      server.data_table.setdefault(key, []).append((value, now + TTL))
+      server.data_table.setdefault('%all', []).append((value, now + TTL))
+    else:
+      server._insert_item(key, value, TTL)
+
+
+
+def run_requests(server, requests, seconds):
+  count = 0
+  start = time.time()
+  while True:
+    for request in requests:
+      server._handle_request(request)
+    count = count + len(requests)
+    elapsed = time.time() - start
+    if elapsed > seconds:
+      return count / elapsed
+
+
+
+def measure(server, serialize, entrycount, seconds, direct):
+  fill(server, entrycount, direct)
+  keycount = entrycount / VALUES_PER_KEY
+  results = {}
+
+  requests = []
+  for count in range(100):
+    number = random.randrange(entrycount)
+    requests.append(serialize.serialize_serializedata(('PUT',
+        'key' + str(number / VALUES_PER_KEY),
+        '10.0.%d.%d:1224' % (number / 256, number % 256), TTL)))
+  results['PUT (existing)'] = run_requests(server, requests, seconds)
+
+  requests = []
+  for count in range(100):
+    requests.append(serialize.serialize_serializedata(('PUT',
+        'key' + str(random.randrange(keycount)),
+        'new%d:1224' % random.randrange(10 ** 9), TTL)))
+  results['PUT (new)'] = run_requests(server, requests, seconds)
+
+  requests = []
+  for count in range(100):
+    requests.append(serialize.serialize_serializedata(('GET',
+        'key' + str(random.randrange(keycount)), 100)))
+  results['GET'] = run_requests(server, requests, seconds)
+
+  requests = [serialize.serialize_serializedata(('GET', '%all', 100))]
+  results['GET %all'] = run_requests(server, requests, seconds)
+
+  # Expire 1% of the entries
+  fill(server, entrycount, direct)
+  keys = ['key' + str(number) for number in range(keycount / 100 + 1)]
+  for key in keys:
+    values = server.data_table[key]
+    if direct:
+      server.data_table[key] = [(value, 0) for value, expiration in values]
+    else:
+      for value in values:
+        values[value] = 0
+        server.expiration_heap.append((0, key, value))
+  if not direct:
+    server.heapq.heapify(server.expiration_heap)
+
+  start = time.time()
+  server._purge_expired_items()
+  results['purge (ms)'] = 1000 * (time.time() - start)
+
+  return results
+
+
+
+def main():
+  serverpath = sys.argv[1]
+  seconds = SECONDS
+  if len(sys.argv) > 2:
+    seconds = float(sys.argv[2])
+  otherpath = None
+  if len(sys.argv) > 3:
+    otherpath = sys.argv[3]
+
+  serialize = load_serialize()
+
+  servers = [(os.path.basename(serverpath),
+      load_server(serverpath, 'advertiseserver'), False)]
+  if otherpath is not None:
+    servers.append((os.path.basename(otherpath),
+        load_server(otherpath, 'otheradvertiseserver'), True))
+
+  columns = ['PUT (existing)', 'PUT (new)', 'GET', 'GET %all', 'purge (ms)']
+  print "%-8s %-22s" % ('entries', 'server') + \
+      ''.join(["%16s" % column for column in columns])
+  print "%31s" % '' + ''.join(["%16s" % 'req/s'] * 4)
+
+  for entrycount in ENTRY_COUNTS:
+    for servername, server, direct in servers:
+      results = measure(server, serialize, entrycount, seconds, direct)
+      print "%-8d %-22s" % (entrycount, servername) + \
+          ''.join(["%16.1f" % results[column] for column in columns])
+      sys.stdout.flush()
+
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,239 @@
+"""
+<Program Name>
+  compression_shim_benchmark.py
+
+<Started>
+  October 18, 2026
+
+<Purpose>
+  Measures the throughput and the compression ratio of the compression shims
+  (production_nat_new/src/CompressionShim.repy and LZWShim.repy) on
+  representative traffic.
+
+  The CompressionShim is measured over TCP: a sending and a receiving shim
+  are connected by an in memory stand-in for a socket, and the data is sent
+  in sends of a few sizes.   The LZWShim (and the CompressionShim for
+  comparison) is measured over UDP with messages of a few sizes.   The
+  traffic is text (the source files of the shims), incompressible data
+  (random bytes) and a mix of both.   It reports the MB/sec. through the
+  sending and the receiving shim and the bytes put on the wire as a
+  fraction of the bytes sent.   Everything received is checked.
+
+  If the paths of other CompressionShim.repy and LZWShim.repy files are given
+  (for example older versions from git), they are measured too.
+
+<Usage>
+  Copy this into a directory prepared with preparetest.py, along with the
+  files in production_nat_new/src, and run it there:
+
+    python compression_shim_benchmark.py [other CompressionShim.repy
+        other LZWShim.repy]
+"""
+
+import sys
+import time
+import random
+import shutil
+
+import repyhelper
+import repypp
+
+# How much traffic is sent for each measurement
+TCP_AMOUNT = 4 * 1024 * 1024
+UDP_AMOUNT = 512 * 1024
+
+TCP_SEND_SIZES = [100, 4096, 65536]
+UDP_MESSAGE_SIZES = [100, 1400]
+
+# The files the text traffic is made of
+TEXT_FILES = ['CompressionShim.repy', 'LZWShim.repy', 'FECShim.repy',
+    'ShimStack.repy', 'BaseShim.repy']
+
+# The shims are included after what they need from the shim framework
+STACK_SOURCE = """
+include ShimStack.repy
+include ShimException.repy
+include ShimLogger.repy
+include BaseShim.repy
+include %s
+include %s
+"""
+
+# The other shims are copied to these names
+OTHER_COMPRESSION_NAME = 'otherCompressionShim.repy'
+OTHER_LZW_NAME = 'otherLZWShim.repy'
+
+# The shims are measured with the streaming / bit stream wire format (older
+# shims ignore the argument).
+SHIM_ARGS = ['2']
+
+
+
+def load_shims(compressionfilename, lzwfilename, modulename):
+  # The shim framework and the shims are put in one file, since repyhelper
+  # translates each included file to a module of its own.
+  open(modulename + '_stack.repy', 'w').write(STACK_SOURCE %
+      (compressionfilename, lzwfilename))
+  outdata = repypp.processfile(modulename + '_stack.repy')
+  open(modulename + '.repy', 'w').writelines(outdata)
+  return __import__(repyhelper.translate(modulename + '.repy'))
+
+
+
+def make_traffic():
+  # Returns {traffic name: data to send}.
+  randomgen = random.Random(1)
+
+  text = ''.join([open(filename).read() for filename in TEXT_FILES])
+  text = text * (TCP_AMOUNT / len(text) + 1)
+  text = text[:TCP_AMOUNT]
+
+  incompressible = ''.join([chr(randomgen.randrange(256))
+      for count in range(TCP_AMOUNT)])
+
+  # Alternating stretches of text and random bytes
+  mixed = []
+  position = 0
+  while position < TCP_AMOUNT:
+    stretch = randomgen.randrange(16 * 1024, 256 * 1024)
+    if len(mixed) % 2 == 0:
+      mixed.append(text[position:position + stretch])
+    else:
+      mixed.append(incompressible[position:position + stretch])
+    position = position + stretch
+
+  return {'text': text, 'incompressible': incompressible,
+      'mixed': ''.join(mixed)[:TCP_AMOUNT]}
+
+
+
+class Pipe:
+  # Stands in for the socket below the sending and the receiving shim.   It
+  # keeps what was sent until it is received.
+
+  def __init__(self):
+    self.pieces = []
+    self.wirebytes = 0
+
+  def socket_send(self, socket, data):
+    self.pieces.append(data)
+    self.wirebytes = self.wirebytes + len(data)
+    return len(data)
+
+  def socket_recv(self, socket, bytes):
+    if not self.pieces:
+      raise Exception("Nothing left to receive")
+    data = ''.join(self.pieces)
+    self.pieces = [data[bytes:]]
+    return data[:bytes]
+
+
+
+class Channel:
+  # Stands in for UDP below the sending shim, handing the messages straight
+  # to the receiving shim.
+
+  def __init__(self):
+    self.callback = None
+    self.wirebytes = 0
+
+  def recvmess(self, host, port, callback):
+    self.callback = callback
+
+  def sendmess(self, host, port, msg, localhost=None, localport=None):
+    self.wirebytes = self.wirebytes + len(msg)
+    self.callback(host, port, msg, None)
+    return len(msg)
+
+
+
+def measure_tcp(module, data, sendsize):
+  # Returns (MB/sec., wire bytes / bytes sent).
+  pipe = Pipe()
+  sender = module.CompressionShim(optional_args=SHIM_ARGS)
+  receiver = module.CompressionShim(optional_args=SHIM_ARGS)
+  sender.shim_stack = pipe
+  receiver.shim_stack = pipe
+
+  received = []
+  receivedlength = 0
+  start = time.time()
+  for position in xrange(0, len(data), sendsize):
+    sender.socket_send('socket', data[position:position + sendsize])
+    # Read what was sent, as an application would
+    while receivedlength < min(position + sendsize, len(data)):
+      received.append(receiver.socket_recv('socket', 65536))
+      receivedlength = receivedlength + len(received[-1])
+  elapsed = time.time() - start
+
+  if ''.join(received) != data:
+    raise Exception("The data was received wrong")
+
+  return (len(data) / elapsed / (1024 * 1024),
+      float(pipe.wirebytes) / len(data))
+
+
+
+def measure_udp(sender, receiver, data, messagesize):
+  # Returns (MB/sec., wire bytes / bytes sent).
+  channel = Channel()
+  sender.shim_stack = channel
+  receiver.shim_stack = channel
+
+  received = []
+  def deliver(srcip, srcport, msg, handle):
+    received.append(msg)
+  receiver.recvmess('127.0.0.1', 12345, deliver)
+
+  data = data[:UDP_AMOUNT]
+  start = time.time()
+  for position in xrange(0, len(data), messagesize):
+    sender.sendmess('127.0.0.1', 12345, data[position:position + messagesize])
+  elapsed = time.time() - start
+
+  if ''.join(received) != data:
+    raise Exception("The messages were received wrong")
+
+  return (len(data) / elapsed / (1024 * 1024),
+      float(channel.wirebytes) / len(data))
+
+
+
+def main():
+  # (name, module)
+  versions = [('new', load_shims('CompressionShim.repy', 'LZWShim.repy',
+      'compression_shim_benchmark_new'))]
+  if len(sys.argv) > 2:
+    shutil.copy(sys.argv[1], OTHER_COMPRESSION_NAME)
+    shutil.copy(sys.argv[2], OTHER_LZW_NAME)
+    versions.append(('other', load_shims(OTHER_COMPRESSION_NAME,
+        OTHER_LZW_NAME, 'compression_shim_benchmark_other')))
+
+  traffic = make_traffic()
+
+  print "%-8s %-16s %-15s %-15s %6s %10s %8s" % ('version', 'shim',
+      'traffic', 'protocol', 'size', 'MB/sec.', 'ratio')
+
+  for trafficname in ['text', 'mixed', 'incompressible']:
+    for versionname, module in versions:
+      for sendsize in TCP_SEND_SIZES:
+        throughput, ratio = measure_tcp(module, traffic[trafficname],
+            sendsize)
+        print "%-8s %-16s %-15s %-15s %6d %10.2f %8.3f" % (versionname,
+            'CompressionShim', trafficname, 'TCP', sendsize, throughput, ratio)
+        sys.stdout.flush()
+
+      for messagesize in UDP_MESSAGE_SIZES:
+        for shimname in ['CompressionShim', 'LZWShim']:
+          shimclass = getattr(module, shimname)
+          throughput, ratio = measure_udp(shimclass(optional_args=SHIM_ARGS),
+              shimclass(optional_args=SHIM_ARGS),
+              traffic[trafficname], messagesize)
+          print "%-8s %-16s %-15s %-15s %6d %10.2f %8.3f" % (versionname,
+              shimname, trafficname, 'UDP', messagesize, throughput, ratio)
+          sys.stdout.flush()
+
+
+
+if __name__ == '__main__':
+  main()
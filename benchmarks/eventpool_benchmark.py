@@ -0,0 +1,192 @@
+"""
+<Program Name>
+  eventpool_benchmark.py
+
+<Started>
+  October 18, 2026
+
+<Purpose>
+  Compares delivering events on a new thread per event (the default) with
+  the reusable worker pool (repy.py --eventpool).   Two bursty workloads
+  are run with each mode:
+
+    - timers: bursts of settimer(0, ...) calls
+    - messages: bursts of UDP messages sent to a recvmess handler
+
+  For each it reports the number of threads created and the mean and p99
+  dispatch latency (from the timer being set / the message being sent
+  until the callback starts running).
+
+  This drives emulcomm and emultimer directly (rather than through repy.py)
+  so that the resource monitor and the sandbox don't add noise.
+
+<Usage>
+  Copy this into a directory prepared with preparetest.py and run it there:
+
+    python eventpool_benchmark.py [bursts] [events per burst]
+"""
+
+import os
+import sys
+import time
+import socket
+import tempfile
+import threading
+
+import restrictions
+import nanny
+import emulcomm
+import emultimer
+import eventpool
+
+BURSTS = 50
+BURST_SIZE = 40
+
+# The events limit also bounds the pool
+EVENTS = 100
+
+IP = '127.0.0.1'
+MESSPORT = 41500
+
+
+
+def write_restrictions():
+  fd, filename = tempfile.mkstemp(prefix='restrictions.eventpool.')
+  restrictionfo = os.fdopen(fd, 'w')
+  restrictionfo.write("resource cpu 1.0\n")
+  restrictionfo.write("resource memory 1000000000\n")
+  restrictionfo.write("resource diskused 1000000\n")
+  restrictionfo.write("resource events %d\n" % EVENTS)
+  restrictionfo.write("resource filewrite 1000000\n")
+  restrictionfo.write("resource fileread 1000000\n")
+  restrictionfo.write("resource filesopened 10\n")
+  restrictionfo.write("resource insockets 10\n")
+  restrictionfo.write("resource outsockets 10\n")
+  restrictionfo.write("resource netsend 100000000\n")
+  restrictionfo.write("resource netrecv 100000000\n")
+  restrictionfo.write("resource loopsend 100000000\n")
+  restrictionfo.write("resource looprecv 100000000\n")
+  restrictionfo.write("resource lograte 1000000\n")
+  restrictionfo.write("resource random 1000\n")
+  restrictionfo.write("resource messport %d\n" % MESSPORT)
+  restrictionfo.write("call settimer allow\n")
+  restrictionfo.write("call recvmess allow\n")
+  restrictionfo.close()
+  return filename
+
+
+
+# Count every thread that is started
+threadstarts = [0]
+original_start = threading.Thread.start
+
+def counting_start(self):
+  threadstarts[0] = threadstarts[0] + 1
+  return original_start(self)
+
+threading.Thread.start = counting_start
+
+
+
+def percentile(values, fraction):
+  values = sorted(values)
+  return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+
+def wait_for(latencies, count):
+  deadline = time.time() + 30
+  while len(latencies) < count:
+    if time.time() > deadline:
+      raise Exception("Only "+str(len(latencies))+" of "+str(count)+" events were delivered")
+    time.sleep(0.001)
+
+
+
+def run_timers(bursts, burstsize):
+  latencies = []
+
+  def callback(settime):
+    latencies.append(time.time() - settime)
+
+  for burst in range(bursts):
+    for event in range(burstsize):
+      emultimer.settimer(0, callback, (time.time(),))
+    wait_for(latencies, (burst + 1) * burstsize)
+
+  return latencies
+
+
+
+def run_messages(bursts, burstsize):
+  latencies = []
+
+  def callback(remoteip, remoteport, message, commhandle):
+    latencies.append(time.time() - float(message))
+
+  handle = emulcomm.recvmess(IP, MESSPORT, callback)
+  sendsock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+  for burst in range(bursts):
+    for event in range(burstsize):
+      sendsock.sendto(repr(time.time()), (IP, MESSPORT))
+    wait_for(latencies, (burst + 1) * burstsize)
+
+  sendsock.close()
+
+  # stopcomm waits for the socket to vanish from netstat.   Just tear it down.
+  entry = emulcomm.comminfo.pop(handle)
+  emulcomm.get_selector_backend().unregister(entry['socket'])
+  entry['socket'].close()
+  nanny.tattle_remove_item('insockets', handle)
+  emulcomm.get_selector_backend().wakeup()
+  while emulcomm.selectorstarted:
+    time.sleep(0.01)
+
+  return latencies
+
+
+
+def main():
+  bursts = BURSTS
+  burstsize = BURST_SIZE
+  if len(sys.argv) > 1:
+    bursts = int(sys.argv[1])
+  if len(sys.argv) > 2:
+    burstsize = int(sys.argv[2])
+
+  restrictionsfile = write_restrictions()
+  try:
+    restrictions.init_restriction_tables(restrictionsfile)
+  finally:
+    os.remove(restrictionsfile)
+  nanny.initialize_consumed_resource_tables()
+
+  print "%-10s %-8s %8s %10s %14s %14s" % ('workload', 'mode', 'events',
+      'threads', 'mean (ms)', 'p99 (ms)')
+
+  for workloadname, workload in [('timers', run_timers), ('messages', run_messages)]:
+    for poolenabled in [False, True]:
+      eventpool.enabled = poolenabled
+      startcount = threadstarts[0]
+
+      latencies = workload(bursts, burstsize)
+
+      if poolenabled:
+        modename = 'pool'
+      else:
+        modename = 'thread'
+
+      print "%-10s %-8s %8d %10d %14.3f %14.3f" % (workloadname, modename,
+          len(latencies), threadstarts[0] - startcount,
+          1000 * sum(latencies) / len(latencies),
+          1000 * percentile(latencies, 0.99))
+      sys.stdout.flush()
+
+  # Pool threads are daemons, but the selector may still be winding down
+  os._exit(0)
+
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,167 @@
+"""
+<Program Name>
+  fecshim_benchmark.py
+
+<Started>
+  October 18, 2026
+
+<Purpose>
+  Measures how many packets per second go through the forward error
+  correction shim (production_nat_new/src/FECShim.repy) and how much memory
+  the shim holds on to, when some of the packets are lost.
+
+  A sending and a receiving FECShim are connected by a stand-in for UDP,
+  which drops each packet with the loss rate and hands the rest straight to
+  the receiving shim.   PACKETS data packets of 200 to 1400 bytes are sent
+  for each loss rate and each (N,M) setting of the shim (N data packets
+  followed by M-N XOR packets).   It reports the data packets per second,
+  how many of them were delivered (including the recovered ones), how many
+  bundles the receiver still holds at the end and how much the memory of
+  the process grew (on Linux).   Each measurement runs in its own process.
+
+  If the path of another FECShim.repy is given (for example an older
+  version from git), it is measured too, with its own setting.
+
+<Usage>
+  Copy this into a directory prepared with preparetest.py, along with the
+  files in production_nat_new/src, and run it there:
+
+    python fecshim_benchmark.py [other FECShim.repy]
+"""
+
+import sys
+import time
+import random
+import shutil
+import multiprocessing
+
+import repyhelper
+import repypp
+
+PACKETS = 20000
+LOSS_RATES = [0.0, 0.01, 0.05, 0.1, 0.2]
+SETTINGS = [None, ['4', '6'], ['8', '9']]
+
+# The shim is included after what it needs from the shim framework (older
+# versions of the shim need random.repy included before it)
+STACK_SOURCE = """
+include random.repy
+include ShimStack.repy
+include ShimException.repy
+include ShimLogger.repy
+include BaseShim.repy
+include %s
+"""
+
+# The other FECShim.repy is copied to this name
+OTHER_NAME = 'otherFECShim.repy'
+
+SOURCE_IP = '10.0.0.1'
+
+
+
+def load_shim(filename, modulename):
+  # The shim framework and the shim are put in one file, since repyhelper
+  # translates each included file to a module of its own.
+  open(modulename + '_stack.repy', 'w').write(STACK_SOURCE % filename)
+  outdata = repypp.processfile(modulename + '_stack.repy')
+  open(modulename + '.repy', 'w').writelines(outdata)
+  return __import__(repyhelper.translate(modulename + '.repy'))
+
+
+
+class LossyChannel:
+  # Stands in for the UDP stack below the sending shim.
+
+  def __init__(self, lossrate, receiver):
+    self.lossrate = lossrate
+    self.receiver = receiver
+    self.random = random.Random(1)
+
+  def sendmess(self, host, port, msg, localhost=None, localport=None):
+    if self.random.random() >= self.lossrate:
+      self.receiver.fec_callback(SOURCE_IP, port, msg, None)
+    return len(msg)
+
+
+
+def memory_kb():
+  # The resident memory of this process, or 0 if it can't be read.
+  try:
+    for line in open('/proc/self/status'):
+      if line.startswith('VmRSS:'):
+        return int(line.split()[1])
+  except (IOError, OSError):
+    pass
+  return 0
+
+
+
+def measure(filename, modulename, setting, lossrate, results):
+  module = load_shim(filename, modulename)
+
+  randomgen = random.Random(2)
+  packets = []
+  for number in range(PACKETS):
+    header = str(number) + ' '
+    packets.append(header + 'x' * (randomgen.randrange(200, 1400) - len(header)))
+
+  delivered = set()
+  def deliver(srcip, srcport, packet, handle):
+    number = int(packet.split(' ', 1)[0])
+    if packet != packets[number]:
+      raise Exception("Packet " + str(number) + " was delivered wrong")
+    delivered.add(number)
+
+  sender = module.FECShim(optional_args=setting)
+  receiver = module.FECShim(optional_args=setting)
+  receiver.prev_callback = deliver
+  sender.shim_stack = LossyChannel(lossrate, receiver)
+
+  startmemory = memory_kb()
+  start = time.time()
+  for packet in packets:
+    sender.sendmess('127.0.0.1', 12345, packet)
+  elapsed = time.time() - start
+
+  bundles = len(module.FECContext['received_bundle_dictionary'][SOURCE_IP])
+  results.put((PACKETS / elapsed, len(delivered), bundles,
+      memory_kb() - startmemory))
+
+
+
+def main():
+  # (name, file, module name, settings)
+  shims = [('FECShim.repy', 'FECShim.repy', 'fecshim_benchmark_new', SETTINGS)]
+  if len(sys.argv) > 1:
+    shutil.copy(sys.argv[1], OTHER_NAME)
+    shims.append((sys.argv[1], OTHER_NAME, 'fecshim_benchmark_other', [None]))
+
+  print "%d data packets of 200 to 1400 bytes" % PACKETS
+  print
+  print "%-24s %7s %6s %10s %10s %9s %11s" % ('shim', 'N,M', 'loss',
+      'packets/s', 'delivered', 'bundles', 'memory (KB)')
+
+  for lossrate in LOSS_RATES:
+    for name, filename, modulename, settings in shims:
+      for setting in settings:
+        results = multiprocessing.Queue()
+        process = multiprocessing.Process(target=measure,
+            args=(filename, modulename, setting, lossrate, results))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+          raise Exception("Measuring " + name + " failed")
+        packetrate, delivered, bundles, memory = results.get()
+
+        settingname = 'default'
+        if setting:
+          settingname = ','.join(setting)
+        print "%-24s %7s %6.2f %10.0f %9.2f%% %9d %11d" % (name, settingname,
+            lossrate, packetrate, 100.0 * delivered / PACKETS, bundles, memory)
+        sys.stdout.flush()
+
+
+
+if __name__ == '__main__':
+  main()
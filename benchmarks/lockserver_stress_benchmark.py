@@ -0,0 +1,171 @@
+"""
+<Program Name>
+  lockserver_stress_benchmark.py
+
+<Started>
+  October 18, 2026
+
+<Purpose>
+  Stress tests the SeattleGeni lockserver (seattlegeni/lockserver/
+  lockserver_daemon.py) with many node locks, as the node state transition
+  scripts use it.
+
+  The first part calls the lockserver's do_* functions directly.   For a
+  growing number of held node locks, one session acquires all of them, a
+  few other sessions queue for some of them, and then the locks are released
+  one at a time.   It reports the microseconds per acquired lock and per
+  release, and the milliseconds per GetStatus.
+
+  The second part goes through XML-RPC to a lockserver on the loopback
+  interface.   It locks and unlocks nodes the way the transition scripts do,
+  with a session and a request for each node, and then a batch of nodes at a
+  time with ReleaseAndAcquireLocks.   It reports the nodes per second.
+
+  If the path of another lockserver_daemon.py is given (for example an older
+  version from git), its first part is measured too.   The histograms of the
+  wait and hold times that GetStatus returns are printed at the end.
+
+<Usage>
+  Run it with seattlegeni (and django) importable:
+
+    PYTHONPATH=/path/to/dir/above/seattlegeni python lockserver_stress_benchmark.py [other lockserver_daemon.py]
+"""
+
+import imp
+import os
+import sys
+import time
+import thread
+import xmlrpclib
+
+LOCK_COUNTS = [1000, 4000, 16000]
+
+# The number of sessions that queue for some of the locks
+WAITING_SESSIONS = 4
+
+# The nodes that are locked and unlocked through XML-RPC, and the number of
+# them locked at a time with ReleaseAndAcquireLocks
+XMLRPC_NODES = 2000
+XMLRPC_BATCH_SIZE = 100
+
+XMLRPC_PORT = 8011
+
+LOCKSERVER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    '..', 'seattlegeni', 'lockserver', 'lockserver_daemon.py')
+
+
+
+def load_lockserver(path, modulename):
+  module = imp.load_source(modulename, path)
+  # Don't log every request.
+  module.log.info = lambda *args: None
+  return module
+
+
+
+def measure_direct(lockserver, lockcount):
+  # Returns the (microseconds per acquired lock, microseconds per release,
+  # milliseconds per GetStatus).
+  lockserver.init_globals()
+  locknames = [str(number) for number in range(lockcount)]
+
+  holder = lockserver.do_start_session()
+  start = time.time()
+  lockserver.do_acquire_locks(holder, {'node': locknames})
+  acquiretime = time.time() - start
+
+  # Every tenth lock has sessions waiting for it.
+  for number in range(WAITING_SESSIONS):
+    waiter = lockserver.do_start_session()
+    lockserver.do_acquire_locks(waiter, {'node': locknames[number::10]})
+
+  start = time.time()
+  for count in range(10):
+    lockserver.do_get_status()
+  statustime = (time.time() - start) / 10
+
+  start = time.time()
+  for lockname in locknames:
+    lockserver.do_release_locks(holder, {'node': [lockname]})
+  releasetime = time.time() - start
+
+  return (acquiretime / lockcount * 1000000, releasetime / lockcount * 1000000,
+      statustime * 1000)
+
+
+
+def measure_xmlrpc(lockserver):
+  # Returns the (nodes per second with a session per node, nodes per second
+  # in batches).
+  lockserver.init_globals()
+  server = lockserver.ThreadedXMLRPCServer(("127.0.0.1", XMLRPC_PORT),
+      allow_none=True, logRequests=False)
+  server.register_instance(lockserver.LockserverPublicFunctions())
+  thread.start_new_thread(server.serve_forever, ())
+
+  proxy = xmlrpclib.ServerProxy("http://127.0.0.1:" + str(XMLRPC_PORT))
+  nodes = [str(number) for number in range(XMLRPC_NODES)]
+
+  start = time.time()
+  for node in nodes:
+    session_id = proxy.StartSession()
+    proxy.AcquireLocks(session_id, {'node': [node]})
+    proxy.ReleaseLocks(session_id, {'node': [node]})
+    proxy.EndSession(session_id)
+  pernode = XMLRPC_NODES / (time.time() - start)
+
+  start = time.time()
+  session_id = proxy.StartSession()
+  batch = nodes[:XMLRPC_BATCH_SIZE]
+  proxy.AcquireLocks(session_id, {'node': batch})
+  for position in range(XMLRPC_BATCH_SIZE, XMLRPC_NODES, XMLRPC_BATCH_SIZE):
+    nextbatch = nodes[position:position + XMLRPC_BATCH_SIZE]
+    proxy.ReleaseAndAcquireLocks(session_id, {'node': batch},
+        {'node': nextbatch})
+    batch = nextbatch
+  proxy.ReleaseLocks(session_id, {'node': batch})
+  proxy.EndSession(session_id)
+  batched = XMLRPC_NODES / (time.time() - start)
+
+  status = proxy.GetStatus()
+  server.shutdown()
+  return (pernode, batched, status)
+
+
+
+def main():
+  # (name, module)
+  versions = [('new', load_lockserver(LOCKSERVER_PATH,
+      'lockserver_benchmark_new'))]
+  if len(sys.argv) > 1:
+    versions.append(('other', load_lockserver(sys.argv[1],
+        'lockserver_benchmark_other')))
+
+  print "%-8s %8s %16s %14s %14s" % ('version', 'locks', 'acquire (us/lock)',
+      'release (us)', 'status (ms)')
+  for lockcount in LOCK_COUNTS:
+    for versionname, module in versions:
+      acquire, release, status = measure_direct(module, lockcount)
+      print "%-8s %8d %16.2f %14.2f %14.2f" % (versionname, lockcount, acquire,
+          release, status)
+      sys.stdout.flush()
+
+  print
+  pernode, batched, status = measure_xmlrpc(versions[0][1])
+  print "XML-RPC, %d nodes:" % XMLRPC_NODES
+  print "  a session and requests for each node: %8.0f nodes/sec." % pernode
+  print "  batches of %d nodes: %25.0f nodes/sec." % (XMLRPC_BATCH_SIZE,
+      batched)
+
+  print
+  for histogramname in ['waittimehistogram', 'holdtimehistogram']:
+    histogram = status[histogramname]
+    print histogramname + ":"
+    bounds = ['<= %gs' % bound for bound in histogram['bounds']] + ['longer']
+    for bound, count in zip(bounds, histogram['counts']):
+      print "  %-10s %8d" % (bound, count)
+
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,243 @@
+"""
+<Program Name>
+  maindb_subnet_benchmark.py
+
+<Started>
+  October 18, 2026
+
+<Purpose>
+  Measures how long seattlegeni/common/api/maindb.py takes to find the
+  available wan and lan vessels for a user in a large SeattleGeni database,
+  with the current functions and with the functions they replaced (which
+  looked at the last_known_ip of every node rather than at the stored subnet
+  of the nodes).
+
+  A sqlite database is generated with 50,000 nodes (2% of them behind NATs)
+  on subnets of 1 to 50 nodes, and 10 vessels on each node. Each vessel has
+  one of the 80 user ports, so each port has about 6,250 vessels. It reports
+  the milliseconds per call of:
+
+    wan        get_available_wan_vessels(user, 10)
+    lan        get_available_lan_vessels_by_subnet(user, 5), after a vessel
+               was acquired or released (so the subnet counts aren't cached)
+    lan cached get_available_lan_vessels_by_subnet(user, 5) again
+    subnets    _get_subnet_list()
+
+<Usage>
+  Run it with seattlegeni and django importable:
+
+    PYTHONPATH=/path/to/dir/above/seattlegeni python maindb_subnet_benchmark.py
+
+  Generating the database takes a few minutes.
+"""
+
+# The seattlegeni testlib must be imported first.
+from seattlegeni.tests import testlib
+
+import random
+import sys
+import time
+
+from datetime import datetime
+
+import django.db
+
+from seattlegeni.common.api import maindb
+
+from seattlegeni.common.exceptions import *
+
+from seattlegeni.common.util import log
+
+NODES = 50000
+VESSELS_PER_NODE = 10
+NAT_NODE_FRACTION = 0.02
+MAX_NODES_PER_SUBNET = 50
+
+CALLS = 20
+
+
+
+def generate_database():
+  # Inserts the nodes, vessels and vessel ports with sql, as creating 500,000
+  # vessels through maindb would take hours.
+  now = datetime.now()
+  ports = maindb.ALLOWED_USER_PORTS
+  cursor = django.db.connection.cursor()
+
+  noderows = []
+  subnetnumber = 0
+  nodesleftonsubnet = 0
+  hostnumber = 0
+  for nodeid in range(1, NODES + 1):
+    if random.random() < NAT_NODE_FRACTION:
+      ip = maindb.NAT_STRING_PREFIX + str(nodeid)
+    else:
+      if nodesleftonsubnet == 0:
+        subnetnumber += 1
+        nodesleftonsubnet = random.randint(1, MAX_NODES_PER_SUBNET)
+        hostnumber = 0
+      nodesleftonsubnet -= 1
+      hostnumber += 1
+      ip = "10.%d.%d.%d" % (subnetnumber / 256, subnetnumber % 256, hostnumber)
+    noderows.append((nodeid, "node" + str(nodeid), ip,
+        ip.rpartition('.')[0], 1224, "0.1t", now, True, False, "1 2", "v1",
+        now, now))
+  cursor.executemany("""INSERT INTO control_node (id, node_identifier,
+      last_known_ip, subnet, last_known_port, last_known_version,
+      date_last_contacted, is_active, is_broken, owner_pubkey,
+      extra_vessel_name, date_created, date_modified)
+      VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""", noderows)
+
+  for firstnodeid in range(1, NODES + 1, 5000):
+    vesselrows = []
+    vesselportrows = []
+    for nodeid in range(firstnodeid, min(firstnodeid + 5000, NODES + 1)):
+      for number in range(VESSELS_PER_NODE):
+        vesselid = nodeid * VESSELS_PER_NODE + number
+        vesselrows.append((vesselid, nodeid, "v" + str(number + 2), False,
+            True, now, now))
+        vesselportrows.append((vesselid, ports[vesselid % len(ports)]))
+    cursor.executemany("""INSERT INTO control_vessel (id, node_id, name,
+        is_dirty, user_keys_in_sync, date_created, date_modified)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)""", vesselrows)
+    cursor.executemany("""INSERT INTO control_vesselport (vessel_id, port)
+        VALUES (%s, %s)""", vesselportrows)
+
+  django.db.transaction.commit_unless_managed()
+
+  return subnetnumber
+
+
+
+def old_get_available_wan_vessels(geniuser, vesselcount):
+  # get_available_wan_vessels() as it was before the subnet field was added.
+  returnvesselcount = maindb.GET_AVAILABLE_VESSELS_MULTIPLIER * vesselcount + maindb.GET_AVAILABLE_VESSELS_ADDER
+  vessellist = []
+  includedsubnets = []
+  nonnatvesselsqueryset = maindb._get_queryset_of_all_available_vessels_for_a_port_exclude_nat_nodes(geniuser.usable_vessel_port)
+  for possiblevessel in nonnatvesselsqueryset:
+    subnet = possiblevessel.node.last_known_ip.rpartition('.')[0]
+    if not subnet:
+      continue
+    if subnet in includedsubnets:
+      continue
+    includedsubnets.append(subnet)
+    vessellist.append(possiblevessel)
+    if len(vessellist) == returnvesselcount:
+      break
+  if len(vessellist) < vesselcount:
+    raise UnableToAcquireResourcesError("Not enough subnets")
+  return vessellist
+
+
+
+def old_get_subnet_list():
+  # _get_subnet_list() as it was before the subnet field was added.
+  queryset = maindb.Node.objects.filter(is_active=True)
+  queryset = queryset.filter(is_broken=False)
+  queryset = queryset.exclude(last_known_ip__startswith=maindb.NAT_STRING_PREFIX)
+  queryset = queryset.order_by('last_known_ip')
+  previous_subnet = None
+  subnetlist = []
+  for node in queryset:
+    subnet = node.last_known_ip.rpartition('.')[0]
+    if not subnet:
+      continue
+    if subnet != previous_subnet:
+      subnetlist.append(subnet)
+      previous_subnet = subnet
+  random.shuffle(subnetlist)
+  return subnetlist
+
+
+
+def old_get_available_lan_vessels_by_subnet(geniuser, vesselcount):
+  # get_available_lan_vessels_by_subnet() as it was before the subnet field
+  # was added.
+  subnetlist = old_get_subnet_list()
+  subnets_vessels_list = []
+  nonnatvesselsqueryset = maindb._get_queryset_of_all_available_vessels_for_a_port_exclude_nat_nodes(geniuser.usable_vessel_port)
+  for subnet in subnetlist:
+    lanvesselsqueryset = nonnatvesselsqueryset.filter(node__last_known_ip__startswith=subnet + '.')
+    if lanvesselsqueryset.count() >= vesselcount:
+      subnets_vessels_list.append(list(lanvesselsqueryset))
+    if len(subnets_vessels_list) >= maindb.GET_AVAILABLE_LAN_VESSELS_MAX_SUBNETS:
+      break
+  if len(subnets_vessels_list) == 0:
+    raise UnableToAcquireResourcesError("No subnets")
+  return subnets_vessels_list
+
+
+
+def milliseconds_per_call(function, before=None):
+  # Returns the mean milliseconds per call of function. The time that before
+  # takes (if given) isn't counted.
+  total = 0.0
+  for count in range(CALLS):
+    if before is not None:
+      before()
+    django.db.reset_queries()
+    start = time.time()
+    function()
+    total += time.time() - start
+  return total / CALLS * 1000
+
+
+
+def main():
+  log.set_log_level(log.LOG_LEVEL_CRITICAL)
+  testlib.setup_test_environment()
+  testlib.setup_test_db()
+
+  try:
+    start = time.time()
+    subnetcount = generate_database()
+    print "Generated %d nodes on %d subnets with %d vessels in %.0f seconds." % (
+        NODES, subnetcount, NODES * VESSELS_PER_NODE, time.time() - start)
+    print
+    sys.stdout.flush()
+
+    user = maindb.create_user("benchmarkuser", "password",
+        "example@example.com", "affiliation", "1 2", "2 2 2", "3 4")
+    someothervessel = maindb.Vessel.objects.exclude(
+        vesselport__port=user.usable_vessel_port)[0]
+
+    def acquire_or_release():
+      # Changes which vessels are available, which clears the cached counts.
+      if someothervessel.acquired_by_user is None:
+        maindb.record_acquired_vessel(user, someothervessel)
+      else:
+        maindb.record_released_vessel(someothervessel)
+
+    # (name, old function, function, function called first)
+    calls = [
+        ('wan', lambda: old_get_available_wan_vessels(user, 10),
+            lambda: maindb.get_available_wan_vessels(user, 10), None),
+        ('lan', lambda: old_get_available_lan_vessels_by_subnet(user, 5),
+            lambda: maindb.get_available_lan_vessels_by_subnet(user, 5),
+            acquire_or_release),
+        ('lan cached', None,
+            lambda: maindb.get_available_lan_vessels_by_subnet(user, 5),
+            None),
+        ('subnets', old_get_subnet_list, maindb._get_subnet_list, None)]
+
+    print "milliseconds per call"
+    print
+    print "%-12s %10s %10s" % ('call', 'before', 'now')
+    for name, oldfunction, function, before in calls:
+      if oldfunction is None:
+        oldtime = '-'
+      else:
+        oldtime = '%.1f' % milliseconds_per_call(oldfunction, before)
+      print "%-12s %10s %10.1f" % (name, oldtime,
+          milliseconds_per_call(function, before))
+      sys.stdout.flush()
+
+  finally:
+    testlib.teardown_test_db()
+    testlib.teardown_test_environment()
+
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,215 @@
+"""
+<Program Name>
+  multiplexer_latency_benchmark.py
+
+<Started>
+  October 18, 2026
+
+<Purpose>
+  Measures the throughput of the Multiplexer (Multiplexer.repy) when the
+  real connection has a high latency, like a connection through a NAT
+  forwarder far away.   The two multiplexers run in this process and their
+  connection goes through a proxy on localhost (in another process), which
+  holds back everything it forwards for half of the round trip time.
+
+  For each round trip time, 8MB are sent over 1 and 4 virtual sockets at
+  once.   It reports the MB/sec. and, when several sockets send at once,
+  how long the first socket took compared to the last one (1.00 if they
+  finished at the same time).
+
+  If the path of another Multiplexer.repy is given (for example an older
+  version from git), it is measured too.
+
+<Usage>
+  Copy this into a directory prepared with preparetest.py and run it there:
+
+    python multiplexer_latency_benchmark.py [other Multiplexer.repy]
+"""
+
+import sys
+import time
+import Queue
+import shutil
+import collections
+import socket
+import threading
+import multiprocessing
+
+from repyportability import *
+
+import repyhelper
+
+RTTS = [0.01, 0.05, 0.1, 0.2]
+SOCKET_COUNTS = [1, 4]
+AMOUNT = 8 * 1024 * 1024
+BLOCK_SIZE = 16 * 1024
+
+IP = '127.0.0.1'
+# The ports are changed for each connection, so that the multiplexers from
+# the earlier connections aren't used.
+FIRST_PORT = 42900
+
+# The other Multiplexer.repy is copied to this name, so that it is
+# translated to another module.
+OTHER_NAME = 'othermultiplexer.repy'
+
+
+
+def load_multiplexer(filename):
+  return __import__(repyhelper.translate(filename))
+
+
+
+def forward(fromsock, tosock, delay):
+  # Forwards what fromsock receives to tosock, delay seconds later.   What
+  # is due at once is sent together.
+  pending = collections.deque()
+  condition = threading.Condition()
+
+  def send():
+    while True:
+      condition.acquire()
+      while not pending:
+        condition.wait()
+      sendtime = pending[0][0]
+      condition.release()
+
+      wait = sendtime - time.time()
+      if wait > 0:
+        time.sleep(wait)
+
+      condition.acquire()
+      now = time.time()
+      chunks = []
+      while pending and pending[0][0] <= now:
+        chunks.append(pending.popleft()[1])
+      condition.release()
+
+      if chunks[-1] is None:
+        tosock.sendall(''.join(chunks[:-1]))
+        tosock.shutdown(socket.SHUT_WR)
+        return
+      tosock.sendall(''.join(chunks))
+
+  thread = threading.Thread(target=send)
+  thread.setDaemon(True)
+  thread.start()
+
+  while True:
+    data = fromsock.recv(65536)
+    condition.acquire()
+    pending.append((time.time() + delay, data or None))
+    condition.notify()
+    condition.release()
+    if not data:
+      return
+
+
+
+def run_proxy(listenport, serverport, rtt):
+  # Accepts a connection and forwards it to the server with the delay.
+  listensock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+  listensock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+  listensock.bind((IP, listenport))
+  listensock.listen(1)
+
+  clientsock, address = listensock.accept()
+  serversock = socket.create_connection((IP, serverport))
+  for sock in [clientsock, serversock]:
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+  thread = threading.Thread(target=forward,
+      args=(serversock, clientsock, rtt / 2))
+  thread.setDaemon(True)
+  thread.start()
+  forward(clientsock, serversock, rtt / 2)
+  thread.join()
+
+
+
+def measure(mux, port, rtt, socketcount):
+  # Returns (MB/sec., first finish / last finish).
+  results = Queue.Queue()
+
+  def receive(remoteip, remoteport, virtualsock, thiscommhandle,
+      listencommhandle):
+    received = 0
+    while True:
+      try:
+        received = received + len(virtualsock.recv(BLOCK_SIZE))
+      except EnvironmentError:
+        break
+    results.put((received, time.time()))
+
+  def send(virtualsock, amount):
+    block = 'x' * BLOCK_SIZE
+    while amount > 0:
+      virtualsock.send(block[:amount])
+      amount = amount - BLOCK_SIZE
+    virtualsock.close()
+
+  proxy = multiprocessing.Process(target=run_proxy, args=(port + 1, port, rtt))
+  proxy.start()
+  time.sleep(0.5)
+
+  mux.mux_waitforconn(IP, port, receive)
+  sockets = []
+  for count in range(socketcount):
+    sockets.append(mux.mux_openconn(IP, port + 1, virtualport=port))
+
+  start = time.time()
+  threads = []
+  for virtualsock in sockets:
+    thread = threading.Thread(target=send,
+        args=(virtualsock, AMOUNT / socketcount))
+    thread.start()
+    threads.append(thread)
+
+  received = 0
+  finishtimes = []
+  for count in range(socketcount):
+    amount, finishtime = results.get()
+    received = received + amount
+    finishtimes.append(finishtime - start)
+
+  # The multiplexers close when the proxy does
+  proxy.terminate()
+  proxy.join()
+
+  if received != AMOUNT:
+    raise Exception("Received " + str(received) + " bytes instead of " +
+        str(AMOUNT))
+
+  return (received / max(finishtimes) / (1024 * 1024),
+      min(finishtimes) / max(finishtimes))
+
+
+
+def main():
+  multiplexers = [('Multiplexer.repy', load_multiplexer('Multiplexer.repy'))]
+  if len(sys.argv) > 1:
+    shutil.copy(sys.argv[1], OTHER_NAME)
+    multiplexers.append((sys.argv[1], load_multiplexer(OTHER_NAME)))
+
+  print "%d MB sent over the virtual sockets" % (AMOUNT / (1024 * 1024))
+  print
+  print "%-30s %9s %8s %10s %10s" % ('multiplexer', 'RTT (ms)', 'sockets',
+      'MB/sec.', 'first/last')
+
+  port = FIRST_PORT
+  for rtt in RTTS:
+    for socketcount in SOCKET_COUNTS:
+      for name, mux in multiplexers:
+        throughput, fairness = measure(mux, port, rtt, socketcount)
+        port = port + 2
+        print "%-30s %9d %8d %10.2f %10.2f" % (name, 1000 * rtt, socketcount,
+            throughput, fairness)
+        sys.stdout.flush()
+
+  # The threads of the multiplexers are still running
+  exitall()
+
+
+
+if __name__ == '__main__':
+  main()
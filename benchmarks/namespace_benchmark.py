@@ -0,0 +1,189 @@
+"""
+<Program Name>
+  namespace_benchmark.py
+
+<Started>
+  October 18, 2026
+
+<Purpose>
+  Measures the per-call overhead that the namespace layer
+  (NamespaceAPIFunctionWrapper) adds to common API calls.   Each of
+  socket.send, socket.recv, file.read, file.write and listdir is called
+  directly (unwrapped) and through its namespace wrapper, and the mean
+  time per call is reported along with the difference.
+
+  The calls are made on loopback sockets and a small local file so the
+  underlying operations are cheap and the wrapper cost is visible.
+
+<Usage>
+  Copy this into a directory prepared with preparetest.py and run it there:
+
+    python namespace_benchmark.py [calls per test]
+"""
+
+import os
+import sys
+import time
+import socket
+import tempfile
+import threading
+
+import restrictions
+import nanny
+import emulcomm
+import emulfile
+import namespace
+
+CALLS = 20000
+
+# The size of the data for send / recv / read / write
+PAYLOAD_SIZE = 64
+
+IP = '127.0.0.1'
+SERVER_PORT = 41600
+
+FILENAME = 'namespace_benchmark.data'
+
+
+
+def write_restrictions():
+  fd, filename = tempfile.mkstemp(prefix='restrictions.namespace.')
+  restrictionfo = os.fdopen(fd, 'w')
+  restrictionfo.write("resource cpu 1.0\n")
+  restrictionfo.write("resource memory 1000000000\n")
+  restrictionfo.write("resource diskused 1000000000\n")
+  restrictionfo.write("resource events 10\n")
+  restrictionfo.write("resource filewrite 1000000000000\n")
+  restrictionfo.write("resource fileread 1000000000000\n")
+  restrictionfo.write("resource filesopened 10\n")
+  restrictionfo.write("resource insockets 10\n")
+  restrictionfo.write("resource outsockets 10\n")
+  restrictionfo.write("resource netsend 1000000000000\n")
+  restrictionfo.write("resource netrecv 1000000000000\n")
+  restrictionfo.write("resource loopsend 1000000000000\n")
+  restrictionfo.write("resource looprecv 1000000000000\n")
+  restrictionfo.write("resource lograte 1000000\n")
+  restrictionfo.write("resource random 1000\n")
+  for callname in ['openconn', 'socket.send', 'socket.recv', 'socket.close',
+      'open', 'file.__init__', 'file.read', 'file.write', 'file.close',
+      'file.seek', 'listdir']:
+    restrictionfo.write("call %s allow\n" % callname)
+  restrictionfo.close()
+  return filename
+
+
+
+def start_server():
+  # Accepts one connection, keeps sending to it and throws away whatever it
+  # receives, so that the client's send and recv never wait long.
+  serversock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+  serversock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+  serversock.bind((IP, SERVER_PORT))
+  serversock.listen(1)
+
+  def serve():
+    clientsock, addr = serversock.accept()
+
+    def sender():
+      data = 'x' * 65536
+      try:
+        while True:
+          clientsock.sendall(data)
+      except socket.error:
+        pass
+
+    sendthread = threading.Thread(target=sender)
+    sendthread.setDaemon(True)
+    sendthread.start()
+
+    try:
+      while clientsock.recv(65536):
+        pass
+    except socket.error:
+      pass
+
+  servethread = threading.Thread(target=serve)
+  servethread.setDaemon(True)
+  servethread.start()
+
+
+
+def time_calls(function, args, calls):
+  start = time.time()
+  for call in xrange(calls):
+    function(*args)
+  return (time.time() - start) / calls
+
+
+
+def main():
+  calls = CALLS
+  if len(sys.argv) > 1:
+    calls = int(sys.argv[1])
+
+  restrictionsfile = write_restrictions()
+  try:
+    restrictions.init_restriction_tables(restrictionsfile)
+  finally:
+    os.remove(restrictionsfile)
+  nanny.initialize_consumed_resource_tables()
+
+  # Populates the wrapped method dictionaries used below
+  namespace._init_namespace()
+  socketfunctions = namespace.socket_object_wrapped_functions_dict
+  filefunctions = namespace.file_object_wrapped_functions_dict
+  wrappedlistdir = namespace.NamespaceAPIFunctionWrapper(
+      namespace.USERCONTEXT_WRAPPER_INFO['listdir']).wrapped_function
+
+  start_server()
+  sockobj = emulcomm.openconn(IP, SERVER_PORT)
+
+  payload = 'x' * PAYLOAD_SIZE
+
+  # Enough data that read() never runs off the end of the file
+  datafo = open(FILENAME, 'w')
+  datafo.write('x' * (PAYLOAD_SIZE * calls * 2 + PAYLOAD_SIZE))
+  datafo.close()
+  readfileobj = emulfile.emulated_open(FILENAME, 'r')
+  writefileobj = emulfile.emulated_open(FILENAME + '.out', 'w')
+
+  tests = [
+    ('send', emulcomm.emulated_socket.send, socketfunctions['send'], (sockobj, payload)),
+    ('recv', emulcomm.emulated_socket.recv, socketfunctions['recv'], (sockobj, PAYLOAD_SIZE)),
+    ('read', emulfile.emulated_file.read, filefunctions['read'], (readfileobj, PAYLOAD_SIZE)),
+    ('write', emulfile.emulated_file.write, filefunctions['write'], (writefileobj, payload)),
+    ('listdir', emulfile.listdir, wrappedlistdir, ()),
+  ]
+
+  print "%-8s %8s %16s %16s %16s" % ('call', 'calls', 'unwrapped (us)',
+      'wrapped (us)', 'overhead (us)')
+
+  try:
+    for callname, unwrapped, wrapped, args in tests:
+      # listdir is much slower than the others
+      if callname == 'listdir':
+        testcalls = max(1, calls / 10)
+      else:
+        testcalls = calls
+
+      unwrappedtime = time_calls(unwrapped, args, testcalls)
+      wrappedtime = time_calls(wrapped, args, testcalls)
+
+      print "%-8s %8d %16.2f %16.2f %16.2f" % (callname, testcalls,
+          1000000 * unwrappedtime, 1000000 * wrappedtime,
+          1000000 * (wrappedtime - unwrappedtime))
+      sys.stdout.flush()
+
+  finally:
+    readfileobj.close()
+    writefileobj.close()
+    os.remove(FILENAME)
+    os.remove(FILENAME + '.out')
+
+  # The server threads are daemons, but the socket may still be open
+  os._exit(0)
+
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,213 @@
+"""
+<Program Name>
+  nanny_benchmark.py
+
+<Started>
+  October 18, 2026
+
+<Purpose>
+  Measures how well the nanny holds a sending program to its network send
+  limit, and what the accounting costs.   Several threads send small
+  messages as fast as they can over loopback TCP connections (through
+  emulcomm, so every send is charged to the nanny) for a fixed time.   For a
+  range of limits it reports:
+
+    - the achieved send rate as a fraction of the limit (accuracy).   The
+      nanny allows a burst of one second's worth at the start, which is not
+      counted.
+    - the CPU time the process used per second and per MB sent (overhead)
+    - the mean and maximum time a send took (how long throttled threads
+      were held up)
+
+  Loopback traffic is charged to 'loopsend' rather than 'netsend', so both
+  are set to the same limit.
+
+  This drives emulcomm directly (rather than through repy.py) so that the
+  resource monitor and the sandbox don't add noise.
+
+<Usage>
+  Copy this into a directory prepared with preparetest.py and run it there:
+
+    python nanny_benchmark.py [seconds per test] [threads] [message size]
+"""
+
+import os
+import sys
+import time
+import socket
+import tempfile
+import threading
+
+import restrictions
+import nanny
+import emulcomm
+
+# Bytes per second
+LIMITS = [100000, 1000000, 10000000]
+
+SECONDS = 5.0
+THREADS = 4
+MESSAGE_SIZE = 512
+
+IP = '127.0.0.1'
+SERVER_PORT = 41700
+
+
+
+def write_restrictions():
+  fd, filename = tempfile.mkstemp(prefix='restrictions.nanny.')
+  restrictionfo = os.fdopen(fd, 'w')
+  restrictionfo.write("resource cpu 1.0\n")
+  restrictionfo.write("resource memory 1000000000\n")
+  restrictionfo.write("resource diskused 1000000\n")
+  restrictionfo.write("resource events 10\n")
+  restrictionfo.write("resource filewrite 1000000\n")
+  restrictionfo.write("resource fileread 1000000\n")
+  restrictionfo.write("resource filesopened 10\n")
+  restrictionfo.write("resource insockets 10\n")
+  restrictionfo.write("resource outsockets 100\n")
+  restrictionfo.write("resource netsend 1000000\n")
+  restrictionfo.write("resource netrecv 1000000000\n")
+  restrictionfo.write("resource loopsend 1000000\n")
+  restrictionfo.write("resource looprecv 1000000000\n")
+  restrictionfo.write("resource lograte 1000000\n")
+  restrictionfo.write("resource random 1000\n")
+  restrictionfo.write("call openconn allow\n")
+  restrictionfo.write("call socket.send allow\n")
+  restrictionfo.write("call socket.close allow\n")
+  restrictionfo.write("call stopcomm allow\n")
+  restrictionfo.close()
+  return filename
+
+
+
+def start_server():
+  # Accepts connections and throws away whatever they send
+  serversock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+  serversock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+  serversock.bind((IP, SERVER_PORT))
+  serversock.listen(100)
+
+  def drain(clientsock):
+    try:
+      while clientsock.recv(65536):
+        pass
+    except socket.error:
+      pass
+
+  def serve():
+    while True:
+      clientsock, addr = serversock.accept()
+      drainthread = threading.Thread(target=drain, args=(clientsock,))
+      drainthread.setDaemon(True)
+      drainthread.start()
+
+  servethread = threading.Thread(target=serve)
+  servethread.setDaemon(True)
+  servethread.start()
+
+
+
+def cputime():
+  usertime, systime = os.times()[:2]
+  return usertime + systime
+
+
+
+def run_test(limit, seconds, threadcount, messagesize):
+  # The restrictions file can only be read once, so set the limits directly
+  nanny.resource_restriction_table['netsend'] = float(limit)
+  nanny.resource_restriction_table['loopsend'] = float(limit)
+  nanny.initialize_consumed_resource_tables()
+
+  message = 'x' * messagesize
+  sockets = []
+  for count in range(threadcount):
+    sockets.append(emulcomm.openconn(IP, SERVER_PORT))
+
+  # Per thread: [bytes sent, number of sends, total send time, max send time]
+  results = []
+  startevent = threading.Event()
+
+  def sender(sockobj, result):
+    startevent.wait()
+    endtime = starttime[0] + seconds
+    while True:
+      before = time.time()
+      if before >= endtime:
+        break
+      sent = sockobj.send(message)
+      elapsed = time.time() - before
+      result[0] = result[0] + sent
+      result[1] = result[1] + 1
+      result[2] = result[2] + elapsed
+      result[3] = max(result[3], elapsed)
+
+  starttime = [time.time()]
+  threads = []
+  for sockobj in sockets:
+    result = [0, 0, 0.0, 0.0]
+    results.append(result)
+    senderthread = threading.Thread(target=sender, args=(sockobj, result))
+    senderthread.start()
+    threads.append(senderthread)
+
+  cpustart = cputime()
+  starttime[0] = time.time()
+  startevent.set()
+  for senderthread in threads:
+    senderthread.join()
+  elapsed = time.time() - starttime[0]
+  cpuused = cputime() - cpustart
+
+  for sockobj in sockets:
+    sockobj.close()
+
+  totalbytes = sum([result[0] for result in results])
+  totalsends = sum([result[1] for result in results])
+  totalsendtime = sum([result[2] for result in results])
+  maxsendtime = max([result[3] for result in results])
+
+  # Don't count the initial burst of up to one second's worth
+  sustainedrate = max(totalbytes - limit, 0) / elapsed
+
+  return (sustainedrate / limit, cpuused / elapsed,
+      cpuused / (totalbytes / 1000000.0), totalsends,
+      totalsendtime / max(totalsends, 1), maxsendtime)
+
+
+
+def main():
+  seconds = SECONDS
+  threadcount = THREADS
+  messagesize = MESSAGE_SIZE
+  if len(sys.argv) > 1:
+    seconds = float(sys.argv[1])
+  if len(sys.argv) > 2:
+    threadcount = int(sys.argv[2])
+  if len(sys.argv) > 3:
+    messagesize = int(sys.argv[3])
+
+  restrictionsfile = write_restrictions()
+  try:
+    restrictions.init_restriction_tables(restrictionsfile)
+  finally:
+    os.remove(restrictionsfile)
+
+  start_server()
+
+  print "%-12s %12s %8s %12s %10s %14s %14s" % ('limit (B/s)', 'rate/limit',
+      'cpu %', 'cpu ms/MB', 'sends', 'mean send (ms)', 'max send (ms)')
+  for limit in LIMITS:
+    (accuracy, cpu, cpupermb, sends, meansend, maxsend) = run_test(limit,
+        seconds, threadcount, messagesize)
+    print "%-12d %12.3f %8.1f %12.1f %10d %14.3f %14.3f" % (limit, accuracy,
+        100 * cpu, 1000 * cpupermb, sends, 1000 * meansend, 1000 * maxsend)
+    sys.stdout.flush()
+
+  os._exit(0)
+
+
+
+if __name__ == '__main__':
+  main()
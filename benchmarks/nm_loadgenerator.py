@@ -0,0 +1,251 @@
+"""
+<Program Name>
+  nm_loadgenerator.py
+
+<Started>
+  October 18, 2026
+
+<Purpose>
+  A load generator for the node manager.   It starts a test mode node
+  manager with each of several worker thread counts (the 'workercount'
+  setting in nodeman.cfg) and for each reports the requests per second and
+  the request latency (mean, p50, p99, max) seen by fast clients.
+
+  Two kinds of clients run at the same time:
+
+    - fast clients send GetVessels requests back to back using fastnmclient.
+    - slow clients trickle their request to the node manager over a couple
+      of seconds, like a client on a slow link uploading a file.   Each slow
+      request ties up a worker until it has been received.
+
+  With a single worker, every fast request queues behind the slow ones.
+
+  The node manager limits the number of connections from a single IP, so
+  each client uses its own loopback source address (127.0.0.2, 127.0.0.3,
+  ...).   This works on Linux where all of 127.0.0.0/8 is local.
+
+  Only public calls are used since signed calls need the node manager to
+  reach a time server.
+
+<Usage>
+  Copy this into a directory prepared with preparetest.py (which contains
+  the node manager) and run it there:
+
+    python nm_loadgenerator.py [seconds per test] [fast clients] [slow clients]
+"""
+
+import os
+import sys
+import time
+import socket
+import threading
+import subprocess
+
+from repyportability import *
+
+import repyhelper
+import fastnmclient
+import persist
+import harshexit
+
+WORKER_COUNTS = [1, 2, 4, 8, 16]
+
+SECONDS = 10.0
+FAST_CLIENTS = 8
+SLOW_CLIENTS = 2
+
+# How long a slow client takes to send its request
+SLOW_REQUEST_SECONDS = 2.0
+
+
+
+# Each client thread connects from its own source IP.   fastnmclient doesn't
+# have a way to choose the local IP (and openconn only binds when a local port
+# is given), so replace the openconn it uses with one that binds a plain
+# socket.
+clientsourceip = threading.local()
+
+def openconn_from_client_ip(desthost, destport, localip=None, localport=None, timeout=5):
+  clientsock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+  clientsock.settimeout(timeout)
+  clientsock.bind((clientsourceip.ip, 0))
+  clientsock.connect((desthost, destport))
+  return clientsock
+
+fastnmclient.timeout_openconn = openconn_from_client_ip
+
+
+
+class MessageCollector:
+  # Collects what session_sendmessage sends so that a slow client can send
+  # the exact bytes fastnmclient would have.
+  def __init__(self):
+    self.data = ''
+
+  def send(self, data):
+    self.data = self.data + data
+    return len(data)
+
+
+
+def percentile(values, fraction):
+  values = sorted(values)
+  return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+
+def start_nodemanager(workercount):
+  persist.commit_object(dict(persist.restore_object('nodeman.cfg'),
+      workercount=workercount), 'nodeman.cfg')
+
+  if os.path.exists('v2' + os.sep + 'nodemanager.old'):
+    os.remove('v2' + os.sep + 'nodemanager.old')
+
+  nmproc = subprocess.Popen([sys.executable, "nmmain.py", "--test-mode"],
+      stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+  nmproc.stdin.close()
+  nmproc.stdout.close()
+  nmproc.stderr.close()
+
+
+
+def wait_for_nodemanager(nmip, nmport):
+  # The port is open before the worker threads start, so wait for a request
+  # to succeed rather than just for a connection
+  clientsourceip.ip = '127.0.0.1'
+  deadline = time.time() + 60
+  while time.time() < deadline:
+    try:
+      fastnmclient.nmclient_createhandle(nmip, nmport, timestamp=False,
+          identity=False)
+      return
+    except fastnmclient.NMClientException:
+      time.sleep(0.2)
+  raise Exception("The node manager did not start")
+
+
+
+def stop_nodemanager():
+  # The node manager daemonizes, so get its pid from the log (like
+  # ut_nm_subprocess.py does)
+  firstline = open('v2' + os.sep + 'nodemanager.old').readline()
+  pidportion = firstline.split(':')[1]
+  harshexit.portablekill(int(pidportion[4:]))
+
+
+
+def fast_client(nmip, nmport, sourceip, endtime, latencies, errors):
+  clientsourceip.ip = sourceip
+
+  nmhandle = None
+  while nmhandle is None and time.time() < endtime:
+    try:
+      nmhandle = fastnmclient.nmclient_createhandle(nmip, nmport,
+          timestamp=False, identity=False)
+    except fastnmclient.NMClientException:
+      errors.append(1)
+
+  while time.time() < endtime:
+    start = time.time()
+    try:
+      fastnmclient.nmclient_rawsay(nmhandle, 'GetVessels')
+    except fastnmclient.NMClientException:
+      errors.append(1)
+      continue
+    latencies.append(time.time() - start)
+
+
+
+def slow_client(nmip, nmport, sourceip, endtime, message):
+  delay = SLOW_REQUEST_SECONDS / len(message)
+  while time.time() < endtime:
+    try:
+      slowsock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+      slowsock.bind((sourceip, 0))
+      slowsock.connect((nmip, nmport))
+      for character in message:
+        slowsock.send(character)
+        time.sleep(delay)
+      slowsock.recv(65536)
+      slowsock.close()
+    except socket.error:
+      time.sleep(0.1)
+
+
+
+def run_load(nmip, nmport, seconds, fastclients, slowclients):
+  latencies = []
+  errors = []
+
+  collector = MessageCollector()
+  fastnmclient.session_sendmessage(collector, 'GetVessels')
+
+  endtime = time.time() + seconds
+  threads = []
+  for clientnumber in range(fastclients + slowclients):
+    sourceip = '127.0.0.' + str(clientnumber + 2)
+    if clientnumber < fastclients:
+      clientthread = threading.Thread(target=fast_client, args=(nmip, nmport,
+          sourceip, endtime, latencies, errors))
+    else:
+      clientthread = threading.Thread(target=slow_client, args=(nmip, nmport,
+          sourceip, endtime, collector.data))
+    clientthread.start()
+    threads.append(clientthread)
+
+  for clientthread in threads:
+    clientthread.join()
+
+  return latencies, len(errors)
+
+
+
+def main():
+  seconds = SECONDS
+  fastclients = FAST_CLIENTS
+  slowclients = SLOW_CLIENTS
+  if len(sys.argv) > 1:
+    seconds = float(sys.argv[1])
+  if len(sys.argv) > 2:
+    fastclients = int(sys.argv[2])
+  if len(sys.argv) > 3:
+    slowclients = int(sys.argv[3])
+
+  initproc = subprocess.Popen([sys.executable, "nminit.py"], stdout=subprocess.PIPE)
+  initproc.communicate()
+
+  nmip = getmyip()
+  nmport = persist.restore_object('nodeman.cfg')['ports'][0]
+
+  print "%d fast clients, %d slow clients, %.1f seconds per test" % (
+      fastclients, slowclients, seconds)
+  print "%-8s %10s %8s %12s %12s %12s %12s" % ('workers', 'req/sec',
+      'errors', 'mean (ms)', 'p50 (ms)', 'p99 (ms)', 'max (ms)')
+
+  for workercount in WORKER_COUNTS:
+    start_nodemanager(workercount)
+    try:
+      wait_for_nodemanager(nmip, nmport)
+      latencies, errorcount = run_load(nmip, nmport, seconds, fastclients,
+          slowclients)
+    finally:
+      stop_nodemanager()
+
+    if not latencies:
+      print "%-8d no requests completed (%d errors)" % (workercount, errorcount)
+      continue
+
+    print "%-8d %10.1f %8d %12.1f %12.1f %12.1f %12.1f" % (workercount,
+        len(latencies) / seconds, errorcount,
+        1000 * sum(latencies) / len(latencies),
+        1000 * percentile(latencies, 0.5), 1000 * percentile(latencies, 0.99),
+        1000 * max(latencies))
+    sys.stdout.flush()
+
+    # Give the port time to be freed
+    time.sleep(2)
+
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,209 @@
+"""
+<Program Name>
+  nm_signedcall_benchmark.py
+
+<Started>
+  October 18, 2026
+
+<Purpose>
+  Measures two costs of talking to the node manager:
+
+    - checking the signature of a signed call.   Signed ListFilesInVessel
+      requests are run through nmrequesthandler.process_API_call (with a
+      stand-in for the API function) with the public key and signature caches
+      in fastsigneddata turned off and on.   It reports the time per check (from
+      nmrequesthandler.get_signature_check_stats) and how many RSA verifies
+      each check does.   Each request has a new timestamp, as a real client's
+      would, so each one has a different signature.
+
+    - the connection per request.   A test mode node manager is started and
+      GetVessels is called back to back with a connection per request and
+      over a persistent session.
+
+  Signed calls aren't sent to the node manager because it needs to reach a
+  time server to check them.   In this process the time is just set.
+
+<Usage>
+  Copy this into a directory prepared with preparetest.py (which contains
+  the node manager) and run it there:
+
+    python nm_signedcall_benchmark.py [signed calls] [seconds per session test]
+"""
+
+import os
+import sys
+import time
+import socket
+import subprocess
+
+from repyportability import *
+
+import repyhelper
+repyhelper.translate_and_import("rsa.repy")
+repyhelper.translate_and_import("time.repy")
+
+import fastsigneddata
+import fastnmclient
+import nmrequesthandler
+import nmAPI
+import persist
+import harshexit
+
+SIGNED_CALLS = 200
+SECONDS = 5.0
+
+VESSELNAME = 'v1'
+
+
+
+def percentile(values, fraction):
+  values = sorted(values)
+  return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+
+def run_signature_checks(calls, publickey, privatekey, cachesize):
+  fastsigneddata.SIGNEDDATA_CACHE_SIZE = cachesize
+  for cache in [fastsigneddata.signeddata_publickey_cache,
+      fastsigneddata.signeddata_verify_cache]:
+    cache.clear()
+  del fastsigneddata.signeddata_publickey_cache_order[:]
+  del fastsigneddata.signeddata_verify_cache_order[:]
+
+  nmAPI.vesseldict[VESSELNAME] = {'ownerkey': publickey, 'userkeys': [],
+      'oldmetadata': None}
+  nmrequesthandler.signaturecheckstats.clear()
+
+  # Count the RSA verifies
+  verifycount = [0]
+  realrsaverify = fastsigneddata.rsa_verify
+  def countingrsaverify(*args):
+    verifycount[0] = verifycount[0] + 1
+    return realrsaverify(*args)
+  fastsigneddata.rsa_verify = countingrsaverify
+
+  try:
+    for call in range(calls):
+      # Timestamps must increase from call to call
+      time_settime(time.time() + call)
+      request = fastsigneddata.signeddata_signdata('ListFilesInVessel|' +
+          VESSELNAME, privatekey, publickey, time_gettime(), time_gettime() +
+          3600, None, None)
+
+      response = nmrequesthandler.process_API_call(request)
+      if not response.endswith('Success'):
+        raise Exception("The signed call failed: " + response)
+  finally:
+    fastsigneddata.rsa_verify = realrsaverify
+
+  stats = nmrequesthandler.get_signature_check_stats()['ListFilesInVessel']
+  return stats, float(verifycount[0]) / calls
+
+
+
+def start_nodemanager():
+  initproc = subprocess.Popen([sys.executable, "nminit.py"],
+      stdout=subprocess.PIPE)
+  initproc.communicate()
+
+  if os.path.exists('v2' + os.sep + 'nodemanager.old'):
+    os.remove('v2' + os.sep + 'nodemanager.old')
+
+  nmproc = subprocess.Popen([sys.executable, "nmmain.py", "--test-mode"],
+      stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+  nmproc.stdin.close()
+  nmproc.stdout.close()
+  nmproc.stderr.close()
+
+
+
+def stop_nodemanager():
+  # The node manager daemonizes, so get its pid from the log (like
+  # ut_nm_subprocess.py does)
+  firstline = open('v2' + os.sep + 'nodemanager.old').readline()
+  pidportion = firstline.split(':')[1]
+  harshexit.portablekill(int(pidportion[4:]))
+
+
+
+def run_session_test(nmip, nmport, seconds, persistent):
+  nmhandle = fastnmclient.nmclient_createhandle(nmip, nmport, timestamp=False,
+      identity=False, persistent=persistent)
+
+  latencies = []
+  try:
+    endtime = time.time() + seconds
+    while time.time() < endtime:
+      start = time.time()
+      fastnmclient.nmclient_rawsay(nmhandle, 'GetVessels')
+      latencies.append(time.time() - start)
+
+    # Make sure the mode we asked for was used
+    if persistent and fastnmclient.nmclient_get_handle_info(nmhandle)['session'] is None:
+      raise Exception("The node manager didn't start a persistent session")
+  finally:
+    fastnmclient.nmclient_destroyhandle(nmhandle)
+
+  return latencies
+
+
+
+def main():
+  calls = SIGNED_CALLS
+  seconds = SECONDS
+  if len(sys.argv) > 1:
+    calls = int(sys.argv[1])
+  if len(sys.argv) > 2:
+    seconds = float(sys.argv[2])
+
+  # Stand in for the real API function so that only the checks are timed
+  nmrequesthandler.API_dict['ListFilesInVessel'] = (1, 'User',
+      lambda vesselname: "\nSuccess")
+
+  print "Generating a key..."
+  publickey, privatekey = rsa_gen_pubpriv_keys(1024)
+
+  print
+  print "%-10s %8s %14s %14s %16s" % ('caches', 'calls', 'mean (ms)',
+      'max (ms)', 'RSA verifies')
+  for cachename, cachesize in [('off', 0), ('on', 256)]:
+    stats, verifiespercall = run_signature_checks(calls, publickey,
+        privatekey, cachesize)
+    print "%-10s %8d %14.3f %14.3f %16.1f" % (cachename, stats['count'],
+        1000 * stats['average'], 1000 * stats['max'], verifiespercall)
+    sys.stdout.flush()
+
+  print
+  start_nodemanager()
+  try:
+    nmip = getmyip()
+    nmport = persist.restore_object('nodeman.cfg')['ports'][0]
+
+    # wait for it to answer requests
+    deadline = time.time() + 60
+    while True:
+      try:
+        fastnmclient.nmclient_createhandle(nmip, nmport, timestamp=False,
+            identity=False)
+        break
+      except fastnmclient.NMClientException:
+        if time.time() > deadline:
+          raise
+        time.sleep(0.2)
+
+    print "%-26s %10s %12s %12s" % ('GetVessels', 'req/sec', 'mean (ms)',
+        'p99 (ms)')
+    for modename, persistent in [('connection per request', False),
+        ('persistent session', True)]:
+      latencies = run_session_test(nmip, nmport, seconds, persistent)
+      print "%-26s %10.1f %12.2f %12.2f" % (modename, len(latencies) / seconds,
+          1000 * sum(latencies) / len(latencies),
+          1000 * percentile(latencies, 0.99))
+      sys.stdout.flush()
+  finally:
+    stop_nodemanager()
+
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,204 @@
+"""
+<Program Name>
+  parallelize_benchmark.py
+
+<Started>
+  October 18, 2026
+
+<Purpose>
+  Measures how quickly parallelize.repy returns results when some targets
+  are much slower than others.   A local fake server answers each target
+  after a delay: most answer in 20ms, some in 200ms and a few in 2 seconds
+  (like a few slow nodes or advertise services).   Each target is contacted
+  over TCP.
+
+  The modes are:
+    - polling: parallelize_initfunction, polling parallelize_getresults
+      every 15ms (like advertise_lookup did) until all targets are done.
+    - queue: parallelize_getnextresult with the same number of events.
+    - queue, first N: stopping once N calls returned (resultsneeded).
+    - queue, extra events: maxconcurrentevents is 3 times concurrentevents,
+      so slow targets don't hold up the others.
+    - queue, timeout: each call times out after 0.5 seconds.
+
+  It reports the time until N results were seen, the time until all of the
+  results were seen and how long after its call finished each result was
+  seen (the delivery delay).
+
+<Usage>
+  Copy this into a directory prepared with preparetest.py and run it there:
+
+    python parallelize_benchmark.py [targets] [concurrent events] [N]
+"""
+
+import sys
+import time
+import random
+import socket
+import threading
+
+from repyportability import *
+
+import repyhelper
+repyhelper.translate_and_import("parallelize.repy")
+
+TARGETS = 200
+CONCURRENT_EVENTS = 10
+FIRST_N = 20
+
+IP = '127.0.0.1'
+SERVER_PORT = 41900
+
+# (delay, fraction of the targets)
+LATENCIES = [(0.02, 0.85), (0.2, 0.12), (2.0, 0.03)]
+
+
+
+def percentile(values, fraction):
+  values = sorted(values)
+  return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+
+def make_delays(targets):
+  random.seed(42)
+  delays = {}
+  for target in range(targets):
+    choice = random.random()
+    for delay, fraction in LATENCIES:
+      if choice < fraction:
+        break
+      choice = choice - fraction
+    delays[target] = delay
+  return delays
+
+
+
+def start_server(delays):
+  serversock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+  serversock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+  serversock.bind((IP, SERVER_PORT))
+  serversock.listen(128)
+
+  def answer(sock):
+    target = int(sock.recv(100))
+    time.sleep(delays[target])
+    sock.sendall(str(target))
+    sock.close()
+
+  def serve():
+    while True:
+      sock, addr = serversock.accept()
+      thread = threading.Thread(target=answer, args=(sock,))
+      thread.setDaemon(True)
+      thread.start()
+
+  thread = threading.Thread(target=serve)
+  thread.setDaemon(True)
+  thread.start()
+
+
+
+def contact_target(target):
+  sock = socket.create_connection((IP, SERVER_PORT))
+  sock.sendall(str(target))
+  answer = sock.recv(100)
+  sock.close()
+  if int(answer) != target:
+    raise Exception("Wrong answer")
+  # when the call finished
+  return time.time()
+
+
+
+def run_polling(targets, concurrentevents, firstn):
+  start = time.time()
+  phandle = parallelize_initfunction(range(targets), contact_target,
+      concurrentevents)
+
+  firstntime = None
+  seen = 0
+  delays = []
+  while True:
+    finished = parallelize_isfunctionfinished(phandle)
+    returned = parallelize_getresults(phandle)['returned']
+    now = time.time()
+    for target, finishtime in returned[seen:]:
+      delays.append(now - finishtime)
+    seen = len(returned)
+    if firstntime is None and seen >= firstn:
+      firstntime = now - start
+    if finished:
+      break
+    time.sleep(0.015)
+
+  parallelize_closefunction(phandle)
+  return firstntime, time.time() - start, delays
+
+
+
+def run_queue(targets, concurrentevents, firstn, **options):
+  start = time.time()
+  phandle = parallelize_startfunction(range(targets), contact_target,
+      concurrentevents, **options)
+
+  firstntime = None
+  seen = 0
+  delays = []
+  while True:
+    result = parallelize_getnextresult(phandle)
+    if result is None:
+      break
+    now = time.time()
+    if result[0] == 'returned':
+      delays.append(now - result[2])
+    seen = seen + 1
+    if firstntime is None and seen >= firstn:
+      firstntime = now - start
+
+  parallelize_closefunction(phandle)
+  return firstntime, time.time() - start, delays
+
+
+
+def main():
+  targets = TARGETS
+  concurrentevents = CONCURRENT_EVENTS
+  firstn = FIRST_N
+  if len(sys.argv) > 1:
+    targets = int(sys.argv[1])
+  if len(sys.argv) > 2:
+    concurrentevents = int(sys.argv[2])
+  if len(sys.argv) > 3:
+    firstn = int(sys.argv[3])
+
+  delays = make_delays(targets)
+  start_server(delays)
+
+  print "%d targets (%.1f seconds of delays), %d concurrent events" % (
+      targets, sum(delays.values()), concurrentevents)
+  print
+  print "%-22s %14s %14s %16s %16s" % ('mode', 'first %d (s)' % firstn,
+      'all (s)', 'delay p50 (ms)', 'delay p99 (ms)')
+
+  modes = [
+      ('polling', run_polling, {}),
+      ('queue', run_queue, {}),
+      ('queue, first N', run_queue, {'resultsneeded': firstn}),
+      ('queue, extra events', run_queue,
+          {'maxconcurrentevents': 3 * concurrentevents}),
+      ('queue, timeout', run_queue, {'targettimeout': 0.5}),
+  ]
+
+  for modename, function, options in modes:
+    firstntime, alltime, resultdelays = function(targets, concurrentevents,
+        firstn, **options)
+    print "%-22s %14.3f %14.3f %16.2f %16.2f" % (modename, firstntime,
+        alltime, 1000 * percentile(resultdelays, 0.5),
+        1000 * percentile(resultdelays, 0.99))
+    sys.stdout.flush()
+
+
+
+if __name__ == '__main__':
+  main()
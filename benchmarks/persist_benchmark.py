@@ -0,0 +1,136 @@
+"""
+<Program Name>
+  persist_benchmark.py
+
+<Started>
+  October 18, 2026
+
+<Purpose>
+  Measures how long persist.commit_object and persist.restore_object take for
+  a vessel dictionary as the number of vessels grows.   Each commit follows a
+  ChangeUsers-like change to one vessel (a new list of user keys), which is
+  what the node manager does for most requests that change its state.
+
+  The journaled persist is measured with and without fsync.   If the path of
+  another persist.py is given (for example an older version from git), it is
+  measured too.   Older versions don't fsync.
+
+<Usage>
+  Copy this into a directory prepared with preparetest.py (or any directory
+  with persist.py) and run it there:
+
+    python persist_benchmark.py [commits per test] [other persist.py]
+
+  For example, to compare with the version before the journal was added:
+
+    git show <commit>:nodemanager/persist.py > oldpersist.py
+    python persist_benchmark.py 200 oldpersist.py
+"""
+
+import os
+import sys
+import imp
+import time
+import random
+
+import persist
+
+VESSEL_COUNTS = [10, 100, 1000, 5000]
+COMMITS = 200
+
+FILENAME = 'persistbenchmark.vesseldict'
+
+
+
+def percentile(values, fraction):
+  values = sorted(values)
+  return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+
+def random_key():
+  # The size of a 1024 bit RSA public key
+  return {'e': random.getrandbits(1024) | 1, 'n': random.getrandbits(1024)}
+
+
+
+def make_vesseldict(vesselcount):
+  vesseldict = {}
+  for number in range(vesselcount):
+    vesseldict['v' + str(number)] = {'userseeds': [], 'ownerkey': random_key(),
+        'oldmetadata': None, 'stopfilename': 'v' + str(number) + '.stop',
+        'logfilename': 'v' + str(number) + '.log',
+        'statusfilename': 'v' + str(number) + '.status',
+        'resourcefilename': 'resource.v' + str(number), 'advertise': True,
+        'ownerinformation': '', 'status': 'Fresh',
+        'userkeys': [random_key()]}
+  return vesseldict
+
+
+
+def removefiles():
+  for suffix in ['', '.new', '.tmp', '.journal']:
+    if os.path.exists(FILENAME + suffix):
+      os.remove(FILENAME + suffix)
+
+
+
+def run_test(persistmodule, vesselcount, commits):
+  removefiles()
+  vesseldict = make_vesseldict(vesselcount)
+  persistmodule.commit_object(vesseldict, FILENAME)
+
+  vesselnames = vesseldict.keys()
+  latencies = []
+  for count in xrange(commits):
+    vesseldict[random.choice(vesselnames)]['userkeys'] = [random_key()]
+    start = time.time()
+    persistmodule.commit_object(vesseldict, FILENAME)
+    latencies.append(time.time() - start)
+
+  start = time.time()
+  restored = persistmodule.restore_object(FILENAME)
+  restoretime = time.time() - start
+  if restored != vesseldict:
+    raise Exception("The restored vessel dictionary is wrong!")
+
+  byteswritten = os.path.getsize(FILENAME)
+  if os.path.exists(FILENAME + '.journal'):
+    byteswritten = byteswritten + os.path.getsize(FILENAME + '.journal')
+
+  removefiles()
+  return latencies, restoretime, byteswritten
+
+
+
+def main():
+  commits = COMMITS
+  if len(sys.argv) > 1:
+    commits = int(sys.argv[1])
+
+  modes = [('journal', persist, True), ('journal, no fsync', persist, False)]
+  if len(sys.argv) > 2:
+    othermodule = imp.load_source('otherpersist', sys.argv[2])
+    modes.append((os.path.basename(sys.argv[2]), othermodule, None))
+
+  print "%-8s %-20s %12s %12s %12s %12s" % ('vessels', 'persist',
+      'commit (ms)', 'p99 (ms)', 'restore (ms)', 'on disk (KB)')
+
+  for vesselcount in VESSEL_COUNTS:
+    for modename, persistmodule, fsync in modes:
+      if fsync is not None:
+        persistmodule.PERSIST_FSYNC = fsync
+      latencies, restoretime, byteswritten = run_test(persistmodule,
+          vesselcount, commits)
+      print "%-8d %-20s %12.3f %12.3f %12.3f %12.1f" % (vesselcount, modename,
+          1000 * sum(latencies) / len(latencies),
+          1000 * percentile(latencies, 0.99), 1000 * restoretime,
+          byteswritten / 1024.0)
+      sys.stdout.flush()
+
+  persist.PERSIST_FSYNC = True
+
+
+
+if __name__ == '__main__':
+  main()
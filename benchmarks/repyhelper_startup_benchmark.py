@@ -0,0 +1,95 @@
+"""
+<Program Name>
+  repyhelper_startup_benchmark.py
+
+<Started>
+  October 18, 2026
+
+<Purpose>
+  Measures how long importing seash.py and nmmain.py takes (which is most of
+  their startup time, and where they translate and import their .repy
+  libraries with repyhelper).   "cold" is with no translations, bytecode or
+  manifests, "warm" is the imports after that.
+
+  If the path of another repyhelper.py is given (for example an older
+  version from git), it is measured too.
+
+<Usage>
+  Copy this into a directory prepared with preparetest.py and run it there:
+
+    python repyhelper_startup_benchmark.py [other repyhelper.py]
+"""
+
+import glob
+import os
+import subprocess
+import sys
+import time
+
+import repyhelper
+
+MODULES = ['seash', 'nmmain']
+WARM_RUNS = 10
+
+
+
+def remove_translations():
+  # nmmain writes its translations to nodemanager.repyhelpercache
+  for pattern in ['*_repy.py', '*_repy.pyc',
+      repyhelper.TRANSLATION_MANIFEST_FILENAME]:
+    for filename in glob.glob(pattern) + glob.glob(
+        os.path.join('nodemanager.repyhelpercache', pattern)):
+      os.remove(filename)
+
+
+
+def milliseconds_to_import(module, repyhelperpath):
+  # Imports the module in a new python process with the given repyhelper.py
+  # (None for the one in this directory).
+  code = ''
+  if repyhelperpath is not None:
+    code = "import imp, sys; sys.modules['repyhelper'] = imp.load_source('repyhelper', %r); " % repyhelperpath
+  code += 'import ' + module
+
+  devnull = open(os.devnull, 'w')
+  try:
+    start = time.time()
+    returncode = subprocess.call([sys.executable, '-c', code], stdout=devnull,
+        stderr=devnull)
+    elapsed = time.time() - start
+  finally:
+    devnull.close()
+
+  if returncode != 0:
+    raise Exception("Importing " + module + " failed")
+  return elapsed * 1000
+
+
+
+def main():
+  # (name, path of repyhelper.py)
+  versions = [('new', None)]
+  if len(sys.argv) > 1:
+    versions.append(('other', os.path.abspath(sys.argv[1])))
+
+  print "milliseconds to import (the median of %d runs for warm)" % WARM_RUNS
+  print
+  print "%-8s %-8s %8s %8s" % ('module', 'version', 'cold', 'warm')
+
+  for module in MODULES:
+    for versionname, repyhelperpath in versions:
+      remove_translations()
+      cold = milliseconds_to_import(module, repyhelperpath)
+      warmtimes = [milliseconds_to_import(module, repyhelperpath)
+          for run in range(WARM_RUNS)]
+      warmtimes.sort()
+      print "%-8s %-8s %8.1f %8.1f" % (module, versionname, cold,
+          warmtimes[len(warmtimes) / 2])
+      sys.stdout.flush()
+
+  remove_translations()
+
+
+
+if __name__ == '__main__':
+  main()
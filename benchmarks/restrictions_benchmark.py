@@ -0,0 +1,112 @@
+"""
+<Program Name>
+  restrictions_benchmark.py
+
+<Started>
+  October 18, 2026
+
+<Purpose>
+  Measures the cost of restrictions.assertisallowed() per call, for the
+  calls repy makes it with (with the arguments they pass) and for the stock
+  restrictions files in repy/tests.   Calls that the restrictions file
+  doesn't allow are measured separately, since building the explanation of
+  a denial is slower.
+
+  If the path of another restrictions.py is given (for example an older
+  version from git), it is measured too.
+
+<Usage>
+  Copy this into a directory prepared with preparetest.py and run it there:
+
+    python restrictions_benchmark.py [other restrictions.py]
+"""
+
+import imp
+import sys
+import time
+
+import nanny
+import restrictions
+
+CALLS = 100000
+
+RESTRICTIONS_FILES = ['restrictions.default', 'restrictions.fullcpu',
+    'restrictions.callwithands']
+
+# (call, args) as repy makes them
+CALL_TYPES = [
+    ('file.read', (1024,)),
+    ('file.write', ('x' * 64,)),
+    ('file.seek', (0, 0)),
+    ('open', ('junk_test.out', 'w')),
+    ('open', ('hello', 'rb')),
+    ('file.__init__', ('hello', 'r')),
+    ('socket.send', ('x' * 64,)),
+    ('socket.recv', (1024,)),
+    ('openconn', ('127.0.0.1', 12345, None, None)),
+    ('sendmess', ('127.0.0.1', 12345, 'x' * 64, None, None)),
+    ('settimer', (0.1,)),
+    ('sleep', (0.1,)),
+    ('getruntime', ()),
+    ('log.write', ('x' * 64,)),
+    ('open', ('somefile', 'w')),
+]
+
+
+
+def init_tables(module, filename):
+  # Each restrictions file sets the same resources, so the resources of the
+  # last one are removed first.
+  nanny.resource_restriction_table.clear()
+  for resource in nanny.individual_item_resources:
+    nanny.resource_restriction_table[resource] = set()
+  module.init_restriction_tables(filename)
+
+
+
+def microseconds_per_call(module, call, args):
+  # Returns (microseconds per call, whether the call is allowed).
+  try:
+    module.assertisallowed(call, *args)
+    allowed = True
+  except Exception:
+    allowed = False
+
+  calls = CALLS
+  if not allowed:
+    calls = CALLS / 10
+
+  start = time.time()
+  for count in xrange(calls):
+    try:
+      module.assertisallowed(call, *args)
+    except Exception:
+      pass
+  return ((time.time() - start) / calls * 1000000, allowed)
+
+
+
+def main():
+  # (name, module)
+  versions = [('new', restrictions)]
+  if len(sys.argv) > 1:
+    versions.append(('other', imp.load_source('restrictions_other',
+        sys.argv[1])))
+
+  print "microseconds per assertisallowed call"
+  for filename in RESTRICTIONS_FILES:
+    print
+    print filename
+    print "  %-8s %-40s %-8s %10s" % ('version', 'call', 'allowed', 'us/call')
+    for call, args in CALL_TYPES:
+      for versionname, module in versions:
+        init_tables(module, filename)
+        microseconds, allowed = microseconds_per_call(module, call, args)
+        print "  %-8s %-40s %-8s %10.3f" % (versionname,
+            call + str(args)[:30], allowed, microseconds)
+        sys.stdout.flush()
+
+
+
+if __name__ == '__main__':
+  main()
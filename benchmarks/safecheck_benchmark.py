@@ -0,0 +1,110 @@
+"""
+<Program Name>
+  safecheck_benchmark.py
+
+<Started>
+  October 18, 2026
+
+<Purpose>
+  Measures the cost of the static safety check that runs for every
+  VirtualNamespace (and the main program).   Three modes are compared:
+
+    - process: a new safe_check.py process for every check (the old
+      behavior, and still what Windows does)
+    - worker: a long running safe_check.py process that handles many checks
+    - cached: repeated checks of the same code that hit the result cache
+
+  For each mode it reports the checks per second and the mean and p99
+  latency of serial_safe_check() for a small piece of code (like a typical
+  VirtualNamespace) and a large one (a few hundred lines, like a library).
+
+<Usage>
+  Copy this into a directory prepared with preparetest.py and run it there:
+
+    python safecheck_benchmark.py [checks per mode]
+"""
+
+import os
+import sys
+import time
+
+import repy_constants
+import safe
+
+CHECKS = 100
+
+SMALL_CODE = """
+def add(a, b):
+  return a + b
+
+mycontext['total'] = add(1, 2)
+"""
+
+# A program with a few hundred lines is closer to a real library
+LARGE_CODE = "".join(["""
+def function%d(value):
+  result = []
+  for item in range(value):
+    if item %% 2:
+      result.append(str(item))
+    else:
+      result.append(item * %d)
+  return result
+""" % (number, number) for number in range(100)])
+
+
+
+def percentile(values, fraction):
+  values = sorted(values)
+  return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+
+def run_mode(modename, code, checks):
+  latencies = []
+
+  for check in range(checks):
+    if modename == 'cached':
+      checkcode = code
+    else:
+      # A comment keeps the code the same but misses the cache
+      checkcode = code + "\n# " + modename + " " + str(check) + " " + repr(time.time()) + "\n"
+
+    start = time.time()
+    safe.serial_safe_check(checkcode)
+    latencies.append(time.time() - start)
+
+  return latencies
+
+
+
+def main():
+  checks = CHECKS
+  if len(sys.argv) > 1:
+    checks = int(sys.argv[1])
+
+  repy_constants.REPY_START_DIR = os.getcwd()
+
+  print "%-8s %-8s %8s %12s %12s %12s" % ('code', 'mode', 'checks',
+      'checks/sec', 'mean (ms)', 'p99 (ms)')
+
+  for codename, code in [('small', SMALL_CODE), ('large', LARGE_CODE)]:
+    for modename in ['process', 'worker', 'cached']:
+      safe.SAFE_CHECK_USE_WORKER = (modename != 'process')
+
+      if modename == 'cached':
+        # Prime the cache
+        safe.serial_safe_check(code)
+
+      latencies = run_mode(modename, code, checks)
+
+      print "%-8s %-8s %8d %12.1f %12.3f %12.3f" % (codename, modename,
+          len(latencies), len(latencies) / sum(latencies),
+          1000 * sum(latencies) / len(latencies),
+          1000 * percentile(latencies, 0.99))
+      sys.stdout.flush()
+
+
+
+if __name__ == '__main__':
+  main()
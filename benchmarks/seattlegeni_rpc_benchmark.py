@@ -0,0 +1,157 @@
+"""
+<Program Name>
+  seattlegeni_rpc_benchmark.py
+
+<Started>
+  October 18, 2026
+
+<Purpose>
+  Measures the latency of the lockserver and backend calls that a SeattleGeni
+  vessel acquisition (acquire_vessels in the website) makes, with the
+  transport in seattlegeni/common/util/rpc.py and with the transport it
+  replaced.
+
+  A lockserver (seattlegeni/lockserver/lockserver_daemon.py) and a stand-in
+  for the backend, whose SetVesselUsers returns right away, run in this
+  process on the loopback interface.   Each acquisition does the calls that
+  acquire_vessels does: it starts a lockserver session, locks the user, locks
+  the nodes, calls SetVesselUsers on the backend for each vessel, unlocks
+  the nodes and the user, and ends the session.   It reports the mean and
+  median milliseconds per acquisition for a few vessel counts:
+
+    xmlrpclib     a new connection and server thread for each call, as
+                  before (a ServerProxy for each lockserver handle and each
+                  backend call, and HTTP/1.0 servers)
+    keep-alive    pooled connections kept open to HTTP/1.1 servers
+    binary        the same, with calls marshalled with marshal
+
+<Usage>
+  Run it with seattlegeni (and django) importable:
+
+    PYTHONPATH=/path/to/dir/above/seattlegeni python seattlegeni_rpc_benchmark.py
+"""
+
+import imp
+import os
+import sys
+import time
+import thread
+import xmlrpclib
+
+import SocketServer
+import SimpleXMLRPCServer
+
+from seattlegeni.common.util import rpc
+
+VESSEL_COUNTS = [1, 10, 50]
+ACQUISITIONS = 200
+
+LOCKSERVER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    '..', 'seattlegeni', 'lockserver', 'lockserver_daemon.py')
+
+# Each transport gets its own ports
+FIRST_PORT = 8110
+
+
+
+class ThreadedXMLRPCServer(SocketServer.ThreadingMixIn,
+    SimpleXMLRPCServer.SimpleXMLRPCServer):
+  daemon_threads = True
+
+
+
+class StandInBackend(object):
+
+  def _dispatch(self, method, args):
+    if method != 'SetVesselUsers':
+      raise xmlrpclib.Fault(1, "Not a stand-in function: " + method)
+    return None
+
+
+
+def start_server(port, instance, requesthandler):
+  server = ThreadedXMLRPCServer(("127.0.0.1", port),
+      requestHandler=requesthandler, allow_none=True, logRequests=False)
+  server.register_instance(instance)
+  thread.start_new_thread(server.serve_forever, ())
+  return "http://127.0.0.1:" + str(port)
+
+
+
+def acquire_vessels(make_proxy, lockserverurl, backendurl, vesselcount):
+  # The calls of acquire_vessels, with a new proxy where the api modules in
+  # seattlegeni/common/api get one.
+  lockserverproxy = make_proxy(lockserverurl)
+  session_id = lockserverproxy.StartSession()
+  lockserverproxy.AcquireLocks(session_id, {'user': ['bob']})
+
+  nodes = ['node' + str(number) for number in range(vesselcount)]
+  lockserverproxy.AcquireLocks(session_id, {'node': nodes})
+  for node in nodes:
+    make_proxy(backendurl).SetVesselUsers(node, 'v1', ['bob key'])
+  lockserverproxy.ReleaseLocks(session_id, {'node': nodes})
+
+  lockserverproxy.ReleaseLocks(session_id, {'user': ['bob']})
+  lockserverproxy.EndSession(session_id)
+
+
+
+def measure(make_proxy, lockserverurl, backendurl, vesselcount):
+  # Returns the (mean, median) milliseconds per acquisition.
+  times = []
+  for count in range(ACQUISITIONS):
+    start = time.time()
+    acquire_vessels(make_proxy, lockserverurl, backendurl, vesselcount)
+    times.append((time.time() - start) * 1000)
+  times.sort()
+  return (sum(times) / len(times), times[len(times) / 2])
+
+
+
+def main():
+  lockserver = imp.load_source('lockserver_benchmark', LOCKSERVER_PATH)
+  lockserver.log.info = lambda *args: None
+  lockserver.init_globals()
+
+  def make_binary_proxy(url):
+    rpc.set_binary_marshalling(True)
+    try:
+      return rpc.get_proxy(url)
+    finally:
+      rpc.set_binary_marshalling(False)
+
+  # (name, request handler of the servers, function that returns a proxy)
+  transports = [
+      ('xmlrpclib', SimpleXMLRPCServer.SimpleXMLRPCRequestHandler,
+          xmlrpclib.ServerProxy),
+      ('keep-alive', rpc.KeepAliveXMLRPCRequestHandler, rpc.get_proxy),
+      ('binary', rpc.KeepAliveXMLRPCRequestHandler, make_binary_proxy)]
+
+  print "milliseconds per acquisition of %d" % ACQUISITIONS
+  print
+  print "%-12s %8s %10s %10s" % ('transport', 'vessels', 'mean', 'median')
+
+  port = FIRST_PORT
+  for name, requesthandler, make_proxy in transports:
+    lockserverurl = start_server(port, lockserver.LockserverPublicFunctions(),
+        requesthandler)
+    backendurl = start_server(port + 1, StandInBackend(), requesthandler)
+    port = port + 2
+
+    for vesselcount in VESSEL_COUNTS:
+      mean, median = measure(make_proxy, lockserverurl, backendurl,
+          vesselcount)
+      print "%-12s %8d %10.2f %10.2f" % (name, vesselcount, mean, median)
+      sys.stdout.flush()
+
+  # Close the pooled connections so that the servers' threads are done
+  # before the interpreter exits.
+  for connectionpool in rpc.connection_pool_dict.values():
+    for connection in connectionpool.idle_connections:
+      connection.close()
+  time.sleep(1)
+
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,105 @@
+"""
+<Program Name>
+  session_benchmark.py
+
+<Started>
+  October 18, 2026
+
+<Purpose>
+  Measures the throughput of the session.repy message framing over a
+  loopback TCP connection.   For message sizes from 1KB to 50MB, messages are
+  sent with session_sendmessage and received with session_recvmessage, and
+  then with a SessionSocket on both sides.   The time from the first send to
+  the last receive is used to report the messages per second and MB per
+  second.
+
+  Plain Python sockets are used so that the cost of the framing is not
+  hidden by the sandbox.
+
+<Usage>
+  Copy this into a directory prepared with preparetest.py and run it there:
+
+    python session_benchmark.py [MB per test]
+"""
+
+import sys
+import time
+import socket
+import threading
+
+import repyhelper
+
+repyhelper.translate_and_import("session.repy")
+
+MESSAGE_SIZES = [1024, 65536, 1048576, 10485760, 52428800]
+
+# About this much data is sent for each size (but at least 3 messages)
+MEGABYTES_PER_TEST = 100
+
+IP = '127.0.0.1'
+SERVER_PORT = 41800
+
+
+
+def connected_pair():
+  serversock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+  serversock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+  serversock.bind((IP, SERVER_PORT))
+  serversock.listen(1)
+  clientsock = socket.create_connection((IP, SERVER_PORT))
+  acceptedsock, addr = serversock.accept()
+  serversock.close()
+  return clientsock, acceptedsock
+
+
+
+def run_test(mode, messagesize, messagecount):
+  sendsock, recvsock = connected_pair()
+  message = 'x' * messagesize
+
+  if mode == 'functions':
+    sendmessage = lambda data: session_sendmessage(sendsock, data)
+    recvmessage = lambda: session_recvmessage(recvsock)
+  else:
+    sendmessage = SessionSocket(sendsock).sendmessage
+    recvmessage = SessionSocket(recvsock).recvmessage
+
+  def sender():
+    for count in xrange(messagecount):
+      sendmessage(message)
+
+  start = time.time()
+  sendthread = threading.Thread(target=sender)
+  sendthread.start()
+  for count in xrange(messagecount):
+    assert(len(recvmessage()) == messagesize)
+  elapsed = time.time() - start
+  sendthread.join()
+
+  sendsock.close()
+  recvsock.close()
+  return elapsed
+
+
+
+def main():
+  megabytes = MEGABYTES_PER_TEST
+  if len(sys.argv) > 1:
+    megabytes = int(sys.argv[1])
+
+  print "%-10s %-14s %10s %12s %12s" % ('size', 'mode', 'messages',
+      'messages/s', 'MB/s')
+
+  for messagesize in MESSAGE_SIZES:
+    messagecount = max(3, megabytes * 1048576 / messagesize)
+    for mode in ['functions', 'SessionSocket']:
+      elapsed = run_test(mode, messagesize, messagecount)
+      print "%-10d %-14s %10d %12.1f %12.1f" % (messagesize, mode,
+          messagecount, messagecount / elapsed,
+          messagecount * messagesize / elapsed / 1048576)
+      sys.stdout.flush()
+
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,193 @@
+"""
+<Program Name>
+  shimstack_overhead_benchmark.py
+
+<Started>
+  October 18, 2026
+
+<Purpose>
+  Measures the overhead the shim framework (production_nat_new/src/
+  ShimStack.repy, BaseShim.repy and ShimSocketWrapper.repy) adds to each
+  message, for shim stacks 1 to 8 shims deep.
+
+  The stacks are made of NoopShims, which leave everything to the shims
+  below, or of a shim that passes every send, recv and sendmess on to the
+  shims below itself.   The bottom of the stacks is a stand-in for the repy
+  network API that doesn't send anything, so only the time spent in the
+  shims is measured.   It reports the microseconds per send and recv on a
+  socket of the stack, per sendmess, and to make and to copy a stack.
+
+  If a directory with other versions of the three files is given (for
+  example older versions from git), they are measured too.
+
+<Usage>
+  Copy this into a directory prepared with preparetest.py, along with the
+  files in production_nat_new/src, and run it there:
+
+    python shimstack_overhead_benchmark.py [directory with other versions]
+"""
+
+import os
+import sys
+import time
+import shutil
+
+import repyhelper
+import repypp
+
+DEPTHS = range(1, 9)
+MESSAGES = 20000
+STACKS = 2000
+
+MESSAGE = 'x' * 100
+
+FRAMEWORK_FILES = ['ShimStack.repy', 'BaseShim.repy', 'ShimSocketWrapper.repy']
+
+# The framework files are included from the given directory.   The
+# PassingShim is the shim that passes everything on itself.
+STACK_SOURCE = """
+include %sShimStack.repy
+include ShimException.repy
+include ShimLogger.repy
+include %sBaseShim.repy
+include %sShimSocketWrapper.repy
+include NoopShim.repy
+
+class PassingShim(BaseShim):
+
+  def copy(self):
+    return PassingShim()
+
+  def _shim_sendmess(self, host, port, msg, localhost=None, localport=None):
+    return self.shim_stack.sendmess(host, port, msg, localhost, localport)
+
+  def _shim_socket_send(self, socket, msg):
+    return self.shim_stack.socket_send(socket, msg)
+
+  def _shim_socket_recv(self, socket, bytes):
+    return self.shim_stack.socket_recv(socket, bytes)
+
+register_shim('NoopShim', NoopShim)
+register_shim('PassingShim', PassingShim)
+"""
+
+# The other versions are copied to this directory
+OTHER_DIRECTORY = 'othershimstack'
+
+
+
+def load_framework(directory, modulename):
+  # The framework and the shims are put in one file, since repyhelper
+  # translates each included file to a module of its own.
+  prefix = ''
+  if directory:
+    prefix = directory + '/'
+  open(modulename + '_stack.repy', 'w').write(STACK_SOURCE %
+      (prefix, prefix, prefix))
+  outdata = repypp.processfile(modulename + '_stack.repy')
+  open(modulename + '.repy', 'w').writelines(outdata)
+  module = __import__(repyhelper.translate(modulename + '.repy'))
+
+  # Stand in for the network API below the stacks
+  module.openconn = lambda *args: FakeSocket()
+  module.sendmess = lambda host, port, msg, *args: len(msg)
+  return module
+
+
+
+class FakeSocket:
+  # Stands in for a repy socket.
+
+  def send(self, msg):
+    return len(msg)
+
+  def recv(self, bytes):
+    return MESSAGE[:bytes]
+
+  def close(self):
+    return True
+
+  def willblock(self):
+    return (False, False)
+
+
+
+def microseconds_per(function, count):
+  start = time.time()
+  for number in xrange(count):
+    function()
+  return (time.time() - start) / count * 1000000
+
+
+
+def measure(module, shimname, depth):
+  # Returns the microseconds per (send and recv, sendmess, making a stack,
+  # copying a stack).
+  stackstring = ('(' + shimname + ')') * depth
+
+  stack = module.ShimStack(stackstring, '')
+  socket = stack.openconn('127.0.0.1', 12345)
+
+  def sendrecv():
+    socket.send(MESSAGE)
+    socket.recv(100)
+
+  def sendmess():
+    stack.sendmess('127.0.0.1', 12345, MESSAGE)
+
+  def makestack():
+    module.ShimStack(stackstring, '')
+
+  def copystack():
+    stack.copy()
+
+  return (microseconds_per(sendrecv, MESSAGES),
+      microseconds_per(sendmess, MESSAGES),
+      microseconds_per(makestack, STACKS),
+      microseconds_per(copystack, STACKS))
+
+
+
+def main():
+  # (name, module)
+  versions = [('new', load_framework('', 'shimstack_benchmark_new'))]
+  if len(sys.argv) > 1:
+    if not os.path.isdir(OTHER_DIRECTORY):
+      os.mkdir(OTHER_DIRECTORY)
+    for filename in FRAMEWORK_FILES:
+      shutil.copy(os.path.join(sys.argv[1], filename), OTHER_DIRECTORY)
+    versions.append(('other', load_framework(OTHER_DIRECTORY,
+        'shimstack_benchmark_other')))
+
+  print "microseconds per operation"
+  print
+  print "%-8s %-12s %6s %12s %10s %10s %10s" % ('version', 'shims', 'depth',
+      'send+recv', 'sendmess', 'make', 'copy')
+
+  for shimname in ['NoopShim', 'PassingShim']:
+    for depth in DEPTHS:
+      for versionname, module in versions:
+        sendrecv, sendmess, makestack, copystack = measure(module, shimname,
+            depth)
+        print "%-8s %-12s %6d %12.2f %10.2f %10.2f %10.2f" % (versionname,
+            shimname, depth, sendrecv, sendmess, makestack, copystack)
+        sys.stdout.flush()
+
+  # What the counters of a stack look like
+  if 'shimstack_collect_stats' in dir(versions[0][1]):
+    module = versions[0][1]
+    module.shimstack_collect_stats(True)
+    stack = module.ShimStack('(PassingShim)(NoopShim)(PassingShim)', '')
+    socket = stack.openconn('127.0.0.1', 12345)
+    for number in range(1000):
+      socket.send(MESSAGE)
+      socket.recv(100)
+      stack.sendmess('127.0.0.1', 12345, MESSAGE)
+    print
+    print "Counters of a stack after 1000 sends, recvs and sendmesses:"
+    print stack.dump_layer_stats()
+
+
+
+if __name__ == '__main__':
+  main()
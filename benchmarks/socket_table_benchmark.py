@@ -0,0 +1,106 @@
+"""
+<Program Name>
+  socket_table_benchmark.py
+
+<Started>
+  October 18, 2026
+
+<Purpose>
+  Measures how long emulcomm's checks for existing sockets take on Linux,
+  with linux_api (which reads /proc/net and caches the table for
+  SOCKET_TABLE_CACHE_TTL seconds) and with nix_common_api (which runs
+  netstat -an, as before).   The checks are made with a few sockets open and
+  with 1,000 loopback connections open.   "uncached" clears the cached table
+  before each check, so it includes reading /proc/net.
+
+  The connections are left in TIME_WAIT afterwards, so wait a minute before
+  running it again.
+
+<Usage>
+  Copy this into a directory prepared with preparetest.py and run it there:
+
+    python socket_table_benchmark.py
+"""
+
+import socket
+import sys
+import time
+
+import linux_api
+import nix_common_api
+
+CONNECTION_COUNTS = [0, 1000]
+CALLS = 200
+
+
+
+def open_connections(listensock, count):
+  sockets = []
+  for number in xrange(count):
+    clientsock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    clientsock.connect(listensock.getsockname())
+    sockets.append(clientsock)
+    sockets.append(listensock.accept()[0])
+  return sockets
+
+
+
+def milliseconds_per_call(function, args, calls, before=None):
+  total = 0.0
+  for count in xrange(calls):
+    if before is not None:
+      before()
+    start = time.time()
+    function(*args)
+    total += time.time() - start
+  return total / calls * 1000
+
+
+
+def clear_cache():
+  linux_api.socket_table_cache = None
+
+
+
+def main():
+  listensock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+  listensock.bind(('127.0.0.1', 0))
+  listensock.listen(128)
+  listenport = listensock.getsockname()[1]
+
+  # (name, module, calls, function called before each call)
+  versions = [
+      ('netstat', nix_common_api, CALLS / 10, None),
+      ('uncached', linux_api, CALLS, clear_cache),
+      ('cached', linux_api, CALLS, None)]
+
+  # (name, function name, args)
+  checks = [
+      ('listening', 'exists_listening_network_socket',
+          ('127.0.0.1', listenport, True)),
+      ('outgoing', 'exists_outgoing_network_socket',
+          ('127.0.0.1', 1, '127.0.0.1', listenport))]
+
+  print "milliseconds per call"
+  print
+  print "%12s %-10s %-10s %10s" % ('connections', 'check', 'version', 'ms')
+
+  sockets = []
+  for connectioncount in CONNECTION_COUNTS:
+    sockets += open_connections(listensock, connectioncount - len(sockets) / 2)
+    for checkname, functionname, args in checks:
+      for versionname, module, calls, before in versions:
+        milliseconds = milliseconds_per_call(getattr(module, functionname),
+            args, calls, before)
+        print "%12d %-10s %-10s %10.3f" % (connectioncount, checkname,
+            versionname, milliseconds)
+        sys.stdout.flush()
+
+  for sock in sockets:
+    sock.close()
+  listensock.close()
+
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,232 @@
+"""
+<Program Name>
+  socketselector_benchmark.py
+
+<Started>
+  October 18, 2026
+
+<Purpose>
+  Measures how the repy SocketSelector scales with the number of listening
+  sockets.   For 10, 100 and 1000 listeners (waitforconn on 127.0.0.1) it
+  reports:
+
+    - accept latency: the time from a client's connect() returning until the
+      waitforconn callback runs, for connections to randomly chosen listeners.
+    - idle CPU: the CPU time the process uses per second while all of the
+      listeners are idle.
+
+  Each readiness backend that is available on this system is measured
+  (epoll, poll, select).   select cannot handle file descriptors above
+  FD_SETSIZE (usually 1024), so it may fail at 1000 listeners.
+
+  This drives emulcomm directly (rather than through repy.py) so that the
+  resource monitor and the sandbox don't add noise.
+
+<Usage>
+  Copy this into a directory prepared with preparetest.py and run it there:
+
+    python socketselector_benchmark.py [connections per test] [idle seconds]
+"""
+
+import os
+import sys
+import time
+import random
+import socket
+import tempfile
+import threading
+
+import restrictions
+import nanny
+import emulcomm
+import selectbackend
+
+# The listeners use consecutive ports starting here
+BASE_PORT = 41000
+
+LISTENER_COUNTS = [10, 100, 1000]
+
+CONNECTIONS = 200
+IDLE_SECONDS = 5.0
+
+IP = '127.0.0.1'
+
+
+
+def write_restrictions(listeners):
+  # Allow enough sockets, events and ports for the largest test
+  fd, filename = tempfile.mkstemp(prefix='restrictions.selector.')
+  restrictionfo = os.fdopen(fd, 'w')
+  restrictionfo.write("resource cpu 1.0\n")
+  restrictionfo.write("resource memory 1000000000\n")
+  restrictionfo.write("resource diskused 1000000\n")
+  restrictionfo.write("resource events %d\n" % (listeners + 100))
+  restrictionfo.write("resource filewrite 1000000\n")
+  restrictionfo.write("resource fileread 1000000\n")
+  restrictionfo.write("resource filesopened 10\n")
+  restrictionfo.write("resource insockets %d\n" % (listeners + 10))
+  restrictionfo.write("resource outsockets %d\n" % (listeners + 10))
+  restrictionfo.write("resource netsend 100000000\n")
+  restrictionfo.write("resource netrecv 100000000\n")
+  restrictionfo.write("resource loopsend 100000000\n")
+  restrictionfo.write("resource looprecv 100000000\n")
+  restrictionfo.write("resource lograte 1000000\n")
+  restrictionfo.write("resource random 1000\n")
+  for port in range(BASE_PORT, BASE_PORT + listeners):
+    restrictionfo.write("resource connport %d\n" % port)
+  restrictionfo.write("call waitforconn allow\n")
+  restrictionfo.write("call stopcomm allow\n")
+  restrictionfo.write("call socket.close allow\n")
+  restrictionfo.close()
+  return filename
+
+
+
+def raise_fd_limit(wanted):
+  try:
+    import resource
+  except ImportError:
+    return
+  soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+  if soft < wanted:
+    if hard != resource.RLIM_INFINITY:
+      wanted = min(wanted, hard)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+
+
+
+def cputime():
+  try:
+    import resource
+  except ImportError:
+    usertime, systime = os.times()[:2]
+    return usertime + systime
+  usage = resource.getrusage(resource.RUSAGE_SELF)
+  return usage.ru_utime + usage.ru_stime
+
+
+
+def percentile(values, fraction):
+  values = sorted(values)
+  return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+
+def run_test(backendname, listeners, connections, idleseconds):
+  # Use a fresh backend of the requested type
+  emulcomm.selectorbackend = selectbackend.get_backend(backendname)
+
+  arrivaltimes = {}
+  arrived = threading.Condition()
+
+  def gotconn(remoteip, remoteport, sockobj, thiscommhandle, listencommhandle):
+    arrived.acquire()
+    arrivaltimes[remoteport] = time.time()
+    arrived.notify()
+    arrived.release()
+    sockobj.close()
+
+  handles = []
+  for port in range(BASE_PORT, BASE_PORT + listeners):
+    handles.append(emulcomm.waitforconn(IP, port, gotconn))
+
+  # Let the selector settle before measuring idle CPU
+  time.sleep(0.5)
+  idlestart = cputime()
+  time.sleep(idleseconds)
+  idlecpu = (cputime() - idlestart) / idleseconds
+
+  latencies = []
+  for connection in range(connections):
+    port = random.randint(BASE_PORT, BASE_PORT + listeners - 1)
+    clientsock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    clientsock.connect((IP, port))
+    clientport = clientsock.getsockname()[1]
+    connecttime = time.time()
+
+    arrived.acquire()
+    while clientport not in arrivaltimes:
+      arrived.wait(5.0)
+      if clientport not in arrivaltimes and time.time() - connecttime > 5.0:
+        arrived.release()
+        raise Exception("Connection to listener on port "+str(port)+" was never accepted")
+    latencies.append(arrivaltimes.pop(clientport) - connecttime)
+    arrived.release()
+    clientsock.close()
+
+  # Don't use stopcomm here since it waits for each socket to vanish from
+  # netstat.   Unregistering and closing directly is good enough.
+  for handle in handles:
+    entry = emulcomm.comminfo.pop(handle)
+    emulcomm.selectorbackend.unregister(entry['socket'])
+    entry['socket'].close()
+    nanny.tattle_remove_item('insockets', handle)
+  emulcomm.selectorbackend.wakeup()
+
+  # Wait for the selector to exit so the next test starts a new one
+  while emulcomm.selectorstarted:
+    time.sleep(0.05)
+
+  return latencies, idlecpu
+
+
+
+def main():
+  connections = CONNECTIONS
+  idleseconds = IDLE_SECONDS
+  if len(sys.argv) > 1:
+    connections = int(sys.argv[1])
+  if len(sys.argv) > 2:
+    idleseconds = float(sys.argv[2])
+
+  maxlisteners = max(LISTENER_COUNTS)
+  raise_fd_limit(2 * maxlisteners + 256)
+
+  restrictionsfile = write_restrictions(maxlisteners)
+  try:
+    restrictions.init_restriction_tables(restrictionsfile)
+  finally:
+    os.remove(restrictionsfile)
+  nanny.initialize_consumed_resource_tables()
+
+  backends = []
+  if selectbackend.have_epoll:
+    backends.append('epoll')
+  if selectbackend.have_poll:
+    backends.append('poll')
+  backends.append('select')
+
+  print "%-8s %10s %14s %14s %14s %12s" % ('backend', 'listeners',
+      'mean acc (ms)', 'p50 acc (ms)', 'p99 acc (ms)', 'idle cpu %')
+  for backendname in backends:
+    for listeners in LISTENER_COUNTS:
+      try:
+        latencies, idlecpu = run_test(backendname, listeners, connections, idleseconds)
+      except Exception, e:
+        print "%-8s %10d   failed: %s" % (backendname, listeners, str(e))
+        # Clean up whatever is left so the next test can bind its ports
+        for handle, entry in emulcomm.comminfo.items():
+          del emulcomm.comminfo[handle]
+          try:
+            entry['socket'].close()
+          except Exception:
+            pass
+          nanny.tattle_remove_item('insockets', handle)
+        emulcomm.selectorbackend.wakeup()
+        while emulcomm.selectorstarted:
+          time.sleep(0.05)
+        continue
+
+      print "%-8s %10d %14.3f %14.3f %14.3f %12.2f" % (backendname, listeners,
+          1000 * sum(latencies) / len(latencies),
+          1000 * percentile(latencies, 0.5), 1000 * percentile(latencies, 0.99),
+          100 * idlecpu)
+      sys.stdout.flush()
+
+  # The selector thread is not a daemon, so don't wait for it.
+  os._exit(0)
+
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,122 @@
+"""
+<Program Name>
+  statusstorage_benchmark.py
+
+<Started>
+  October 18, 2026
+
+<Purpose>
+  Measures the cost of the vessel status heartbeats in repy/statusstorage.py,
+  with the current status file (a record written in place) and with the
+  status files it replaced (a new "prefix-status-timestamp" file for each
+  heartbeat).   For 1 to 200 vessels with their status files in one
+  directory (as in the node manager's directory), it reports the
+  microseconds per:
+
+    heartbeat   write_status("Started") for one vessel
+    pass        one pass of the node manager's status monitor, which reads
+                the status of every vessel (read_statuses() now, a
+                read_status() per vessel before)
+
+<Usage>
+  Copy this into a directory prepared with preparetest.py and run it there:
+
+    python statusstorage_benchmark.py
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import statusstorage
+
+VESSEL_COUNTS = [1, 10, 50, 200]
+HEARTBEATS = 2000
+PASSES = 200
+
+
+
+def old_write_status(status, mystatusfilenameprefix):
+  # write_status() as it was before the status was written in place.
+  mystatusdir = os.path.dirname(mystatusfilenameprefix) + '/'
+  existingfiles = os.listdir(mystatusdir)
+  timestamp = time.time()
+  open(mystatusfilenameprefix+"-"+status+"-"+str(timestamp),"w").close()
+  for filename in existingfiles:
+    if len(filename.split('-')) == 3 and filename.split('-')[0] == os.path.basename(mystatusfilenameprefix):
+      try:
+        os.remove(mystatusdir+filename)
+      except OSError, e:
+        if e[0] == 2:
+          continue
+        raise
+
+
+
+def old_read_status(mystatusfilenameprefix):
+  # read_status() as it was before the status was written in place (with the
+  # prefixes matched against the file names without the directory, as the
+  # node manager's relative prefixes were).
+  existingfiles = os.listdir(os.path.dirname(mystatusfilenameprefix))
+  latesttime = 0
+  lateststatus = None
+  for filename in existingfiles:
+    if filename.split('-')[0] == os.path.basename(mystatusfilenameprefix):
+      thisstatus = filename.split('-',2)[1]
+      thistime = float(filename.split('-',2)[2])
+      if thistime > latesttime:
+        latesttime = thistime
+        lateststatus = thisstatus
+  return (lateststatus, latesttime)
+
+
+
+def old_monitor_pass(prefixes):
+  for prefix in prefixes:
+    old_read_status(prefix)
+
+
+
+def microseconds_per_call(function, args, calls):
+  start = time.time()
+  for count in xrange(calls):
+    function(*args)
+  return (time.time() - start) / calls * 1000000
+
+
+
+def main():
+  # (name, write function, function that does a monitor pass)
+  versions = [
+      ('old', old_write_status, old_monitor_pass),
+      ('in place', statusstorage.write_status, statusstorage.read_statuses)]
+
+  print "microseconds per call"
+  print
+  print "%8s %-10s %12s %12s" % ('vessels', 'version', 'heartbeat', 'pass')
+
+  for vesselcount in VESSEL_COUNTS:
+    for versionname, write_status, monitor_pass in versions:
+      dirname = tempfile.mkdtemp(prefix='statusstorage.')
+      try:
+        prefixes = [os.path.join(dirname, 'v' + str(number) + '.status')
+            for number in range(vesselcount)]
+        for prefix in prefixes:
+          write_status('Started', prefix)
+
+        heartbeattime = microseconds_per_call(write_status,
+            ('Started', prefixes[0]), HEARTBEATS)
+        passtime = microseconds_per_call(monitor_pass, (prefixes,), PASSES)
+
+        print "%8d %-10s %12.1f %12.1f" % (vesselcount, versionname,
+            heartbeattime, passtime)
+        sys.stdout.flush()
+      finally:
+        shutil.rmtree(dirname)
+
+
+
+if __name__ == '__main__':
+  main()
@@ -156,10 +156,12 @@ def main(installpath):
     print '\nGrabbing vesseldict from seattle_repy.'
     print '\nFile contents of vesseldict:'
     
-    # we also need to dump the vesseldict file
+    # we also need to dump the vesseldict file.   It may be journaled, so it
+    # is read with the installed persist.py and printed on one line.
     if os.path.isfile(installpath+'/vesseldict'):
-      out, err = shellexec('cat '+installpath+'/vesseldict')
-      format_print(out, err)
+      sys.path.insert(0, installpath)
+      import persist
+      print repr(persist.restore_object(installpath+'/vesseldict'))
     else:
       print '\tvesseldict is missing!!!'
       
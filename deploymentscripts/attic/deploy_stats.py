@@ -129,7 +129,7 @@ def parse_vessel_string(vesseldict_string):
     
   <Arguments>
     vesseldict_string:
-      the vesseldict file dumped as a string.
+      the repr of the vesseldict, as custom.py prints it.
     
   <Exceptions>
     None.
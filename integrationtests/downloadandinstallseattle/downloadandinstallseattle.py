@@ -155,10 +155,11 @@ def main():
     integrationtestlib.log("retrieving vesseldict from installed Seattle")
     dict = {}
     try:
-        f=open(prefix + "/seattle/seattle_repy/vesseldict", "r")
-        lines = f.readlines()
-        f.close()
-        dict = eval(lines[0])
+        # the vesseldict may be journaled, so read it with the installed
+        # persist.py
+        sys.path.insert(0, prefix + "/seattle/seattle_repy")
+        import persist
+        dict = persist.restore_object(prefix + "/seattle/seattle_repy/vesseldict")
     except:
         integrationtestlib.handle_exception("failed to open/read/eval vesseldict file", "seattle downloadandinstall failed!")
         # uninstall Seattle and remove its dir
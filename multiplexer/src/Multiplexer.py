@@ -24,6 +24,14 @@ There are 3 main objects in the Multiplexer
 -- When the multiplexer creates virtual sockets, a MultiplexerSocket is returned. This socket is tied to its parent multiplexer
 -- since that parent buffers all of the incoming data for this socket. 
 
+Frames are sent as text (the header fields are written out in decimal) until the partner multiplexer
+agrees to receive binary frames, which have a fixed size header. See MULTIPLEXER_FORMAT_OFFER.
+
+Each virtual socket may send as much data as its partner has given it credit for. A partner that
+knows MULTIPLEXER_CONN_CREDIT frames returns credit whenever a part of its window was read, and
+grows the window of a socket that is read quickly compared to the round trip time. Older partners
+hand out a whole new buffer (MULTIPLEXER_CONN_BUF_SIZE) once the last one was read.
+
 These three objects are wrapped in several mux_* functions, which abstract the details of the Multiplexer
 and provide a repy like interface for easily multiplexing a normal TCP connection. mux_remap can be used to
 multiplex any type of connection.
@@ -39,12 +47,57 @@ include deserialize.py
 MULTIPLEXER_FRAME_HEADER_DIGITS = 3 
 MULTIPLEXER_FRAME_DIVIDER = ";" # What character is used to divide a frame header
 
+# The header of a binary frame is the message type (1 byte), the content length and the
+# reference ID (4 bytes each, most significant byte first)
+MULTIPLEXER_BINARY_HEADER_SIZE = 9
+
+# Multiplexers talk to each other with MULTIPLEXER_INIT_STATUS frames for
+# MULTIPLEXER_CONTROL_REFERENCE_ID. (Older multiplexers ignore them, since they have no pending
+# socket with that ID.) In binary frames the ID is written as MULTIPLEXER_BINARY_CONTROL_ID.
+MULTIPLEXER_CONTROL_REFERENCE_ID = -1
+MULTIPLEXER_BINARY_CONTROL_ID = 4294967295
+
+# A multiplexer offers to receive binary frames by sending MULTIPLEXER_FORMAT_OFFER. A multiplexer
+# that receives the offer answers with MULTIPLEXER_FORMAT_SWITCH, and every frame it sends after
+# that one is binary. The offer also means that the multiplexer understands
+# MULTIPLEXER_CONN_CREDIT frames and pings.
+MULTIPLEXER_FORMAT_OFFER = "BINARY_OFFER"
+MULTIPLEXER_FORMAT_SWITCH = "BINARY_SWITCH"
+
+# A ping is answered with a pong, which has the time the ping waited for an answer after the
+# prefix. The pong goes out with the next frame that is sent.
+MULTIPLEXER_CONTROL_PING = "PING"
+MULTIPLEXER_CONTROL_PONG = "PONG:"
+
+# How often the round trip time is measured, in seconds, and how many of the last measurements
+# are kept. The smallest is used, since the others include time spent behind other frames.
+MULTIPLEXER_PING_INTERVAL = 5
+MULTIPLEXER_RTT_SAMPLES = 8
+
+# Credit is returned once this fraction (1/n) of the window of a socket was read
+MULTIPLEXER_CREDIT_FRACTION = 4
+
+# The largest window a socket grows to
+MULTIPLEXER_MAX_WINDOW = 1024*1024
+
+# The most data sent in one frame, so that a socket doesn't hold the connection for all of a
+# large send while other sockets wait to send
+MULTIPLEXER_MAX_FRAME_CONTENT = 32*1024
+
+# How much is read from the real socket at once. Frames are parsed out of what was read.
+MULTIPLEXER_RECV_SIZE = 65536
+
+# How much is passed to the real socket at once. The socket may take less, and the rest is
+# sent in pieces of this size so that it is not copied after every send.
+MULTIPLEXER_SEND_SIZE = 65536
+
 # These are the valid Message Types
 MULTIPLEXER_DATA_FORWARD = 0
 MULTIPLEXER_CONN_TERM = 1
 MULTIPLEXER_CONN_BUF_SIZE = 2
 MULTIPLEXER_INIT_CLIENT = 3
 MULTIPLEXER_INIT_STATUS = 4
+MULTIPLEXER_CONN_CREDIT = 5
 
 # Special Case
 MULTIPLEXER_FRAME_NOT_INIT = -1
@@ -207,6 +260,32 @@ class MultiplexerFrame():
   
   
   
+  def initConnCreditFrame(self,referenceID, credit):
+    """
+    <Purpose>
+      Makes the frame a MULTIPLEXER_CONN_CREDIT frame
+
+    <Arguments>
+      referenceID:
+            The referenceID of the socket that may send more.
+            
+      credit:
+            How much more the socket may send.
+    
+    """
+    self.referenceID = referenceID
+
+    # Set the frame content, convert the credit into a string
+    self.content = str(credit)
+
+    # Set the content length
+    self.contentLength = len(self.content)
+
+    # Set the correct frame message type
+    self.mesgType = MULTIPLEXER_CONN_CREDIT
+  
+  
+  
   def initFromSocket(self, inSocket):
     """
     <Purpose>
@@ -235,30 +314,67 @@ class MultiplexerFrame():
       self._parseStringHeader(header)
 
       if self.contentLength != 0:
-        content = ""  # Store the data we have received so far
-        recieved = 0  # Track the amount of data we have
-        
-        # Loop until we receive all of the data
-        while recieved < self.contentLength:
-          newContent = inSocket.recv(self.contentLength - recieved)
-          newLength = len(newContent)
-          
-          # Check the length
-          if newLength == 0:
-            raise EnvironmentError, "Received null dataset!"
-          else:
-            # Store the new data
-            recieved += newLength
-            content += newContent
-        
-        # Assign the content
-        self.content = content
+        self.content = self._recvContent(inSocket)
 
     else:
       raise EnvironmentError, "Unexpected Header Size!"
   
   
   
+  def initFromBinarySocket(self, inSocket):
+    """
+    <Purpose>
+      Constructs a frame object given a socket which contains binary frames.
+
+    <Arguments>
+      inSocket:
+            The socket to read from.
+    
+    <Exceptions>
+      An EnvironmentError will be raised if the header is incomplete. This could happen if the socket is closed.
+    """
+    header = inSocket.recv(MULTIPLEXER_BINARY_HEADER_SIZE)
+    
+    if len(header) != MULTIPLEXER_BINARY_HEADER_SIZE:
+      raise EnvironmentError, "Unexpected Header Size!"
+    
+    # Setup header
+    self.mesgType = ord(header[0])
+    self.contentLength = _mux_unpack_int(header, 1)
+    self.referenceID = _mux_unpack_int(header, 5)
+    if self.referenceID == MULTIPLEXER_BINARY_CONTROL_ID:
+      self.referenceID = MULTIPLEXER_CONTROL_REFERENCE_ID
+    
+    if self.contentLength != 0:
+      self.content = self._recvContent(inSocket)
+  
+  
+  
+  # Receives the content of the frame, given that the header is set
+  def _recvContent(self, inSocket):
+    content = []  # Store the data we have received so far
+    recieved = 0  # Track the amount of data we have
+    
+    # Loop until we receive all of the data
+    while recieved < self.contentLength:
+      newContent = inSocket.recv(self.contentLength - recieved)
+      newLength = len(newContent)
+      
+      # Check the length
+      if newLength == 0:
+        raise EnvironmentError, "Received null dataset!"
+      else:
+        # Store the new data
+        recieved += newLength
+        content.append(newContent)
+    
+    # Usually this was received at once
+    if len(content) == 1:
+      return content[0]
+    return "".join(content)
+  
+  
+  
   # Takes a string representing the header, and initializes the frame  
   def _parseStringHeader(self, header):
     # Explode based on the divider
@@ -281,11 +397,15 @@ class MultiplexerFrame():
       raise EnvironmentError, "Failed to parse header: "+header+" with fields: "+str(headerFields)    
     
     
-  def toString(self):
+  def toString(self, binary=False):
     """
     <Purpose>
       Converts the frame to a string.
 
+    <Arguments>
+      binary:
+        If True, the frame is converted to a binary frame.
+
     <Exceptions>
       Raises an AttributeError exception if the frame is not yet initialized.
       
@@ -295,6 +415,16 @@ class MultiplexerFrame():
     if self.mesgType == MULTIPLEXER_FRAME_NOT_INIT:
       raise AttributeError, "Frame is not yet initialized!"
     
+    if binary:
+      referenceID = self.referenceID
+      if referenceID == MULTIPLEXER_CONTROL_REFERENCE_ID:
+        referenceID = MULTIPLEXER_BINARY_CONTROL_ID
+      elif referenceID < 0:
+        raise AttributeError, "Binary frames cannot have a negative reference ID!"
+      
+      return chr(self.mesgType) + _mux_pack_int(self.contentLength) + \
+             _mux_pack_int(referenceID) + self.content
+    
     # Create header
     frameHeader = MULTIPLEXER_FRAME_DIVIDER + str(self.mesgType) + MULTIPLEXER_FRAME_DIVIDER + str(self.contentLength) + \
                   MULTIPLEXER_FRAME_DIVIDER + str(self.referenceID) + MULTIPLEXER_FRAME_DIVIDER
@@ -309,6 +439,80 @@ class MultiplexerFrame():
     
 
 
+# Converts a non-negative integer to the 4 bytes used in binary frame headers
+def _mux_pack_int(number):
+  return chr((number >> 24) & 255) + chr((number >> 16) & 255) + chr((number >> 8) & 255) + chr(number & 255)
+
+# Converts 4 bytes of a binary frame header, starting at start, back to an integer
+def _mux_unpack_int(data, start):
+  return (ord(data[start]) << 24) | (ord(data[start+1]) << 16) | (ord(data[start+2]) << 8) | ord(data[start+3])
+
+
+
+# Reads from a socket in large pieces, so that a frame doesn't take several small
+# reads of the real socket
+class MultiplexerReader():
+  
+  def __init__(self, socket):
+    # The socket to read from
+    self.socket = socket
+    
+    # Data that was read but not returned yet, starting at offset
+    self.data = ""
+    self.offset = 0
+  
+  def recv(self, bytes):
+    """
+    <Purpose>
+      Reads exactly bytes from the socket. This blocks until they are available.
+    
+    <Arguments>
+      bytes:
+        The amount to read.
+        
+    <Exceptions>
+      An EnvironmentError is raised if the socket is closed. Exceptions from the socket's recv are passed on.
+    
+    <Returns>
+      A string of length bytes.
+    """
+    available = len(self.data) - self.offset
+    
+    # Is it all buffered already?
+    if available >= bytes:
+      start = self.offset
+      self.offset += bytes
+      return self.data[start:self.offset]
+    
+    # Take what is buffered, then read until we have enough.
+    pieces = []
+    if available > 0:
+      pieces.append(self.data[self.offset:])
+    self.data = ""
+    self.offset = 0
+    
+    while available < bytes:
+      newData = self.socket.recv(MULTIPLEXER_RECV_SIZE)
+      if len(newData) == 0:
+        raise EnvironmentError, "Received null dataset!"
+      
+      needed = bytes - available
+      available += len(newData)
+      
+      # Keep whatever is past what we need for the next call
+      if len(newData) > needed:
+        self.data = newData
+        self.offset = needed
+        newData = newData[:needed]
+        
+      pieces.append(newData)
+    
+    if len(pieces) == 1:
+      return pieces[0]
+    return "".join(pieces)
+    
+
+
 # This helps abstract the details of a Multiplexed connection    
 class Multiplexer():
   
@@ -338,6 +542,28 @@ class Multiplexer():
       # This is the main socket
       self.socket = socket 
 
+      # Frames are read through this, so that the socket is read in large pieces
+      self.reader = MultiplexerReader(socket)
+
+      # Are the frames we send and receive binary? See MULTIPLEXER_FORMAT_OFFER
+      self.sendBinary = False
+      self.recvBinary = False
+
+      # Does our partner return credit with MULTIPLEXER_CONN_CREDIT frames?
+      self.peerCredits = False
+
+      # The round trip time to our partner, in seconds, or None if it was not measured.
+      # It is the smallest of the last few measurements in rttSamples.
+      self.rtt = None
+      self.rttSamples = []
+
+      # When our ping was sent, if it was not answered yet, and when the next one may be sent
+      self.pingSent = None
+      self.nextPing = 0
+
+      # When a ping from our partner arrived, if it was not answered yet
+      self.pongOwed = None
+
       # This dictionary contains information about this socket
       # This just has some junk default values, and is filled in during init
       self.socketInfo = {"localip":"127.0.0.1","localport":0,"remoteip":"127.0.0.1","remoteport":0}
@@ -372,6 +598,15 @@ class Multiplexer():
       
       # Callback function in case of fatal error
       self.errorDelegate = None
+      
+      # Offer to receive binary frames
+      offer = MultiplexerFrame()
+      offer.initResponseFrame(MULTIPLEXER_CONTROL_REFERENCE_ID, MULTIPLEXER_FORMAT_OFFER)
+      try:
+        self._sendFrame(offer)
+      except EnvironmentError:
+        # The multiplexer is closed, and the error is stored
+        pass
         
       # Launch event to handle the multiplexing
       # Wait a few seconds so that the user has a chance to set waitforconn
@@ -503,7 +738,10 @@ class Multiplexer():
       self.readLock.acquire()
       
       # Construct frame, this blocks
-      frame.initFromSocket(self.socket)
+      if self.recvBinary:
+        frame.initFromBinarySocket(self.reader)
+      else:
+        frame.initFromSocket(self.reader)
    
     except Exception, exp:
       # Store the error
@@ -522,7 +760,8 @@ class Multiplexer():
     return frame
 
   # Private: Sends a single frame
-  def _sendFrame(self,frame):
+  # If startBinary is True, all of the frames sent after this one are binary
+  def _sendFrame(self,frame,startBinary=False):
     # Check if we are initialized
     if not self.isAlive():
       raise AttributeError, "Multiplexer is not yet initialized or is closed!"
@@ -531,8 +770,25 @@ class Multiplexer():
       # Get the send lock
       self.writeLock.acquire()
 
-      # Send the frame!
-      self.socket.send(frame.toString())
+      data = frame.toString(self.sendBinary)
+      
+      # Answer a ping from our partner along with it, in the format of the frames after this one
+      if self.pongOwed != None:
+        pong = MultiplexerFrame()
+        pong.initResponseFrame(MULTIPLEXER_CONTROL_REFERENCE_ID, MULTIPLEXER_CONTROL_PONG + str(getruntime() - self.pongOwed))
+        self.pongOwed = None
+        data += pong.toString(self.sendBinary or startBinary)
+      
+      # Send the frame! The socket may not take all of it at once.
+      if len(data) <= MULTIPLEXER_SEND_SIZE:
+        sent = self.socket.send(data)
+      else:
+        sent = 0
+      while sent < len(data):
+        sent += self.socket.send(data[sent:sent + MULTIPLEXER_SEND_SIZE])
+      
+      if startBinary:
+        self.sendBinary = True
     
     except Exception, exp:
       # Store the error
@@ -571,6 +827,21 @@ class Multiplexer():
     # Send it!
     self._sendFrame(frame)
 
+  # Private: Sends a ping to measure the round trip time, if it is time for one
+  def _ping(self):
+    # Only partners that know about pings get them, and one is sent at a time
+    if not self.peerCredits or self.pingSent != None or getruntime() < self.nextPing:
+      return
+    
+    ping = MultiplexerFrame()
+    ping.initResponseFrame(MULTIPLEXER_CONTROL_REFERENCE_ID, MULTIPLEXER_CONTROL_PING)
+    self.pingSent = getruntime()
+    try:
+      self._sendFrame(ping)
+    except:
+      # The multiplexer may be closed
+      pass
+
   def openconn(self, desthost, destport, localip=None,localport=None,timeout=15):
     """
     <Purpose>
@@ -608,53 +879,49 @@ class Multiplexer():
     # Setup the frame
     frame.initClientFrame(requestedID, desthost, destport, localip, localport)
     
-   
+    # Create info dictionary
+    info  = {"localip":localip,"localport":localport,"remoteip":desthost,"remoteport":destport}
     
     # Add this request to the pending sockets, add a bool to hold if this was successful, and a lock that we use for blocking
     # The third element is a timer handle, that is used for the timeout
-    self.pendingSockets[requestedID] = [False, getlock(), None]
+    # The fourth element is the info for the socket, which is replaced by the socket once our partner confirms
+    self.pendingSockets[requestedID] = [False, getlock(), None, info]
     
-    # Send the request
-    self._sendFrame(frame)
-
-    # Now we block until the request is handled, or until we reach the timeout
+    # Acquire the lock before sending the request, so that a quick response can release it
+    self.pendingSockets[requestedID][1].acquire()
     
     # Set a timer to unblock us after a timeout
     self.pendingSockets[requestedID][2] = settimer(timeout, self._openconn_timeout, [requestedID])
     
-    # Acquire the lock twice, and wait for it to be release
-    self.pendingSockets[requestedID][1].acquire()
+    # Send the request
+    self._sendFrame(frame)
+
+    # Now we block until the request is handled, or until we reach the timeout
+    # Acquire the lock again, and wait for it to be released
     self.pendingSockets[requestedID][1].acquire()
     
+    # Hold the virtual sockets lock while removing the request, so that _pending_client either
+    # registers the socket before we look at it, or sees that we gave up
+    self.virtualSocketsLock.acquire()
+    
     # Were we successful?
     success = self.pendingSockets[requestedID][0]
     
     # Get the timer handle
     handle = self.pendingSockets[requestedID][2]
     
+    # Get the virtual socket
+    socket = self.pendingSockets[requestedID][3]
+    
     # Remove the request
     del self.pendingSockets[requestedID]
     
+    # Release the dictionary lock
+    self.virtualSocketsLock.release()
+    
     # At this point we've been unblocked, so were we successful?
     if success:
-      # Create info dictionary
-      info  = {"localip":localip,"localport":localport,"remoteip":desthost,"remoteport":destport}
-      
-      # Return a virtual socket
-      socket = MultiplexerSocket(requestedID, self, self.defaultBufSize, info)
-      
-      # By default there is no data, so set the lock
-      socket.socketLocks["nodata"].acquire()
-      
-      # Lock the virtual sockets dictionary
-      self.virtualSocketsLock.acquire()
-      
-      # Create the entry for it, add the data to it
-      self.virtualSockets[requestedID] = socket
-      
-      # Release the dictionary lock
-      self.virtualSocketsLock.release()
-      
+      # Return the virtual socket
       return socket
       
     # We failed or timed out  
@@ -751,6 +1018,31 @@ class Multiplexer():
     # Release the socket
     socket.socketLocks["send"].release()
     
+  # Handles a MULTIPLEXER_CONN_CREDIT message
+  # Increases the amount we can send out by the credit
+  def _conn_credit(self,socket, num):
+    # The socket may be closed by another thread, which clears these
+    locks = socket.socketLocks
+    info = socket.bufferInfo
+    if locks == None or info == None:
+      return
+    
+    # Acquire a lock for the socket
+    locks["send"].acquire()
+    
+    # Increase the buffer size
+    info["outgoing"] += num
+    
+    # Release the outgoing lock, this unblocks socket.send
+    try:
+      locks["outgoing"].release()
+    except:
+      # That means the lock was already released
+      pass
+    
+    # Release the socket
+    locks["send"].release()
+    
   # Handles a new client connecting
   def _new_client(self, frame, refID):
     # Do an internal error check
@@ -817,8 +1109,8 @@ class Multiplexer():
     # Acquire a lock for the socket
     socket.socketLocks["recv"].acquire()
     
-    # Increase the buffer size
-    socket.buffer += frame.content
+    # Add the data to the buffer
+    socket._bufferAppend(frame.content)
     
     # Release the outgoing lock, this unblocks socket.send
     try:
@@ -833,8 +1125,19 @@ class Multiplexer():
   
   # Handles MULTIPLEXER_INIT_STATUS messages for a pending client
   def _pending_client(self, frame, refID):
-    # Return if the referenced client is not in the pending list
+    # Lock the virtual sockets dictionary, openconn holds it while it removes the request
+    self.virtualSocketsLock.acquire()
+    
+    # If the referenced client is not in the pending list, then openconn has given up on it
     if not (refID in self.pendingSockets):
+      abandoned = frame.content == MULTIPLEXER_STATUS_CONFIRMED and not (refID in self.virtualSockets)
+      self.virtualSocketsLock.release()
+      
+      # If our partner opened the connection anyway, tell it to close it, since nobody will
+      if abandoned:
+        termFrame = MultiplexerFrame()
+        termFrame.initConnTermFrame(refID)
+        self._sendFrame(termFrame)
       return
     
     # Cancel the timeout timer
@@ -851,12 +1154,56 @@ class Multiplexer():
     # Has our partner confirmed the connection? If so, then update the pending socket
     if frame.content == MULTIPLEXER_STATUS_CONFIRMED:
       self.pendingSockets[refID][0] = True
+      
+      # Create the virtual socket now, since our partner may send data on it before openconn runs again
+      socket = MultiplexerSocket(refID, self, self.defaultBufSize, self.pendingSockets[refID][3])
+      
+      # By default there is no data, so set the lock
+      socket.socketLocks["nodata"].acquire()
+      
+      # Create the entry for it
+      self.virtualSockets[refID] = socket
+      
+      self.pendingSockets[refID][3] = socket
     
     # Unblock openconn
     try:
       self.pendingSockets[refID][1].release()
     except:
       pass
+    
+    # Release the dictionary lock
+    self.virtualSocketsLock.release()
+  
+  # Handles the frames our partner sends for MULTIPLEXER_CONTROL_REFERENCE_ID
+  def _control_frame(self, frame):
+    # Our partner can receive binary frames, so tell it that the rest are binary
+    if frame.content == MULTIPLEXER_FORMAT_OFFER and not self.sendBinary:
+      self.peerCredits = True
+      switch = MultiplexerFrame()
+      switch.initResponseFrame(MULTIPLEXER_CONTROL_REFERENCE_ID, MULTIPLEXER_FORMAT_SWITCH)
+      self._sendFrame(switch, startBinary=True)
+    
+    # The frames after this one are binary
+    elif frame.content == MULTIPLEXER_FORMAT_SWITCH:
+      self.recvBinary = True
+    
+    # Answer with the next frame we send. This thread doesn't send it, so that it keeps reading
+    # even if the real socket is full.
+    elif frame.content == MULTIPLEXER_CONTROL_PING:
+      self.pongOwed = getruntime()
+    
+    # Our ping was answered
+    elif frame.content.startswith(MULTIPLEXER_CONTROL_PONG) and self.pingSent != None:
+      now = getruntime()
+      rtt = now - self.pingSent - float(frame.content[len(MULTIPLEXER_CONTROL_PONG):])
+      self.pingSent = None
+      self.nextPing = now + MULTIPLEXER_PING_INTERVAL
+      
+      self.rttSamples.append(max(rtt, 0.0))
+      if len(self.rttSamples) > MULTIPLEXER_RTT_SAMPLES:
+        del self.rttSamples[0]
+      self.rtt = min(self.rttSamples)
   
   # Simple function to determine if a client is connected,
   # and if so returns their virtual socket
@@ -899,6 +1246,11 @@ class Multiplexer():
         if not self.isAlive():
           break 
       
+        # Handle the frames from our partner multiplexer
+        if refID == MULTIPLEXER_CONTROL_REFERENCE_ID and frameType == MULTIPLEXER_INIT_STATUS:
+          self._control_frame(frame)
+          continue
+      
         # Get the virtual socket if it exists
         socket = self._virtualSock(refID)
       
@@ -917,8 +1269,15 @@ class Multiplexer():
             self._closeCONN(socket, refID)
       
         # Handle MULTIPLEXER_CONN_BUF_SIZE
-        elif socket != None and frameType == MULTIPLEXER_CONN_BUF_SIZE:
-          self. _conn_buf_size(socket, int(frame.content))
+        elif frameType == MULTIPLEXER_CONN_BUF_SIZE:
+          # The socket may have been closed after our partner read from it
+          if socket != None:
+            self. _conn_buf_size(socket, int(frame.content))
+      
+        # Handle MULTIPLEXER_CONN_CREDIT
+        elif frameType == MULTIPLEXER_CONN_CREDIT:
+          if socket != None:
+            self._conn_credit(socket, int(frame.content))
           
         # Handle MULTIPLEXER_DATA_FORWARD
         elif frameType == MULTIPLEXER_DATA_FORWARD:
@@ -980,11 +1339,20 @@ class MultiplexerSocket():
     # Socket information
     self.socketInfo = {"closed":False,"localip":"","localport":0,"remoteip":"","remoteport":0}
     
-    # Actual buffer of unread data
-    self.buffer = ""
+    # Actual buffer of unread data. This is a list of the data received in each frame,
+    # in order. Entries before bufferHead were read, and bufferOffset bytes of the entry
+    # at bufferHead were read. bufferSize is the amount of unread data.
+    self.buffer = []
+    self.bufferHead = 0
+    self.bufferOffset = 0
+    self.bufferSize = 0
     
     # Buffering Information
-    self.bufferInfo = {"incoming":buf,"outgoing":buf}
+    # incoming is what is left of the buffer given to an older partner. If the partner
+    # takes credit, window is how much it may have sent that was not read yet, and credit
+    # is how much was read since credit was last returned. consumed is how much was read
+    # since sampleStart, which is used to grow the window once per round trip.
+    self.bufferInfo = {"incoming":buf,"outgoing":buf,"window":buf,"credit":0,"consumed":0,"sampleStart":getruntime()}
 
     # Various locks used in the socket
     self.socketLocks = {"recv":getlock(),"send":getlock(),"nodata":getlock(),"outgoing":getlock()}
@@ -1021,6 +1389,7 @@ class MultiplexerSocket():
     self.mux = None
     self.socketInfo = None
     self.buffer = None
+    self.bufferSize = 0
     self.bufferInfo = None
 
     try:
@@ -1032,7 +1401,7 @@ class MultiplexerSocket():
   # Checks if the socket is closed, and handles it
   def _handleClosed(self):
     # Check if the socket is closed from the other side  
-    if self.socketInfo["closed"] and len(self.buffer) < 1:
+    if self.socketInfo["closed"] and self.bufferSize < 1:
       self.close() # Clean-up
       raise EnvironmentError, "The socket has been closed!"
     elif self.socketInfo["closed"]:
@@ -1042,7 +1411,7 @@ class MultiplexerSocket():
     
     # handle the case where the socket was closed and recv is called
   def _handleClosed_recv(self):  
-    if self.socketInfo["closed"] and len(self.buffer) < 1:
+    if self.socketInfo["closed"] and self.bufferSize < 1:
       self.close() # Clean-up
       raise EnvironmentError, "The socket has been closed!"
     
@@ -1089,36 +1458,15 @@ class MultiplexerSocket():
     # Get our own lock
     self.socketLocks["recv"].acquire()
   
-    # Read up to bytes
-    data = self.buffer[:bytes] 
+    # Read up to bytes, removing it from the buffer
+    data = self._bufferTake(bytes)
     amountIn = len(data)
-    
-    # Remove what we read from the buffer
-    self.buffer = self.buffer[bytes:] 
-  
-    # Reduce amount of incoming data available
-    self.bufferInfo["incoming"] -= amountIn
   
-    # Check if there is more incoming buffer available, if not, send a MULTIPLEXER_CONN_BUF_SIZE
-    # This does not count against the outgoingAvailable quota
-    if self.bufferInfo["incoming"] <= 0:
-      # Create MULTIPLEXER_CONN_BUF_SIZE frame
-      buf_frame = MultiplexerFrame()
-      buf_frame.initConnBufSizeFrame(self.id, self.mux.defaultBufSize)
-      
-      # Send it
-      try:
-        self.mux._sendFrame(buf_frame)
-      except:
-        # The multiplexer may be closed
-        # Check if the socket is closed
-        self._handleClosed()
-      
-      # Increase our incoming buffer
-      self.bufferInfo["incoming"] = self.mux.defaultBufSize
+    # Let our partner send more
+    self._returnCredit(amountIn)
     
     # Set the no data lock if there is none
-    if len(self.buffer) == 0:
+    if self.bufferSize == 0:
       self.socketLocks["nodata"].acquire()
       
     # Release the lock
@@ -1138,6 +1486,114 @@ class MultiplexerSocket():
     else:
       return data
 
+  # Tells our partner that amount was read, so that it can send more. The recv lock must be held.
+  def _returnCredit(self, amount):
+    info = self.bufferInfo
+    
+    # Older partners get a new buffer once the last one was read
+    # This does not count against the outgoingAvailable quota
+    if not self.mux.peerCredits:
+      # Reduce amount of incoming data available
+      info["incoming"] -= amount
+      
+      # Check if there is more incoming buffer available, if not, send a MULTIPLEXER_CONN_BUF_SIZE
+      if info["incoming"] <= 0:
+        # Create MULTIPLEXER_CONN_BUF_SIZE frame
+        buf_frame = MultiplexerFrame()
+        buf_frame.initConnBufSizeFrame(self.id, self.mux.defaultBufSize)
+        
+        # Send it
+        try:
+          self.mux._sendFrame(buf_frame)
+        except:
+          # The multiplexer may be closed
+          # Check if the socket is closed
+          self._handleClosed()
+        
+        # Increase our incoming buffer
+        info["incoming"] = self.mux.defaultBufSize
+      return
+    
+    info["credit"] += amount
+    info["consumed"] += amount
+    
+    # Once per round trip, check how much was read. If it was more than half of the window,
+    # our partner was probably waiting for credit, so double the window (or grow it to twice
+    # what was read). The window doesn't shrink, since memory is only used if data is not read.
+    rtt = self.mux.rtt
+    now = getruntime()
+    if rtt != None and now - info["sampleStart"] >= rtt:
+      if info["consumed"] * 2 > info["window"] and info["window"] < MULTIPLEXER_MAX_WINDOW:
+        window = min(info["consumed"] * 2, MULTIPLEXER_MAX_WINDOW)
+        info["credit"] += window - info["window"]
+        info["window"] = window
+      
+      info["consumed"] = 0
+      info["sampleStart"] = now
+    
+    # Return the credit once a part of the window was read
+    if info["credit"] >= info["window"] / MULTIPLEXER_CREDIT_FRACTION:
+      credit_frame = MultiplexerFrame()
+      credit_frame.initConnCreditFrame(self.id, info["credit"])
+      
+      try:
+        self.mux._sendFrame(credit_frame)
+      except:
+        # The multiplexer may be closed
+        # Check if the socket is closed
+        self._handleClosed()
+      
+      info["credit"] = 0
+      
+      # Keep the round trip time up to date
+      self.mux._ping()
+  
+  # Adds received data to the end of the buffer. The recv lock must be held.
+  def _bufferAppend(self, data):
+    self.buffer.append(data)
+    self.bufferSize += len(data)
+  
+  # Removes up to bytes from the front of the buffer and returns them. The recv
+  # lock must be held. The data of a frame that is read all at once is not copied.
+  def _bufferTake(self, bytes):
+    pieces = []
+    needed = bytes
+    
+    while needed > 0 and self.bufferHead < len(self.buffer):
+      chunk = self.buffer[self.bufferHead]
+      available = len(chunk) - self.bufferOffset
+      
+      if available <= needed:
+        # Use the rest of this chunk
+        if self.bufferOffset == 0:
+          pieces.append(chunk)
+        else:
+          pieces.append(chunk[self.bufferOffset:])
+        needed -= available
+        self.buffer[self.bufferHead] = None
+        self.bufferHead += 1
+        self.bufferOffset = 0
+      
+      else:
+        # Use part of this chunk
+        pieces.append(chunk[self.bufferOffset:self.bufferOffset + needed])
+        self.bufferOffset += needed
+        needed = 0
+    
+    # Drop the chunks that were read once they are a good part of the list
+    if self.bufferHead == len(self.buffer):
+      self.buffer = []
+      self.bufferHead = 0
+    elif self.bufferHead > 32 and self.bufferHead * 2 > len(self.buffer):
+      del self.buffer[:self.bufferHead]
+      self.bufferHead = 0
+    
+    self.bufferSize -= bytes - needed
+    
+    if len(pieces) == 1:
+      return pieces[0]
+    return "".join(pieces)
+  
   def send(self,data):
     """
     <Purpose>
@@ -1158,9 +1614,12 @@ class MultiplexerSocket():
     # Input sanity
     if fullDataLength == 0:
       raise ValueError, "Cannot send a null data-set!"
+    
+    # How much of the data is sent
+    offset = 0
         
-    # Send chunks of data until it is all sent
-    while True:
+    # Send frames of data until it is all sent
+    while offset < fullDataLength:
       # Check if the socket is closed
       self._handleClosed()
         
@@ -1178,55 +1637,35 @@ class MultiplexerSocket():
       # Get our own lock
       self.socketLocks["send"].acquire()
       
-      # How much outgoing traffic is available?
-      outgoingAvailable = self.bufferInfo["outgoing"]
-      
-      # If we can, just send it all at once
-      if len(data) < outgoingAvailable:
-        try:
-          # Instruct the multiplexer object to send our data
-          self.mux._send(self.id, data)
-        except AttributeError:
-          # The multiplexer may be closed
-          # Check if the socket is closed
-          self._handleClosed()
-        
-        # Reduce the size of outgoing avail
-        self.bufferInfo["outgoing"] -= len(data)
-        
-        # Release the lock
-        self.socketLocks["send"].release()
-          
-        # We need to explicitly leave the loop
-        break
-        
-      # We need to send chunks, while waiting for more outgoing B/W
+      # Send as much as we may, in a frame that is not too large
+      amount = min(fullDataLength - offset, self.bufferInfo["outgoing"], MULTIPLEXER_MAX_FRAME_CONTENT)
+      if amount == fullDataLength:
+        chunk = data
       else:
-        # Get a chunk of data, and send it
-        chunk = data[:outgoingAvailable]
-        try:
-          # Instruct the multiplexer object to send our data
-          self.mux._send(self.id, chunk)
-        except AttributeError:
-          # The multiplexer may be closed
-          # Check if the socket is closed
-          self._handleClosed()
+        chunk = data[offset:offset + amount]
       
-        # Reduce the size of outgoing avail
-        self.bufferInfo["outgoing"] = 0
-
-        # Lock the outgoing lock, so that we block until we get a MULTIPLEXER_CONN_BUF_SIZE message
+      try:
+        # Instruct the multiplexer object to send our data
+        self.mux._send(self.id, chunk)
+      except AttributeError:
+        # The multiplexer may be closed
+        # Check if the socket is closed
+        self._handleClosed()
+      except EnvironmentError:
+        # The real socket failed, which closed the multiplexer and this socket
+        self._handleClosed()
+        raise
+      
+      # Reduce the size of outgoing avail
+      self.bufferInfo["outgoing"] -= amount
+      offset += amount
+      
+      # Lock the outgoing lock if we used it all, so that we block until we get more credit
+      if self.bufferInfo["outgoing"] <= 0:
         self.socketLocks["outgoing"].acquire()
       
-        # Trim data to only what isn't sent syet
-        data = data[outgoingAvailable:]
-    
-        # Release the lock
-        self.socketLocks["send"].release()
-        
-        # If there is no data left to send, then break
-        if len(data) == 0:
-          break
+      # Release the lock
+      self.socketLocks["send"].release()
     
     # Return bytes sent, which is always the full message
     # since we will block indefinately until everything is sent.
@@ -1636,7 +2075,9 @@ def mux_stopall():
   # Map this close to all existing multiplexers
   for (key, mux) in MULTIPLEXER_OBJECTS.items():
     mux.close()
-    del MULTIPLEXER_OBJECTS[key]
+    # The error delegate of its partner may have removed it already
+    if key in MULTIPLEXER_OBJECTS:
+      del MULTIPLEXER_OBJECTS[key]
   
   # Stop all underlying waitforconns
   for key in MULTIPLEXER_WAIT_HANDLES.keys():
@@ -1,11 +1,28 @@
-# This test tries to use mux_waitforconn and mux_openconn.
-# It then attempts to exchange the numbers 1 to 100
+# This benchmark uses mux_waitforconn and mux_openconn.
+# First it exchanges the numbers 1 to n for MESSAGE_SECONDS and reports the messages per second.
+# Then it measures the throughput of bulk transfers over 1 to 64 virtual sockets at once.
+#
+# Run it with restrictions.benchmark, which allows an event for each virtual socket:
+#   python repy.py restrictions.benchmark speed_benchmark.py
 
 # Get the Multiplexer
 include Multiplexer.py
 
 INTERVAL = 49
 
+# How long to exchange messages for
+MESSAGE_SECONDS = 10
+
+# How many virtual sockets send at once, and how much they send in total
+THROUGHPUT_SOCKETS = [1, 2, 4, 8, 16, 32, 64]
+THROUGHPUT_BYTES = 16 * 1024 * 1024
+
+# How much is sent and received at once
+THROUGHPUT_BLOCK_SIZE = 16 * 1024
+
+# The virtual port for the bulk transfers
+THROUGHPUT_PORT = 20000
+
 # Handle a new virtual connection
 def new_virtual_conn(remoteip, remoteport, virtualsock, junk, multiplexer):
   num = 0
@@ -19,7 +36,7 @@ def new_virtual_conn(remoteip, remoteport, virtualsock, junk, multiplexer):
     else:
       print "Serv. Unexpected number! Expected: ", str(num), " Received: ",data
       part += data
-      
+
       if part == str(num):
         part = ""
         num = num + 1
@@ -27,48 +44,101 @@ def new_virtual_conn(remoteip, remoteport, virtualsock, junk, multiplexer):
         num = num + 1
 
 
+# Receives a bulk transfer until the sender closes the socket
+def bulk_receiver(remoteip, remoteport, virtualsock, junk, multiplexer):
+  received = 0
+  while True:
+    try:
+      data = virtualsock.recv(THROUGHPUT_BLOCK_SIZE)
+    except EnvironmentError:
+      break
+    received += len(data)
+
+  mycontext["lock"].acquire()
+  mycontext["received"] += received
+  mycontext["finished"] += 1
+  mycontext["lock"].release()
+
+
+# Sends amount bytes over the socket, then closes it
+def bulk_sender(virtualsock, amount):
+  block = "x" * THROUGHPUT_BLOCK_SIZE
+  while amount > 0:
+    if amount < len(block):
+      block = block[:amount]
+    virtualsock.send(block)
+    amount -= len(block)
+  virtualsock.close()
+
+
+# Measures the throughput with socketcount virtual sockets sending at once
+def measure_throughput(socketcount):
+  mycontext["received"] = 0
+  mycontext["finished"] = 0
+
+  sockets = []
+  for count in range(socketcount):
+    sockets.append(mux_openconn("127.0.0.1", 12345, virtualport=THROUGHPUT_PORT))
+
+  start = getruntime()
+  for virtualsock in sockets:
+    settimer(0, bulk_sender, (virtualsock, THROUGHPUT_BYTES / socketcount))
+
+  while mycontext["finished"] < socketcount:
+    sleep(0.01)
+  elapsed = getruntime() - start
+
+  print str(socketcount).rjust(8), str(round(mycontext["received"] / elapsed / (1024*1024), 2)).rjust(12)
+
+
 # Setup a waitforconn on a real socket
 mux_waitforconn("127.0.0.1", 12345, new_virtual_conn)
+mux_virtual_waitforconn("127.0.0.1", THROUGHPUT_PORT, bulk_receiver)
 
 # Try to connect to the other multiplexer
 virtualsock = mux_openconn("127.0.0.1", 12345)
 
 start = getruntime()
 maxrate = 0
-try:
-  data = "-1"
-  num = -1
-  part = ""
-  while True:
-    try:
-      if (num % INTERVAL) == 0:
-        time = getruntime()-start
-        avg = (num/time)
-        INTERVAL = (int(avg)/2)*4-1
-        maxrate = max(maxrate, avg)
-        print round(time,2), "Average", round(avg,2), "mesg./sec.","("+str(num)+")"
-    except ZeroDivisionError:
-      INTERVAL = 50
-      
-    if data == str(num):
+data = "-1"
+num = -1
+part = ""
+while getruntime() - start < MESSAGE_SECONDS:
+  try:
+    if (num % INTERVAL) == 0:
+      time = getruntime()-start
+      avg = (num/time)
+      INTERVAL = (int(avg)/2)*4-1
+      maxrate = max(maxrate, avg)
+      print round(time,2), "Average", round(avg,2), "mesg./sec.","("+str(num)+")"
+  except ZeroDivisionError:
+    INTERVAL = 50
+
+  if data == str(num):
+    num = num + 1
+    virtualsock.send(str(num))
+    num = num + 1
+  else:
+    print "Client Unexpected number! Expected: ", str(num), " Received: ",data
+    part += data
+
+    if part == str(num):
+      part = ""
       num = num + 1
       virtualsock.send(str(num))
       num = num + 1
-    else:
-      print "Client Unexpected number! Expected: ", str(num), " Received: ",data
-      part += data
-      
-      if part == str(num):
-        part = ""
-        num = num + 1
-        virtualsock.send(str(num))
-        num = num + 1
-        
-    data = virtualsock.recv(1024)
 
-except KeyboardInterrupt:
-  print "Runtime: ",getruntime()-start
-  print "Fastest: ",maxrate," mesg./sec."
+  data = virtualsock.recv(1024)
+
+print "Runtime: ",getruntime()-start
+print "Fastest: ",maxrate," mesg./sec."
 
+# Bulk transfers
+mycontext["lock"] = getlock()
+print
+print "Throughput of", THROUGHPUT_BYTES / (1024*1024), "MB sent over the virtual sockets"
+print "sockets".rjust(8), "MB/sec.".rjust(12)
+for socketcount in THROUGHPUT_SOCKETS:
+  measure_throughput(socketcount)
 
-exitall()
\ No newline at end of file
+exitall()
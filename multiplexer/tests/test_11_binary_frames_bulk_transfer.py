@@ -0,0 +1,99 @@
+# This test checks that frames are read back the same in the text and binary formats,
+# even when the socket returns them in small pieces. Then it checks that two multiplexers
+# switch to binary frames and transfer a lot of data over several virtual sockets at once.
+
+# Get the Multiplexer
+include Multiplexer.py
+
+SOCKETS = 2
+AMOUNT = 64 * 1024
+
+# Returns the data it was given, a few bytes at a time
+class PieceSocket:
+  def __init__(self, data):
+    self.data = data
+
+  def recv(self, bytes):
+    piece = self.data[:min(bytes, 7)]
+    self.data = self.data[len(piece):]
+    return piece
+
+# The data sent by a virtual socket
+def make_data(number):
+  return (str(number) + "abcdefghijklmnopqrstuvwxyz") * (AMOUNT / 27)
+
+# Receives everything sent to a virtual socket, in differently sized pieces
+def receiver(remoteip, remoteport, virtualsock, junk, multiplexer):
+  pieces = []
+  size = 1
+  while True:
+    try:
+      pieces.append(virtualsock.recv(size))
+    except EnvironmentError:
+      break
+    size = (size * 7) % 20000 + 1
+
+  data = "".join(pieces)
+  mycontext["lock"].acquire()
+  mycontext["received"][data[0]] = data
+  mycontext["lock"].release()
+
+def sender(virtualsock, number):
+  virtualsock.send(make_data(number))
+  virtualsock.close()
+
+def timeout():
+  print "Reached timeout!"
+  exitall()
+
+if callfunc=='initialize':
+  settimer(30, timeout,())
+
+  # Frame round trips
+  frames = []
+  for (mesgType, referenceID, content) in [(MULTIPLEXER_DATA_FORWARD, 0, "some data"),
+      (MULTIPLEXER_CONN_TERM, 70000, ""), (MULTIPLEXER_DATA_FORWARD, 3, "x" * 20000)]:
+    frame = MultiplexerFrame()
+    frame.mesgType = mesgType
+    frame.referenceID = referenceID
+    frame.content = content
+    frame.contentLength = len(content)
+    frames.append(frame)
+
+  for binary in [False, True]:
+    reader = MultiplexerReader(PieceSocket("".join([frame.toString(binary) for frame in frames])))
+    for frame in frames:
+      readFrame = MultiplexerFrame()
+      if binary:
+        readFrame.initFromBinarySocket(reader)
+      else:
+        readFrame.initFromSocket(reader)
+      if (readFrame.mesgType, readFrame.referenceID, readFrame.content) != (frame.mesgType, frame.referenceID, frame.content):
+        print "Read the wrong frame! Binary:", binary, "Expected:", frame.mesgType, frame.referenceID, "Read:", readFrame.mesgType, readFrame.referenceID
+
+  # Bulk transfers
+  mycontext["lock"] = getlock()
+  mycontext["received"] = {}
+
+  mux_waitforconn("127.0.0.1", 12345, receiver)
+
+  sockets = []
+  for number in range(SOCKETS):
+    sockets.append(mux_openconn("127.0.0.1", 12345))
+
+  # Both multiplexers should have switched to binary frames by now
+  for mux in MULTIPLEXER_OBJECTS.values():
+    if not mux.sendBinary or not mux.recvBinary:
+      print "The multiplexers didn't switch to binary frames!"
+
+  for number in range(SOCKETS):
+    settimer(0, sender, (sockets[number], number))
+
+  while len(mycontext["received"]) < SOCKETS:
+    sleep(0.1)
+
+  for number in range(SOCKETS):
+    if mycontext["received"][str(number)] != make_data(number):
+      print "Socket", number, "received the wrong data!"
+
+  exitall()
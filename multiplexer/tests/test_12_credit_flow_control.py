@@ -0,0 +1,94 @@
+# This test checks the credit based flow control. First it gives a socket with a fake multiplexer
+# some data to read, and checks when credit is returned and that the window grows. Then it sends
+# more than a window of data between two multiplexers, and checks that the credit adds up and
+# that the round trip time was measured.
+
+# Get the Multiplexer
+include Multiplexer.py
+
+AMOUNT = 256 * 1024
+
+# Returns the data it was given
+class StringSocket:
+  def __init__(self, data):
+    self.data = data
+
+  def recv(self, bytes):
+    piece = self.data[:bytes]
+    self.data = self.data[len(piece):]
+    return piece
+
+# Collects the frames the socket sends. Every read is a round trip.
+class FakeMux:
+  def __init__(self):
+    self.peerCredits = True
+    self.rtt = 0.0
+    self.defaultBufSize = 1000
+    self.frames = []
+
+  def _sendFrame(self, frame):
+    self.frames.append(frame)
+
+  def _ping(self):
+    pass
+
+def check_credit(mux, expected):
+  if expected == None and mux.frames:
+    print "Returned credit too soon:", mux.frames[-1].content
+  elif expected != None and (not mux.frames or mux.frames[-1].mesgType != MULTIPLEXER_CONN_CREDIT or mux.frames[-1].content != str(expected)):
+    print "Expected a credit of", expected, "but got:", mux.frames
+  mux.frames = []
+
+def receiver(remoteip, remoteport, virtualsock, junk, multiplexer):
+  mycontext["serversock"] = virtualsock
+  virtualsock.send("x" * AMOUNT)
+
+def timeout():
+  print "Reached timeout!"
+  exitall()
+
+if callfunc=='initialize':
+  settimer(30, timeout,())
+
+  # Credit is returned once a quarter of the window was read
+  mux = FakeMux()
+  sock = MultiplexerSocket(0, mux, 1000, {})
+  sock._returnCredit(100)
+  check_credit(mux, None)
+  sock._returnCredit(200)
+  check_credit(mux, 300)
+
+  # Reading more than half of the window in a round trip grows it to twice what was read
+  sock._returnCredit(600)
+  check_credit(mux, 800)
+  if sock.bufferInfo["window"] != 1200:
+    print "The window didn't grow! Window:", sock.bufferInfo["window"]
+  sock._returnCredit(100)
+  check_credit(mux, None)
+
+  # Control frames can be sent in binary frames
+  frame = MultiplexerFrame()
+  frame.initResponseFrame(MULTIPLEXER_CONTROL_REFERENCE_ID, MULTIPLEXER_CONTROL_PING)
+  readFrame = MultiplexerFrame()
+  readFrame.initFromBinarySocket(MultiplexerReader(StringSocket(frame.toString(True))))
+  if readFrame.referenceID != MULTIPLEXER_CONTROL_REFERENCE_ID or readFrame.content != MULTIPLEXER_CONTROL_PING:
+    print "Read the wrong control frame:", readFrame
+
+  # Send more than a window between two multiplexers
+  mux_waitforconn("127.0.0.1", 12345, receiver)
+  virtualsock = mux_openconn("127.0.0.1", 12345)
+
+  received = 0
+  while received < AMOUNT:
+    received += len(virtualsock.recv(4096))
+  sleep(1)
+
+  # Everything was read, so the sender may send a window, less the credit that was not returned
+  serversock = mycontext["serversock"]
+  if serversock.bufferInfo["outgoing"] + virtualsock.bufferInfo["credit"] != virtualsock.bufferInfo["window"]:
+    print "The credit doesn't add up! Outgoing:", serversock.bufferInfo["outgoing"], "Credit:", virtualsock.bufferInfo["credit"], "Window:", virtualsock.bufferInfo["window"]
+
+  if virtualsock.mux.rtt == None:
+    print "The round trip time wasn't measured!"
+
+  exitall()
@@ -0,0 +1,63 @@
+# This test checks that a connection confirmed after openconn timed out is closed. The partner
+# multiplexer only starts reading after MULTIPLEXER_START_DELAY, so it confirms the connection
+# long after openconn gave up. The virtual socket must not be registered, and the partner's
+# socket must be closed.
+
+# Get the Multiplexer
+include Multiplexer.py
+
+# Handle a new virtual connection, it should be closed right away
+def new_virtual_conn(remoteip, remoteport, virtualsock, junk, multiplexer):
+  try:
+    virtualsock.recv(1, blocking=True)
+  except EnvironmentError:
+    mycontext['closed-lock'].release()
+  else:
+    print "Received data on a socket that should be closed!"
+
+
+# Handle a new client connecting to us
+def new_connection(remoteip, remoteport, socket, thiscommhandle, listencommhandle):
+  # Immediately create a multiplexer from this connection
+  mux = Multiplexer(socket, {"localip":"127.0.0.1", "localport":12345,"remoteip":remoteip,"remoteport":remoteport,"mux":"waitforconn"})
+
+  # Setup the waitforconn
+  mux.waitforconn("127.0.0.1", 12345, new_virtual_conn)
+
+
+def timeout():
+  print "Reached timeout! The late connection wasn't closed."
+  exitall()
+
+if callfunc=='initialize':
+  mycontext['closed-lock'] = getlock()
+  mycontext['closed-lock'].acquire() # unlock after the partner's socket is closed
+
+  # Kill us in 15 seconds
+  settimer(15, timeout,())
+
+  # Setup a waitforconn on a real socket
+  waitforconn("127.0.0.1", 12345, new_connection)
+
+  # Try to connect to the real socket
+  realsocket = openconn("127.0.0.1", 12345)
+
+  # Try to setup a multiplexed connection on this
+  mux = Multiplexer(realsocket, {"remoteip":"127.0.0.1","remoteport":12345,"mux":"openconn"})
+
+  # Our partner isn't reading yet, so this times out
+  try:
+    virtualsock = mux.openconn("127.0.0.1", 12345,timeout=0.1)
+  except EnvironmentError,e:
+    if str(e) != "Connection timed out!":
+      print "Unexpected exception,expected timeout. Got:",e
+  else:
+    print "Expected timeout. Was able to open socket!"
+
+  # Wait for the partner's socket to be closed
+  mycontext['closed-lock'].acquire()
+
+  if mux.virtualSockets:
+    print "The late connection was registered:", mux.virtualSockets
+
+  exitall()
@@ -1,6 +1,8 @@
 # This test tries to test for proper connection buffering
 # It does this by hooking into the multiplexers internal functions and by counting the number
 # of CONN_BUF_SIZE messages sent. The buffer is also decreased substantially to speed this up.
+# Multiplexers only send CONN_BUF_SIZE messages to older partners, which don't take credit,
+# so both multiplexers are made to treat the other one as an older partner.
 
 # Get the Multiplexer
 include Multiplexer.py
@@ -25,6 +27,7 @@ def client_conn_buf_size(socket, num):
 def new_virtual_conn(remoteip, remoteport, virtualsock, junk, multiplexer):
   # Change the default buffer size
   multiplexer.defaultBufSize = BUF_SIZE
+  multiplexer.peerCredits = False
   
   # Intercept the servers function
   mycontext["serverfunc"] = multiplexer._conn_buf_size
@@ -81,6 +84,7 @@ if callfunc=='initialize':
   # Change the default buffer size
   mux = MULTIPLEXER_OBJECTS["IP:127.0.0.1:12345"]
   mux.defaultBufSize = BUF_SIZE
+  mux.peerCredits = False
   
   # Intercept the clients function
   mycontext["clientfunc"] = mux._conn_buf_size
@@ -3,7 +3,8 @@ Author: Justin Cappos
 
 Module: Node Manager connection handling.   This does everything up to handling
         a request (i.e. accept connections, handle the order they should be
-        processed in, etc.)   Requests will be handled one at a time.
+        processed in, etc.)   Requests are handled by a pool of worker
+        threads.
 
 Start date: August 28th, 2008
 
@@ -20,31 +21,31 @@ connections from a single source.   This callback places valid connections into
 an ordered list.   This callback handles meta information like sceduling 
 requests and preventing DOS attacks that target admission.
 
-Another thread (the worker thread) processes the first element in the list.  
-The worker thread is responsible for handling an individual request.   This
-ensures that the request is validly signed, prevents slow connections from 
-clogging the request stream, etc.
-
-
-Right now I ensure that only one worker thread is active at a time.   In the 
-future, it would be possible to have multiple threads that are performing 
-disjoint operations to proceed in parallel.   This may allow starvation attacks
-if it involves reordering the list of connections.   As a result, it is punted 
-to future work.
-
-I'm going to use "polling" by the worker thread.   I'll sleep when the 
-list is empty and periodically look to see if a new element was added.
+Worker threads process the first element in the list.   A worker thread is
+responsible for handling an individual request.   This ensures that the 
+request is validly signed, prevents slow connections from clogging the request
+stream, etc.
+
+There are several worker threads (see DEFAULT_WORKER_COUNT) so that one slow
+request (e.g. a large AddFileToVessel from a slow client) doesn't hold up
+everyone else.   Workers always take the connection that pop_request says is
+next, so the order connections are handled in is the same as with a single
+worker.   A connection that is being handled still counts against its IP's
+connection limit.   An IP may also have at most max_active_per_IP connections
+being handled (fewer than there are workers), and its other connections wait
+until one of them is done, so one IP can't tie up every worker.   Requests
+that touch the same vessel are serialized by nmrequesthandler.
+
+Workers wait on a condition variable that is notified when a connection is
+added, so they neither poll nor sleep while there is work to do.
 """
 
-# needed to have a separate thread for the worker
+# needed to have separate threads for the workers
 import threading
 
 # need to get connections, etc.
 import socket
 
-# needed for sleep
-import time
-
 # does the actual request handling
 import nmrequesthandler
 
@@ -57,6 +58,26 @@ import servicelogger
 from repyportability import *
 
 connectionlock = getlock()
+
+# Notified (with connectionlock held) whenever a connection is added or a
+# worker is done with one
+connectioncondition = threading.Condition(connectionlock)
+
+# The number of worker threads nmmain starts if the configuration doesn't say
+DEFAULT_WORKER_COUNT = 4
+
+# How many connections from one IP workers may handle at once.   This is kept
+# below the number of workers (see set_worker_count) so that other IPs always
+# have a worker.
+max_active_per_IP = DEFAULT_WORKER_COUNT - 1
+
+
+
+# Tells how many workers there are, so that one IP is kept from using all of
+# them.
+def set_worker_count(workercount):
+  global max_active_per_IP
+  max_active_per_IP = max(1, workercount - 1)
   
 
 def connection_handler(IP, port, socketobject, thiscommhandle, maincommhandle):
@@ -67,14 +88,10 @@ def connection_handler(IP, port, socketobject, thiscommhandle, maincommhandle):
  
   # always release the lock...
   try:
-    # it's not in the list, let's initialize!
-    if IP not in connection_dict_order:
-      connection_dict_order.append(IP)
-      connection_dict[IP] = []
-
     # we're rejecting lots of connections from the same IP to limit DOS by 
-    # grabbing lots of connections
-    if len(connection_dict[IP]) > 3:
+    # grabbing lots of connections.   Connections that a worker is handling
+    # count too, otherwise an IP could occupy every worker.
+    if len(connection_dict.get(IP, [])) + active_connection_count.get(IP, 0) > 3:
       # Armon: Avoid leaking sockets
       socketobject.close()
       return
@@ -84,9 +101,18 @@ def connection_handler(IP, port, socketobject, thiscommhandle, maincommhandle):
       socketobject.close()
       return
 
+    # it's not in the list, let's initialize!   (This is done after the 
+    # checks so that a rejected connection doesn't leave an empty entry.)
+    if IP not in connection_dict_order:
+      connection_dict_order.append(IP)
+      connection_dict[IP] = []
+
     # we should add this connection to the list
     connection_dict[IP].append(socketobject)
 
+    # and wake up a worker to handle it
+    connectioncondition.notify()
+
   finally:
     connectionlock.release()
 
@@ -96,6 +122,10 @@ def _get_total_connection_count():
   for srcIP in connection_dict:
     totalconnections = totalconnections + len(connection_dict[srcIP])
 
+  # connections that are being handled count too
+  for srcIP in active_connection_count:
+    totalconnections = totalconnections + active_connection_count[srcIP]
+
   return totalconnections
   
   
@@ -119,9 +149,14 @@ connection_dict_order = []
 # maps to a list of connections that are pending for that IP.
 connection_dict = {}
 
+# The number of connections from each IP that workers are handling right now.
+# IPs with no active connections are not in the dict.
+active_connection_count = {}
+
 
 
-# get the first request
+# get the first request.   Returns a tuple of the IP and the connection.   The
+# caller must call finish_request(IP) when it is done with the connection.
 def pop_request():
 
   # Acquire a lock to prevent a race (#993)...
@@ -129,39 +164,107 @@ def pop_request():
 
   # ...but always release it.
   try:
-    if len(connection_dict)==0:
-      raise ValueError, "Internal Error: Popping a request for an empty connection_dict"
+    return _pop_request_locked()
+
+  finally:
+    # if there is a bug in the above code, we still want to prevent deadlock...
+    connectionlock.release()
 
-    # get the first item of the connection_dict_order... 
-    nextIP = connection_dict_order[0]
-    del connection_dict_order[0]
 
-    # ...and the first item of this list
-    therequest = connection_dict[nextIP][0]
-    del connection_dict[nextIP][0]
 
-    # if this is the last connection from this IP, let's remove the empty list 
-    # from the dictionary
-    if len(connection_dict[nextIP]) == 0:
-      del connection_dict[nextIP]
-    else:
-      # there are more.   Let's append the IP to the end of the dict_order
-      connection_dict_order.append(nextIP)
+# Like pop_request but waits for there to be a request that can be handled.
+def wait_and_pop_request():
+  connectionlock.acquire()
+  try:
+    while _get_next_IP_locked() is None:
+      connectioncondition.wait()
+
+    return _pop_request_locked()
 
   finally:
-    # if there is a bug in the above code, we still want to prevent deadlock...
     connectionlock.release()
 
+
+
+# Private.   Returns the index in connection_dict_order of the first IP 
+# whose connection can be handled now (it doesn't already have 
+# max_active_per_IP connections being handled), or None.   The caller must 
+# hold connectionlock.
+def _get_next_IP_locked(exceptIP=None):
+  for index in range(len(connection_dict_order)):
+    IP = connection_dict_order[index]
+    if IP != exceptIP and active_connection_count.get(IP, 0) < max_active_per_IP:
+      return index
+  return None
+
+
+
+# Private.   The caller must hold connectionlock.
+def _pop_request_locked():
+  if len(connection_dict)==0:
+    raise ValueError, "Internal Error: Popping a request for an empty connection_dict"
+
+  # get the first item of the connection_dict_order that can be handled now.
+  # IPs that are skipped keep their place.
+  nextindex = _get_next_IP_locked()
+  if nextindex is None:
+    raise ValueError, "Internal Error: Popping a request when every IP is at its limit"
+
+  nextIP = connection_dict_order[nextindex]
+  del connection_dict_order[nextindex]
+
+  # ...and the first item of this list
+  therequest = connection_dict[nextIP][0]
+  del connection_dict[nextIP][0]
+
+  # if this is the last connection from this IP, let's remove the empty list 
+  # from the dictionary
+  if len(connection_dict[nextIP]) == 0:
+    del connection_dict[nextIP]
+  else:
+    # there are more.   Let's append the IP to the end of the dict_order
+    connection_dict_order.append(nextIP)
+
+  # the connection counts against the IP until the worker is done with it
+  active_connection_count[nextIP] = active_connection_count.get(nextIP, 0) + 1
+
   # and return the request we removed.
-  return therequest
+  return (nextIP, therequest)
+
+
+
+# Are connections from IPs other than this one waiting for a worker (and not
+# held back by their IP's limit)?   A worker with a persistent session ends it
+# if so, so that the session doesn't let one IP skip the round robin.
+def other_requests_are_waiting(IP):
+  connectionlock.acquire()
+  try:
+    return _get_next_IP_locked(exceptIP=IP) is not None
+  finally:
+    connectionlock.release()
+
+
+
+# A worker is done handling a connection from this IP
+def finish_request(IP):
+  connectionlock.acquire()
+  try:
+    active_connection_count[IP] = active_connection_count[IP] - 1
+    if active_connection_count[IP] == 0:
+      del active_connection_count[IP]
+
+    # another connection from this IP may be handled now
+    connectioncondition.notify()
+  finally:
+    connectionlock.release()
   
 
 
-# this class is the worker thread.   It processes connections
+# this class is a worker thread.   It processes connections
 class WorkerThread(threading.Thread):
-  sleeptime = None
-  def __init__(self,st):
-    self.sleeptime = st
+  # sleeptime is no longer used (workers are woken up when a connection
+  # arrives).   It is accepted so that older callers still work.
+  def __init__(self, sleeptime=None):
     threading.Thread.__init__(self, name="WorkerThread")
 
   def run(self):
@@ -169,16 +272,16 @@ class WorkerThread(threading.Thread):
 
       while True:
         
-        if len(connection_dict)>0:
-          # get the "first" request
-          conn = pop_request()
+        # get the "first" request (waiting for one if necessary)
+        IP, conn = wait_and_pop_request()
+        try:
 # Removing this logging which seems excessive...          
 #          servicelogger.log('start handle_request:'+str(id(conn)))
-          nmrequesthandler.handle_request(conn)
+          nmrequesthandler.handle_request(conn, 
+              lambda: other_requests_are_waiting(IP))
 #          servicelogger.log('finish handle_request:'+str(id(conn)))
-        else:
-          # check at most twice a second (if nothing is new)
-          time.sleep(self.sleeptime)
+        finally:
+          finish_request(IP)
 
     except:
       servicelogger.log_last_exception()
@@ -23,8 +23,8 @@ that users and owners can locate their vessels.
 updates statuses in the table used by the API.
    An accepter (nmconnectionmanager) listens for connections (preventing
 simple attacks) and puts them into a list.
-   A worker thread (used in the nmconnectionmanager, nmrequesthandler, nmAPI)
-handles enacting the appropriate actions given requests from the user.
+   Worker threads (used in the nmconnectionmanager, nmrequesthandler, nmAPI)
+handle enacting the appropriate actions given requests from the user.
    The main thread initializes the other threads and monitors them to ensure
 they do not terminate prematurely (restarting them as necessary).
 
@@ -313,21 +313,37 @@ def start_accepter():
 
 
 
-# has the thread started?
-def is_worker_thread_started():
+# how many worker threads should there be?   The 'workercount' setting is
+# optional in the configuration.
+def get_worker_thread_count():
+  return configuration.get('workercount', nmconnectionmanager.DEFAULT_WORKER_COUNT)
+
+
+
+# how many worker threads are running?
+def count_worker_threads():
+  workercount = 0
   for thread in threading.enumerate():
     if 'WorkerThread' in str(thread):
-      return True
-  else:
-    return False
+      workercount = workercount + 1
+  return workercount
+
+
+
+# have all of the worker threads started?
+def is_worker_thread_started():
+  return count_worker_threads() >= get_worker_thread_count()
 
 
 
 def start_worker_thread(sleeptime):
 
-  if not is_worker_thread_started():
-    # start the WorkerThread and set it to a daemon.   I think the daemon 
-    # setting is unnecessary since I'll clobber on restart...
+  # keep one IP from using every worker
+  nmconnectionmanager.set_worker_count(get_worker_thread_count())
+
+  # start any WorkerThreads that are missing and set them to daemons.   I 
+  # think the daemon setting is unnecessary since I'll clobber on restart...
+  for count in range(get_worker_thread_count() - count_worker_threads()):
     workerthread = nmconnectionmanager.WorkerThread(sleeptime)
     workerthread.setDaemon(True)
     workerthread.start()
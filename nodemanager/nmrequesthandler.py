@@ -12,6 +12,15 @@ that order).
 
 I think this is fairly straightforward...   Get requests, check them, and
 pass them to the appropriate API function
+
+Requests may be handled by several worker threads at once.   The only 
+concurrency this module worries about is making sure that requests that use
+the same vessel (or that change the set of vessels) run one at a time.
+
+A connection normally carries one request.   If the first message is
+'PersistentSession', the connection is kept open for more requests (which may
+be pipelined).   Each request is still checked exactly as if it came on its
+own connection.
 """
 
 from repyportability import *
@@ -39,6 +48,9 @@ import socket
 # for logging informative errors
 import traceback
 
+# to serialize requests for the same vessel
+import threading
+
 
 
 import servicelogger
@@ -60,10 +72,24 @@ def initialize(myip, publickey, version):
 
 
   
+# The first message of a connection that will carry many requests
+PERSISTENT_SESSION_REQUEST = 'PersistentSession'
+
+# A persistent session ends after this many requests, after waiting this long
+# (seconds) for a request, or when other IPs' connections are waiting for a 
+# worker.   The client can open a new one.
+PERSISTENT_SESSION_MAX_REQUESTS = 50
+PERSISTENT_SESSION_IDLE_TIMEOUT = 10
+
+
+
 # Armon: Safely closes a socket object
 
 # this takes a connection and safely processes the request.   
-def handle_request(socketobj):
+# otherrequestswaiting is an optional function that tells if other IPs'
+# connections are waiting to be handled (so that a persistent session doesn't
+# hold up a worker).
+def handle_request(socketobj, otherrequestswaiting=None):
 
   # always close the socketobj
   try:
@@ -72,47 +98,21 @@ def handle_request(socketobj):
     try:
       # let's get the request...
       # BUG: Should prevent endless data / slow retrival attacks
-      fullrequest = session_recvmessage(socketobj)
-  
-    # Armon: Catch a vanilla exception because repy emulated_sockets
-    # will raise Exception when the socket has been closed.
-    # This is changed from just passing through socket.error,
-    # which we were catching previously.
-    except Exception, e:
-
-      #JAC: Fix for the exception logging observed in #992
-      if 'Socket closed' in str(e) or 'timed out!' in str(e):
-        servicelogger.log('Connection abruptly closed during recv')
-        return
-      elif 'Bad message size' in str(e):
-        servicelogger.log('Received bad message size')
-        return
-      else:
-        # I can't handle this, let's exit
-        # BUG: REMOVE LOGGING IN PRODUCTION VERSION (?)
-        servicelogger.log_last_exception()
-        return
-
-
-
-    # handle the request as appropriate
-    try:
-      retstring = process_API_call(fullrequest)
+      fullrequest = _receive_request(session_recvmessage, socketobj)
+    except SessionEOF:
+      servicelogger.log_last_exception()
+      return
 
-    # Bad parameters, signatures, etc.
-    except nmAPI.BadRequest,e:
-      session_sendmessage(socketobj, str(e)+"\nError")
+    if fullrequest is None:
       return
 
-    # Other exceptions only should happen on an internal error and should be
-    # captured by servicelogger.log
-    except Exception,e:
-      servicelogger.log_last_exception()
-      session_sendmessage(socketobj,"Internal Error\nError")
+    if fullrequest == PERSISTENT_SESSION_REQUEST:
+      session_sendmessage(socketobj, "\nSuccess")
+      _handle_persistent_session(SessionSocket(socketobj), otherrequestswaiting)
       return
  
     # send the output of the command...
-    session_sendmessage(socketobj,retstring)
+    session_sendmessage(socketobj, _get_response(fullrequest))
 
   except Exception, e:
     #JAC: Fix for the exception logging observed in #992
@@ -129,6 +129,107 @@ def handle_request(socketobj):
     except Exception, e:
       servicelogger.log_last_exception()
    
+
+
+# Gets a request with recvmessage(*args).   Problems receiving it are logged
+# and None is returned (except SessionEOF, which is raised).
+def _receive_request(recvmessage, *args):
+  try:
+    return recvmessage(*args)
+
+  except SessionEOF:
+    raise
+
+  # Armon: Catch a vanilla exception because repy emulated_sockets
+  # will raise Exception when the socket has been closed.
+  # This is changed from just passing through socket.error,
+  # which we were catching previously.
+  except Exception, e:
+
+    #JAC: Fix for the exception logging observed in #992
+    if 'Socket closed' in str(e) or 'timed out!' in str(e):
+      servicelogger.log('Connection abruptly closed during recv')
+    elif 'Bad message size' in str(e):
+      servicelogger.log('Received bad message size')
+    else:
+      # I can't handle this, let's exit
+      # BUG: REMOVE LOGGING IN PRODUCTION VERSION (?)
+      servicelogger.log_last_exception()
+    return None
+
+
+
+# Returns the response to send for a request
+def _get_response(fullrequest):
+  # handle the request as appropriate
+  try:
+    return process_API_call(fullrequest)
+
+  # Bad parameters, signatures, etc.
+  except nmAPI.BadRequest,e:
+    return str(e)+"\nError"
+
+  # Other exceptions only should happen on an internal error and should be
+  # captured by servicelogger.log
+  except Exception,e:
+    servicelogger.log_last_exception()
+    return "Internal Error\nError"
+
+
+
+# Handles the requests on a persistent session until the client ends it or 
+# we do.   The caller closes the socket.
+def _handle_persistent_session(sessionsock, otherrequestswaiting):
+  for requestcount in range(PERSISTENT_SESSION_MAX_REQUESTS):
+    if not _wait_for_next_request(sessionsock, otherrequestswaiting):
+      break
+
+    try:
+      fullrequest = _receive_request(sessionsock.recvmessage)
+    except SessionEOF:
+      # the client is done
+      return
+
+    if fullrequest is None:
+      return
+
+    sessionsock.sendmessage(_get_response(fullrequest))
+
+    # Let the others go first, even if the client has more requests for us.
+    if otherrequestswaiting is not None and otherrequestswaiting():
+      break
+
+  # Tell the client that we didn't read another request, so it knows it's
+  # safe to send it again on a new connection.
+  sessionsock.close()
+
+
+
+# Waits for the client to send the next request of a persistent session.
+# Returns False if we should give up on the session instead.
+def _wait_for_next_request(sessionsock, otherrequestswaiting):
+  starttime = getruntime()
+  sleeptime = 0.0001
+
+  try:
+    while not sessionsock.hasbuffereddata() and sessionsock.socket.willblock()[0]:
+      if getruntime() - starttime > PERSISTENT_SESSION_IDLE_TIMEOUT:
+        return False
+
+      if otherrequestswaiting is not None and otherrequestswaiting():
+        return False
+
+      # back off like sockettimeout does, up to 100ms
+      sleep(sleeptime)
+      sleeptime = min(sleeptime * 2, 0.1)
+
+  except Exception:
+    # The socket is closed.   Let the recv report it.
+    pass
+
+  return True
+
+
       
   
 
@@ -179,6 +280,115 @@ API_dict = { \
 }
 
 
+# These calls change the set of vessels or use shared temporary files, so
+# they are run when no other request is in progress.
+EXCLUSIVE_CALLS = ['SplitVessel', 'JoinVessels', 'SetRestrictions']
+
+# Protects the variables below.   Notified whenever a request finishes.
+requestcondition = threading.Condition()
+
+# Is there an exclusive request running?   How many are waiting to run?
+exclusiverequestrunning = False
+exclusiverequestswaiting = 0
+
+# The number of other requests that are running and the vessels they use
+sharedrequestcount = 0
+busyvessels = set()
+
+
+
+def acquire_request_lock(callname, vesselname):
+  """
+  <Purpose>
+    Waits until a request can run.   A request for a vessel waits for any other
+    request for that vessel.   Exclusive calls wait for all other requests.
+
+  <Arguments>
+    callname:
+      The name of the call (a key in API_dict)
+    vesselname:
+      The vessel the request is for or None if it is a public call.
+
+  <Exceptions>
+    None.
+
+  <Side Effects>
+    Blocks other requests until release_request_lock is called.
+
+  <Returns>
+    None.
+  """
+  global exclusiverequestrunning
+  global exclusiverequestswaiting
+  global sharedrequestcount
+
+  requestcondition.acquire()
+  try:
+    if callname in EXCLUSIVE_CALLS:
+      exclusiverequestswaiting = exclusiverequestswaiting + 1
+      try:
+        while exclusiverequestrunning or sharedrequestcount > 0:
+          requestcondition.wait()
+      finally:
+        exclusiverequestswaiting = exclusiverequestswaiting - 1
+
+      exclusiverequestrunning = True
+
+    else:
+      # Exclusive calls that are waiting go first so that they aren't starved
+      while exclusiverequestrunning or exclusiverequestswaiting > 0 or \
+          vesselname in busyvessels:
+        requestcondition.wait()
+
+      sharedrequestcount = sharedrequestcount + 1
+      if vesselname is not None:
+        busyvessels.add(vesselname)
+
+  finally:
+    requestcondition.release()
+
+
+
+def release_request_lock(callname, vesselname):
+  """
+  <Purpose>
+    Lets other requests run after a request acquired with acquire_request_lock
+    is done.
+
+  <Arguments>
+    callname:
+      The name of the call that was passed to acquire_request_lock
+    vesselname:
+      The vessel name that was passed to acquire_request_lock
+
+  <Exceptions>
+    None.
+
+  <Side Effects>
+    Other requests may start.
+
+  <Returns>
+    None.
+  """
+  global exclusiverequestrunning
+  global sharedrequestcount
+
+  requestcondition.acquire()
+  try:
+    if callname in EXCLUSIVE_CALLS:
+      exclusiverequestrunning = False
+    else:
+      sharedrequestcount = sharedrequestcount - 1
+      if vesselname is not None:
+        busyvessels.discard(vesselname)
+
+    requestcondition.notifyAll()
+
+  finally:
+    requestcondition.release()
+
+
+
 def process_API_call(fullrequest):
 
   callname = fullrequest.split('|')[0]
@@ -186,6 +396,26 @@ def process_API_call(fullrequest):
   if callname not in API_dict:
     raise nmAPI.BadRequest("Unknown Call")
 
+  # find the vessel the call is for.   Public calls don't have one.   If the
+  # request is malformed, let _process_API_call complain about it.
+  vesselname = None
+  if API_dict[callname][1] != 'Public':
+    try:
+      requestdata = fastsigneddata.signeddata_split_signature(fullrequest)[0]
+      vesselname = requestdata.split('|',2)[1]
+    except Exception:
+      pass
+
+  acquire_request_lock(callname, vesselname)
+  try:
+    return _process_API_call(fullrequest, callname)
+  finally:
+    release_request_lock(callname, vesselname)
+
+
+
+def _process_API_call(fullrequest, callname):
+
   # find the entry that describes this call...
   numberofargs, permissiontype, APIfunction = API_dict[callname]
   
@@ -223,7 +453,11 @@ def process_API_call(fullrequest):
       allowedkeys = [ nmAPI.vesseldict[vesselname]['ownerkey'] ] + nmAPI.vesseldict[vesselname]['userkeys']
 
     # I need to pass the fullrequest in here...
-    ensure_is_correctly_signed(fullrequest, allowedkeys, nmAPI.vesseldict[vesselname]['oldmetadata'])
+    checkstarttime = getruntime()
+    try:
+      ensure_is_correctly_signed(fullrequest, allowedkeys, nmAPI.vesseldict[vesselname]['oldmetadata'])
+    finally:
+      record_signature_check_time(callname, getruntime() - checkstarttime)
     
     # If there are 3 args, we want to split at most 3 times (the first item is 
     # the callname)
@@ -240,6 +474,60 @@ def process_API_call(fullrequest):
 
 
 
+# How long checking the signature of each call takes.   callname -> [number of
+# checks, total seconds, most seconds for one check].
+signaturecheckstats = {}
+signaturecheckstatslock = threading.Lock()
+
+def record_signature_check_time(callname, seconds):
+  signaturecheckstatslock.acquire()
+  try:
+    if callname not in signaturecheckstats:
+      signaturecheckstats[callname] = [0, 0.0, 0.0]
+    stats = signaturecheckstats[callname]
+    stats[0] = stats[0] + 1
+    stats[1] = stats[1] + seconds
+    stats[2] = max(stats[2], seconds)
+  finally:
+    signaturecheckstatslock.release()
+
+
+
+def get_signature_check_stats():
+  """
+  <Purpose>
+    Reports how long signature checks have taken for each call.
+
+  <Arguments>
+    None.
+
+  <Exceptions>
+    None.
+
+  <Side Effects>
+    None.
+
+  <Returns>
+    A dict that maps each call name to a dict with 'count' (the number of
+    checks), 'average' and 'max' (seconds).
+  """
+  signaturecheckstatslock.acquire()
+  try:
+    statsdict = {}
+    for callname in signaturecheckstats:
+      count, totalseconds, maxseconds = signaturecheckstats[callname]
+      statsdict[callname] = {'count': count, 'average': totalseconds / count,
+          'max': maxseconds}
+    return statsdict
+  finally:
+    signaturecheckstatslock.release()
+
+
+
+# Only one thread should try to get the time at once (they would all use the
+# same port)
+timeupdatelock = threading.Lock()
+
 # Raise a BadRequest exception if it's not correctly signed...
 def ensure_is_correctly_signed(fullrequest, allowedkeys, oldmetadata):
 
@@ -247,7 +535,15 @@ def ensure_is_correctly_signed(fullrequest, allowedkeys, oldmetadata):
   try:
     time_gettime()
   except TimeError:
-    time_updatetime(34612)
+    timeupdatelock.acquire()
+    try:
+      # another thread may have done this while we waited
+      try:
+        time_gettime()
+      except TimeError:
+        time_updatetime(34612)
+    finally:
+      timeupdatelock.release()
   
   # check if request is still valid and has not expired
   # this code has been added to resolve an issue where we are not checking of the request is expired in the case that there is no old metadata
@@ -282,7 +578,7 @@ def ensure_is_correctly_signed(fullrequest, allowedkeys, oldmetadata):
   if not(oldmetadata==None):
     oldrawpublickey, oldrawtimestamp, oldrawexpiration, oldrawsequenceno, oldrawdestination, oldjunksignature = oldmetadata.rsplit('!',5)
     try:
-      conversion_try = rsa_string_to_publickey(oldrawpublickey[1:])
+      conversion_try = fastsigneddata.signeddata_string_to_publickey(oldrawpublickey[1:])
     except ValueError:
       #we catch any exception here that occurs when trying to convert, and assume it is because we are dealing with a full request
       #catching the general exception is ok here since we will do this same conversion in shouldtrust
@@ -93,6 +93,7 @@ class statusthread(threading.Thread):
         # the race condition here is that they might delete something and I will
         # check it.   This is okay.   I'll end up getting a KeyError when trying
         # to update the dictionary (checked below) or look at the old entry.
+        vessellist = []
         for vesselname in self.statusdict.keys()[:]:
 
           try:
@@ -101,21 +102,18 @@ class statusthread(threading.Thread):
           except KeyError:
             # race condition, this was removed in the meantime.
             continue
-  
-  
-          # there should be a status file (assuming we've inited)
-  
-          try: 
-            status,timestamp = statusstorage.read_status(statusfilename)
-          except IOError, e:
-            # if the file exists, raise the exception since we don't know what
-            # it is about.
-            if e[0] != 2:
-              raise
-
-            # file not found.   This means it is fresh...
-            status = 'Fresh'
-            timestamp = time.time()
+
+          vessellist.append((vesselname, statusfilename, oldstatus))
+
+
+        # there should be a status file (assuming we've inited).   The
+        # statuses of all of the vessels are read at once.
+        readstatusdict = statusstorage.read_statuses(
+            [statusfilename for (vesselname, statusfilename, oldstatus) in vessellist])
+
+        for vesselname, statusfilename, oldstatus in vessellist:
+
+          status,timestamp = readstatusdict[statusfilename]
                
           
           # Armon: Check if status is ThreadErr, this is a critical error condition
@@ -15,26 +15,68 @@ Were it not for the eval / repr ugliness, I would write this in repy...
 # when and where failures occur.   I assume this will break if there are 
 # multiple of either.
 
-# BUG: How do I ensure the file is flushed to disk?   Does flush / close do it?
+# An object is kept in filename as a snapshot.   For dictionaries (like the
+# vessel dictionary), a commit usually only changes a few keys, so instead of
+# rewriting the whole snapshot the changed and deleted keys are appended as a
+# record to filename+'.journal'.   When the journal gets larger than the
+# snapshot (or JOURNAL_COMPACTION_SIZE), the whole object is written out as a
+# new snapshot (this is compaction) and the journal is emptied.   Both files
+# are flushed with os.fsync before a commit returns.
+#
+# Snapshots and records are serialized with marshal instead of repr / eval.
+# marshal only understands the basic types, so loading a file can't run code
+# and is much faster than eval.   An object that marshal can't handle is
+# written with repr (and isn't journaled).   A snapshot starts with the line
+# 'persist <generation> <marshal|repr>'.   Files without this line were
+# written by older versions and are read with eval.
+#
+# Each snapshot has a generation number that is one more than the last one.
+# Each journal record says which generation it applies to, so records that
+# were left behind (because the writer died after replacing the snapshot and
+# before emptying the journal) are ignored.   A record is written with its
+# length and a checksum, so a partly written record at the end of the journal
+# (from a writer that died, or a write in progress) is ignored too.
 
 
-# the commit protocol is:
+# the commit protocol for a snapshot is:
 # 1) if filename does not exist and filename+'.new' exists, move 
 #    filename+'.new' to filename
 # 2) open filename+'.new'
 # 3) write the object
-# 4) close the file 
-# 5) delete filename
+# 4) flush, fsync and close the file 
+# 5) (Windows only) delete filename
 # 6) move filename+'.new' to filename
+# 7) empty filename+'.journal'
 # 
 # the reason for step 1 is in case a previous incarnation died after step 5
 # but before step 6.
 # the reason for having step 5 is (from the Python docs on os.rename): On 
 # Windows, if dst already exists, OSError will be raised even if it is a file; 
 # there may be no way to implement an atomic rename when dst names an existing 
-# file.
+# file.   Elsewhere the rename atomically replaces filename, so filename
+# always exists.
+#
+# the commit protocol for a journal record is:
+# 1) check that neither file changed since this process last committed or
+#    restored the object (otherwise write a snapshot instead)
+# 2) append the record to filename+'.journal'
+# 3) flush, fsync and close the file
 #
 # the recovery protocol is:
+# 1) read filename.   If it doesn't exist, read it (or filename+'.new') with
+#    the protocol below.
+# 2) read the records in filename+'.journal' up to the first one that is
+#    incomplete
+# 3) apply the records for the snapshot's generation in order
+# 4) if there is a record for a later generation and filename changed since
+#    step 1, a new snapshot was written, so goto step 1
+# 5) return the object
+#
+# If the journal is emptied while it is read, only some of the records are 
+# applied.   The result is still the object as it was after one of the
+# commits.
+#
+# the recovery protocol when filename doesn't exist is:
 # 1) try to get the ctime for filename+'.new" 
 # 2) try to copy filename to filename+".tmp" 
 # 3) if step 2 succeeded, goto step 8
@@ -72,12 +114,195 @@ import os
 # copy
 import shutil
 
+# for serializing snapshots and journal records
+import marshal
+
+# for packing the journal record headers
+import struct
+
+# for the journal record checksums
+import zlib
+
+# The node manager handles requests in several threads.   Within a process,
+# only let one thread at a time commit or restore (they use the same
+# temporary file names).
+import threading
+persistlock = threading.Lock()
+
+
+# Set this to False to skip the os.fsync calls (the data is still written, 
+# but may be lost if the machine crashes).
+PERSIST_FSYNC = True
+
+# The journal is compacted once it is larger than both the snapshot and this
+# many bytes.
+JOURNAL_COMPACTION_SIZE = 65536
+
+SNAPSHOT_HEADER_PREFIX = 'persist '
+
+# the length and the checksum of a journal record
+JOURNAL_RECORD_HEADER = '<II'
+JOURNAL_RECORD_HEADER_SIZE = struct.calcsize(JOURNAL_RECORD_HEADER)
+
+# What this process last committed or restored for each (dictionary) object,
+# so that the next commit only needs to journal the keys that changed.   The
+# key is the absolute file name and the value is a dictionary with:
+#   'generation': the generation of the snapshot
+#   'values': a copy of the object as it was committed
+#   'snapshotsize': the size of the snapshot
+#   'snapshotsignature': the signature (see _file_signature) of the snapshot
+#   'journalsignature': the signature of the journal (None if it's empty)
+#   'journalsize': the size of the journal
+committedstate = {}
+
 
 
 
 
 # commits the given object to a file with the provided name
 def commit_object(object, filename):
+  persistlock.acquire()
+  try:
+    _commit_object(object, filename)
+  finally:
+    persistlock.release()
+
+
+
+def _commit_object(object, filename):
+  state = committedstate.get(os.path.abspath(filename))
+
+  if state is not None and type(object) is dict:
+    try:
+      record = _journal_record(object, state)
+    except ValueError:
+      # Something in the object can't be marshalled
+      record = None
+
+    if record is not None and \
+        state['journalsize'] + len(record) <= \
+        max(state['snapshotsize'], JOURNAL_COMPACTION_SIZE) and \
+        _journal_is_unchanged(filename, state):
+      _append_journal_record(record, filename, state)
+      return
+
+  _commit_snapshot(object, filename, state)
+
+
+
+def _file_signature(statinfo):
+  # Used to notice if a file was replaced or written by someone else.
+  return (statinfo.st_ino, statinfo.st_size, statinfo.st_mtime)
+
+
+
+def _signature_of(filename):
+  try:
+    return _file_signature(os.stat(filename))
+  except OSError, e:
+    if e[0] == 2: # file not found
+      return None
+    raise
+
+
+
+def _copy_values(object):
+  # A private copy of each value (made with marshal, which fails if a value
+  # can't be marshalled)
+  return marshal.loads(marshal.dumps(object, 2))
+
+
+
+def _journal_record(object, state):
+  # Returns the journal record that turns the last committed object into 
+  # this one.   Comparing the values is much cheaper than serializing all of
+  # them.   (Values that are equal but of different types, like 1 and True,
+  # are treated as unchanged.)
+  oldvalues = state['values']
+
+  changed = {}
+  addedcount = 0
+  for key in object:
+    if key not in oldvalues:
+      changed[key] = object[key]
+      addedcount = addedcount + 1
+    elif oldvalues[key] != object[key]:
+      changed[key] = object[key]
+
+  # Only look for deleted keys if there are some
+  deleted = []
+  if len(oldvalues) + addedcount != len(object):
+    for key in oldvalues:
+      if key not in object:
+        deleted.append(key)
+
+  data = marshal.dumps((state['generation'], changed, deleted), 2)
+  header = struct.pack(JOURNAL_RECORD_HEADER, len(data), 
+      zlib.crc32(data) & 0xffffffff)
+
+  # Once the record is written, these are applied to state['values']
+  state['pendingchanges'] = (marshal.loads(data)[1], deleted)
+  return header + data
+
+
+
+def _journal_is_unchanged(filename, state):
+  # If another process committed since we did, we can't just add to the 
+  # journal
+  return _signature_of(filename) == state['snapshotsignature'] and \
+      _signature_of(filename+'.journal') == state['journalsignature']
+
+
+
+def _sync(fileobj):
+  fileobj.flush()
+  if PERSIST_FSYNC:
+    os.fsync(fileobj.fileno())
+
+
+
+def _append_journal_record(record, filename, state):
+  # 2) append the record to filename+'.journal'
+  journalobj = open(filename+'.journal', 'ab')
+  try:
+    journalobj.write(record)
+
+    # 3) flush, fsync and close the file
+    _sync(journalobj)
+    journalsignature = _file_signature(os.fstat(journalobj.fileno()))
+  finally:
+    journalobj.close()
+
+  changed, deleted = state.pop('pendingchanges')
+  state['values'].update(changed)
+  for key in deleted:
+    del state['values'][key]
+  state['journalsize'] = journalsignature[1]
+  state['journalsignature'] = journalsignature
+
+
+
+def _sync_directory(filename):
+  # fsync the directory so the rename itself makes it to disk.   This isn't
+  # possible on Windows.
+  if not PERSIST_FSYNC or os.name == 'nt':
+    return
+  directory = os.path.dirname(os.path.abspath(filename))
+  try:
+    directoryfd = os.open(directory, os.O_RDONLY)
+  except OSError:
+    return
+  try:
+    try:
+      os.fsync(directoryfd)
+    except OSError:
+      pass
+  finally:
+    os.close(directoryfd)
+
+
+
+def _commit_snapshot(object, filename, state):
   # the commit protocol is:
 
   # 1) if filename does not exist and filename+'.new' exists, move 
@@ -85,53 +310,237 @@ def commit_object(object, filename):
   if not os.path.exists(filename) and os.path.exists(filename+'.new'):
     os.rename(filename+'.new',filename)
 
+  # The generation must be newer than the one on disk (which another process
+  # may have written)
+  generation = _snapshot_generation(filename)
+  if state is not None:
+    generation = max(generation, state['generation'])
+
+  # ... and than any records we don't know about in the journal, or they 
+  # might be applied to the new snapshot if we die before emptying it
+  if state is None or \
+      _signature_of(filename+'.journal') != state['journalsignature']:
+    for record in _read_journal(filename)[0]:
+      generation = max(generation, record[0])
+
+  generation = generation + 1
+
+  try:
+    data = SNAPSHOT_HEADER_PREFIX + str(generation) + ' marshal\n' + \
+        marshal.dumps(object, 2)
+    encoding = 'marshal'
+  except ValueError:
+    data = SNAPSHOT_HEADER_PREFIX + str(generation) + ' repr\n' + repr(object)
+    encoding = 'repr'
+
   # 2) open filename+'.new'
-  outobj = open(filename+'.new', "w")
+  outobj = open(filename+'.new', "wb")
 
-  # 3) write the object
-  outobj.write(repr(object))
+  try:
+    # 3) write the object
+    outobj.write(data)
 
-  # 4) close the file 
-  outobj.flush()
-  outobj.close()
+    # 4) flush, fsync and close the file 
+    _sync(outobj)
+  finally:
+    outobj.close()
 
-  # 5) delete filename
+  # 5) (Windows only) delete filename
   # it should exist unless this is our first time...
-  if os.path.exists(filename):
+  if os.name == 'nt' and os.path.exists(filename):
     os.remove(filename)
  
   # 6) move filename+'.new' to filename
   os.rename(filename+'.new',filename)
-  
+  _sync_directory(filename)
+
+  # 7) empty filename+'.journal'.   Any records left in it (if we die first)
+  #    are for an older generation and will be ignored.
+  if os.path.exists(filename+'.journal'):
+    journalobj = open(filename+'.journal', 'wb')
+    try:
+      _sync(journalobj)
+    finally:
+      journalobj.close()
+
+  if encoding == 'marshal' and type(object) is dict:
+    committedstate[os.path.abspath(filename)] = {
+        'generation': generation,
+        'values': _copy_values(object),
+        'snapshotsize': len(data),
+        'snapshotsignature': _signature_of(filename),
+        'journalsignature': _signature_of(filename+'.journal'),
+        'journalsize': 0}
+  else:
+    committedstate.pop(os.path.abspath(filename), None)
+
+
+
+def _snapshot_generation(filename):
+  # Returns the generation of the snapshot on disk (0 if there isn't one or 
+  # it was written by an older version)
+  try:
+    fileobj = open(filename, 'rb')
+  except IOError, e:
+    if e[0] == 2: # file not found
+      return 0
+    raise
+  try:
+    firstline = fileobj.readline(100)
+  finally:
+    fileobj.close()
+
+  if not firstline.startswith(SNAPSHOT_HEADER_PREFIX):
+    return 0
+  return int(firstline.split()[1])
+
+
+
+def _parse_snapshot(data):
+  # Returns the generation and object in a snapshot.
+  if not data.startswith(SNAPSHOT_HEADER_PREFIX):
+    # Written by an older version of this module
+    return 0, eval(data)
+
+  headerend = data.index('\n')
+  generationstring, encoding = data[len(SNAPSHOT_HEADER_PREFIX):headerend].split()
+  if encoding == 'marshal':
+    return int(generationstring), marshal.loads(data[headerend + 1:])
+  elif encoding == 'repr':
+    return int(generationstring), eval(data[headerend + 1:])
+  raise ValueError, "Unknown snapshot encoding '"+encoding+"'"
 
   
 
 # reads the disk version of an object from a file with the provided name
 def restore_object(filename):
+  persistlock.acquire()
+  try:
+    return _restore_object(filename)
+  finally:
+    persistlock.release()
 
-  # BUG FIX:   Previously I just did os.listdir('.') below.   This makes 
-  # this function fail if the file isn't in this directory.
 
-  # I need to find the directory of the object.   
-  filedirectory = os.path.dirname(filename)
 
-  # I need to find the filename of the object.   
-  filenameonly = os.path.basename(filename)
+def _restore_object(filename):
+  # the recovery protocol is:
+  while True:
+    # 1) read filename.   If it doesn't exist, read it (or filename+'.new') 
+    #    with the protocol below.
+    snapshotdata, snapshotsignature = _read_snapshot(filename)
+    generation, object = _parse_snapshot(snapshotdata)
+
+    if type(object) is not dict:
+      return object
+
+    # 2) read the records in filename+'.journal' up to the first one that is
+    #    incomplete
+    records, journalsignature, complete = _read_journal(filename)
+
+    # 3) apply the records for the snapshot's generation in order
+    newersnapshot = False
+    for recordgeneration, changed, deleted in records:
+      if recordgeneration < generation:
+        continue
+      if recordgeneration > generation:
+        newersnapshot = True
+        break
+      object.update(changed)
+      for key in deleted:
+        if key in object:
+          del object[key]
+
+    # 4) if there is a record for a later generation and filename changed 
+    #    since step 1, a new snapshot was written, so goto step 1.   (If it
+    #    didn't change, an older version of this module wrote it and the 
+    #    records are out of date.)
+    if newersnapshot and snapshotsignature is not None and \
+        _signature_of(filename) != snapshotsignature:
+      continue
+
+    break
 
-  # however, for some silly reason, this sometimes returns '' instead of '.'
-  if filedirectory == '':
-    filedirectory = '.'
+  # Remember what was read so the next commit can just add to the journal.
+  # This is only safe if we know exactly what is in both files.
+  if snapshotsignature is not None and complete and not newersnapshot and \
+      snapshotdata.startswith(SNAPSHOT_HEADER_PREFIX):
+    try:
+      values = _copy_values(object)
+    except ValueError:
+      pass
+    else:
+      committedstate[os.path.abspath(filename)] = {
+          'generation': generation,
+          'values': values,
+          'snapshotsize': len(snapshotdata),
+          'snapshotsignature': snapshotsignature,
+          'journalsignature': journalsignature,
+          'journalsize': journalsignature and journalsignature[1] or 0}
 
-  # I'm assuming that listdir is an atomic way that I'll be able to check for
-  # the existence of filename and filename.new
+  # 5) return the object
+  return object
 
-  # either filename or filename+'.new' must exist (or else something is wrong)
-  filelist = os.listdir(filedirectory)
-  
-  if filenameonly not in filelist and filenameonly+'.new' not in filelist:
-    raise ValueError, "Filename '"+filename+"' missing."
 
-  # the recovery protocol is:
+
+def _read_snapshot(filename):
+  # Returns the contents of the snapshot and its signature (None if it 
+  # had to be recovered from filename+'.new')
+  while True:
+    try:
+      fileobj = open(filename, 'rb')
+    except IOError, e:
+      if e[0] != 2: # file not found
+        raise
+    else:
+      try:
+        return fileobj.read(), _file_signature(os.fstat(fileobj.fileno()))
+      finally:
+        fileobj.close()
+
+    if os.path.exists(filename+'.new'):
+      return _recover_snapshot(filename), None
+
+    # either filename or filename+'.new' must exist (or else something is 
+    # wrong).   filename may have been renamed in since we checked.
+    if not os.path.exists(filename):
+      raise ValueError, "Filename '"+filename+"' missing."
+
+
+
+def _read_journal(filename):
+  # Returns the records in the journal, its signature (None if there isn't a
+  # journal) and whether all of it was read.
+  try:
+    journalobj = open(filename+'.journal', 'rb')
+  except IOError, e:
+    if e[0] == 2: # file not found
+      return [], None, True
+    raise
+  try:
+    journaldata = journalobj.read()
+    journalsignature = _file_signature(os.fstat(journalobj.fileno()))
+  finally:
+    journalobj.close()
+
+  records = []
+  position = 0
+  while position + JOURNAL_RECORD_HEADER_SIZE <= len(journaldata):
+    length, checksum = struct.unpack(JOURNAL_RECORD_HEADER, 
+        journaldata[position:position + JOURNAL_RECORD_HEADER_SIZE])
+    datastart = position + JOURNAL_RECORD_HEADER_SIZE
+    data = journaldata[datastart:datastart + length]
+    if len(data) != length or zlib.crc32(data) & 0xffffffff != checksum:
+      break
+    records.append(marshal.loads(data))
+    position = datastart + length
+
+  complete = position == len(journaldata) == journalsignature[1]
+  return records, journalsignature, complete
+
+
+
+def _recover_snapshot(filename):
+  # the recovery protocol when filename doesn't exist is:
   while True:
     # 1) try to get the ctime for filename+'.new" 
     try:
@@ -181,9 +590,11 @@ def restore_object(filename):
     if latestctime != currentctime:
       continue
 
+    # otherwise goto step 8
+    break
 
   # 8) read the contents of filename+'.tmp'
-  readfileobj = open(filename+'.tmp')
+  readfileobj = open(filename+'.tmp', 'rb')
   readdata = readfileobj.read()
   readfileobj.close()
 
@@ -191,4 +602,4 @@ def restore_object(filename):
   os.remove(filename+'.tmp')
 
   # 10) return the result read in step 8
-  return eval(readdata)
+  return readdata
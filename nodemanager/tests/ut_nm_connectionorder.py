@@ -0,0 +1,70 @@
+"""
+Description:
+This test verifies that connections are handled round robin by IP and that
+workers skip an IP that already has max_active_per_IP connections being
+handled, so that one IP can't use every worker.
+
+The connections are handed to nmconnectionmanager directly (with made up
+IPs), so no node manager needs to be running.
+
+"""
+
+import nmconnectionmanager
+
+
+
+def check_pop(expectedIP, expectedconnection):
+  IP, connection = nmconnectionmanager.pop_request()
+  if (IP, connection) != (expectedIP, expectedconnection):
+    raise Exception("Popped " + str((IP, connection)) + " instead of " +
+        str((expectedIP, expectedconnection)))
+
+
+
+if __name__ == '__main__':
+  # With two workers, an IP may only use one of them
+  nmconnectionmanager.set_worker_count(2)
+  if nmconnectionmanager.max_active_per_IP != 1:
+    raise Exception("One IP may use " +
+        str(nmconnectionmanager.max_active_per_IP) + " of 2 workers!")
+
+  # A single worker can still be used
+  nmconnectionmanager.set_worker_count(1)
+  if nmconnectionmanager.max_active_per_IP != 1:
+    raise Exception("An IP can't use the only worker!")
+
+  nmconnectionmanager.set_worker_count(2)
+
+  # The connections only need to be distinct, they aren't used
+  for connection in ['A1', 'A2', 'A3']:
+    nmconnectionmanager.connection_handler('1.1.1.1', 1224, connection, None, None)
+  nmconnectionmanager.connection_handler('2.2.2.2', 1224, 'B1', None, None)
+
+  check_pop('1.1.1.1', 'A1')
+
+  # 1.1.1.1 is at its limit, so 2.2.2.2 goes next...
+  check_pop('2.2.2.2', 'B1')
+  if nmconnectionmanager.other_requests_are_waiting('2.2.2.2'):
+    raise Exception("Waiting connections of an IP at its limit were counted!")
+
+  # ...and nothing can be handled until 1.1.1.1's connection is done.
+  try:
+    nmconnectionmanager.pop_request()
+  except ValueError:
+    pass
+  else:
+    raise Exception("A connection of an IP at its limit was popped!")
+
+  nmconnectionmanager.finish_request('1.1.1.1')
+  if not nmconnectionmanager.other_requests_are_waiting('2.2.2.2'):
+    raise Exception("Waiting connections of another IP weren't counted!")
+
+  check_pop('1.1.1.1', 'A2')
+  nmconnectionmanager.finish_request('1.1.1.1')
+  check_pop('1.1.1.1', 'A3')
+  nmconnectionmanager.finish_request('1.1.1.1')
+  nmconnectionmanager.finish_request('2.2.2.2')
+
+  if nmconnectionmanager.connection_dict or \
+      nmconnectionmanager.active_connection_count:
+    raise Exception("Connections were left over!")
@@ -0,0 +1,126 @@
+"""
+Description:
+This test verifies that persist restores what was committed when commits are
+journaled, when the journal is compacted, when a file was written by an older
+version of persist and when a writer died part way through a commit.
+
+"""
+
+import os
+
+import persist
+
+FILENAME = 'persisttest.dict'
+
+
+
+def check_restore(expected):
+  # Restore like a different process would
+  persist.committedstate.clear()
+  restored = persist.restore_object(FILENAME)
+  if restored != expected:
+    raise Exception("Restored " + repr(restored) + " instead of " +
+        repr(expected))
+
+
+
+def removefiles():
+  for suffix in ['', '.new', '.tmp', '.journal']:
+    if os.path.exists(FILENAME + suffix):
+      os.remove(FILENAME + suffix)
+
+
+
+if __name__ == '__main__':
+  removefiles()
+  try:
+    # A file written by an older version of persist
+    vesseldict = {'v1': {'userkeys': [{'e': 3L, 'n': 5L}], 'advertise': True},
+        'v2': {'userkeys': [], 'advertise': False}}
+    fileobj = open(FILENAME, 'w')
+    fileobj.write(repr(vesseldict))
+    fileobj.close()
+    check_restore(vesseldict)
+
+    # The first commit writes a snapshot and later ones are journaled
+    vesseldict = persist.restore_object(FILENAME)
+    vesseldict['v3'] = {'userkeys': [], 'advertise': None}
+    persist.commit_object(vesseldict, FILENAME)
+    check_restore(vesseldict)
+
+    vesseldict = persist.restore_object(FILENAME)
+    snapshotsize = os.path.getsize(FILENAME)
+    vesseldict['v1']['userkeys'] = []
+    persist.commit_object(vesseldict, FILENAME)
+    del vesseldict['v2']
+    persist.commit_object(vesseldict, FILENAME)
+    if os.path.getsize(FILENAME) != snapshotsize or \
+        os.path.getsize(FILENAME + '.journal') == 0:
+      raise Exception("The changes weren't journaled!")
+    check_restore(vesseldict)
+
+    # A writer that died while appending a record
+    fileobj = open(FILENAME + '.journal', 'ab')
+    fileobj.write('\x40\x00\x00\x00\x01')
+    fileobj.close()
+    check_restore(vesseldict)
+
+    # ... and the next commit after that
+    vesseldict = persist.restore_object(FILENAME)
+    vesseldict['v1']['advertise'] = False
+    persist.commit_object(vesseldict, FILENAME)
+    check_restore(vesseldict)
+
+    # A writer that died after writing a snapshot but before emptying the
+    # journal.   The old records must not be applied to the new snapshot.
+    vesseldict = persist.restore_object(FILENAME)
+    vesseldict['v1']['advertise'] = True
+    persist.commit_object(vesseldict, FILENAME)
+    oldjournal = open(FILENAME + '.journal', 'rb').read()
+    persist.committedstate.clear()
+    vesseldict['v1']['advertise'] = 'snapshot'
+    persist.commit_object(vesseldict, FILENAME)
+    fileobj = open(FILENAME + '.journal', 'wb')
+    fileobj.write(oldjournal)
+    fileobj.close()
+    check_restore(vesseldict)
+
+    # Many commits compact the journal
+    vesseldict = persist.restore_object(FILENAME)
+    for count in range(2000):
+      vesseldict['v1']['userkeys'] = [{'e': count, 'n': 7L}]
+      persist.commit_object(vesseldict, FILENAME)
+    if os.path.getsize(FILENAME + '.journal') > \
+        max(os.path.getsize(FILENAME), persist.JOURNAL_COMPACTION_SIZE):
+      raise Exception("The journal wasn't compacted!")
+    check_restore(vesseldict)
+
+    # An older version of persist wrote the object after records were
+    # journaled
+    vesseldict['v1']['advertise'] = 'older version'
+    fileobj = open(FILENAME, 'w')
+    fileobj.write(repr(vesseldict))
+    fileobj.close()
+    check_restore(vesseldict)
+
+    vesseldict = persist.restore_object(FILENAME)
+    vesseldict['v1']['advertise'] = 'newer version'
+    persist.commit_object(vesseldict, FILENAME)
+    persist.commit_object(vesseldict, FILENAME)
+    check_restore(vesseldict)
+
+    # Objects that aren't dictionaries
+    for otherobject in [['a', 1, None], set([1, 2]), 'text']:
+      persist.commit_object(otherobject, FILENAME)
+      persist.committedstate.clear()
+      if persist.restore_object(FILENAME) != otherobject:
+        raise Exception("Restored the wrong object for " + repr(otherobject))
+
+    # The snapshot is missing (an older writer died before renaming the new
+    # one)
+    persist.commit_object(vesseldict, FILENAME)
+    os.rename(FILENAME, FILENAME + '.new')
+    check_restore(vesseldict)
+
+  finally:
+    removefiles()
@@ -0,0 +1,108 @@
+"""
+Description:
+This test verifies that a persistent session doesn't hold up the requests of
+other IPs.   One IP keeps many requests buffered on a persistent session while
+a second IP's request waits for the only worker.   The second request must be
+handled after about one request of the session, not after all of them.
+
+The connections are handed to nmconnectionmanager directly (with made up
+IPs), and process_API_call is replaced by one that takes a fixed time, so no
+node manager needs to be running.
+
+"""
+
+from repyportability import *
+
+import repyhelper
+
+repyhelper.translate_and_import("session.repy")
+
+import nmconnectionmanager
+import nmrequesthandler
+
+# How long each request takes
+REQUESTTIME = 0.1
+
+# How many requests the first IP sends on its session
+SESSIONREQUESTS = 30
+
+PORT = 12351
+
+serversockets = []
+
+
+
+def slow_process_API_call(fullrequest):
+  sleep(REQUESTTIME)
+  return fullrequest + "\nSuccess"
+
+
+
+def accept(remoteip, remoteport, socketobj, thiscommhandle, listencommhandle):
+  serversockets.append(socketobj)
+
+
+
+# Connects to ourselves and hands the server side of the connection to the
+# connection manager as if it came from IP
+def connect_as(IP):
+  serversocketcount = len(serversockets)
+  clientsocket = openconn(getmyip(), PORT)
+  while len(serversockets) == serversocketcount:
+    sleep(0.01)
+
+  nmconnectionmanager.connection_handler(IP, PORT, serversockets[-1], None, None)
+  return clientsocket
+
+
+
+if __name__ == '__main__':
+  nmrequesthandler.process_API_call = slow_process_API_call
+
+  listenhandle = waitforconn(getmyip(), PORT, accept)
+
+  worker = nmconnectionmanager.WorkerThread()
+  worker.setDaemon(True)
+  worker.start()
+
+  try:
+    # The first IP starts a session and sends all of its requests at once
+    sessionsock = SessionSocket(connect_as('1.1.1.1'))
+    sessionsock.sendmessage('PersistentSession')
+    if sessionsock.recvmessage() != '\nSuccess':
+      raise Exception("The persistent session wasn't started!")
+
+    for count in range(SESSIONREQUESTS):
+      sessionsock.sendmessage('Session' + str(count))
+
+    if sessionsock.recvmessage() != 'Session0\nSuccess':
+      raise Exception("The first request of the session wasn't handled!")
+
+    # The second IP's request waits while the session has requests left
+    starttime = getruntime()
+    othersock = connect_as('2.2.2.2')
+    session_sendmessage(othersock, 'Other')
+    if session_recvmessage(othersock) != 'Other\nSuccess':
+      raise Exception("The other IP's request wasn't handled!")
+    waittime = getruntime() - starttime
+    othersock.close()
+
+    if waittime > 3 * REQUESTTIME + 0.2:
+      raise Exception("The other IP's request waited " + str(waittime) +
+          " seconds behind the persistent session!")
+
+    # The session was ended without handling the rest of its requests, so
+    # the client knows to send them again.
+    sessionresponses = 1
+    try:
+      while True:
+        sessionsock.recvmessage()
+        sessionresponses = sessionresponses + 1
+    except Exception:
+      pass
+
+    if sessionresponses >= SESSIONREQUESTS:
+      raise Exception("The persistent session handled all of its requests!")
+
+  finally:
+    stopcomm(listenhandle)
@@ -32,6 +32,15 @@ import inspect # for fiddling with callstack/module namespaces
 # JAC / JS: to get the Python path
 import sys
 
+# for the translation manifest
+import marshal
+
+# to tell if a source file's content changed
+import hashlib
+
+# to compile translations to bytecode when they are generated
+import py_compile
+
 
 TRANSLATION_TAGLINE = "### Automatically generated by repyhelper.py ###"
 
@@ -48,6 +57,17 @@ WARNING_LABEL = """
 ENCODING_STRING = """# -*- coding: utf-8 -*-"""
 
 
+# The file in each directory with translations that records what they were
+# translated from (see _translation_is_recorded)
+TRANSLATION_MANIFEST_FILENAME = "repyhelper_translations.manifest"
+
+# The manifests that have been read, keyed by directory.   Each maps the name
+# of a translation in the directory to a tuple (absolute path of the source 
+# file, sha1 of the source file, stat of the source file, stat of the
+# translation), where a stat is (mtime, size, inode).
+_translation_manifests = {}
+
+
 class TranslationError(Exception):
   """ An error occurred during translation """
 
@@ -171,6 +191,11 @@ def _translation_is_needed(repyfilename, generatedfile):
   # Does the file already exist?
   if not os.path.isfile(generatedfile):
     return True
+
+  # If the translation is recorded in the manifest and it hasn't changed since,
+  # the checks below were already done.
+  if _translation_is_recorded(repyfilename, generatedfile):
+    return False
   
   # Was it automatically generated?
   # A file is considered to have been automatically generated if the first
@@ -192,10 +217,13 @@ def _translation_is_needed(repyfilename, generatedfile):
   
   #Check to see if the file was generated by repyhelper, to prevent
   #clobbering a file that we didn't create
-  if not first_line.startswith(ENCODING_STRING) or not second_line.startswith(TRANSLATION_TAGLINE):
+  if first_line.startswith(ENCODING_STRING) and second_line.startswith(TRANSLATION_TAGLINE):
+    tag_line = second_line
+  elif first_line.startswith(TRANSLATION_TAGLINE):
     # it also could have been created by an earlier version of repyhelper.
-    if not first_line.startswith(TRANSLATION_TAGLINE):
-      raise TranslationError("File name exists but wasn't automatically generated: " + generatedfile)
+    tag_line = first_line
+  else:
+    raise TranslationError("File name exists but wasn't automatically generated: " + generatedfile)
 
   if not last_line.startswith(TRANSLATION_TAGLINE):
     # The file generation wasn't completed...   I think this means we should
@@ -205,7 +233,7 @@ def _translation_is_needed(repyfilename, generatedfile):
   # Was it generated from the same source file?
   # This is determined by reading the source file from the translated file, and
   # comparing that to the fully-qualified filename of the source file.
-  old_translation_path = first_line[len(TRANSLATION_TAGLINE):].strip()
+  old_translation_path = tag_line[len(TRANSLATION_TAGLINE):].strip()
   generated_abs_path = os.path.abspath(repyfilename)
   if old_translation_path != generated_abs_path:
     # The old file was a translation, but not for this repy file! Regen then...
@@ -218,10 +246,115 @@ def _translation_is_needed(repyfilename, generatedfile):
   if repy_timestamp >= gen_timestamp:
     return True
     
-  # Everything appears to be consistent
+  # Everything appears to be consistent.   Record it so that the files don't
+  # need to be read next time.
+  _record_translation(repyfilename, generatedfile)
   return False
 
 
+def _get_file_stat(filename):
+  # Returns the (mtime, size, inode) of a file, which change when it is written.
+  filestat = os.stat(filename)
+  return (filestat.st_mtime, filestat.st_size, filestat.st_ino)
+
+
+def _hash_file(filename):
+  # Returns the sha1 of the content of a file.
+  fh = open(filename, "rb")
+  try:
+    return hashlib.sha1(fh.read()).hexdigest()
+  finally:
+    fh.close()
+
+
+def _read_manifest(manifestdir):
+  # Returns the manifest of the translations in a directory (an empty one if
+  # there is no readable manifest).
+  try:
+    fh = open(os.path.join(manifestdir, TRANSLATION_MANIFEST_FILENAME), "rb")
+    try:
+      manifest = marshal.load(fh)
+    finally:
+      fh.close()
+  except (IOError, EOFError, ValueError, TypeError):
+    return {}
+
+  if type(manifest) != dict:
+    return {}
+  return manifest
+
+
+def _get_manifest(manifestdir):
+  # Returns the manifest of a directory, which is only read once.
+  if manifestdir not in _translation_manifests:
+    _translation_manifests[manifestdir] = _read_manifest(manifestdir)
+  return _translation_manifests[manifestdir]
+
+
+def _translation_is_recorded(repyfilename, generatedfile):
+  """ Checks if the manifest records that generatedfile is a translation of 
+  repyfilename, and that neither has changed since.   The source file is
+  unchanged if its content is the same, even if it was modified (e.g. 
+  touched) since. This doesn't need to read the translation.
+  """
+  manifestdir, generatedname = os.path.split(os.path.abspath(generatedfile))
+  entry = _get_manifest(manifestdir).get(generatedname)
+  if entry is None:
+    return False
+
+  (source_path, source_hash, source_stat, generated_stat) = entry
+  if source_path != os.path.abspath(repyfilename):
+    return False
+
+  if _get_file_stat(generatedfile) != generated_stat:
+    return False
+
+  if _get_file_stat(repyfilename) == source_stat:
+    return True
+
+  if _hash_file(repyfilename) != source_hash:
+    return False
+
+  # Record the new stat of the source so that it isn't hashed again.
+  _record_translation(repyfilename, generatedfile)
+  return True
+
+
+def _record_translation(repyfilename, generatedfile):
+  """ Records in the manifest that generatedfile is an up to date translation
+  of repyfilename.   The manifest is only a cache, so it is fine if it can't
+  be written.
+  """
+  manifestdir, generatedname = os.path.split(os.path.abspath(generatedfile))
+  entry = (os.path.abspath(repyfilename), _hash_file(repyfilename),
+      _get_file_stat(repyfilename), _get_file_stat(generatedfile))
+
+  # Another process may have recorded other translations since the manifest
+  # was read.
+  manifest = _read_manifest(manifestdir)
+  manifest[generatedname] = entry
+  _translation_manifests[manifestdir] = manifest
+
+  manifestfilename = os.path.join(manifestdir, TRANSLATION_MANIFEST_FILENAME)
+  tempfilename = manifestfilename + "." + str(os.getpid())
+  try:
+    fh = open(tempfilename, "wb")
+    try:
+      marshal.dump(manifest, fh)
+    finally:
+      fh.close()
+
+    # Windows can't rename over an existing file
+    if os.name == 'nt' and os.path.exists(manifestfilename):
+      os.remove(manifestfilename)
+    os.rename(tempfilename, manifestfilename)
+  except (IOError, OSError):
+    try:
+      os.remove(tempfilename)
+    except (IOError, OSError):
+      pass
+
+
 def _generate_python_file_from_repy(repyfilename, generatedfilename, shared_mycontext, callfunc, callargs):
   """ Generate a python module from a repy file so it can be imported
   The first line is TRANSLATION_TAGLINE, so it's easy to detect that
@@ -342,7 +475,9 @@ def translate(filename, shared_mycontext=True, callfunc="import", callargs=None,
   
   <Side Effects>
     Creates a python file correspond to the repy file, overwriting previously 
-    generated files that exists with that name
+    generated files that exists with that name, and compiles it.   The 
+    translation is recorded in the TRANSLATION_MANIFEST_FILENAME file in
+    the same directory, so that it can be checked without being read.
   
   <Returns>
     The name of the Python module that was created in the current directory. This
@@ -407,6 +542,17 @@ def translate(filename, shared_mycontext=True, callfunc="import", callargs=None,
   if force_overwrite or _translation_is_needed(filenamewithpath, generatedfilenamewithpath):
     _generate_python_file_from_repy(filenamewithpath, generatedfilenamewithpath, shared_mycontext, callfunc, callargs)
 
+    # Compile it now, so that the bytecode is up to date even if the 
+    # translation was rewritten within the second the old bytecode was
+    # written (Python only compares the mtime in seconds).   If it can't be
+    # compiled, the import reports the error.
+    try:
+      py_compile.compile(generatedfilenamewithpath, doraise=True)
+    except (py_compile.PyCompileError, IOError, OSError):
+      pass
+
+    _record_translation(filenamewithpath, generatedfilenamewithpath)
+
   # return the name so that we can import it
   return modulenameonly
 
@@ -498,7 +644,7 @@ def _import_file_contents_to_caller_namespace(modulename, preserve_globals):
 
   #Now iterate over the import's members, and insert them into the
   #caller's namespace
-  for name,definition in inspect.getmembers(import_module):
+  for name,definition in import_module.__dict__.items():
 
     # Don't want to import things like __name__...
     if name.startswith('__'):
@@ -16,6 +16,7 @@ oldrestrictioncalls['nanny.tattle_quantity'] = nanny.tattle_quantity
 oldrestrictioncalls['nanny.tattle_add_item'] = nanny.tattle_add_item
 oldrestrictioncalls['nanny.tattle_remove_item'] = nanny.tattle_remove_item
 oldrestrictioncalls['nanny.tattle_check'] = nanny.tattle_check
+oldrestrictioncalls['nanny.tattle_disk_use'] = nanny.tattle_disk_use
 oldrestrictioncalls['restrictions.assertisallowed'] = restrictions.assertisallowed
 oldrestrictioncalls['emulfile._assert_is_allowed_filename'] = emulfile._assert_is_allowed_filename
 
@@ -47,6 +48,7 @@ def override_restrictions():
   nanny.tattle_add_item = _do_nothing
   nanny.tattle_remove_item = _do_nothing
   nanny.tattle_check = _do_nothing
+  nanny.tattle_disk_use = _do_nothing
   restrictions.assertisallowed = _do_nothing
   emulfile._assert_is_allowed_filename = _do_nothing
 
@@ -0,0 +1,79 @@
+"""
+Test that a translation is recorded in the manifest, that it isn't
+regenerated while the source is unchanged (even if the source is touched),
+and that it is regenerated when the source's content changes or the
+translation is removed.
+
+No output indicates success
+
+"""
+
+import os
+import time
+
+import repyhelper
+import test_utils
+
+TESTFILE = "rhtest_manifest.repy"
+TESTFILE_TR = test_utils.get_translation_filename(TESTFILE)
+
+
+def write_source(contents):
+  fh = open(TESTFILE, "w")
+  print >> fh, contents
+  fh.close()
+
+
+def translation_stat():
+  return repyhelper._get_file_stat(TESTFILE_TR)
+
+
+test_utils.cleanup_file(TESTFILE_TR)
+write_source("def rhtest_manifest_value():\n  return 1")
+
+repyhelper.translate(TESTFILE)
+manifest = repyhelper._read_manifest(os.path.abspath('.'))
+if TESTFILE_TR not in manifest:
+  print "The translation wasn't recorded in the manifest"
+
+if not os.path.isfile(TESTFILE_TR + "c"):
+  print "The translation wasn't compiled"
+
+# An unchanged source isn't translated again.
+firststat = translation_stat()
+repyhelper.translate(TESTFILE)
+if translation_stat() != firststat:
+  print "An unchanged translation was regenerated"
+
+# A translation that isn't in the manifest (e.g. from an earlier version) is
+# checked by reading it, and then recorded.
+repyhelper._translation_manifests.clear()
+os.remove(repyhelper.TRANSLATION_MANIFEST_FILENAME)
+if repyhelper._translation_is_needed(TESTFILE, TESTFILE_TR):
+  print "A valid translation that isn't in the manifest was thought to be stale"
+if TESTFILE_TR not in repyhelper._read_manifest(os.path.abspath('.')):
+  print "A valid translation that was checked wasn't recorded in the manifest"
+
+# Nor is a source that was only touched.
+time.sleep(0.01)
+os.utime(TESTFILE, None)
+repyhelper.translate(TESTFILE)
+if translation_stat() != firststat:
+  print "A translation was regenerated when its source was only touched"
+
+# Changing the content of the source regenerates it.
+write_source("def rhtest_manifest_value():\n  return 2")
+repyhelper.translate(TESTFILE)
+if "return 2" not in open(TESTFILE_TR).read():
+  print "A translation wasn't regenerated when its source changed"
+
+# So does removing the translation.
+test_utils.cleanup_file(TESTFILE_TR)
+repyhelper.translate(TESTFILE)
+if not os.path.isfile(TESTFILE_TR):
+  print "A removed translation wasn't regenerated"
+
+test_utils.cleanup_file(TESTFILE_TR)
+test_utils.cleanup_file(TESTFILE_TR + "c")
+test_utils.cleanup_file(TESTFILE)
+test_utils.cleanup_file(repyhelper.TRANSLATION_MANIFEST_FILENAME)
@@ -9,6 +9,9 @@ various information along the way.
 import sys
 import subprocess
 
+# addme.py is run from the node manager's directory
+import persist
+
 LOCAL = False
 
 if LOCAL:
@@ -32,9 +35,7 @@ def do_example_acquire_renew_release():
                              allow_ssl_insecure=ALLOW_SSL_INSECURE)
 
   try:
-    f = open('nodeman.cfg')
-    dictobj = eval(f.read())
-    f.close()
+    dictobj = persist.restore_object('nodeman.cfg')
   except Exception, e:
     print "addme.py: unable to read public key: '%s'" % e
     return
@@ -0,0 +1,154 @@
+"""
+<Program>
+  ut_shim_fecshim.py
+
+<Purpose>
+  Test that the FECShim passes messages through when nothing is lost, that
+  it recovers one lost data packet per group with its XOR packet, and that
+  the receiver forgets incomplete bundles after FEC_BUNDLE_TIMEOUT seconds
+  and when a source has more than FEC_MAX_BUNDLES_PER_SOURCE of them.
+
+  The bottom of the stack is a shim that hands each message straight to the
+  callback of its recvmess, unless it was told to drop it, so no network is
+  needed.
+"""
+
+import repyhelper
+import repypp
+
+STACK_SOURCE = """
+include ShimStack.repy
+include ShimException.repy
+include ShimLogger.repy
+include BaseShim.repy
+include ShimSocketWrapper.repy
+include FECShim.repy
+
+class LoopbackShim(BaseShim):
+
+  mycontext['LoopbackMessages'] = []
+  mycontext['LoopbackDrop'] = set()
+
+  def copy(self):
+    return LoopbackShim()
+
+  def get_advertisement_string(self):
+    return '(LoopbackShim)'
+
+  def recvmess(self, host, port, callback):
+    mycontext['LoopbackCallback'] = callback
+    return 'loopback'
+
+  def sendmess(self, host, port, msg, localhost=None, localport=None):
+    mycontext['LoopbackMessages'].append(msg)
+    if len(mycontext['LoopbackMessages']) - 1 not in mycontext['LoopbackDrop']:
+      mycontext['LoopbackCallback'](host, port, msg, 'loopback')
+    return len(msg)
+
+register_shim('FECShim', FECShim)
+register_shim('LoopbackShim', LoopbackShim)
+"""
+
+open('ut_shim_fecshim_stack.repy', 'w').write(STACK_SOURCE)
+open('ut_shim_fecshim_lib.repy', 'w').writelines(
+    repypp.processfile('ut_shim_fecshim_stack.repy'))
+stacklib = __import__(repyhelper.translate('ut_shim_fecshim_lib.repy'))
+
+FECContext = stacklib.FECContext
+
+# The receiver gets the time from here, so bundles can be aged
+clock = [1000.0]
+stacklib.getruntime = lambda: clock[0]
+
+received = []
+def callback(remoteip, remoteport, message, commhandle):
+  received.append(message)
+
+
+# Sends the messages from host through a new stack, dropping the packets
+# below the FECShim with the given (0 based) positions. Returns the packets
+# that were sent below the FECShim.
+def send(stackstring, host, messages, drop=()):
+  del stacklib.mycontext['LoopbackMessages'][:]
+  stacklib.mycontext['LoopbackDrop'] = set(drop)
+  del received[:]
+
+  stack = stacklib.ShimStack(stackstring, 'localhost')
+  stack.recvmess(host, 12345, callback)
+  for message in messages:
+    assert stack.sendmess(host, 12345, message) == len(message)
+  return list(stacklib.mycontext['LoopbackMessages'])
+
+
+# Different lengths, so the recovered packets must be truncated
+messages = ['Hello', 'World!!!', 'a' * 1000, '', 'xyz' * 50, 'Q']
+
+# Nothing lost: every message arrives once, and no XOR packet is needed
+for stackstring, packetspersent in [('(FECShim)(LoopbackShim)', 3 / 2.0),
+    ('(FECShim,3,6)(LoopbackShim)', 2)]:
+  usefulxorcount = FECContext['usefulxorcount']
+  sent = send(stackstring, 'nolosshost', messages)
+  assert len(sent) == len(messages) * packetspersent
+  assert received == messages
+  assert FECContext['usefulxorcount'] == usefulxorcount
+
+# (FECShim,4,6) has two groups per bundle: data packets 0 and 2 with XOR
+# packet 4, and data packets 1 and 3 with XOR packet 5. Losing one packet of
+# each group loses nothing. The bundles are sent as packets 0-5 and 6-11.
+usefulxorcount = FECContext['usefulxorcount']
+send('(FECShim,4,6)(LoopbackShim)', 'losshost', messages + ['end', 'END'],
+    drop=[1, 2, 6])
+assert sorted(received) == sorted(messages + ['end', 'END'])
+assert FECContext['usefulxorcount'] == usefulxorcount + 3
+
+# With the default of 2 data packets and 1 XOR packet, one loss per bundle is
+# fine...
+send('(FECShim)(LoopbackShim)', 'defaultlosshost', messages,
+    drop=[0, 4, 8])
+assert sorted(received) == sorted(messages)
+
+# ... but two losses in one group can't be recovered.
+insufficientxorcount = FECContext['insufficientxorcount']
+send('(FECShim,4,6)(LoopbackShim)', 'twolosshost', messages[:4], drop=[0, 2])
+assert sorted(received) == sorted(messages[1:2] + messages[3:4])
+assert FECContext['insufficientxorcount'] == insufficientxorcount + 1
+
+
+# An incomplete bundle is forgotten once it is older than FEC_BUNDLE_TIMEOUT
+# (the check is done when another bundle arrives)
+clock[0] = clock[0] + 5
+sent = send('(FECShim)(LoopbackShim)', 'expiryhost', messages[:2], drop=[1, 2])
+assert received == messages[:1]
+[(createdtime, bundleid)] = FECContext['received_bundle_order']['expiryhost']
+assert bundleid in FECContext['received_bundle_dictionary']['expiryhost']
+
+clock[0] = clock[0] + stacklib.FEC_BUNDLE_TIMEOUT / 2.0
+send('(FECShim)(LoopbackShim)', 'otherhost', messages[:2])
+assert bundleid in FECContext['received_bundle_dictionary']['expiryhost']
+
+expiredbundlecount = FECContext['expiredbundlecount']
+clock[0] = clock[0] + stacklib.FEC_BUNDLE_TIMEOUT
+send('(FECShim)(LoopbackShim)', 'otherhost', messages[:2])
+assert 'expiryhost' not in FECContext['received_bundle_dictionary']
+assert 'expiryhost' not in FECContext['received_bundle_order']
+assert FECContext['expiredbundlecount'] > expiredbundlecount
+
+# A late packet of the expired bundle starts a new bundle
+del received[:]
+stacklib.mycontext['LoopbackCallback']('expiryhost', 12345, sent[1], 'loopback')
+assert received == messages[1:2]
+
+
+# A source can't have more than FEC_MAX_BUNDLES_PER_SOURCE bundles, the
+# oldest are forgotten first
+clock[0] = clock[0] + 1
+bundlecount = stacklib.FEC_MAX_BUNDLES_PER_SOURCE + 10
+send('(FECShim)(LoopbackShim)', 'manybundleshost', messages[:2] * bundlecount,
+    drop=range(2, 3 * bundlecount, 3))
+assert received == messages[:2] * bundlecount
+bundleorder = FECContext['received_bundle_order']['manybundleshost']
+bundledict = FECContext['received_bundle_dictionary']['manybundleshost']
+assert len(bundleorder) == stacklib.FEC_MAX_BUNDLES_PER_SOURCE
+assert len(bundledict) == stacklib.FEC_MAX_BUNDLES_PER_SOURCE
+assert sorted(bundledict.keys()) == [bundleid for (createdtime, bundleid) in bundleorder]
+assert min(bundledict.keys()) == FECContext['nextbundleid'] - stacklib.FEC_MAX_BUNDLES_PER_SOURCE
@@ -0,0 +1,98 @@
+"""
+<Program>
+  ut_shim_teststats_compression.py
+
+<Purpose>
+  Test that a shim that overrides its public sendmess (here the
+  CompressionShim) still transforms its messages when the operations are
+  counted (see shimstack_collect_stats()), and that the messages are counted
+  and round trip through the stack. Also test that (CompressionShim) still
+  sends the legacy wire format, so that it works with older nodes.
+
+  The bottom of the stack is a shim that hands each message straight to the
+  callback of its recvmess, so no network is needed.
+"""
+
+import repyhelper
+import repypp
+
+STACK_SOURCE = """
+include ShimStack.repy
+include ShimException.repy
+include ShimLogger.repy
+include BaseShim.repy
+include ShimSocketWrapper.repy
+include CompressionShim.repy
+
+class LoopbackShim(BaseShim):
+
+  mycontext['LoopbackMessages'] = []
+
+  def copy(self):
+    return LoopbackShim()
+
+  def get_advertisement_string(self):
+    return '(LoopbackShim)'
+
+  def recvmess(self, host, port, callback):
+    mycontext['LoopbackCallback'] = callback
+    return 'loopback'
+
+  def sendmess(self, host, port, msg, localhost=None, localport=None):
+    mycontext['LoopbackMessages'].append(msg)
+    mycontext['LoopbackCallback'](host, port, msg, 'loopback')
+    return len(msg)
+
+register_shim('CompressionShim', CompressionShim)
+register_shim('LoopbackShim', LoopbackShim)
+"""
+
+open('ut_shim_teststats_stack.repy', 'w').write(STACK_SOURCE)
+open('ut_shim_teststats_lib.repy', 'w').writelines(
+    repypp.processfile('ut_shim_teststats_stack.repy'))
+stacklib = __import__(repyhelper.translate('ut_shim_teststats_lib.repy'))
+
+received = []
+def callback(remoteip, remoteport, message, commhandle):
+  received.append(message)
+
+message = 'Hello World ' * 100
+
+for collect in [False, True]:
+  stacklib.shimstack_collect_stats(collect)
+  del stacklib.mycontext['LoopbackMessages'][:]
+  del received[:]
+
+  stack = stacklib.ShimStack('(CompressionShim,2)(LoopbackShim)', 'localhost')
+  stack.recvmess('localhost', 12345, callback)
+  assert stack.sendmess('localhost', 12345, message) == len(message)
+
+  # The message below the CompressionShim was compressed...
+  [sentmessage] = stacklib.mycontext['LoopbackMessages']
+  assert sentmessage.startswith(stacklib.COMPRESSED_CHUNK)
+  assert len(sentmessage) < len(message)
+
+  # ... and the message that came back up was decompressed.
+  assert received == [message]
+
+  assert isinstance(stack.top_shim, stacklib.CompressionShim)
+  stats = stack.top_shim.get_stats()
+  if collect:
+    assert stats['sendmess'][:2] == [1, len(message)]
+  else:
+    assert stats == {}
+
+stacklib.shimstack_collect_stats(False)
+
+# The legacy format is the message compressed on its own, without a type
+del stacklib.mycontext['LoopbackMessages'][:]
+del received[:]
+
+stack = stacklib.ShimStack('(CompressionShim)(LoopbackShim)', 'localhost')
+stack.recvmess('localhost', 12345, callback)
+assert stack.sendmess('localhost', 12345, message) == len(message)
+
+[sentmessage] = stacklib.mycontext['LoopbackMessages']
+assert sentmessage == stacklib.zlib.compress(message, 9)
+assert received == [message]
+assert stack.top_shim.get_advertisement_string() == '(CompressionShim)(LoopbackShim)'
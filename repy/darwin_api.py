@@ -24,6 +24,7 @@ import portable_popen  # Import for our custom Popen
 # Manually import the common functions we want
 exists_outgoing_network_socket = nix_api.exists_outgoing_network_socket
 exists_listening_network_socket = nix_api.exists_listening_network_socket
+clear_socket_table_cache = nix_api.clear_socket_table_cache
 get_available_interfaces = nix_api.get_available_interfaces
 get_ctypes_errno = nix_api.get_ctypes_errno
 get_ctypes_error_str = nix_api.get_ctypes_error_str
@@ -24,6 +24,9 @@ import socket
 # Armon: Used to check if a socket is ready
 import select
 
+# Used by the SocketSelector to wait for listening sockets to become ready
+import selectbackend
+
 # socket uses getattr and setattr.   We need to make these available to it...
 socket.getattr = getattr
 socket.setattr = setattr
@@ -60,11 +63,14 @@ import errno
 # Armon: Used for getting the constant IP values for resolving our external IP
 import repy_constants 
 
-# The architecture is that I have a thread which "polls" all of the sockets
-# that are being listened on using select.  If a connection
-# oriented socket has a connection pending, or a message-based socket has a
-# message pending, and there are enough events it calls the appropriate
-# function.
+# for reusing threads to deliver events when the pool is enabled
+import eventpool
+
+# The architecture is that I have a thread which waits on all of the sockets
+# that are being listened on using a readiness backend (epoll, poll, or 
+# select, see selectbackend.py).  If a connection oriented socket has a 
+# connection pending, or a message-based socket has a message pending, and 
+# there are enough events it calls the appropriate function.
 
 
 
@@ -421,6 +427,12 @@ selectorlock = threading.Lock()
 # is the selector thread started...
 selectorstarted = False
 
+# The readiness backend that holds all of the listening sockets.   This is
+# created the first time a socket is registered and lives as long as the
+# process does (even if the selector thread exits and is later restarted).
+selectorbackend = None
+selectorbackendlock = threading.Lock()
+
 
 #### helper functions
 
@@ -434,6 +446,28 @@ def find_socket_entry(socketobject):
 
 
 
+# private.   Returns the readiness backend, creating it if needed.
+def get_selector_backend():
+  global selectorbackend
+
+  selectorbackendlock.acquire()
+  try:
+    if selectorbackend is None:
+      selectorbackend = selectbackend.get_backend()
+    return selectorbackend
+  finally:
+    selectorbackendlock.release()
+
+
+
+# private.   Have the SocketSelector watch a listening socket.   If the socket
+# is already watched, the handle is updated (waitforconn / recvmess can 
+# replace the handle of an existing listener)
+def register_listening_socket(socketobject, handle):
+  get_selector_backend().register(socketobject, handle)
+
+
+
 # wait until there is a free event
 def wait_for_event(eventname):
   while True:
@@ -482,7 +516,8 @@ def should_selector_exit():
 
 
 # This function starts a thread to handle an entry with a readable socket in 
-# the comminfo table
+# the comminfo table.   Returns True if an event was started, False if the
+# socket turned out to have nothing for us.
 def start_event(entry, handle,eventhandle):
   if entry['type'] == 'UDP':
     # some sort of socket error, I'll assume they closed the socket or it's
@@ -493,7 +528,7 @@ def start_event(entry, handle,eventhandle):
     except socket.error:
       # they closed in the meantime?
       nanny.tattle_remove_item('events',eventhandle)
-      return
+      return False
 
     # wait if we're over the limit
     if data:
@@ -505,17 +540,18 @@ def start_event(entry, handle,eventhandle):
     else:
       # no data...   Let's stop this...
       nanny.tattle_remove_item('events',eventhandle)
-      return
+      return False
 
       
     try:
-      EventDeliverer(entry['function'],(addr[0], addr[1], data, handle), eventhandle).start()
+      start_event_delivery(entry['function'],(addr[0], addr[1], data, handle), eventhandle)
     except Exception, e:
       # This is an internal error I think...
       # This will cause the program to exit and log things if logging is
       # enabled. -Brent
       tracebackrepy.handle_internalerror("Can't start UDP EventDeliverer '" + str(e)+"'", 29)
 
+    return True
 
 
   # or it's a TCP accept event...
@@ -525,7 +561,7 @@ def start_event(entry, handle,eventhandle):
     except socket.error:
       # they closed in the meantime?
       nanny.tattle_remove_item('events',eventhandle)
-      return
+      return False
     
     # put this handle in the table
     newhandle = generate_commhandle()
@@ -537,13 +573,15 @@ def start_event(entry, handle,eventhandle):
     safesocket = emulated_socket(newhandle)
 
     try:
-      EventDeliverer(entry['function'],(addr[0], addr[1], safesocket, newhandle, handle),eventhandle).start()
+      start_event_delivery(entry['function'],(addr[0], addr[1], safesocket, newhandle, handle),eventhandle)
     except Exception, e:
       # This is an internal error I think...
       # This will cause the program to exit and log things if logging is
       # enabled. -Brent
       tracebackrepy.handle_internalerror("Can't start TCP EventDeliverer '"+str(e)+"'", 23)
 
+    return True
+
 
   else:
     # Should never get here
@@ -554,75 +592,52 @@ def start_event(entry, handle,eventhandle):
 
 
 # Armon: What is the maximum number of samples to perform per second?
-# This is to prevent excessive sampling if there is a bad socket and
-# select() returns before timing out
+# This is to prevent excessive sampling if there is a bad socket that is
+# reported as ready but never produces an event.   When sockets are ready
+# normally, the selector does not sleep at all.
 MAX_SAMPLES_PER_SEC = 10
 TIME_BETWEEN_SAMPLES = 1.0 / MAX_SAMPLES_PER_SEC
 
-# Check for sockets using select and fire up user event threads as needed.
+# How long the selector blocks waiting for a ready socket.   The selector is 
+# woken up early when a listening socket is removed, so this only bounds how
+# long an unnoticed change can go unhandled.
+SELECTOR_WAIT_TIMEOUT = 0.5
+
+# Check for ready sockets and fire up user event threads as needed.
 #
 # This class holds nearly all of the complexity in this module.   It's 
-# basically just a loop that gets pending sockets (using select) and then
-# fires up events that call user provided functions
+# basically just a loop that gets pending sockets (from the readiness 
+# backend) and then fires up events that call user provided functions
 class SocketSelector(threading.Thread):
   
   def __init__(self):
     threading.Thread.__init__(self, name="SocketSelector")
 
 
-  # Gets a list of all the sockets which are ready to have
-  # accept() called on them
+  # Gets a list of (commtableentry, commhandle) tuples for the listening
+  # sockets which are ready to have accept() / recvfrom() called on them
   def get_acceptable_sockets(self):
-    # get the list of socket objects we might have a pending request on
-    requestlist = []
-    for comm in comminfo.values():
-      if not comm['outgoing']:
-        requestlist.append(comm['socket'])
+    readylist = []
+
+    for (readysocket, commhandle) in get_selector_backend().wait(SELECTOR_WAIT_TIMEOUT):
+      # The backend knows the handle the socket was registered with.   This
+      # is almost always right, but the handle may have been replaced in the
+      # interim (waitforconn / recvmess on the same ip and port).
+      entry = comminfo.get(commhandle)
+      if entry is None or entry['socket'] is not readysocket:
+        try: 
+          entry, commhandle = find_socket_entry(readysocket)
+        except KeyError:
+          # let's skip this one, it's likely it was closed in the interim
+          continue
 
-    # nothing to request.   We should loop back around and check if all 
-    # sockets have been closed
-    if requestlist == []:
-      return []
+      readylist.append((entry, commhandle))
 
-    # Perform a select on these sockets
-    try:
-      # Call select
-      (acceptable, not_applic, has_excp) = select.select(requestlist,[],requestlist,0.5)
-    
-      # Add all the sockets with exceptions to the acceptable list
-      for sock in has_excp:
-        if sock not in acceptable:
-          acceptable.append(sock)
-
-      # Return the acceptable list
-      return acceptable
-    
-    # There was probably an exception on the socket level, check individually
-    except:
-
-      # Hold the ready sockets
-      readylist = []
-
-      # Check each requested socket
-      for socket in requestlist:
-        try:
-          (accept_will_block, write_will_block) = socket_state(socket, "r")
-          if not accept_will_block:
-            readylist.append(socket)
-        
-        # Ignore errors, probably the socket is closed.
-        except:
-          pass
-
-      # Return the ready list
-      return readylist
+    return readylist
 
 
 
   def run(self):
-    # Keep track of the last sample time
-    # updated when there are no ready sockets
-    last_sample = 0
 
     while True:
 
@@ -630,29 +645,14 @@ class SocketSelector(threading.Thread):
       if should_selector_exit():
         return
 
-      # If the last sample with 0 ready sockets was less than TIME_BETWEEN_SAMPLES
-      # seconds ago, sleep a while. This is to prevent a tight loop from consuming
-      # CPU time doing nothing.
-      current_time = nonportable.getruntime()
-      time_diff = current_time - last_sample
-      if time_diff < TIME_BETWEEN_SAMPLES:
-        time.sleep(TIME_BETWEEN_SAMPLES - time_diff)
-
-      # Get all the ready sockets
+      # Get all the ready sockets.   This blocks until there is something to
+      # do, a listening socket is removed, or the wait times out.
       readylist = self.get_acceptable_sockets()
 
-      # If there is nothing to do, potentially delay the next sample
-      if len(readylist) == 0:
-        last_sample = current_time
-
       # go through the pending sockets, grab an event and then start a thread
       # to handle the connection
-      for thisitem in readylist:
-        try: 
-          commtableentry,commhandle = find_socket_entry(thisitem)
-        except KeyError:
-          # let's skip this one, it's likely it was closed in the interim
-          continue
+      startedevent = False
+      for (commtableentry, commhandle) in readylist:
 
         # now it's time to get the event...   I'll loop until there is a free
         # event
@@ -666,9 +666,14 @@ class SocketSelector(threading.Thread):
           nanny.tattle_quantity('netrecv',0)
 
         # Now I can start a thread to run the user's code...
-        start_event(commtableentry,commhandle,eventhandle)
-      
+        if start_event(commtableentry,commhandle,eventhandle):
+          startedevent = True
 
+      # Sockets were ready, but none of them did anything (likely a socket 
+      # in an error state).   Don't spin on them.
+      if readylist and not startedevent:
+        time.sleep(TIME_BETWEEN_SAMPLES)
+      
 
 
 
@@ -690,17 +695,34 @@ class EventDeliverer(threading.Thread):
     threading.Thread.__init__(self,name=idhelper.get_new_thread_name(COMM_PREFIX))
 
   def run(self):
-    try:
-      self.func(*(self.args))
-    except:
-      # we probably should exit if they raise an exception in a thread...
-      tracebackrepy.handle_exception()
-      harshexit.harshexit(14)
+    deliver_event(self.func, self.args, self.eventid)
+
+
+
+# Calls the user's function for an event and releases the event afterwards.
+# This runs in an EventDeliverer thread or on an eventpool worker.
+def deliver_event(func, args, eventid):
+  try:
+    func(*args)
+  except:
+    # we probably should exit if they raise an exception in a thread...
+    tracebackrepy.handle_exception()
+    harshexit.harshexit(14)
+
+  finally:
+    # our event is going away...
+    nanny.tattle_remove_item('events',eventid)
+
+
+
+# Delivers an event using a new EventDeliverer thread, or a pool worker if the
+# pool is enabled.   The caller must already have the event.
+def start_event_delivery(func, args, eventid):
+  if eventpool.enabled:
+    eventpool.deliver(deliver_event, (func, args, eventid), COMM_PREFIX)
+  else:
+    EventDeliverer(func, args, eventid).start()
 
-    finally:
-      # our event is going away...
-      nanny.tattle_remove_item('events',self.eventid)
-      
 
 
 
@@ -1022,6 +1044,11 @@ def cleanup(handle):
   # if it's in the table then remove the entry and tattle...
   try:
     if handle in comminfo:
+      # Stop the selector from watching a listening socket before it's
+      # closed (otherwise the file descriptor may be reused while watched)
+      if not comminfo[handle]['outgoing']:
+        get_selector_backend().unregister(comminfo[handle]['socket'])
+
       # Armon: Shutdown the socket for writing prior to close
       # to unblock any threads that are writing
       try:
@@ -1054,6 +1081,7 @@ def cleanup(handle):
         # another process binds to the ip/port we are checking. This would cause us to detect
         # the socket from the other process and we would block indefinately while that socket
         # is open.
+        nonportable.os_api.clear_socket_table_cache()
         while nonportable.os_api.exists_listening_network_socket(ip,port, tcp):
           time.sleep(RETRY_INTERVAL)
       
@@ -1063,6 +1091,10 @@ def cleanup(handle):
       except KeyError:
         pass
 
+      # Let the selector check if it still has anything to listen on
+      if not info['outgoing']:
+        get_selector_backend().wakeup()
+
   finally:
     # Always release the lock
     handle_lock.release()
@@ -1297,6 +1329,9 @@ def recvmess(localip, localport, function):
     # Remove the old entry
     safe_delete_handle(oldhandle)
 
+    # The selector should report the new handle for this socket
+    register_listening_socket(comminfo[handle]['socket'], handle)
+
     # We need nanny to substitute the old handle with the new one
     nanny.tattle_remove_item('insockets',oldhandle)
     nanny.tattle_add_item('insockets',handle)
@@ -1330,6 +1365,10 @@ def recvmess(localip, localport, function):
   # set up our table entry
   comminfo[handle] = {'type':'UDP','localip':localip, 'localport':localport,'function':function,'socket':s, 'outgoing':False, 'closing_lock':threading.Lock() }
 
+  # have the selector watch for messages (this must happen before the
+  # selector is checked so it won't exit thinking there is nothing to do)
+  register_listening_socket(s, handle)
+
   # start the selector if it's not running already
   check_selector()
 
@@ -1434,6 +1473,9 @@ def openconn(desthost, destport,localip=None, localport=None,timeout=None):
 
   # Armon: Check for any pre-existing sockets. If they are being closed, wait for them.
   # This will also serve to check if repy has a pre-existing socket open on this same tuple
+  # A socket on this tuple may have just been opened or closed, so don't use
+  # a socket table that was read before that.
+  nonportable.os_api.clear_socket_table_cache()
   exists = True
   while exists and nonportable.getruntime() - starttime < timeout:
     # Update the status
@@ -1603,6 +1645,9 @@ def waitforconn(localip, localport,function):
     # Remove the entry for the old socket
     safe_delete_handle(oldhandle)
 
+    # The selector should report the new handle for this socket
+    register_listening_socket(comminfo[handle]['socket'], handle)
+
     # Un "tattle" the old handle, re-add the new handle
     nanny.tattle_remove_item('insockets',oldhandle)
     nanny.tattle_add_item('insockets',handle)
@@ -1629,6 +1674,10 @@ def waitforconn(localip, localport,function):
     nanny.tattle_remove_item('insockets',handle)
     raise
 
+  # have the selector watch for connections (this must happen before the
+  # selector is checked so it won't exit thinking there is nothing to do)
+  register_listening_socket(mainsock, handle)
+
 
   # start the selector if it's not running already
   check_selector()
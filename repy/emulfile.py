@@ -21,6 +21,10 @@ import gc
 # needed for locking the fileinfo hash
 import threading
 
+# The disk use that each file is charged for in addition to its size (this
+# is the same as nonportable.compute_disk_use).
+FILE_DISK_USE_OVERHEAD = 4096
+
 # Fix for ticket #983. By retaining a reference to unicode, we prevent
 # os.path.abspath from failing in some versions of python when the unicode
 # builtin is overwritten.
@@ -68,7 +72,7 @@ def removefile(filename):
       An exception is raised if the file does not exist
 
    <Side Effects>
-      None
+      The disk use of the file is no longer charged.
 
    <Returns>
       None
@@ -88,10 +92,13 @@ def removefile(filename):
       if filename == fileinfo[filehandle]['filename']:
         raise Exception, 'File "'+filename+'" is open with handle "'+filehandle+'"'
 
+    filesize = os.path.getsize(filename)
     result = os.remove(filename)
   finally:
     fileinfolock.release()
 
+  nanny.tattle_disk_use(-(filesize + FILE_DISK_USE_OVERHEAD))
+
   return result
    
 
@@ -153,7 +160,10 @@ def emulated_open(filename, mode="rb"):
 
   elif mode == "w" or mode == "w+":
     file_object = emulated_file(filename, "rw", create=True)
-    fileinfo[file_object.filehandle]['fobj'].truncate()
+    thisfileinfo = fileinfo[file_object.filehandle]
+    thisfileinfo['fobj'].truncate()
+    nanny.tattle_disk_use(-thisfileinfo['size'])
+    thisfileinfo['size'] = 0
 
   elif mode == "a" or mode == "a+":
     file_object = emulated_file(filename, "rw", create=True)
@@ -214,6 +224,19 @@ def how_is_filename_incorrect(filename):
 
 
 
+# Charges the disk use of writing writeamt bytes at the current position of
+# the file in thisfileinfo (an entry of fileinfo), before it is written.
+# Only the bytes that are past the end of the file count.   Raises an
+# exception (and charges nothing) if this would be over the disk use limit.
+def _charge_write(thisfileinfo, writeamt):
+  newsize = thisfileinfo['fobj'].tell() + writeamt
+  if newsize > thisfileinfo['size']:
+    nanny.tattle_disk_use(newsize - thisfileinfo['size'])
+    thisfileinfo['size'] = newsize
+
+
+
+
 # PUBLIC class.  The user can mess with this...
 class emulated_file:
   """
@@ -302,18 +325,29 @@ class emulated_file:
         # Create a file by opening it in write mode and then closing it.
         restrictions.assertisallowed('file.__init__', filename, 'wb')
 
-        # Allocate a resource.
+        # A new file is charged for even while it is empty.
+        nanny.tattle_disk_use(FILE_DISK_USE_OVERHEAD)
+
         try:
-          nanny.tattle_add_item('filesopened', self.filehandle)
-        except Exception:
-          # Ok, maybe we can free up a file by garbage collecting.
-          gc.collect()
-          nanny.tattle_add_item('filesopened', self.filehandle)
+          # Allocate a resource.
+          try:
+            nanny.tattle_add_item('filesopened', self.filehandle)
+          except Exception:
+            # Ok, maybe we can free up a file by garbage collecting.
+            gc.collect()
+            nanny.tattle_add_item('filesopened', self.filehandle)
+
+          # Create the file, and then free up the resource.
+          try:
+            created_file = myfile(filename, 'wb')
+            created_file.close()
+          finally:
+            nanny.tattle_remove_item('filesopened', self.filehandle)
 
-        # Create the file, and then free up the resource.
-        created_file = myfile(filename, 'wb')
-        created_file.close()
-        nanny.tattle_remove_item('filesopened', self.filehandle)
+        except Exception:
+          # The file wasn't created, so it isn't charged for.
+          nanny.tattle_disk_use(-FILE_DISK_USE_OVERHEAD)
+          raise
 
       self.filehandle = idhelper.getuniqueid()
 
@@ -329,8 +363,14 @@ class emulated_file:
         gc.collect()
         nanny.tattle_add_item('filesopened', self.filehandle)
 
+      fileobj = myfile(filename, actual_mode)
       fileinfo[self.filehandle] = {'filename':filename, \
-          'mode':actual_mode, 'fobj':myfile(filename, actual_mode)}
+          'mode':actual_mode, 'fobj':fileobj}
+
+      # The size of a file that can be written is tracked so that only the
+      # writes that grow it are charged as disk use.
+      if mode == "rw":
+        fileinfo[self.filehandle]['size'] = os.fstat(fileobj.fileno()).st_size
       self.name = filename
       self.mode = mode
 
@@ -485,9 +525,11 @@ class emulated_file:
 
     if "w" in self.mode:
       try:
-        retval = fileinfo[myfilehandle]['fobj'].write(writeitem)
+        thisfileinfo = fileinfo[myfilehandle]
       except KeyError:
         raise ValueError("Invalid file object (probably closed).")
+      _charge_write(thisfileinfo, len(str(writeitem)))
+      retval = thisfileinfo['fobj'].write(writeitem)
     else:
       raise ValueError("write() isn't allowed on read-only file objects!")
 
@@ -509,13 +551,14 @@ class emulated_file:
       raise ValueError("writelines() isn't allowed on read-only file objects!")
     
     try:
-      fh = fileinfo[myfilehandle]['fobj']
+      thisfileinfo = fileinfo[myfilehandle]
     except KeyError:
       raise ValueError("Invalid file object (probably closed).")
 
     for writeitem in writelist:
       strtowrite = str(writeitem)
-      fileinfo[myfilehandle]['fobj'].write(strtowrite)
+      _charge_write(thisfileinfo, len(strtowrite))
+      thisfileinfo['fobj'].write(strtowrite)
       nanny.tattle_quantity('filewrite', len(strtowrite))
 
     return None   # python documentation states there is no return value
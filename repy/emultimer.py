@@ -25,10 +25,14 @@ import tracebackrepy
 # for harshexit
 import harshexit
 
+# for reusing threads when the pool is enabled
+import eventpool
+
 
 timerinfo = {}
 # Table of timer structures:
 # {'timer':timerobj,'function':function}
+# timerobj is a threading.Timer, or an eventpool.Timer if the pool is enabled
 
 # Armon: Prefix for use with event handles
 EVENT_PREFIX = "_EVENT:"
@@ -132,10 +136,14 @@ def settimer(waittime, function, args):
 
   nanny.tattle_add_item('events',eventhandle)
 
-  tobj = threading.Timer(waittime,functionwrapper,[function] + [eventhandle] + [args])
+  if eventpool.enabled:
+    # The pool names the worker thread when the timer fires
+    tobj = eventpool.Timer(waittime,functionwrapper,[function] + [eventhandle] + [args], EVENT_PREFIX)
+  else:
+    tobj = threading.Timer(waittime,functionwrapper,[function] + [eventhandle] + [args])
 
-  # Set the name of the thread
-  tobj.setName(idhelper.get_new_thread_name(EVENT_PREFIX))
+    # Set the name of the thread
+    tobj.setName(idhelper.get_new_thread_name(EVENT_PREFIX))
 
   timerinfo[eventhandle] = {'timer':tobj}
   
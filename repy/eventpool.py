@@ -0,0 +1,324 @@
+"""
+   Start Date: 18 October 2026
+
+   Description:
+
+   An optional pool of reusable threads for delivering events to user code.
+
+   Normally every incoming connection or message (emulcomm) and every timer
+   (emultimer) gets a brand new thread.   Under bursty load, creating and
+   tearing down those threads costs more than the user callbacks do.   When
+   the pool is enabled (repy.py --eventpool), callbacks are instead handed to
+   idle worker threads, and timers wait in a single scheduler thread rather
+   than a sleeping thread apiece.
+
+   The pool does not change resource accounting.   The caller still charges
+   the 'events' resource before handing over a callback, and the callback
+   itself (e.g. EventDeliverer / functionwrapper code) removes the event when
+   it finishes.   Since every running or pending callback holds an event,
+   there is never a need for more workers than the 'events' limit, which is
+   what bounds the pool by default.
+
+   Each time a worker picks up a callback it is given a fresh thread name with
+   the caller's prefix, so user code sees the same unique names it would with
+   a thread per event.
+
+   Idle workers (and the scheduler thread when there are no pending timers)
+   are still alive, so repy.py subtracts idle_thread_count() from
+   threading.activeCount() when it decides whether the program is done.
+"""
+
+import threading
+import thread   # for allocate_lock and thread.error
+import time
+import heapq
+
+# for the events limit
+import nanny
+
+# to give each delivered event a unique thread name
+import idhelper
+
+# for exiting if a worker thread can't be started for a timer
+import harshexit
+
+
+# Is the pool used?   This is set by repy.py before any user code runs.
+enabled = False
+
+# The maximum number of worker threads.   None means use the 'events' limit.
+maxworkers = None
+
+# The number of threads the pool has created (for benchmarks / diagnostics)
+threadscreated = 0
+
+
+# Protects everything below (and is also the lock for the timer condition, so
+# that handing a timer to a worker is atomic with respect to
+# idle_thread_count())
+poollock = threading.Lock()
+
+# Workers waiting for something to do (a stack so hot threads are reused)
+idleworkers = []
+
+# Callbacks waiting for a worker when the pool is at its limit
+pendingtasks = []
+
+# The number of worker threads that exist
+workercount = 0
+
+# Timer state.   timerheap holds (firetime, sequence, timerobj) tuples.   Cancelled
+# timers are left in the heap and skipped when they reach the top.
+timercondition = threading.Condition(poollock)
+timerheap = []
+timersequence = [0]
+livetimercount = 0
+timerthread = None
+
+
+
+
+def _get_worker_limit():
+  if maxworkers is not None:
+    return maxworkers
+
+  # This is a float when read from a restrictions file
+  return int(nanny.resource_restriction_table['events'])
+
+
+
+
+def _run_task(task):
+  (function, args, threadprefix) = task
+  threading.currentThread().setName(idhelper.get_new_thread_name(threadprefix))
+  function(*args)
+
+
+
+
+class EventWorker(threading.Thread):
+  """
+  A thread that runs callbacks for the pool until the process exits.
+  """
+
+  def __init__(self, task):
+    threading.Thread.__init__(self, name="EventWorker")
+    self.setDaemon(True)
+    self.task = task
+
+    # Held while the worker is idle.   Releasing it hands the worker a task.
+    self.wakelock = thread.allocate_lock()
+    self.wakelock.acquire()
+
+
+  def run(self):
+    while True:
+      _run_task(self.task)
+      self.task = None
+
+      poollock.acquire()
+      try:
+        if pendingtasks:
+          self.task = pendingtasks.pop(0)
+          continue
+        idleworkers.append(self)
+      finally:
+        poollock.release()
+
+      # Block until deliver() gives us something to do
+      self.wakelock.acquire()
+
+
+
+
+# Private.   The caller must hold poollock
+def _deliver_locked(task):
+  global workercount
+  global threadscreated
+
+  if idleworkers:
+    worker = idleworkers.pop()
+    worker.task = task
+    worker.wakelock.release()
+    return
+
+  if workercount < _get_worker_limit():
+    worker = EventWorker(task)
+    # start() may raise thread.error.   The caller handles this the same way
+    # it would for a thread of its own.
+    worker.start()
+    workercount = workercount + 1
+    threadscreated = threadscreated + 1
+    return
+
+  pendingtasks.append(task)
+
+
+
+
+def deliver(function, args, threadprefix):
+  """
+   <Purpose>
+      Runs function(*args) on a pool worker thread.
+
+   <Arguments>
+      function:
+         The function to run.   It is responsible for handling its own
+         exceptions and for removing its event from the nanny.
+      args:
+         A tuple of arguments for function
+      threadprefix:
+         The prefix for the thread name the function sees (e.g. COMM_PREFIX)
+
+   <Exceptions>
+      thread.error if a worker thread is needed but cannot be started.
+
+   <Side Effects>
+      May start a worker thread.
+
+   <Returns>
+      None.
+  """
+  poollock.acquire()
+  try:
+    _deliver_locked((function, args, threadprefix))
+  finally:
+    poollock.release()
+
+
+
+
+def idle_thread_count():
+  """
+   <Purpose>
+      Returns the number of pool threads that are alive but have nothing to
+      do.   repy.py uses this to tell when the program is done.
+
+   <Arguments>
+      None.
+
+   <Exceptions>
+      None.
+
+   <Side Effects>
+      None.
+
+   <Returns>
+      An integer.
+  """
+  poollock.acquire()
+  try:
+    idlecount = len(idleworkers)
+    if timerthread is not None and livetimercount == 0:
+      idlecount = idlecount + 1
+    return idlecount
+  finally:
+    poollock.release()
+
+
+
+
+class Timer:
+  """
+  A drop in replacement for the threading.Timer objects emultimer uses.   The
+  function is run on a pool worker (with a name from threadprefix) once
+  waittime has passed, unless cancel() is called first.
+  """
+
+  def __init__(self, waittime, function, args, threadprefix):
+    self.waittime = waittime
+    self.function = function
+    self.args = args
+    self.threadprefix = threadprefix
+    self.cancelled = False
+    self.fired = False
+
+
+  def start(self):
+    global livetimercount
+
+    poollock.acquire()
+    try:
+      # There is nothing to wait for, so skip the scheduler
+      if self.waittime <= 0:
+        self.fired = True
+        _deliver_locked((self.function, self.args, self.threadprefix))
+        return
+
+      _start_timer_thread_locked()
+
+      timersequence[0] = timersequence[0] + 1
+      firetime = time.time() + self.waittime
+      heapq.heappush(timerheap, (firetime, timersequence[0], self))
+      livetimercount = livetimercount + 1
+
+      # Only wake the scheduler if it needs to sleep for less time
+      if timerheap[0][2] is self:
+        timercondition.notify()
+    finally:
+      poollock.release()
+
+
+  def cancel(self):
+    global livetimercount
+
+    poollock.acquire()
+    try:
+      if not self.cancelled and not self.fired:
+        self.cancelled = True
+        livetimercount = livetimercount - 1
+    finally:
+      poollock.release()
+
+
+
+
+# Private.   The caller must hold poollock
+def _start_timer_thread_locked():
+  global timerthread
+  global threadscreated
+
+  if timerthread is None:
+    newthread = threading.Thread(target=_timer_loop, name="EventTimer")
+    newthread.setDaemon(True)
+    newthread.start()
+    timerthread = newthread
+    threadscreated = threadscreated + 1
+
+
+
+
+def _timer_loop():
+  global livetimercount
+
+  timercondition.acquire()
+  try:
+    while True:
+      if not timerheap:
+        timercondition.wait()
+        continue
+
+      (firetime, sequence, timerobj) = timerheap[0]
+
+      if timerobj.cancelled:
+        heapq.heappop(timerheap)
+        continue
+
+      waittime = firetime - time.time()
+      if waittime > 0:
+        timercondition.wait(waittime)
+        continue
+
+      heapq.heappop(timerheap)
+      timerobj.fired = True
+      livetimercount = livetimercount - 1
+
+      # Handing over the timer happens under poollock, so the worker is busy
+      # before this timer stops counting as pending.
+      try:
+        _deliver_locked((timerobj.function, timerobj.args, timerobj.threadprefix))
+      except thread.error:
+        # Same as failing to start a timer thread in emultimer.settimer
+        harshexit.harshexit(56)
+  finally:
+    timercondition.release()
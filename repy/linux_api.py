@@ -10,6 +10,11 @@ Description:
 """
 
 import os           # Provides some convenience functions
+import errno        # For EAGAIN
+import fcntl        # For making the inotify descriptor non-blocking
+import struct       # For unpacking inotify events and /proc/net addresses
+import socket       # For formatting /proc/net addresses
+import time         # For expiring the cached socket table
 
 import nix_common_api as nix_api # Import the Common API
 
@@ -17,8 +22,6 @@ import textops      # Import seattlelib's text processing lib
 import portable_popen  # For Popen
 
 # Manually import the common functions we want
-exists_outgoing_network_socket = nix_api.exists_outgoing_network_socket
-exists_listening_network_socket = nix_api.exists_listening_network_socket
 get_available_interfaces = nix_api.get_available_interfaces
 
 # Libc
@@ -31,11 +34,55 @@ syscall = libc.syscall # syscall function
 # Globals
 last_stat_data = None   # Store the last array of data from _get_proc_info_by_pid
 
+# The socket table read from /proc/net by _get_socket_table and when it was
+# read, as a tuple (time, tcp sockets, udp sockets), or None
+socket_table_cache = None
+
 # Constants
 JIFFIES_PER_SECOND = 100.0
 PAGE_SIZE = os.sysconf('SC_PAGESIZE')
 GETTID = 224 # Get the thread id of the currently executing thread
 
+# How long the socket table read from /proc/net is used for, in seconds.   
+# This is shorter than the interval emulcomm polls for a socket to go away.
+# emulcomm clears the table before it first checks for a socket, since its
+# own sockets may have just been opened or closed.
+SOCKET_TABLE_CACHE_TTL = 0.1
+
+# The names of the TCP states in /proc/net/tcp, as netstat shows them
+TCP_STATES = {
+"01":"ESTABLISHED",
+"02":"SYN_SENT",
+"03":"SYN_RECV",
+"04":"FIN_WAIT1",
+"05":"FIN_WAIT2",
+"06":"TIME_WAIT",
+"07":"CLOSE",
+"08":"CLOSE_WAIT",
+"09":"LAST_ACK",
+"0A":"LISTEN",
+"0B":"CLOSING",
+}
+
+# inotify event masks (see inotify(7))
+IN_MODIFY = 0x2
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+
+# The changes to the files of a directory that a directory watch reports
+DIRECTORY_WATCH_MASK = IN_MODIFY | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | \
+    IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+# The size of an inotify event without the name (int wd, uint32 mask, cookie, len)
+INOTIFY_EVENT_HEADER = "iIII"
+INOTIFY_EVENT_HEADER_SIZE = struct.calcsize(INOTIFY_EVENT_HEADER)
+
 # Maps each field in /proc/{pid}/stat to an index when split by spaces
 FIELDS = {
 "pid":0,
@@ -344,3 +391,264 @@ def get_interface_ip_addresses(interfaceName):
 
   # Done, return the interfaces
   return ipaddressList
+
+
+
+def _get_proc_net_addresses(ip, port):
+  # Returns the ways an (ip, port) is written in /proc/net, e.g. 
+  # ("127.0.0.1", 80) is "0100007F:0050" (and "0000000000000000FFFF00000100007F:0050"
+  # as an IPv4 address mapped to IPv6).   The ip is written as 32 bit words
+  # in host byte order.   An ip that isn't an IP address (e.g. a hostname)
+  # isn't written any way, as netstat -an wouldn't show it either.
+  try:
+    packedips = [socket.inet_aton(ip)]
+    packedips.append("\0" * 10 + "\xff" * 2 + packedips[0])
+  except socket.error:
+    try:
+      packedips = [socket.inet_pton(socket.AF_INET6, ip)]
+    except (socket.error, ValueError):
+      return []
+
+  addresses = []
+  for packedip in packedips:
+    hexip = ""
+    for index in range(0, len(packedip), 4):
+      hexip += "%08X" % struct.unpack("=I", packedip[index:index+4])[0]
+    addresses.append(hexip + ":" + "%04X" % port)
+
+  return addresses
+
+
+def _read_proc_net_file(filename):
+  # Returns a list of (local address, remote address, state) tuples for the
+  # sockets in a /proc/net file, as they are written there.   The file not
+  # existing (e.g. if there is no IPv6 support) is the same as there being
+  # no sockets.
+  try:
+    fileobj = myopen(filename, "r")
+  except IOError:
+    return []
+
+  try:
+    # The first line is the header
+    lines = fileobj.readlines()[1:]
+  finally:
+    fileobj.close()
+
+  sockets = []
+  for line in lines:
+    fields = line.split(None, 4)
+    sockets.append((fields[1], fields[2], fields[3]))
+
+  return sockets
+
+
+def _get_socket_table():
+  """
+  <Purpose>
+    Returns the sockets on the system, from /proc/net.   The table is cached
+    for SOCKET_TABLE_CACHE_TTL seconds.   The addresses are as they are
+    written in /proc/net (see _get_proc_net_addresses), so that building
+    the table doesn't need to convert them.
+
+  <Exceptions>
+    IOError if /proc/net/tcp can't be read.
+
+  <Returns>
+    A tuple (tcp, udp).   tcp is a dict that maps the local address of each
+    tcp socket to a list of (remote address, state) tuples.   udp is a set of
+    the local addresses of the udp sockets.
+  """
+  global socket_table_cache
+
+  cache = socket_table_cache
+  currenttime = time.time()
+  if cache is not None and 0 <= currenttime - cache[0] < SOCKET_TABLE_CACHE_TTL:
+    return cache[1:]
+
+  # Unlike the other files, this must exist.
+  myopen("/proc/net/tcp", "r").close()
+
+  tcp = {}
+  for filename in ["/proc/net/tcp", "/proc/net/tcp6"]:
+    for (local, remote, state) in _read_proc_net_file(filename):
+      if local not in tcp:
+        tcp[local] = []
+      tcp[local].append((remote, state))
+
+  udp = set()
+  for filename in ["/proc/net/udp", "/proc/net/udp6"]:
+    for (local, remote, state) in _read_proc_net_file(filename):
+      udp.add(local)
+
+  # This is replaced rather than updated so that other threads never see a
+  # partly built table.
+  socket_table_cache = (currenttime, tcp, udp)
+  return (tcp, udp)
+
+
+def clear_socket_table_cache():
+  """
+  <Purpose>
+    Makes the next socket lookup read /proc/net again rather than use the
+    cached socket table.
+
+  <Returns>
+    None.
+  """
+  global socket_table_cache
+  socket_table_cache = None
+
+
+def exists_outgoing_network_socket(localip, localport, remoteip, remoteport):
+  """
+  <Purpose>
+    Determines if there exists a network socket with the specified unique tuple.
+    Assumes TCP.   Uses /proc/net rather than netstat.
+
+  <Arguments>
+    localip: The IP address of the local socket
+    localport: The port of the local socket
+    remoteip:  The IP of the remote host
+    remoteport: The port of the remote host
+    
+  <Returns>
+    A Tuple, indicating the existence and state of the socket. E.g. (Exists (True/False), State (String or None))
+  """
+  # This only works if all are not of the None type
+  if not (localip and localport and remoteip and remoteport):
+    return (False, None)
+
+  try:
+    (tcp, udp) = _get_socket_table()
+  except IOError:
+    # /proc isn't mounted, so ask netstat
+    return nix_api.exists_outgoing_network_socket(localip, localport, remoteip, remoteport)
+
+  remoteaddresses = _get_proc_net_addresses(remoteip, remoteport)
+  for localaddress in _get_proc_net_addresses(localip, localport):
+    for (remoteaddress, state) in tcp.get(localaddress, []):
+      if remoteaddress in remoteaddresses:
+        return (True, TCP_STATES.get(state, state))
+
+  return (False, None)
+
+
+def exists_listening_network_socket(ip, port, tcp):
+  """
+  <Purpose>
+    Determines if there exists a network socket with the specified ip and port which is the LISTEN state.
+    Uses /proc/net rather than netstat.
+  
+  <Arguments>
+    ip: The IP address of the listening socket
+    port: The port of the listening socket
+    tcp: Is the socket of TCP type, else UDP
+    
+  <Returns>
+    True or False.
+  """
+  # This only works if both are not of the None type
+  if not (ip and port):
+    return False
+
+  try:
+    (tcpsockets, udpsockets) = _get_socket_table()
+  except IOError:
+    # /proc isn't mounted, so ask netstat
+    return nix_api.exists_listening_network_socket(ip, port, tcp)
+
+  # UDP connections are stateless, so for TCP check for the LISTEN state
+  # and for UDP, just check that there exists a UDP port
+  for address in _get_proc_net_addresses(ip, port):
+    if not tcp:
+      if address in udpsockets:
+        return True
+      continue
+
+    for (remoteaddress, state) in tcpsockets.get(address, []):
+      if TCP_STATES.get(state) == "LISTEN":
+        return True
+
+  return False
+
+
+def create_directory_watch(dirname):
+  """
+  <Purpose>
+    Starts watching the files in a directory for changes with inotify.
+
+  <Arguments>
+    dirname:
+      The directory to watch.
+
+  <Exceptions>
+    EnvironmentError if the directory can't be watched (e.g. the C library
+    doesn't have inotify).
+
+  <Returns>
+    A file descriptor for read_directory_watch_events().
+  """
+  try:
+    watchfd = libc.inotify_init()
+  except AttributeError:
+    raise EnvironmentError, "inotify is not available"
+
+  if watchfd < 0:
+    raise EnvironmentError, "inotify_init failed: "+nix_api.get_ctypes_error_str()
+
+  # Reading the events must never block the caller
+  flags = fcntl.fcntl(watchfd, fcntl.F_GETFL)
+  fcntl.fcntl(watchfd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+  if libc.inotify_add_watch(watchfd, dirname, DIRECTORY_WATCH_MASK) < 0:
+    errorstr = nix_api.get_ctypes_error_str()
+    os.close(watchfd)
+    raise EnvironmentError, "inotify_add_watch failed: "+errorstr
+
+  return watchfd
+
+
+def read_directory_watch_events(watchfd):
+  """
+  <Purpose>
+    Reads the changes reported since the last call on a directory watch.
+
+  <Arguments>
+    watchfd:
+      The file descriptor returned by create_directory_watch().
+
+  <Exceptions>
+    OSError if the events can't be read.
+
+  <Returns>
+    A tuple (changed, missed). changed is a set of the names of the files in
+    the directory that were created, written, removed or renamed. missed is
+    True if there may have been changes that weren't reported (the event
+    queue overflowed, or the directory itself was removed or renamed).
+  """
+  changed = set()
+  missed = False
+
+  while True:
+    try:
+      data = os.read(watchfd, 65536)
+    except OSError, e:
+      if e.errno == errno.EAGAIN:
+        break
+      raise
+
+    index = 0
+    while index + INOTIFY_EVENT_HEADER_SIZE <= len(data):
+      (wd, mask, cookie, namelength) = struct.unpack(INOTIFY_EVENT_HEADER,
+          data[index:index+INOTIFY_EVENT_HEADER_SIZE])
+      index += INOTIFY_EVENT_HEADER_SIZE
+      name = data[index:index+namelength].rstrip("\0")
+      index += namelength
+
+      if mask & (IN_Q_OVERFLOW | IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF):
+        missed = True
+      elif name:
+        changed.add(name)
+
+  return (changed, missed)
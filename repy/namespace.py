@@ -1136,6 +1136,32 @@ class NamespaceObjectWrapper(object):
 
 
 
+# The types of objects that _copy() returns as-is rather than copying. These
+# are either immutable or are objects (functions, instances of the user's own
+# classes) that are deliberately shared. This is keyed by the id of the type so
+# that, like _is_in(), membership is an identity check.
+_UNCOPIED_TYPE_IDS = {}
+for _uncopied_type in [str, unicode, int, long, float, complex, bool, frozenset,
+                       types.NoneType, types.FunctionType, types.LambdaType,
+                       types.MethodType, types.InstanceType]:
+  _UNCOPIED_TYPE_IDS[_saved_id(_uncopied_type)] = True
+
+
+
+def _contains_only_uncopied_types(sequence):
+  """
+  Returns True if none of the items in the sequence need to be copied. This
+  lets _copy() skip its recursion for things like argument tuples of strings
+  and integers and lists of filenames.
+  """
+  for item in sequence:
+    if _saved_id(type(item)) not in _UNCOPIED_TYPE_IDS:
+      return False
+  return True
+
+
+
+
 class NamespaceAPIFunctionWrapper(object):
   """
   Instances of this class exist solely to provide function wrapping. This is
@@ -1193,22 +1219,38 @@ class NamespaceAPIFunctionWrapper(object):
       The deep copy of obj with circular/recursive references preserved.
     """
     try:
+      # Nearly every call passes and returns strings, numbers and tuples of
+      # them, so check for those before doing any other work.
+      if _saved_id(type(obj)) in _UNCOPIED_TYPE_IDS:
+        return obj
+
+      # A tuple of objects that don't need copying can't be modified and
+      # can't be part of a circular reference, so it can be used as-is.
+      if type(obj) is tuple and _contains_only_uncopied_types(obj):
+        return obj
+
       # If this is a top-level call to _copy, create a new objectmap for use
       # by recursive calls to _copy.
       if objectmap is None:
+        # A list or dict of simple objects (e.g. the result of listdir()) only
+        # needs a shallow copy. This isn't done for nested lists and dicts
+        # since they may be referenced more than once and need to go in the
+        # objectmap.
+        if type(obj) is list and _contains_only_uncopied_types(obj):
+          return list(obj)
+        if type(obj) is dict and _contains_only_uncopied_types(obj.keys()) and \
+            _contains_only_uncopied_types(obj.values()):
+          return obj.copy()
+
         objectmap = {}
       # If this is a circular reference, use the copy we already made.
       elif _saved_id(obj) in objectmap:
         return objectmap[_saved_id(obj)]
       
-      # types.InstanceType is included because the user can provide an instance
-      # of a class of their own in the list of callback args to settimer.
-      if _is_in(type(obj), [str, unicode, int, long, float, complex, bool, frozenset,
-                            types.NoneType, types.FunctionType, types.LambdaType,
-                            types.MethodType, types.InstanceType]):
-        return obj
-
-      elif type(obj) is list:
+      # Note that types.InstanceType is one of the uncopied types because the
+      # user can provide an instance of a class of their own in the list of
+      # callback args to settimer. Those were handled above.
+      if type(obj) is list:
         temp_list = []
         # Need to save this in the objectmap before recursing because lists
         # might have circular references.
@@ -1431,6 +1473,10 @@ class NamespaceAPIFunctionWrapper(object):
     self.__arg_unwrapping_func = func_dict.get("arg_unwrapping_func", None)
     self.__return_wrapping_func = func_dict.get("return_wrapping_func", None)
 
+    # Decide once whether the target is the name of a method rather than
+    # checking on every call.
+    self.__target_is_method_name = type(self.__target_func) is str
+
     # Make sure that the __target_func really is a function or a string
     # indicating a function by that name on the underlying object should
     # be called.
@@ -1462,9 +1508,11 @@ class NamespaceAPIFunctionWrapper(object):
       Anything that the underlying function may return.
     """
 
-    # Copy first, then check.
+    # Copy first, then check. Python always gives us a new kwargs dict, so
+    # there is nothing to copy if it's empty (it nearly always is).
     args = self._copy(args)
-    kwargs = self._copy(kwargs)
+    if kwargs:
+      kwargs = self._copy(kwargs)
     self._check_arguments(*args, **kwargs)
 
     if self.__arg_wrapping_func is not None:
@@ -1478,7 +1526,7 @@ class NamespaceAPIFunctionWrapper(object):
       # for indicating that we want to wrap the function of this particular
       # object. We use this if the function to wrap isn't available without
       # having the object around, such as with real lock objects.
-      if type(self.__target_func) is str:
+      if self.__target_is_method_name:
         func_to_call = _saved_getattr(args[0], self.__target_func)
         # The "self" argument will be passed implicitly by python, so we remove
         # it from the args we pass to the function.
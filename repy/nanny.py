@@ -11,6 +11,21 @@
    This module handles the policy decisions and accounting to detect if there 
    is a resource violation.  The actual "stopping", etc. is done in the
    nonportable module.
+
+   Renewable resources (network, file I/O, etc.) are accounted for like a
+   bucket that drains at the resource's limit per second.   A thread that
+   pushes the bucket over the limit sleeps until the bucket will have drained
+   back down to the limit.   Each thread works out its own wake up time while
+   holding the resource's lock, but sleeps without the lock.   This way
+   threads that are over quota don't hold up every other thread using the
+   resource, and the total rate is still the limit.
+
+   To keep small charges cheap, the nanny remembers how far below the limit
+   the bucket was when it last updated it (the "headroom").   Charges that fit
+   in the headroom are just added to the bucket without looking at the clock
+   (since the bucket only gets emptier with time, they can't put it over the
+   limit).   Checks for zero (i.e. "wait if over quota") don't even need the
+   lock when there is headroom.
 """
 
 # for sleep
@@ -25,6 +40,9 @@ import threading
 # needed for handling internal errors
 import tracebackrepy
 
+# for the directory whose disk use is charged
+import repy_constants
+
 # common functionality needed between nanny and nonportable
 import nanny_resource_limits
 nanny_resource_limits.init(nonportable.getruntime)
@@ -85,6 +103,22 @@ fungible_resource_lock_table = nanny_resource_limits.fungible_resource_lock_tabl
 renewable_resource_update_time = nanny_resource_limits.renewable_resource_update_time
 
 
+# Lock for resource_consumption_table['diskused']
+disk_used_lock = nanny_resource_limits.disk_used_lock
+
+
+# How much more of each renewable resource can be charged before the
+# consumption could exceed the limit.   This ignores whatever has drained since
+# the last update, so it is never more than the real headroom.   Use with the
+# renewable_resource_lock_table lock (except for reads).   A negative value
+# means the consumption may be over the limit and must be updated before
+# anything else is charged (it is negative initially so that the first charge
+# does a full update).
+renewable_resource_headroom = {}
+for init_resource in renewable_resources:
+  renewable_resource_headroom[init_resource] = -1.0
+
+
 # Updates the values in the consumption table (taking the current time into 
 # account)
 def update_resource_consumption_table(resource):
@@ -116,24 +150,51 @@ def update_resource_consumption_table(resource):
 
 
 
-# I want to wait until a resource can be used again...
-def sleep_until_resource_drains(resource):
+# Charges a renewable resource.   If this puts the resource over its limit,
+# returns the time (in terms of nonportable.getruntime()) when the consumption
+# will have drained back down to the limit.   Otherwise returns None.   The
+# caller must hold the lock for the resource.
+def charge_renewable_resource(resource, quantity):
 
   # It'll never drain!
   if resource_restriction_table[resource] == 0:
     raise Exception, "Resource '"+resource+"' limit set to 0, won't drain!"
-    
 
-  # We may need to go through this multiple times because other threads may
-  # also block and consume resources.
-  while resource_consumption_table[resource] > resource_restriction_table[resource]:
+  # If this fits within the headroom, there is no need to check the time
+  if quantity <= renewable_resource_headroom[resource]:
+    resource_consumption_table[resource] = resource_consumption_table[resource] + quantity
+    renewable_resource_headroom[resource] = renewable_resource_headroom[resource] - quantity
+    return None
 
-    # Sleep until we're expected to be under quota
-    sleeptime = (resource_consumption_table[resource] - resource_restriction_table[resource]) / resource_restriction_table[resource]
+  # update the resource counters based upon the current time.
+  update_resource_consumption_table(resource)
 
-    time.sleep(sleeptime)
+  resource_consumption_table[resource] = resource_consumption_table[resource] + quantity
 
-    update_resource_consumption_table(resource)
+  headroom = resource_restriction_table[resource] - resource_consumption_table[resource]
+  renewable_resource_headroom[resource] = headroom
+
+  if headroom >= 0:
+    return None
+
+  # We're over quota until the excess drains (counting from the update we
+  # just did)
+  return renewable_resource_update_time[resource] + (-headroom / resource_restriction_table[resource])
+
+
+
+# I want to wait until a resource can be used again...
+def sleep_until_resource_drains(readytime):
+
+  # Threads that charged the resource after us may have pushed the
+  # consumption up further, but that doesn't change when our own charge
+  # has drained.   time.sleep may return early, so check again.
+  while True:
+    sleeptime = readytime - nonportable.getruntime()
+    if sleeptime <= 0:
+      return
+
+    time.sleep(sleeptime)
 
 
 
@@ -165,6 +226,10 @@ def initialize_consumed_resource_tables():
   for resource in quantity_resources:
     resource_consumption_table[resource] = 0.0
 
+  # Force a full update on the next charge of each renewable resource
+  for resource in renewable_resources:
+    renewable_resource_headroom[resource] = -1.0
+
   for resource in item_resources:
     # double check there is no overlap...
     if resource in quantity_resources:
@@ -187,12 +252,17 @@ def start_resource_nanny():
       None.
 
    <Side Effects>
-      None.
+      Sets the disk use to that of the files in the vessel directory.
 
    <Returns>
       None.
   """
 
+  # Files are charged as they are written from now on, so start from what is
+  # there already.
+  nanny_resource_limits.set_disk_used(
+      nonportable.compute_disk_use(repy_constants.REPY_CURRENT_DIR))
+
   nonportable.monitor_cpu_disk_and_mem()
 
 
@@ -232,37 +302,79 @@ def tattle_quantity(resource, quantity):
     # enabled. -Brent
     tracebackrepy.handle_internalerror("Resource '" + resource + 
         "' has a negative quantity " + str(quantity) + "!", 132)
+
+  # It's renewable, so I can wait for it to clear
+  if resource not in renewable_resources:
+    # Should never have a quantity tattle for a non-renewable resource
+    # This will cause the program to exit and log things if logging is
+    # enabled. -Brent
+    tracebackrepy.handle_internalerror("Resource '" + resource + 
+        "' is not renewable!", 133)
+
+  # Checking if we're over quota doesn't need the lock if we know there is
+  # headroom.   (Reading the value is atomic, and it is never larger than the
+  # real headroom.)
+  if quantity == 0 and renewable_resource_headroom[resource] >= 0:
+    return
     
   # get the lock for this resource
   renewable_resource_lock_table[resource].acquire()
   
   # release the lock afterwards no matter what
   try: 
-    # update the resource counters based upon the current time.
-    update_resource_consumption_table(resource)
-
-    # It's renewable, so I can wait for it to clear
-    if resource not in renewable_resources:
-      # Should never have a quantity tattle for a non-renewable resource
-      # This will cause the program to exit and log things if logging is
-      # enabled. -Brent
-      tracebackrepy.handle_internalerror("Resource '" + resource + 
-          "' is not renewable!", 133)
-  
-
-    resource_consumption_table[resource] = resource_consumption_table[resource] + quantity
-    # I'll block if I'm over...
-    sleep_until_resource_drains(resource)
-  
+    readytime = charge_renewable_resource(resource, quantity)
   finally:
     # release the lock for this resource
     renewable_resource_lock_table[resource].release()
+
+  # I'll block if I'm over...   This is done without the lock so that other
+  # threads can charge the resource (and work out their own wait) meanwhile.
+  if readytime is not None:
+    sleep_until_resource_drains(readytime)
     
 
 
 
 
 
+def tattle_disk_use(quantity):
+  """
+   <Purpose>
+      Notify the nanny that files in the vessel directory are about to grow
+      (or have shrunk) by some number of bytes.   This is checked against
+      the disk use restriction right away rather than when the disk is next
+      scanned.
+
+   <Arguments>
+      quantity:
+         The number of bytes the disk use changes by.   Negative if files 
+         were truncated or removed.
+
+   <Exceptions>
+      Exception if the disk use would be over the restriction.   The disk
+      use isn't charged in this case.
+
+   <Side Effects>
+      Updates resource_consumption_table['diskused'].
+
+   <Returns>
+      None.
+  """
+
+  disk_used_lock.acquire()
+  try:
+    newdiskused = resource_consumption_table['diskused'] + quantity
+    # Shrinking is always allowed, even if the vessel is (still) over quota.
+    if quantity > 0 and newdiskused > resource_restriction_table['diskused']:
+      raise Exception, "Disk use '"+str(newdiskused)+"' over limit '"+str(resource_restriction_table['diskused'])+"'"
+    resource_consumption_table['diskused'] = newdiskused
+  finally:
+    disk_used_lock.release()
+
+
+
+
+
 def tattle_add_item(resource, item):
   """
    <Purpose>
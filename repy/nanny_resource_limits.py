@@ -74,6 +74,11 @@ for init_resource in fungible_item_resources:
 renewable_resource_update_time = {}
 
 
+# Lock for resource_consumption_table['diskused'], which is charged as files
+# are written (see nanny.tattle_disk_use) and corrected by the disk monitor.
+disk_used_lock = threading.Lock()
+
+
 # Set up individual_item_resources to be in the restriction_table (as a set)
 for init_resource in individual_item_resources:
   resource_restriction_table[init_resource] = set()
@@ -89,6 +94,15 @@ def init(getruntime):
     renewable_resource_update_time[init_resource] = getruntime()
 
 
+def set_disk_used(diskused):
+  # Sets the disk use to the value a scan of the vessel directory found.
+  disk_used_lock.acquire()
+  try:
+    resource_consumption_table['diskused'] = diskused
+  finally:
+    disk_used_lock.release()
+
+
 ########################## Used Internally for resource monitoring and metering #########
 
 # Data structures and functions for a cross platform CPU limiter
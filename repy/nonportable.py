@@ -95,6 +95,97 @@ def compute_disk_use(dirname):
   return diskused
 
 
+
+class DiskUseTracker:
+  """
+  Keeps track of the disk use of the files in a directory (as
+  compute_disk_use() computes it) without listing the directory each time.
+
+  On Linux, inotify reports which files changed, and only those are looked
+  at again.   The whole directory is still rescanned every rescanfrequency
+  seconds, and whenever inotify may have missed changes.   Elsewhere, the
+  directory is rescanned every time.
+  """
+
+  def __init__(self, dirname, rescanfrequency=repy_constants.DISK_RESCAN_FREQ):
+    self.dirname = os.path.abspath(dirname)
+    self.rescanfrequency = rescanfrequency
+
+    # The disk use of each file (its size plus the 4K charged per file)
+    self.file_disk_use = {}
+    self.diskused = 0
+    self.last_rescan_time = None
+
+    try:
+      self.watchfd = os_api.create_directory_watch(self.dirname)
+    except (AttributeError, EnvironmentError):
+      # This isn't Linux, or inotify isn't available
+      self.watchfd = None
+
+
+  def _update_file(self, filename):
+    # Looks at a file that changed.   It isn't charged if it no longer exists.
+    self.diskused = self.diskused - self.file_disk_use.pop(filename, 0)
+
+    try:
+      filesize = os.path.getsize(os.path.join(self.dirname, filename))
+    except OSError:   # The file was removed or renamed
+      return
+
+    self.file_disk_use[filename] = filesize + 4096
+    self.diskused = self.diskused + filesize + 4096
+
+
+  def rescan(self):
+    """
+    <Purpose>
+      Looks at every file in the directory.
+
+    <Returns>
+      The disk used.
+    """
+    file_disk_use = {}
+    for filename in os.listdir(self.dirname):
+      try:
+        filesize = os.path.getsize(os.path.join(self.dirname, filename))
+      except (IOError, OSError):   # They likely deleted the file in the meantime...
+        filesize = 0
+      file_disk_use[filename] = filesize + 4096
+
+    self.file_disk_use = file_disk_use
+    self.diskused = sum(file_disk_use.values())
+    self.last_rescan_time = getruntime()
+    return self.diskused
+
+
+  def get_disk_use(self):
+    """
+    <Purpose>
+      Gets the current disk use of the directory.
+
+    <Returns>
+      A tuple (diskused, rescanned).   rescanned is True if the whole
+      directory was rescanned.
+    """
+    if self.watchfd is None:
+      return (self.rescan(), True)
+
+    try:
+      (changed, missed) = os_api.read_directory_watch_events(self.watchfd)
+    except OSError:
+      missed = True
+
+    if missed or self.last_rescan_time is None or \
+        getruntime() - self.last_rescan_time >= self.rescanfrequency:
+      return (self.rescan(), True)
+
+    for filename in changed:
+      self._update_file(filename)
+
+    return (self.diskused, False)
+
+
+
 # prepare a socket so it behaves how we want
 def preparesocket(socketobject):
   
@@ -278,9 +369,6 @@ exposed_resources = set(["cpu","memory","diskused","events",
 # set of thread's, we flatten this into N number of threads.
 flatten_exempt_resources = set(["connport","messport"])
 
-# Cache the disk used from the external process
-cached_disk_used = 0L
-
 # This array holds the times that repy was stopped.
 # It is an array of tuples, of the form (time, amount)
 # where time is when repy was stopped (from getruntime()) and amount
@@ -389,8 +477,9 @@ def get_resources():
   else:
     raise EnvironmentError("Unsupported Platform!")
 
-  # Use the cached disk used amount
-  usage["diskused"] = cached_disk_used
+  # Use the disk used that is charged as files are written (and corrected
+  # by the resource monitor)
+  usage["diskused"] = nanny_resource_limits.resource_consumption_table.get("diskused", 0)
 
   # Release the lock
   get_resources_lock.release()
@@ -416,6 +505,9 @@ class WindowsNannyThread(threading.Thread):
     else:
       disk_interval = int(repy_constants.RESOURCE_POLLING_FREQ_WIN / repy_constants.CPU_POLLING_FREQ_WIN)
     current_interval = 0 # What cycle are we on  
+
+    # The disk use was computed when the nanny was started
+    last_rescan_time = getruntime()
     
     # Elevate our priority, above normal is higher than the usercode, and is enough for disk/mem
     windows_api.set_current_thread_priority(windows_api.THREAD_PRIORITY_ABOVE_NORMAL)
@@ -438,8 +530,14 @@ class WindowsNannyThread(threading.Thread):
 
         # Check if we should check the disk
         if (current_interval % disk_interval) == 0:
+          # The disk use is charged as files are written, so the directory is
+          # only rescanned now and then to correct it.
+          if getruntime() - last_rescan_time >= repy_constants.DISK_RESCAN_FREQ:
+            nanny_resource_limits.set_disk_used(compute_disk_use(repy_constants.REPY_CURRENT_DIR))
+            last_rescan_time = getruntime()
+
           # Check diskused
-          diskused = compute_disk_use(repy_constants.REPY_CURRENT_DIR)
+          diskused = nanny_resource_limits.resource_consumption_table["diskused"]
           if diskused > nanny_resource_limits.resource_limit("diskused"):
             raise Exception, "Disk use '"+str(diskused)+"' over limit '"+str(nanny_resource_limits.resource_limit("diskused"))+"'"
         
@@ -573,9 +671,10 @@ class WinCPUNannyThread(threading.Thread):
 
 # This method handles messages on the "diskused" channel from
 # the external process. When the external process measures disk used,
-# it is piped in and cached for calls to getresources.
+# it is piped in and replaces the disk use charged as files were written
+# (which misses changes made by other processes).
 def IPC_handle_diskused(bytes):
-  cached_disk_used = bytes
+  nanny_resource_limits.set_disk_used(bytes)
 
 
 # This method handles meessages on the "repystopped" channel from
@@ -854,6 +953,9 @@ def resource_monitor(childpid, pipe_handle):
   # Calculate how often disk should be checked
   disk_interval = int(repy_constants.RESOURCE_POLLING_FREQ_LINUX / repy_constants.CPU_POLLING_FREQ_LINUX)
   current_interval = -1 # What cycle are we on  
+
+  # Keeps track of the disk used without scanning the whole directory each time
+  disk_use_tracker = DiskUseTracker(repy_constants.REPY_CURRENT_DIR)
   
   # Store time of the last interval
   last_time = getruntime()
@@ -934,14 +1036,16 @@ def resource_monitor(childpid, pipe_handle):
       current_interval = 0
        
       # Calculate disk used
-      diskused = compute_disk_use(repy_constants.REPY_CURRENT_DIR)
+      (diskused, rescanned) = disk_use_tracker.get_disk_use()
 
       # Raise exception if we are over limit
       if diskused > nanny_resource_limits.resource_limit("diskused"):
         raise ResourceException, "Disk use '"+str(diskused)+"' over limit '"+str(nanny_resource_limits.resource_limit("diskused"))+"'."
 
-      # Send the disk usage information, raw bytes used
-      write_message_to_pipe(pipe_handle, "diskused", diskused)
+      # Send the disk usage information, raw bytes used.   Repy charges its
+      # own writes, so this is only needed to correct it now and then.
+      if rescanned:
+        write_message_to_pipe(pipe_handle, "diskused", diskused)
     
     ########### End Check Disk ###########
     
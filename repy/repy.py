@@ -73,6 +73,9 @@ import virtual_namespace
 ## we'll use tracebackrepy to print our exceptions
 import tracebackrepy
 
+# for --eventpool and to tell when pooled event threads are idle
+import eventpool
+
 
 # This block allows or denies different actions in the safe module.   I'm 
 # doing this here rather than the natural place in the safe module because
@@ -224,8 +227,9 @@ def main(restrictionsfn, program, args):
 
 
   # I've changed to the threading library, so this should increase if there are
-  # pending events
-  while threading.activeCount() > idlethreadcount:
+  # pending events.   Idle event pool threads don't count (they are always 
+  # alive once started).
+  while threading.activeCount() - eventpool.idle_thread_count() > idlethreadcount:
     # do accounting here?
     time.sleep(0.25)
 
@@ -298,6 +302,8 @@ Where [options] are some combination of the following:
 --cwd dir              : Set Current working directory
 --servicelog           : Enable usage of the servicelogger for internal errors
 --norestrictions       : Disable the use of function restrictions, but not resource limits
+--eventpool            : Deliver events (connections, messages, timers) on a pool of reusable
+                       : threads instead of starting a new thread for each event
 """
   return
 
@@ -344,7 +350,8 @@ if __name__ == '__main__':
   try:
     optlist, fnlist = getopt.getopt(args, '', [
       'simple', 'execinfo', 'ip=', 'iface=', 'nootherips', 'logfile=',
-      'stop=', 'status=', 'cwd=', 'servicelog', 'norestrictions'
+      'stop=', 'status=', 'cwd=', 'servicelog', 'norestrictions',
+      'eventpool'
       ])
 
   except getopt.GetoptError:
@@ -426,6 +433,10 @@ if __name__ == '__main__':
     elif option == '--execinfo':
       displayexecinfo = True
 
+    # Deliver events on reusable threads rather than a thread per event
+    elif option == '--eventpool':
+      eventpool.enabled = True
+
   # Update repy current directory
   repy_constants.REPY_CURRENT_DIR = os.path.abspath(os.getcwd())
 
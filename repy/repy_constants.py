@@ -36,6 +36,11 @@ CPU_POLLING_FREQ_LINUX = .1 # Linux
 CPU_POLLING_FREQ_WIN = .1 # Windows
 CPU_POLLING_FREQ_WINCE = .5 # Mobile devices are pretty slow
 
+# How often the whole vessel directory is rescanned to correct the tracked disk
+# use. In between, the disk use is charged as repy writes files and (on Linux)
+# updated for just the files inotify reports changes to.
+DISK_RESCAN_FREQ = 60
+
 
 # These IP addresses are used to resolve our external IP address
 # We attempt to connect to these IP addresses, and then check our local IP
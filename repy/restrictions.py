@@ -102,6 +102,13 @@ known_calls = [ "canceltimer", "exitall", "file.close", "file.flush",
 # this table is indexed by call name and contains tuples of (rule, action)
 call_rule_table = {}
 
+# This table is built from call_rule_table by compile_call_rule_table() and is
+# what assertisallowed() uses.   It is indexed by call name and contains tuples
+# of (action, decision function).   If the decision function is None, the
+# action applies to every call.   Otherwise the decision function returns the
+# action for the arguments of a call.
+call_decision_table = {}
+
 
 
 
@@ -286,6 +293,10 @@ def init_restriction_tables(filename):
       nanny.resource_restriction_table[resource] = 0.0
 
 
+  # build the tables that assertisallowed uses
+  compile_call_rule_table()
+
+
 
 
 
@@ -329,21 +340,153 @@ def match_rule(rulelist, args):
 
 
 # rulesets look like: [ ([('arg',2,'foo'),('noargs',1)],'allow'), ([],'deny') ]
-# I'm going to write this recursively
+# The first item returned is the action, the rest are the rules that didn't
+# match, last one first.
 def find_action(ruleset, args):
+  nonmatches = []
+
+  for thisrule, thisaction in ruleset:
+    match = match_rule(thisrule, args)
+    matched, matched_rule, reasoning = match
+    if matched:
+      nonmatches.reverse()
+      return [(thisaction, matched_rule, reasoning)] + nonmatches
+
+    nonmatches.append(match)
+
   # There wasn't a matching rule so deny
-  if ruleset == []:
-    return [('deny', '', 'No matching rule found')]
+  nonmatches.reverse()
+  return [('deny', '', 'No matching rule found')] + nonmatches
+
+
+
+
+
+
+
+
+
+######################### Rule Compiling ##############################
+
+# find_action() goes through the rules one at a time, which is too slow for
+# the calls that are checked on every file and socket operation.   Instead,
+# the rules of each call are compiled into "steps" that assertisallowed()
+# goes through:
+#
+# (None, table, None, None)       A run of rules of the form 'noargs is num'.
+#                                 The table maps the number of args to the
+#                                 action of the first of them that matches.
+# (pos, table, None, None)        A run of rules of the form 'arg pos is val',
+#                                 all with the same pos.   The table maps val
+#                                 to the action of the first one with it.
+# (None, None, rule, action)      Any other rule.
+#
+# The first step that matches gives the action, the same way the first rule
+# that matches does.   An empty rule (or the end of the rules) ends the steps.
+# find_action() is still used to explain why a call was denied.
+
+
+# Returns (None, val) if the rule is 'noargs is val', (pos, val) if the rule
+# is 'arg pos is val', and None otherwise
+def get_rule_key(rule):
+  if len(rule) != 1:
+    return None
+
+  if rule[0][0] == 'noargs':
+    return (None, rule[0][1])
+
+  if rule[0][0] == 'arg' and rule[0][1] >= 0:
+    return (rule[0][1], rule[0][2])
+
+  return None
+
+
+
+# Returns whether the args match the rule.   This is match_rule() without the
+# reasoning.
+def rule_matches(rule, args):
+  for condition in rule:
+    if condition[0] == 'arg':
+      if len(args) <= condition[1] or str(args[condition[1]]) != condition[2]:
+        return False
 
-  # this should be a tuple of two arguments, a rule and an action
-  thisrule, thisaction = ruleset[0]
-  match = match_rule(thisrule, args)
-  matched, matched_rule, reasoning = match
-  if matched:
-    return [(thisaction, matched_rule, reasoning)]
+    elif condition[0] == 'noargs':
+      if len(args) != condition[1]:
+        return False
 
-  # do the recursive bit...
-  return find_action(ruleset[1:], args)+[match]
+  return True
+
+
+
+# Returns a function that returns the action for a call's args
+def make_decision_function(steps, defaultaction):
+
+  def decide(args):
+    for pos, table, rule, action in steps:
+      if table is not None:
+        if pos is None:
+          key = len(args)
+        elif len(args) > pos:
+          key = str(args[pos])
+        else:
+          continue
+
+        if key in table:
+          return table[key]
+
+      elif rule_matches(rule, args):
+        return action
+
+    return defaultaction
+
+  return decide
+
+
+
+# Returns the (action, decision function) of a ruleset for
+# call_decision_table
+def compile_ruleset(ruleset):
+  steps = []
+
+  # If no rule matches, the call is denied
+  defaultaction = 'deny'
+
+  for rule, action in ruleset:
+    if rule == []:
+      # This rule matches everything, so the rules after it don't matter
+      defaultaction = action
+      break
+
+    rulekey = get_rule_key(rule)
+    if rulekey is None:
+      steps.append((None, None, rule, action))
+      continue
+
+    pos, val = rulekey
+    if steps and steps[-1][1] is not None and steps[-1][0] == pos:
+      # Add it to the table of the rules before it.   An earlier rule with
+      # the same val comes first.
+      table = steps[-1][1]
+    else:
+      table = {}
+      steps.append((pos, table, None, None))
+
+    if val not in table:
+      table[val] = action
+
+  if steps == []:
+    # The action doesn't depend on the args
+    return (defaultaction, None)
+
+  return (None, make_decision_function(steps, defaultaction))
+
+
+
+# Builds call_decision_table from call_rule_table
+def compile_call_rule_table():
+  call_decision_table.clear()
+  for callname in call_rule_table:
+    call_decision_table[callname] = compile_ruleset(call_rule_table[callname])
 
 
 
@@ -365,12 +508,15 @@ def assertisallowed(call,*args):
     return True
 
   # let's pre-reject certain open / file calls
-  #print call_rule_table[call]
-  matches = find_action(call_rule_table[call], args)
-  action, matched_rule, reasoning = matches[0]
+  action, decide = call_decision_table[call]
+  if decide is not None:
+    action = decide(args)
+
   if action == 'allow':
     return True
   elif action == 'deny':
+    # go through the rules again to explain why the call isn't allowed
+    matches = find_action(call_rule_table[call], args)
     matches.reverse()
     estr = "Call '"+str(call)+"' with args "+str(args)+" not allowed\n"
     estr += "Matching dump:\n"
@@ -69,6 +69,8 @@ import nonportable  # This is to get the current runtime
 import os           # This is for some path manipulation
 import repy_constants # This is to get our start-up directory
 import safety_exceptions # This is for exception classes shared with tracebackrepy
+import select       # This is to wait for the checker process with a timeout
+import hashlib      # This is to key the safety check cache
 
 # Hide the DeprecationWarning for compiler
 import warnings
@@ -257,9 +259,13 @@ SAFE_CHECK_LOCK = threading.Lock()
 def serial_safe_check(code):
   """
   <Purpose>
-    Serializes calls to safe_check. This is because safe_check forks a new process
-    which may take many seconds to return. This prevents us from forking many new
-    python processes.
+    Serializes calls to safe_check. This is because safe_check uses a separate
+    process which may take many seconds to return. This prevents us from 
+    forking many new python processes.
+
+    Results are cached by a hash of the code, so checking the same code again
+    (e.g. the same library in many VirtualNamespaces) returns immediately
+    without waiting for other checks in progress.
   
   <Arguments>
     code: See safe_check.
@@ -270,20 +276,217 @@ def serial_safe_check(code):
   <Return>
     See safe_check.
   """
+  codehash = hashlib.sha1(code).digest()
+
+  # Cache hits don't need to wait for the lock
+  if _check_cached_result(codehash):
+    return True
+
   # Acquire the lock
   SAFE_CHECK_LOCK.acquire()
   
   try:
+    # Someone may have checked the same code while we waited
+    if _check_cached_result(codehash):
+      return True
+
     # Call safe check
-    return safe_check(code)
+    try:
+      result = safe_check(code)
+    except safety_exceptions.SafeException, e:
+      # The code is unsafe, this won't change if it's checked again
+      _add_cached_result(codehash, e)
+      raise
+
+    _add_cached_result(codehash, None)
+    return result
   
   finally:
     # Release
     SAFE_CHECK_LOCK.release()
-      
+
+
+
+# The number of safety check results to remember.   Only results that say
+# the code is safe or unsafe are cached (not timeouts or other errors).
+SAFE_CHECK_CACHE_SIZE = 256
+
+# Maps the hash of the code to None (safe) or the SafeException (unsafe)
+_safe_check_cache = {}
+
+# The hashes in _safe_check_cache, least recently used first
+_safe_check_cache_order = []
+
+_safe_check_cache_lock = threading.Lock()
+
+
+# Returns True if the code with this hash is known to be safe, raises 
+# SafeException if it's known to be unsafe, and returns False otherwise.
+def _check_cached_result(codehash):
+  _safe_check_cache_lock.acquire()
+  try:
+    if codehash not in _safe_check_cache:
+      return False
+
+    # Mark this as recently used
+    _safe_check_cache_order.remove(codehash)
+    _safe_check_cache_order.append(codehash)
+
+    safetyexception = _safe_check_cache[codehash]
+  finally:
+    _safe_check_cache_lock.release()
+
+  if safetyexception is not None:
+    raise safetyexception
+  return True
+
+
+def _add_cached_result(codehash, safetyexception):
+  _safe_check_cache_lock.acquire()
+  try:
+    if codehash in _safe_check_cache:
+      _safe_check_cache_order.remove(codehash)
+    _safe_check_cache[codehash] = safetyexception
+    _safe_check_cache_order.append(codehash)
+
+    # Evict the least recently used entries
+    while len(_safe_check_cache_order) > SAFE_CHECK_CACHE_SIZE:
+      del _safe_check_cache[_safe_check_cache_order.pop(0)]
+  finally:
+    _safe_check_cache_lock.release()
+
+
+
+# Should the checker process be kept running between checks?   This needs 
+# select() to work on pipes, so Windows starts a new process for every check.
+SAFE_CHECK_USE_WORKER = (os.name != 'nt')
+
+# Restart the checker process after this many checks so that any memory it
+# has accumulated is reclaimed.
+SAFE_CHECK_WORKER_MAX_REQUESTS = 200
+
+# The running checker process (if any).   Use with _safe_check_worker_lock.
+_safe_check_worker = None
+_safe_check_worker_lock = threading.Lock()
+
+
+class _SafeCheckWorker:
+  """
+  A long running safe_check.py process that checks one piece of code per 
+  request.   Requests and responses are the length of the data followed by
+  a newline and then the data.
+  """
+
+  def __init__(self):
+    # Get the path to safe_check.py by using the original start directory of python
+    path_to_safe_check = os.path.join(repy_constants.REPY_START_DIR, "safe_check.py")
     
-def safe_check(code):
-    """Check the code to be safe."""
+    # Since this process lives on, it must not hold copies of our sockets
+    # and files (close_fds is fine since this is never used on Windows)
+    self.proc = subprocess.Popen([sys.executable, path_to_safe_check, "--server"],stdin=subprocess.PIPE, stdout=subprocess.PIPE, close_fds=True)
+    self.requestcount = 0
+
+    # Data read from the process but not yet returned
+    self.readbuffer = ""
+
+
+  def check(self, code):
+    """Returns the raw output of the checker for this code."""
+    self.requestcount = self.requestcount + 1
+
+    # Write out the user code
+    self.proc.stdin.write(str(len(code)) + "\n" + code)
+    self.proc.stdin.flush()
+
+    starttime = nonportable.getruntime()
+    stdoutfd = self.proc.stdout.fileno()
+    responselength = None
+
+    while True:
+      # Look for the length line (skipping any stray output, see #1080)
+      while responselength is None and "\n" in self.readbuffer:
+        line, self.readbuffer = self.readbuffer.split("\n", 1)
+        try:
+          responselength = int(line)
+        except ValueError:
+          pass
+
+      if responselength is not None and len(self.readbuffer) >= responselength:
+        output = self.readbuffer[:responselength]
+        self.readbuffer = self.readbuffer[responselength:]
+        return output
+
+      # Only wait up to EVALUTATION_TIMEOUT seconds before terminating
+      remaining = EVALUTATION_TIMEOUT - (nonportable.getruntime() - starttime)
+      if remaining <= 0:
+        self.kill()
+        raise Exception, "Evaluation of code safety exceeded timeout threshold ("+str(nonportable.getruntime() - starttime)+" seconds)"
+
+      (readable, writable, excepted) = select.select([stdoutfd], [], [], remaining)
+      if readable:
+        data = os.read(stdoutfd, 65536)
+        if not data:
+          # The process died.   There is no (complete) output.
+          self.kill()
+          return ""
+        self.readbuffer = self.readbuffer + data
+
+
+  def kill(self):
+    # Try to terminate the external process
+    try:
+      harshexit.portablekill(self.proc.pid)
+    except:
+      pass
+
+    for pipe in [self.proc.stdin, self.proc.stdout]:
+      try:
+        pipe.close()
+      except:
+        pass
+
+    # Reap it so we don't leave a zombie
+    try:
+      self.proc.wait()
+    except:
+      pass
+
+
+
+def _safe_check_with_worker(code):
+  global _safe_check_worker
+
+  _safe_check_worker_lock.acquire()
+  try:
+    if _safe_check_worker is None:
+      _safe_check_worker = _SafeCheckWorker()
+
+    worker = _safe_check_worker
+    try:
+      rawoutput = worker.check(code)
+    except (IOError, OSError):
+      # The process went away before we could talk to it.   Give it one more
+      # try with a fresh process.
+      worker.kill()
+      worker = _safe_check_worker = _SafeCheckWorker()
+      rawoutput = worker.check(code)
+    except:
+      # Timeouts kill the process, so start a new one next time
+      _safe_check_worker = None
+      raise
+
+    if rawoutput == "" or worker.requestcount >= SAFE_CHECK_WORKER_MAX_REQUESTS:
+      worker.kill()
+      _safe_check_worker = None
+
+    return rawoutput
+
+  finally:
+    _safe_check_worker_lock.release()
+      
+
+
+def _safe_check_with_new_process(code):
     # NOTE: This code will not work in Windows Mobile due to the reliance on subprocess
     
     # Get the path to safe_check.py by using the original start directory of python
@@ -322,6 +525,16 @@ def safe_check(code):
     rawoutput = proc.stdout.read()
     proc.stdout.close()
 
+    return rawoutput
+
+    
+def safe_check(code):
+    """Check the code to be safe."""
+    if SAFE_CHECK_USE_WORKER:
+      rawoutput = _safe_check_with_worker(code)
+    else:
+      rawoutput = _safe_check_with_new_process(code)
+
     # Interim fix for #1080: Get rid of stray debugging output on Android
     # of the form "dlopen libpython2.6.so" and "dlopen /system/lib/libc.so",
     # yet preserve all of the other output (including empty lines).
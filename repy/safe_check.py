@@ -7,6 +7,11 @@ Description:
   The purpose of this script is to be called from the main repy.py script to that the
   memory used by the safe function call will be reclaimed when this process quits.
 
+  With --server, this keeps running and checks one piece of code per request
+  instead, so that repy doesn't pay for starting Python on every check.   A 
+  request is the length of the code, a newline, and then the code.   The
+  response has the same format.   The process exits when stdin is closed.
+
 """
 
 import safe
@@ -42,10 +47,8 @@ safe._STR_OK.append("__del__")
 # allow __ in strings.   I'm 99% sure this is okay (do I want to risk it?)
 safe._NODE_ATTR_OK.append('value')
 
-if __name__ == "__main__":
-  # Get the user "code"
-  usercode = sys.stdin.read()
-  
+
+def check_code(usercode):
   # Output buffer
   output = ""
   
@@ -55,8 +58,34 @@ if __name__ == "__main__":
     output += str(value)
   except Exception,e:
     output += str(type(e)) + " " + str(e)
-  
-  # Write out
-  sys.stdout.write(output)
-  sys.stdout.flush()
+
+  return output
+
+
+
+def serve_requests():
+  while True:
+    header = sys.stdin.readline()
+    if not header:
+      # repy went away
+      return
+
+    usercode = sys.stdin.read(int(header))
+    output = check_code(usercode)
+
+    sys.stdout.write(str(len(output)) + "\n" + output)
+    sys.stdout.flush()
+
+
+
+if __name__ == "__main__":
+  if sys.argv[1:] == ["--server"]:
+    serve_requests()
+  else:
+    # Get the user "code"
+    usercode = sys.stdin.read()
+
+    # Write out
+    sys.stdout.write(check_code(usercode))
+    sys.stdout.flush()
   
@@ -0,0 +1,426 @@
+"""
+   Start Date: 18 October 2026
+
+   Description:
+
+   Readiness notification backends used by the SocketSelector in emulcomm.
+
+   The original SocketSelector rebuilt a list of every listening socket and
+   called select() on it (with a sampling delay) each time through its loop.
+   This module instead keeps the listening sockets registered with a
+   long-lived readiness object.   Sockets are added and removed as
+   waitforconn / recvmess / stopcomm are called, and a wait() call blocks
+   until at least one of them is ready (or the timeout expires).
+
+   There are three backends: epoll (Linux), poll (most other UNIX-like
+   systems) and select (everything else, notably Windows).   They all have
+   the same interface:
+
+     register(sockobj, data)    Start watching sockobj.   data is returned
+                                with the socket when it becomes ready.
+                                Registering the same socket again only
+                                updates data.
+     unregister(sockobj)        Stop watching sockobj.   Idempotent.
+     wakeup()                   Force a blocked wait() to return early.
+     wait(timeout)              Returns a list of (sockobj, data) tuples.
+     len(backend)               The number of registered sockets.
+
+   Use get_backend() to get the best backend for this system.
+"""
+
+# for epoll, poll, and select
+import select
+
+# for pipe, read, write
+import os
+
+# for EEXIST, EINTR, etc.
+import errno
+
+# needed to protect the registration tables
+import threading
+
+# So we can avoid poll on systems where it is known to be broken
+import sys
+
+# for sleep
+import time
+
+# Used to make the wakeup pipe non-blocking.   This doesn't exist on Windows,
+# but neither do the backends that need it.
+try:
+  import fcntl
+except ImportError:
+  fcntl = None
+
+
+
+# NOTE: The availability checks are done at import time since hasattr is not
+# usable once the sandbox has replaced the builtins.
+have_epoll = hasattr(select, 'epoll')
+
+# poll is broken for some descriptors on Mac OS X
+have_poll = hasattr(select, 'poll') and not sys.platform.startswith('darwin')
+
+# The events that mean a listening socket should be looked at.   Errors and
+# hangups are included so the caller can notice and clean up the socket.
+if have_epoll:
+  EPOLL_READ_MASK = select.EPOLLIN | select.EPOLLPRI | select.EPOLLERR | select.EPOLLHUP
+
+if have_poll:
+  POLL_READ_MASK = select.POLLIN | select.POLLPRI | select.POLLERR | select.POLLHUP
+
+
+
+
+class _PipeWakeupMixin:
+  """
+  A self-pipe that lets other threads interrupt a blocked wait().   Only used
+  on systems where pipes can be waited on (i.e. not Windows).
+  """
+
+  def _init_wakeup(self):
+    self.wakeupread, self.wakeupwrite = os.pipe()
+    # Set both ends non-blocking so that a full pipe never blocks a caller
+    # and draining never blocks the selector.
+    for fd in (self.wakeupread, self.wakeupwrite):
+      flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+      fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+
+  def wakeup(self):
+    try:
+      os.write(self.wakeupwrite, 'x')
+    except OSError, e:
+      # The pipe is already full so the selector will wake up anyways.
+      if e[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+        raise
+
+
+  def _drain_wakeup(self):
+    try:
+      while os.read(self.wakeupread, 4096):
+        pass
+    except OSError, e:
+      if e[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+        raise
+
+
+
+
+
+class _BaseBackend:
+  """
+  Bookkeeping shared by all of the backends.   Maps file descriptors to a
+  (sockobj, data) tuple.
+  """
+
+  # The name of the backend (for diagnostics and benchmarks)
+  name = None
+
+  def __init__(self):
+    self.fdtable = {}
+    self.fdlock = threading.Lock()
+
+
+  def __len__(self):
+    return len(self.fdtable)
+
+
+  def _entries_for(self, sockobj):
+    # A closed socket has no fileno (or a bogus one), so fall back to
+    # scanning the table by identity.
+    try:
+      fd = sockobj.fileno()
+      if fd in self.fdtable and self.fdtable[fd][0] is sockobj:
+        return [(fd, self.fdtable[fd])]
+    except Exception:
+      pass
+    return [(fd, entry) for fd, entry in self.fdtable.items() if entry[0] is sockobj]
+
+
+  def _lookup(self, fd):
+    # Returns the entry for fd or None if it was unregistered in the interim.
+    return self.fdtable.get(fd)
+
+
+  def _is_interrupted(self, exceptionobj):
+    # wait() may be interrupted by a signal.   Treat this like a timeout.
+    try:
+      return exceptionobj[0] == errno.EINTR
+    except (IndexError, TypeError):
+      return False
+
+
+
+
+
+class EpollBackend(_BaseBackend, _PipeWakeupMixin):
+  """
+  Readiness notification using Linux's epoll.   Registration is O(1) and
+  wait() is proportional to the number of ready sockets, not the number of
+  registered sockets.
+  """
+
+  name = 'epoll'
+
+  def __init__(self):
+    _BaseBackend.__init__(self)
+    self.epollobj = select.epoll()
+    self._init_wakeup()
+    self.epollobj.register(self.wakeupread, select.EPOLLIN)
+
+
+  def register(self, sockobj, data):
+    fd = sockobj.fileno()
+    self.fdlock.acquire()
+    try:
+      if fd in self.fdtable and self.fdtable[fd][0] is sockobj:
+        # Already watched, just update the data
+        self.fdtable[fd] = (sockobj, data)
+        return
+
+      try:
+        self.epollobj.register(fd, EPOLL_READ_MASK)
+      except IOError, e:
+        # The fd was reused after a close we didn't hear about
+        if e[0] != errno.EEXIST:
+          raise
+        self.epollobj.modify(fd, EPOLL_READ_MASK)
+
+      self.fdtable[fd] = (sockobj, data)
+    finally:
+      self.fdlock.release()
+
+
+  def unregister(self, sockobj):
+    self.fdlock.acquire()
+    try:
+      for fd, entry in self._entries_for(sockobj):
+        del self.fdtable[fd]
+        try:
+          self.epollobj.unregister(fd)
+        except (IOError, ValueError):
+          # Already closed, so the kernel removed it for us
+          pass
+    finally:
+      self.fdlock.release()
+
+
+  def wait(self, timeout):
+    try:
+      events = self.epollobj.poll(timeout)
+    except IOError, e:
+      if self._is_interrupted(e):
+        return []
+      raise
+
+    readylist = []
+    for fd, eventmask in events:
+      if fd == self.wakeupread:
+        self._drain_wakeup()
+        continue
+
+      entry = self._lookup(fd)
+      if entry is not None:
+        readylist.append(entry)
+
+    return readylist
+
+
+
+
+
+class PollBackend(_BaseBackend, _PipeWakeupMixin):
+  """
+  Readiness notification using poll().   wait() is proportional to the number
+  of registered sockets, but unlike select() there is no limit on the value
+  of a file descriptor.
+  """
+
+  name = 'poll'
+
+  def __init__(self):
+    _BaseBackend.__init__(self)
+    self.pollobj = select.poll()
+    self._init_wakeup()
+    self.pollobj.register(self.wakeupread, select.POLLIN)
+
+
+  def register(self, sockobj, data):
+    fd = sockobj.fileno()
+    self.fdlock.acquire()
+    try:
+      needswakeup = fd not in self.fdtable
+      self.pollobj.register(fd, POLL_READ_MASK)
+      self.fdtable[fd] = (sockobj, data)
+    finally:
+      self.fdlock.release()
+
+    # A poll() that is already in progress won't see the new socket
+    if needswakeup:
+      self.wakeup()
+
+
+  def unregister(self, sockobj):
+    self.fdlock.acquire()
+    try:
+      for fd, entry in self._entries_for(sockobj):
+        del self.fdtable[fd]
+        try:
+          self.pollobj.unregister(fd)
+        except KeyError:
+          pass
+    finally:
+      self.fdlock.release()
+
+
+  def wait(self, timeout):
+    # poll takes milliseconds
+    try:
+      events = self.pollobj.poll(int(timeout * 1000))
+    except select.error, e:
+      if self._is_interrupted(e):
+        return []
+      raise
+
+    readylist = []
+    for fd, eventmask in events:
+      if fd == self.wakeupread:
+        self._drain_wakeup()
+        continue
+
+      entry = self._lookup(fd)
+
+      if eventmask & select.POLLNVAL:
+        # The socket was closed without being unregistered.   Stop watching
+        # it, otherwise poll() would return immediately forever.
+        self.fdlock.acquire()
+        try:
+          try:
+            self.pollobj.unregister(fd)
+          except KeyError:
+            pass
+          if fd in self.fdtable:
+            del self.fdtable[fd]
+        finally:
+          self.fdlock.release()
+        continue
+
+      if entry is not None:
+        readylist.append(entry)
+
+    return readylist
+
+
+
+
+
+class SelectBackend(_BaseBackend):
+  """
+  Readiness notification using select().   This is the fallback for systems
+  that have neither epoll nor a working poll (i.e. Windows).   There is no
+  wakeup pipe, so a newly registered socket is only noticed when the current
+  wait() times out.
+  """
+
+  name = 'select'
+
+  # Since we can't interrupt select, don't block in it for too long.
+  MAX_WAIT = 0.5
+
+  def register(self, sockobj, data):
+    self.fdlock.acquire()
+    try:
+      self.fdtable[sockobj.fileno()] = (sockobj, data)
+    finally:
+      self.fdlock.release()
+
+
+  def unregister(self, sockobj):
+    self.fdlock.acquire()
+    try:
+      for fd, entry in self._entries_for(sockobj):
+        del self.fdtable[fd]
+    finally:
+      self.fdlock.release()
+
+
+  def wakeup(self):
+    pass
+
+
+  def wait(self, timeout):
+    entries = self.fdtable.values()
+    if not entries:
+      # Nothing to select on (and select on Windows rejects empty lists)
+      time.sleep(min(timeout, self.MAX_WAIT))
+      return []
+
+    socklist = []
+    for sockobj, data in entries:
+      socklist.append(sockobj)
+
+    try:
+      (readable, not_applic, has_excp) = select.select(socklist, [], socklist, min(timeout, self.MAX_WAIT))
+
+    # There was probably an exception on the socket level, check individually
+    except Exception:
+      readable = []
+      has_excp = []
+      for sockobj in socklist:
+        try:
+          (thisreadable, not_applic, thisexcp) = select.select([sockobj], [], [sockobj], 0)
+          readable.extend(thisreadable)
+          has_excp.extend(thisexcp)
+
+        # Ignore errors, probably the socket is closed.
+        except Exception:
+          pass
+
+    readylist = []
+    for sockobj, data in entries:
+      if sockobj in readable or sockobj in has_excp:
+        readylist.append((sockobj, data))
+
+    return readylist
+
+
+
+
+
+def get_backend(preferred=None):
+  """
+   <Purpose>
+      Returns a new readiness backend.   The best backend for the current
+      system is used unless preferred is specified.
+
+   <Arguments>
+      preferred:
+         Optional.   One of 'epoll', 'poll', or 'select'.
+
+   <Exceptions>
+      Exception if the preferred backend is not available on this system.
+
+   <Side Effects>
+      The epoll and poll backends allocate file descriptors.
+
+   <Returns>
+      A backend object.
+  """
+  if preferred is None:
+    if have_epoll:
+      preferred = 'epoll'
+    elif have_poll:
+      preferred = 'poll'
+    else:
+      preferred = 'select'
+
+  if preferred == 'epoll' and have_epoll:
+    return EpollBackend()
+  elif preferred == 'poll' and have_poll:
+    return PollBackend()
+  elif preferred == 'select':
+    return SelectBackend()
+
+  raise Exception("Readiness backend '"+str(preferred)+"' is not available")
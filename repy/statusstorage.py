@@ -8,11 +8,17 @@
    This module stores status information about the sandbox.   Use "read_status"
    and "write_status" to set and check the status...
 
-   This module works by creating a file with an name that indicates the status.
-   The order of operations is: find old file name(s), write new file, delete 
-   old file(s).   File names contain a timestamp so that one can tell when it
-   was last updated.   The actual format is: "prefix-status-timestamp".  
+   The status is kept in a small file, "prefix.heartbeat", that is written in
+   place.   The file holds one fixed size record: "seq status timestamp crc",
+   padded with spaces.   seq counts the writes, the timestamp tells when the
+   status was last updated and the crc lets a reader tell a record that was
+   read while it was being written (it then reads it again).   The writers
+   keep the file memory mapped, so a heartbeat doesn't create, list or remove
+   any files.
 
+   Earlier versions created a new file with a name that indicates the status
+   for each update: "prefix-status-timestamp".   read_status still reads
+   these if there is no heartbeat file (see read_old_status).
 """
 
 # to store the current time...
@@ -24,7 +30,16 @@ import threading
 # needed for listdir...
 import os
 
-# To allow access to a real fileobject 
+# for the crc of a status record
+import zlib
+
+# The writers map the status file into memory (if mmap is available)
+try:
+  import mmap
+except ImportError:
+  mmap = None
+
+# To allow access to a real fileobject
 # call type...
 myfile = file
 
@@ -33,11 +48,107 @@ statusfilenameprefix = None
 # This prevents writes to the nanny's status information after we want to stop
 statuslock = threading.Lock()
 
+# The suffix of the name of the status file (added to the prefix)
+STATUS_FILE_SUFFIX = ".heartbeat"
+
+# The size of a status record in the status file
+STATUS_RECORD_SIZE = 128
+
+# How many times a reader tries again if a record is being written while it
+# reads it
+STATUS_READ_ATTEMPTS = 10
+
+# The status files this process has written, keyed by the prefix.   The
+# values are [mapped file (or None if mmap isn't available), seq of the last
+# write].
+statusfiledict = {}
+statusfiledictlock = threading.Lock()
+
+
 def init(sfnp):
   global statusfilenameprefix
   statusfilenameprefix = sfnp
 
 
+# Returns the status record for a status and timestamp, padded to
+# STATUS_RECORD_SIZE.
+def _make_status_record(seq, status, timestamp):
+  record = str(seq) + " " + status + " " + repr(timestamp)
+  record = record + " " + str(zlib.crc32(record) & 0xffffffff)
+
+  if len(record) >= STATUS_RECORD_SIZE:
+    raise ValueError, "Status '"+status+"' is too long"
+
+  return record.ljust(STATUS_RECORD_SIZE - 1) + "\n"
+
+
+# Returns (seq, status, timestamp) from a status record, or None if the
+# record is incomplete (e.g. it was read while being written).
+def _parse_status_record(record):
+  fields = record.split()
+  if len(fields) != 4:
+    return None
+
+  (seq, status, timestamp, crc) = fields
+  if str(zlib.crc32(seq + " " + status + " " + timestamp) & 0xffffffff) != crc:
+    return None
+
+  return (int(seq), status, float(timestamp))
+
+
+# Reads the record in a status file.   Returns (seq, status, timestamp), or
+# None if the file doesn't exist.
+def _read_status_file(statusfilename):
+  try:
+    fileobj = myfile(statusfilename, "rb")
+  except IOError, e:
+    if e[0] == 2:
+      # file not found
+      return None
+    raise
+
+  try:
+    for attempt in range(STATUS_READ_ATTEMPTS):
+      fileobj.seek(0)
+      parsedrecord = _parse_status_record(fileobj.read(STATUS_RECORD_SIZE))
+      if parsedrecord is not None:
+        return parsedrecord
+  finally:
+    fileobj.close()
+
+  # A file that was created but not yet written is the same as no status
+  return (0, None, 0)
+
+
+# Opens a status file for writing (creating it if needed).   The old format
+# status files with the same prefix are removed.
+def _open_status_file(mystatusfilenameprefix):
+  statusfilename = mystatusfilenameprefix + STATUS_FILE_SUFFIX
+
+  existingrecord = _read_status_file(statusfilename)
+  if existingrecord is None:
+    seq = 0
+  else:
+    seq = existingrecord[0]
+
+  fd = os.open(statusfilename, os.O_RDWR | os.O_CREAT, 0644)
+  try:
+    # Readers treat the zeroed record as no status until it is written.
+    if os.fstat(fd).st_size < STATUS_RECORD_SIZE:
+      os.ftruncate(fd, STATUS_RECORD_SIZE)
+
+    if mmap is None:
+      mappedfile = None
+    else:
+      mappedfile = mmap.mmap(fd, STATUS_RECORD_SIZE)
+  finally:
+    os.close(fd)
+
+  _remove_old_status_files(mystatusfilenameprefix)
+
+  return [mappedfile, seq]
+
+
 # Write out a status that can be read by another process...
 def write_status(status, mystatusfilenameprefix=None):
 
@@ -47,42 +158,108 @@ def write_status(status, mystatusfilenameprefix=None):
   # nothing set, nothing to do...
   if not mystatusfilenameprefix:
     return
-  
-  mystatusdir = os.path.dirname(mystatusfilenameprefix)
-  if mystatusdir == '':
-    mystatusdir = './'
-  else:
-    mystatusdir = mystatusdir+'/'
 
-  # BUG: Is getting a directory list atomic wrt file creation / deletion?
-  # get the current file list...
-  # Fix.   Need to prepend the directory name we're writing into...
-  existingfiles = os.listdir(mystatusdir)
-
-  timestamp = time.time()
+  statusfiledictlock.acquire()
+  try:
+    if mystatusfilenameprefix not in statusfiledict:
+      statusfiledict[mystatusfilenameprefix] = _open_status_file(mystatusfilenameprefix)
+    statusfile = statusfiledict[mystatusfilenameprefix]
 
-  # write the file
-  myfile(mystatusfilenameprefix+"-"+status+"-"+str(timestamp),"w").close()
+    statusfile[1] = statusfile[1] + 1
+    record = _make_status_record(statusfile[1], status, time.time())
 
-  # remove the old files...
-  for filename in existingfiles:
-    if len(filename.split('-')) == 3 and filename.split('-')[0] == os.path.basename(mystatusfilenameprefix):
+    # write the record in place
+    if statusfile[0] is not None:
+      statusfile[0][:] = record
+    else:
+      fileobj = myfile(mystatusfilenameprefix + STATUS_FILE_SUFFIX, "r+b")
       try:
-        os.remove(mystatusdir+filename)
-      except OSError, e:
-        if e[0] == 2:
-          # file not found, let's assume another instance removed it...
-          continue
+        fileobj.write(record)
+      finally:
+        fileobj.close()
+  finally:
+    statusfiledictlock.release()
 
-        # otherwise, let's re-raise the error
-        raise
-  
 
 def read_status(mystatusfilenameprefix=None):
 
   if not mystatusfilenameprefix:
     mystatusfilenameprefix = statusfilenameprefix
-  
+
+  return read_statuses([mystatusfilenameprefix])[mystatusfilenameprefix]
+
+
+def read_statuses(statusfilenameprefixlist):
+  """
+   <Purpose>
+      Reads the status of a number of sandboxes at once (e.g. of all the
+      vessels).
+
+   <Arguments>
+      statusfilenameprefixlist:
+         A list of the status file name prefixes of the sandboxes.
+
+   <Exceptions>
+      As with listdir if a sandbox has no status file and its directory can't
+      be listed.
+
+   <Side Effects>
+      None
+
+   <Returns>
+      A dict that maps each prefix to a tuple (status, timestamp).   The
+      status is None (and the timestamp 0) if there is no status yet.
+  """
+
+  statusdict = {}
+
+  # The prefixes that have no status file, by directory.   The directories
+  # are listed once to look for old format status files.
+  oldformatprefixdict = {}
+
+  for mystatusfilenameprefix in statusfilenameprefixlist:
+    record = _read_status_file(mystatusfilenameprefix + STATUS_FILE_SUFFIX)
+    if record is not None:
+      statusdict[mystatusfilenameprefix] = record[1:]
+      continue
+
+    mystatusdir = os.path.dirname(mystatusfilenameprefix)
+    if mystatusdir not in oldformatprefixdict:
+      oldformatprefixdict[mystatusdir] = []
+    oldformatprefixdict[mystatusdir].append(mystatusfilenameprefix)
+
+  for mystatusdir in oldformatprefixdict:
+    existingfiles = os.listdir(mystatusdir or '.')
+    for mystatusfilenameprefix in oldformatprefixdict[mystatusdir]:
+      statusdict[mystatusfilenameprefix] = _find_old_status(mystatusfilenameprefix, existingfiles)
+
+  return statusdict
+
+
+def read_old_status(mystatusfilenameprefix=None):
+  """
+   <Purpose>
+      Reads the status from the old format status files
+      ("prefix-status-timestamp").
+
+   <Arguments>
+      mystatusfilenameprefix:
+         The status file name prefix (the one set by init() by default).
+
+   <Exceptions>
+      As with listdir.
+
+   <Side Effects>
+      None
+
+   <Returns>
+      A tuple (status, timestamp).   The status is None (and the timestamp 0)
+      if there is no status file.
+  """
+
+  if not mystatusfilenameprefix:
+    mystatusfilenameprefix = statusfilenameprefix
+
   # BUG: is getting a dir list atomic wrt file creation / deletion?
   # get the current file list...
   # Fix.   Need to prepend the directory name we're writing into...
@@ -91,12 +268,17 @@ def read_status(mystatusfilenameprefix=None):
   else:
     existingfiles = os.listdir('.')
 
+  return _find_old_status(mystatusfilenameprefix, existingfiles)
+
+
+# Finds the newest old format status for a prefix in a directory listing.
+def _find_old_status(mystatusfilenameprefix, existingfiles):
   latesttime = 0
   lateststatus = None
 
   # find the newest status update...
   for filename in existingfiles:
-    if filename.split('-')[0] == mystatusfilenameprefix:
+    if len(filename.split('-')) == 3 and filename.split('-')[0] == os.path.basename(mystatusfilenameprefix):
       thisstatus = filename.split('-',2)[1]
       thistime = float(filename.split('-',2)[2])
 
@@ -108,4 +290,22 @@ def read_status(mystatusfilenameprefix=None):
   return (lateststatus, latesttime)
 
 
+# Removes the old format status files for a prefix.
+def _remove_old_status_files(mystatusfilenameprefix):
+  mystatusdir = os.path.dirname(mystatusfilenameprefix)
+  if mystatusdir == '':
+    mystatusdir = './'
+  else:
+    mystatusdir = mystatusdir+'/'
 
+  for filename in os.listdir(mystatusdir):
+    if len(filename.split('-')) == 3 and filename.split('-')[0] == os.path.basename(mystatusfilenameprefix):
+      try:
+        os.remove(mystatusdir+filename)
+      except OSError, e:
+        if e[0] == 2:
+          # file not found, let's assume another instance removed it...
+          continue
+
+        # otherwise, let's re-raise the error
+        raise
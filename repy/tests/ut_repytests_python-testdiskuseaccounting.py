@@ -0,0 +1,108 @@
+"""
+Test that the disk use is charged as files are created, written, truncated
+and removed, that a write that would go over the disk use limit fails before
+anything is written, that a file that can't be created isn't charged for, and
+that nonportable.DiskUseTracker sees changes that repy didn't make.
+"""
+
+import os
+
+import nanny
+import restrictions
+import emulfile
+import nonportable
+
+
+def allow_everything(*args):
+  return True
+
+restrictions.assertisallowed = allow_everything
+
+nanny.resource_restriction_table['filesopened'] = 10
+nanny.resource_restriction_table['filewrite'] = 1000000000.0
+nanny.resource_restriction_table['diskused'] = 20000
+nanny.initialize_consumed_resource_tables()
+
+def diskused():
+  return nanny.resource_consumption_table['diskused']
+
+for filename in ['junk_diskuse1', 'junk_diskuse2', 'junk_diskuse3']:
+  if os.path.exists(filename):
+    os.remove(filename)
+
+
+# A new file is charged 4K, then whatever it grows by.
+fileobj = emulfile.emulated_open('junk_diskuse1', 'w')
+assert diskused() == 4096
+fileobj.write('x' * 100)
+assert diskused() == 4196
+
+# Overwriting doesn't grow the file.
+fileobj.seek(0)
+fileobj.write('y' * 50)
+assert diskused() == 4196
+fileobj.seek(80)
+fileobj.writelines(['z' * 10, 'z' * 20])
+assert diskused() == 4206
+
+# This would be over the limit.
+try:
+  fileobj.write('x' * 20000)
+except Exception, e:
+  assert 'over limit' in str(e)
+else:
+  raise AssertionError("A write over the disk use limit was allowed")
+assert diskused() == 4206
+fileobj.close()
+assert os.path.getsize('junk_diskuse1') == 110
+
+# Appending is charged, truncating is refunded.
+fileobj = emulfile.emulated_open('junk_diskuse1', 'a')
+fileobj.write('x' * 10)
+fileobj.close()
+assert diskused() == 4216
+
+fileobj = emulfile.emulated_open('junk_diskuse1', 'w')
+fileobj.close()
+assert diskused() == 4096
+
+# Removing a file refunds all of it.
+fileobj = emulfile.emulated_open('junk_diskuse1', 'w')
+fileobj.write('x' * 1000)
+fileobj.close()
+emulfile.removefile('junk_diskuse1')
+assert diskused() == 0
+
+# A file that can't be created (here because all of the files that can be
+# opened are) isn't charged for.
+nanny.resource_restriction_table['filesopened'] = 1
+fileobj = emulfile.emulated_open('junk_diskuse1', 'w')
+assert diskused() == 4096
+try:
+  emulfile.emulated_open('junk_diskuse3', 'w')
+except Exception, e:
+  assert 'filesopened' in str(e)
+else:
+  raise AssertionError("A file was opened over the filesopened limit")
+assert diskused() == 4096
+assert not os.path.exists('junk_diskuse3')
+fileobj.close()
+emulfile.removefile('junk_diskuse1')
+assert diskused() == 0
+nanny.resource_restriction_table['filesopened'] = 10
+
+
+# The tracker agrees with compute_disk_use as the directory is changed behind
+# its back.
+tracker = nonportable.DiskUseTracker('.')
+(trackeddiskused, rescanned) = tracker.get_disk_use()
+assert rescanned
+assert trackeddiskused == nonportable.compute_disk_use('.')
+
+fileobj = open('junk_diskuse2', 'w')
+fileobj.write('x' * 5000)
+fileobj.close()
+assert tracker.get_disk_use()[0] == nonportable.compute_disk_use('.')
+
+os.remove('junk_diskuse2')
+assert tracker.get_disk_use()[0] == nonportable.compute_disk_use('.')
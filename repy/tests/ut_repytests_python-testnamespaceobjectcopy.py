@@ -68,3 +68,34 @@ retval = wrapped_foo(circtuple)
 assert(retval is not circtuple)
 assert(retval[0]["test"] is retval)
 
+
+# Tuple of immutable objects. There's no need to copy this.
+mytuple = ("abc", 1, 2.0, None)
+retval = wrapped_foo(mytuple)
+assert(retval is mytuple)
+
+# List of immutable objects. The list still needs to be copied.
+mylist = ["abc", "def"]
+retval = wrapped_foo(mylist)
+assert(retval is not mylist)
+assert(retval == mylist)
+
+# Dict of immutable objects. The dict still needs to be copied.
+mydict = {"abc" : 1}
+retval = wrapped_foo(mydict)
+assert(retval is not mydict)
+assert(retval == mydict)
+
+# A list that is referenced more than once must only be copied once.
+mylist = ["abc"]
+retval = wrapped_foo([mylist, mylist])
+assert(retval[0] is not mylist)
+assert(retval[0] is retval[1])
+
+# Tuple containing a mutable object.
+mylist = ["abc"]
+mytuple = (1, mylist)
+retval = wrapped_foo(mytuple)
+assert(retval is not mytuple)
+assert(retval[1] is not mylist)
+assert(retval == mytuple)
@@ -0,0 +1,41 @@
+"""
+Test that the nanny throttles renewable resources to their limit, and that a
+thread that is waiting for a resource to drain does not hold the resource's
+lock while it waits.
+"""
+
+import time
+import threading
+
+import nanny
+
+nanny.resource_restriction_table['netsend'] = 1000.0
+nanny.initialize_consumed_resource_tables()
+
+# Charges within the limit don't wait.
+start = time.time()
+nanny.tattle_quantity('netsend', 0)
+nanny.tattle_quantity('netsend', 500)
+nanny.tattle_quantity('netsend', 0)
+assert(time.time() - start < 0.1)
+
+# This puts us 500 over the limit, so we should wait about half a second.
+start = time.time()
+nanny.tattle_quantity('netsend', 1000)
+elapsed = time.time() - start
+assert(elapsed > 0.4)
+assert(elapsed < 1.0)
+
+# A thread that is over the limit must not hold the lock while it waits.
+def charge():
+  nanny.tattle_quantity('netsend', 2000)
+
+chargethread = threading.Thread(target=charge)
+chargethread.start()
+time.sleep(0.2)
+
+assert(chargethread.isAlive())
+assert(nanny.renewable_resource_lock_table['netsend'].acquire(False))
+nanny.renewable_resource_lock_table['netsend'].release()
+
+chargethread.join()
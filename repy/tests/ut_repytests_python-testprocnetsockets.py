@@ -0,0 +1,47 @@
+"""
+Test that on Linux the socket table read from /proc/net finds the same
+sockets as netstat does, and that the cached table is read again once it
+expires.
+"""
+
+import socket
+import time
+
+import nonportable
+
+if nonportable.osrealtype == "Linux":
+  import linux_api
+  import nix_common_api
+
+  listensock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+  listensock.bind(('127.0.0.1', 0))
+  listensock.listen(1)
+  listenport = listensock.getsockname()[1]
+
+  clientsock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+  clientsock.connect(('127.0.0.1', listenport))
+  clientport = clientsock.getsockname()[1]
+  serversock = listensock.accept()[0]
+
+  udpsock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+  udpsock.bind(('127.0.0.1', 0))
+  udpport = udpsock.getsockname()[1]
+
+  for api in [linux_api, nix_common_api]:
+    assert api.exists_listening_network_socket('127.0.0.1', listenport, True)
+    assert not api.exists_listening_network_socket('127.0.0.1', clientport, True)
+    assert api.exists_listening_network_socket('127.0.0.1', udpport, False)
+    assert not api.exists_listening_network_socket('127.0.0.1', udpport, True)
+    assert api.exists_outgoing_network_socket('127.0.0.1', clientport,
+        '127.0.0.1', listenport) == (True, 'ESTABLISHED')
+    assert api.exists_outgoing_network_socket('127.0.0.1', clientport,
+        '127.0.0.1', udpport) == (False, None)
+
+  # Once the cached table expires, the closed socket is gone.
+  listensock.close()
+  time.sleep(linux_api.SOCKET_TABLE_CACHE_TTL)
+  assert not linux_api.exists_listening_network_socket('127.0.0.1', listenport, True)
+
+  clientsock.close()
+  serversock.close()
+  udpsock.close()
@@ -0,0 +1,54 @@
+"""
+This tests that the compiled call rules that restrictions.assertisallowed()
+uses give the same actions as going through the rules one at a time with
+restrictions.find_action(), and that denials are still explained.
+"""
+
+import restrictions
+
+
+rulesets = [
+  [],
+  [([], 'allow')],
+  [([], 'deny'), ([], 'allow')],
+  [([('noargs', 1)], 'allow'), ([('arg', 0, 'junk_test.out')], 'allow'),
+   ([('arg', 1, 'r')], 'allow'), ([('arg', 1, 'rb')], 'allow')],
+  [([('arg', 1, 'w')], 'deny'), ([('arg', 1, 'w')], 'allow'),
+   ([('arg', 1, 'r')], 'prompt'), ([], 'allow')],
+  [([('noargs', 1), ('arg', 0, '0.1')], 'allow'), ([('noargs', 2)], 'deny'),
+   ([('noargs', 1)], 'deny'), ([('noargs', 2)], 'allow'),
+   ([('arg', 0, '0.1')], 'allow')],
+  [([('arg', 0, 'foo')], 'deny'), ([('arg', 1, 'foo')], 'allow'),
+   ([('arg', 0, 'foo')], 'allow'), ([('arg', 0, '2')], 'allow')],
+]
+
+argslist = [(), ('foo',), ('junk_test.out',), ('junk_test.out', 'w'),
+  ('bar', 'r'), ('bar', 'rb'), ('bar', 'w'), (0.1,), ('0.1', 'x'), (2,),
+  ('foo', 'foo'), ('x', 'foo', 'z')]
+
+for ruleset in rulesets:
+  restrictions.call_rule_table['open'] = ruleset
+  restrictions.compile_call_rule_table()
+
+  for args in argslist:
+    expectedaction = restrictions.find_action(ruleset, args)[0][0]
+    action, decide = restrictions.call_decision_table['open']
+    if decide is not None:
+      action = decide(args)
+    assert action == expectedaction, str(ruleset) + " " + str(args)
+
+    if expectedaction == 'allow':
+      assert restrictions.assertisallowed('open', *args)
+    else:
+      try:
+        restrictions.assertisallowed('open', *args)
+      except Exception, e:
+        if expectedaction == 'deny':
+          assert "Matching dump" in str(e)
+      else:
+        raise AssertionError("Call was allowed: " + str(ruleset) + " " + str(args))
+
+# Unconditional rules don't need the args to be looked at.
+restrictions.call_rule_table['open'] = [([], 'allow'), ([('noargs', 1)], 'deny')]
+restrictions.compile_call_rule_table()
+assert restrictions.call_decision_table['open'] == ('allow', None)
@@ -0,0 +1,69 @@
+"""
+Test that statusstorage writes the status in place in one status file, that
+the batched reader reads it for a number of prefixes, that old format status
+files are still read (and are removed once the status is written), and that
+a record that is being written isn't taken for a status.
+"""
+
+import os
+import time
+
+import statusstorage
+
+prefixes = ['junk_status1', 'junk_status2', 'junk_status3']
+
+def remove_status_files():
+  for filename in os.listdir('.'):
+    if filename.split('-')[0].split('.')[0] in prefixes:
+      os.remove(filename)
+
+remove_status_files()
+
+
+# Nothing written yet.
+assert statusstorage.read_status('junk_status1') == (None, 0)
+
+# An old format status file is read.
+open('junk_status1-Started-1000.5', 'w').close()
+open('junk_status1-Stopped-999.0', 'w').close()
+assert statusstorage.read_status('junk_status1') == ('Started', 1000.5)
+assert statusstorage.read_old_status('junk_status1') == ('Started', 1000.5)
+
+# Writing the status removes the old format files and replaces them with the
+# status file.
+before = time.time()
+statusstorage.write_status('Started', 'junk_status1')
+(status, timestamp) = statusstorage.read_status('junk_status1')
+assert status == 'Started'
+assert before <= timestamp <= time.time()
+assert sorted([filename for filename in os.listdir('.')
+    if filename.startswith('junk_status1')]) == ['junk_status1.heartbeat']
+
+# Later writes go to the same file, with the next seq.
+statusstorage.write_status('Terminated', 'junk_status1')
+assert statusstorage.read_status('junk_status1')[0] == 'Terminated'
+record = open('junk_status1.heartbeat', 'rb').read()
+assert len(record) == statusstorage.STATUS_RECORD_SIZE
+assert record.split()[0] == '2'
+
+# The prefix set by init() is the default.
+statusstorage.init('junk_status2')
+statusstorage.write_status('Started')
+assert statusstorage.read_status()[0] == 'Started'
+statusstorage.init(None)
+
+# The batched reader reads all of them.
+statusdict = statusstorage.read_statuses(prefixes)
+assert statusdict['junk_status1'][0] == 'Terminated'
+assert statusdict['junk_status2'][0] == 'Started'
+assert statusdict['junk_status3'] == (None, 0)
+
+# A record that was only partly written isn't a status.
+goodrecord = statusstorage._make_status_record(5, 'Stopped', 1234.5)
+assert statusstorage._parse_status_record(goodrecord) == (5, 'Stopped', 1234.5)
+otherrecord = statusstorage._make_status_record(5, 'Started', 1299.0)
+tornrecord = otherrecord[:10] + goodrecord[10:]
+assert statusstorage._parse_status_record(tornrecord) is None
+assert statusstorage._parse_status_record('\0' * statusstorage.STATUS_RECORD_SIZE) is None
+
+remove_status_files()
@@ -0,0 +1,57 @@
+#pragma repy --eventpool restrictions.default
+
+"""
+Description:
+  Connections and messages are delivered by the event pool, each with a
+  unique thread name, and stopping the listeners lets the program exit.
+"""
+
+THREAD_NAMES = set([])
+
+def record_thread_name():
+  mycontext['lock'].acquire()
+  name = get_thread_name()
+  if name in THREAD_NAMES:
+    print "Re-used thread name '"+str(name)+"'"
+  THREAD_NAMES.add(name)
+  mycontext['lock'].release()
+
+def gotmess(ip,port,mess,ch):
+  record_thread_name()
+  mycontext['mess'] += 1
+
+def gotconn(ip,port,sockobj,ch,mainch):
+  record_thread_name()
+  data = sockobj.recv(5)
+  sockobj.send(data)
+  sockobj.close()
+  mycontext['conn'] += 1
+
+def timeout():
+  print "Timed out!", mycontext['conn'], mycontext['mess']
+  exitall()
+
+if callfunc == 'initialize':
+  mycontext['lock'] = getlock()
+  mycontext['mess'] = 0
+  mycontext['conn'] = 0
+  timerhandle = settimer(20,timeout,())
+
+  ip = '127.0.0.1'
+  tcphandle = waitforconn(ip,<connport>,gotconn)
+  udphandle = recvmess(ip,<messport>,gotmess)
+
+  for count in xrange(5):
+    sockobj = openconn(ip,<connport>)
+    sockobj.send('hello')
+    if sockobj.recv(5) != 'hello':
+      print "Bad echo"
+    sockobj.close()
+    sendmess(ip,<messport>,'hello')
+
+  while mycontext['conn'] < 5 or mycontext['mess'] < 5:
+    sleep(.05)
+
+  stopcomm(tcphandle)
+  stopcomm(udphandle)
+  canceltimer(timerhandle)
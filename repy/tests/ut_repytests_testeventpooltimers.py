@@ -0,0 +1,55 @@
+#pragma repy --eventpool restrictions.default
+
+"""
+Description:
+  Timers delivered by the event pool fire in order, can be cancelled, get
+  unique thread names even though threads are reused, and the program still
+  exits once nothing is pending.
+"""
+
+THREAD_NAMES = set([])
+
+def fired(number):
+  mycontext['lock'].acquire()
+  mycontext['fired'].append(number)
+  name = get_thread_name()
+  if name in THREAD_NAMES:
+    raise Exception, "Re-used thread name '"+str(name)+"'"
+  THREAD_NAMES.add(name)
+  mycontext['lock'].release()
+
+def never():
+  print "A cancelled timer fired!"
+
+if callfunc == "initialize":
+  mycontext['fired'] = []
+  mycontext['lock'] = getlock()
+  THREAD_NAMES.add(get_thread_name())
+
+  # These are set out of order on purpose
+  settimer(.3,fired,(3,))
+  settimer(.1,fired,(1,))
+  settimer(.2,fired,(2,))
+  handle = settimer(.15,never,())
+  if not canceltimer(handle):
+    print "Could not cancel a pending timer"
+
+  sleep(1)
+  if mycontext['fired'] != [1,2,3]:
+    print "Timers fired out of order:", mycontext['fired']
+
+  # Reuse the same workers a few times
+  for round in xrange(3):
+    for event in xrange(8):
+      settimer(0,fired,(event,))
+    sleep(.5)
+
+  if len(mycontext['fired']) != 27:
+    print "Wrong number of timers fired:", len(mycontext['fired'])
+
+  # Leave one pending so the program has to wait for it before exiting
+  settimer(.5,fired,(4,))
+
+if callfunc == "exit":
+  if mycontext['fired'][-1] != 4:
+    print "Exited before the last timer fired"
@@ -0,0 +1,55 @@
+#pragma repy
+
+# Listening sockets are added to and removed from the selector while it is
+# already waiting on other sockets.   Every listener must still get its events.
+
+def gotmess(ip,port,mess,ch):
+  mycontext['mess'] += 1
+
+def gotconn(ip,port,sockobj,ch,mainch):
+  mycontext['conn'] += 1
+  sockobj.close()
+
+def timeout():
+  print "Timed out!", mycontext
+  exitall()
+
+def waitfor(key, count):
+  while mycontext[key] < count:
+    sleep(.01)
+
+if callfunc == 'initialize':
+  mycontext['mess'] = 0
+  mycontext['conn'] = 0
+  timerhandle = settimer(20,timeout,())
+
+  ip = '127.0.0.1'
+
+  # The selector is waiting on the UDP socket when the TCP one is added
+  udphandle = recvmess(ip,<messport>,gotmess)
+  sleep(.1)
+  tcphandle = waitforconn(ip,<connport>,gotconn)
+
+  openconn(ip,<connport>).close()
+  waitfor('conn', 1)
+  sendmess(ip,<messport>,'hello')
+  waitfor('mess', 1)
+
+  # Replacing the handler keeps the socket registered
+  tcphandle = waitforconn(ip,<connport>,gotconn)
+  openconn(ip,<connport>).close()
+  waitfor('conn', 2)
+
+  # Removing one listener doesn't affect the other
+  stopcomm(udphandle)
+  openconn(ip,<connport>).close()
+  waitfor('conn', 3)
+
+  # ...and a listener added back after removal works again
+  udphandle = recvmess(ip,<messport>,gotmess)
+  sendmess(ip,<messport>,'hello')
+  waitfor('mess', 2)
+
+  stopcomm(tcphandle)
+  stopcomm(udphandle)
+  canceltimer(timerhandle)
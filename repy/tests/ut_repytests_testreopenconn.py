@@ -0,0 +1,50 @@
+#pragma repy restrictions.severalports
+
+# Closing a connection and opening one on the same (localip, localport,
+# desthost, destport) straight away must see the socket as it is now, not
+# as it was when the last openconn looked for it.
+
+def server(remoteip, remoteport, sock, thiscommhandle, listencommhandle):
+  # Close first, so the client's socket goes to CLOSE_WAIT and then away
+  # when it is closed.
+  sock.close()
+
+
+def wait_for_close(sock):
+  while True:
+    try:
+      if sock.recv(1024) == '':
+        return
+    except Exception:
+      return
+
+
+if callfunc == "initialize":
+  ip = getmyip()
+  serverport = <connport>
+  clientport = <connport1>
+
+  listenhandle = waitforconn(ip, serverport, server)
+
+  sock1 = openconn(ip, serverport, ip, clientport)
+  wait_for_close(sock1)
+
+  # sock1 is in CLOSE_WAIT, so this looks it up and fails
+  try:
+    openconn(ip, serverport, ip, clientport)
+  except Exception, e:
+    if "Duplicate" not in str(e):
+      print "Expected error about duplicate handles! Got:"+str(e)
+  else:
+    print "Unexpectedly created a new socket! Reused network tuple!"
+
+  # Once sock1 is closed, the same tuple can be used again right away
+  sock1.close()
+  try:
+    sock2 = openconn(ip, serverport, ip, clientport, timeout=5)
+  except Exception, e:
+    print "Couldn't reopen a closed connection: "+str(e)
+  else:
+    sock2.close()
+
+  stopcomm(listenhandle)
@@ -0,0 +1,29 @@
+#pragma repy
+
+"""
+Description:
+  Checks the same safe and unsafe code many times (which is answered from
+  the safety check cache after the first check) and interleaves it with new
+  code (which goes to the checker process).   The results must not change.
+"""
+
+if callfunc == "initialize":
+  safe_code = "meaning_of_life = 42\n"
+  unsafe_code = "import sys\n"
+
+  for count in xrange(20):
+    context = VirtualNamespace(safe_code).evaluate({})
+    if context["meaning_of_life"] != 42:
+      print "Wrong result from a repeated namespace"
+
+    try:
+      VirtualNamespace(unsafe_code)
+      print "Error! Created unsafe virtual namespace on attempt", count
+    except ValueError, e:
+      if "import" not in str(e).lower():
+        print "Unexpected safety error:", e
+
+    # Different code each time
+    context = VirtualNamespace("value = " + str(count) + "\n").evaluate({})
+    if context["value"] != count:
+      print "Wrong result from a new namespace"
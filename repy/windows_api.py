@@ -1398,6 +1398,18 @@ def exists_listening_network_socket(ip, port, tcp):
   return (num > 0)
 
 
+def clear_socket_table_cache():
+  """
+  <Purpose>
+    Makes the next socket lookup see the sockets as they are now.   netstat
+    is run for every lookup, so nothing is cached.
+
+  <Returns>
+    None.
+  """
+  pass
+
+
 def _fetch_ipconfig_infomation():
   """
   <Purpose>
@@ -266,6 +266,10 @@ def find_handle_for_node(nodename):
 
 MAX_CONTACT_WORKER_THREAD_COUNT = 10
 
+# Nodes that are much slower to respond than the others don't hold up the
+# rest.   Up to this many threads are used while waiting for them.
+MAX_CONTACT_WORKER_THREAD_COUNT_WITH_SLOW_NODES = 20
+
 
 # This function abstracts out contacting different nodes.   It spawns off
 # multiple worker threads to handle the clients...
@@ -273,10 +277,13 @@ MAX_CONTACT_WORKER_THREAD_COUNT = 10
 # NOTE: entries in targetlist are assumed by me to be unique
 def contact_targets(targetlist, func,*args):
 
-  phandle = parallelize_initfunction(targetlist, func, MAX_CONTACT_WORKER_THREAD_COUNT, *args)
+  phandle = parallelize_startfunction(targetlist, func, 
+      MAX_CONTACT_WORKER_THREAD_COUNT, args, 
+      maxconcurrentevents=MAX_CONTACT_WORKER_THREAD_COUNT_WITH_SLOW_NODES)
 
-  while not parallelize_isfunctionfinished(phandle):
-    sleep(.1)
+  # wait for every node to be contacted
+  while parallelize_getnextresult(phandle) is not None:
+    pass
 
   # I'm going to change the format slightly...
   resultdict = parallelize_getresults(phandle)
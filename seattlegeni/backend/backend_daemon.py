@@ -54,6 +54,8 @@ from seattlegeni.common.exceptions import *
 from seattlegeni.common.util import log
 from seattlegeni.common.util import parallel
 
+from seattlegeni.common.util import rpc
+
 from seattlegeni.common.util.assertions import *
 
 from seattlegeni.common.util.decorators import log_function_call
@@ -72,6 +74,10 @@ LISTENPORT = 8020
 class ThreadedXMLRPCServer(SocketServer.ThreadingMixIn, SimpleXMLRPCServer.SimpleXMLRPCServer):
   """This is a threaded XMLRPC Server. """
   
+  # Clients keep their connections open between calls, so don't let the
+  # threads of idle connections keep the backend from exiting.
+  daemon_threads = True
+  
 
 
 
@@ -632,7 +638,10 @@ def main():
   thread.start_new_thread(sync_user_keys_of_vessels, ())
   
   # Register the XMLRPCServer. Use allow_none to allow allow the python None value.
-  server = ThreadedXMLRPCServer(("127.0.0.1", LISTENPORT), allow_none=True)
+  # The request handler keeps connections open between calls.
+  server = ThreadedXMLRPCServer(("127.0.0.1", LISTENPORT),
+                                requestHandler=rpc.KeepAliveXMLRPCRequestHandler,
+                                allow_none=True)
 
   log.info("Backend listening on port " + str(LISTENPORT) + ".")
 
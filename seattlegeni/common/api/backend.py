@@ -42,6 +42,8 @@ import xmlrpclib
 
 from seattlegeni.common.exceptions import *
 
+from seattlegeni.common.util import rpc
+
 from seattlegeni.common.util.decorators import log_function_call
 
 
@@ -60,7 +62,8 @@ backend_authcode = None
 
 
 def _get_backend_proxy():
-  return xmlrpclib.ServerProxy(BACKEND_URL)
+  # The proxies share a pool of connections to the backend that are kept open.
+  return rpc.get_proxy(BACKEND_URL)
 
 
 
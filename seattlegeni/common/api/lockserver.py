@@ -66,6 +66,8 @@ import xmlrpclib
 
 from seattlegeni.common.exceptions import *
 
+from seattlegeni.common.util import rpc
+
 from seattlegeni.common.util.decorators import log_function_call
 
 
@@ -109,7 +111,9 @@ def create_lockserver_handle(lockserver_url=LOCKSERVER_URL):
   """
   
   lockserver_handle = {}
-  lockserver_handle["proxy"] = xmlrpclib.ServerProxy(lockserver_url)
+  # The proxies share a pool of connections to the lockserver that are kept
+  # open, so a handle doesn't need a connection of its own.
+  lockserver_handle["proxy"] = rpc.get_proxy(lockserver_url)
   
   try:
     lockserver_handle["session_id"] = lockserver_handle["proxy"].StartSession()
@@ -297,6 +301,46 @@ def unlock_multiple_nodes(lockserver_handle, node_id_list):
 
   
   
+def unlock_and_lock_multiple_nodes(lockserver_handle, unlock_node_id_list, lock_node_id_list):
+  """
+  <Purpose>
+    Release node locks previously obtained with the same lockserver_handle and
+    obtain locks on other nodes, in a single request to the lockserver. This
+    is for working through many nodes a batch at a time.
+  <Arguments>
+    lockserver_handle
+      The lockserver handle whose session the locks will be released and
+      obtained under.
+    unlock_node_id_list
+      The list of node ids of the nodes to release the locks of.
+    lock_node_id_list
+      The list of node ids of the nodes to obtain locks on.
+  <Exceptions>
+    ProgrammerError
+    InternalError
+      If the lockserver can't be communicated with.
+  <Side Effects>
+    Releases the locks and then blocks until all requested locks are obtained.
+  <Returns>
+    None.
+  """
+  session_id = lockserver_handle["session_id"]
+  
+  try:
+    lockserver_handle["proxy"].ReleaseAndAcquireLocks(session_id,
+                                                      {"node": unlock_node_id_list},
+                                                      {"node": lock_node_id_list})
+  except xmlrpclib.Fault:
+    raise ProgrammerError("The lockserver rejected the request: " + traceback.format_exc())
+  except xmlrpclib.ProtocolError:
+    raise InternalError("Unable to communicate with the lockserver: " + traceback.format_exc())
+  except socket.error:
+    raise InternalError("Unable to communicate with the lockserver: " + traceback.format_exc())
+
+
+
+
+
 def _perform_lock_request(request_type, lockserver_handle, user_list=None, node_list=None):
   """
   A helper function that does the actual lock or unlock calls to the lockserver.
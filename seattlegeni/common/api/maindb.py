@@ -39,6 +39,8 @@ import django.db
 
 from django.db import transaction
 
+from django.db.models import Count
+
 import random
 
 from seattlegeni.common.exceptions import *
@@ -109,6 +111,19 @@ GET_AVAILABLE_LAN_VESSELS_MAX_SUBNETS = 10
 # The string that is the prefix to all NAT strings in node last_known_ip fields.
 NAT_STRING_PREFIX = "NAT$"
 
+# The counts of available vessels on each subnet (used for selecting lan
+# vessels) are cached for this long. The cache is cleared whenever this module
+# changes which vessels are available, but that only clears it in the process
+# that made the change (for example, vessels marked as clean by the backend
+# aren't counted by the website until the cached counts expire).
+# This must be a datetime.timedelta object.
+SUBNET_VESSEL_COUNT_CACHE_TIMEDELTA = timedelta(seconds=60)
+
+# The cached counts of available vessels on each subnet, keyed by port. Each
+# value is a tuple of (the time the counts were cached, a dictionary of subnet
+# to number of vessels). See _get_available_vessel_counts_by_subnet().
+subnet_vessel_count_cache = {}
+
 
 
 
@@ -618,6 +633,7 @@ def set_vessel_ports(vessel, port_list):
   
   else:
     transaction.commit()
+    _clear_subnet_vessel_count_cache()
 
 
 
@@ -1101,6 +1117,8 @@ def record_node_communication_failure(node):
   
   node.is_active = False
   node.save()
+  
+  _clear_subnet_vessel_count_cache()
 
 
 
@@ -1137,6 +1155,10 @@ def record_node_communication_success(node, version, ip, port):
   assert_str(ip)
   assert_positive_int(port)
   
+  # The node may have moved to another subnet or become active again.
+  if node.last_known_ip != ip or not node.is_active:
+    _clear_subnet_vessel_count_cache()
+  
   node.last_known_version = version
   node.last_known_ip = ip
   node.last_known_port = port
@@ -1201,6 +1223,8 @@ def mark_node_as_active(node):
   
   node.is_active = True
   node.save()
+  
+  _clear_subnet_vessel_count_cache()
 
 
 
@@ -1230,6 +1254,8 @@ def mark_node_as_inactive(node):
   
   node.is_active = False
   node.save()
+  
+  _clear_subnet_vessel_count_cache()
 
 
 
@@ -1259,6 +1285,8 @@ def mark_node_as_broken(node):
   
   node.is_broken = True
   node.save()
+  
+  _clear_subnet_vessel_count_cache()
 
 
 
@@ -1393,6 +1421,51 @@ def _get_queryset_of_all_available_vessels_for_a_port_only_nat_nodes(port):
 
 
 
+def _clear_subnet_vessel_count_cache():
+  """
+  Clears the cached counts of available vessels on each subnet. This is called
+  whenever a function in this module changes which vessels are available.
+  """
+  subnet_vessel_count_cache.clear()
+
+
+
+
+
+def _get_available_vessel_counts_by_subnet(port, use_cache=True):
+  """
+  Returns a dictionary where each key is a subnet that has available vessels
+  with a certain port on non-nat nodes and each value is the number of those
+  vessels on the subnet. The counts are made with a single query and are
+  cached (see SUBNET_VESSEL_COUNT_CACHE_TIMEDELTA), so unless use_cache is
+  False they may be out of date. The returned dictionary must not be modified.
+  """
+  now = datetime.now()
+  
+  if use_cache and port in subnet_vessel_count_cache:
+    (cachetime, countdict) = subnet_vessel_count_cache[port]
+    if cachetime <= now < cachetime + SUBNET_VESSEL_COUNT_CACHE_TIMEDELTA:
+      return countdict
+  
+  queryset = _get_queryset_of_all_available_vessels_for_a_port_exclude_nat_nodes(port)
+  queryset = queryset.exclude(node__subnet='')
+  
+  # Group the vessels by the subnet of their node. The random ordering has to
+  # be cleared or the database would group by it, too.
+  queryset = queryset.order_by().values('node__subnet').annotate(vesselcount=Count('id'))
+  
+  countdict = {}
+  for row in queryset:
+    countdict[row['node__subnet']] = row['vesselcount']
+  
+  subnet_vessel_count_cache[port] = (now, countdict)
+  
+  return countdict
+
+
+
+
+
 @log_function_call
 def get_available_rand_vessels(geniuser, vesselcount):
   """
@@ -1507,10 +1580,13 @@ def get_available_wan_vessels(geniuser, vesselcount):
   # attempted to be acquired by the client code.
   returnvesselcount = GET_AVAILABLE_VESSELS_MULTIPLIER * vesselcount + GET_AVAILABLE_VESSELS_ADDER
   
-  vessellist = []
-  includedsubnets = []
+  vesselidlist = []
+  includedsubnets = set()
   
   nonnatvesselsqueryset = _get_queryset_of_all_available_vessels_for_a_port_exclude_nat_nodes(geniuser.usable_vessel_port)
+  
+  # Nodes whose last_known_ip isn't an ip address have an empty subnet.
+  nonnatvesselsqueryset = nonnatvesselsqueryset.exclude(node__subnet='')
    
   # Note: it would be more efficient to have the sql query return vessels
   # in unique subnets, but we would have to be very careful that the UNIQUE
@@ -1518,30 +1594,30 @@ def get_available_wan_vessels(geniuser, vesselcount):
   # have to be careful that we weren't always getting the same node for a given
   # subnet. So, instead of worrying about the sql for that which wouldn't
   # be intuitive to do with the django ORM, let's just do that part manually.
+  # We only read the id and the subnet of each vessel here rather than
+  # loading every vessel and its node.
   
-  for possiblevessel in nonnatvesselsqueryset:
+  for (vesselid, subnet) in nonnatvesselsqueryset.values_list('id', 'node__subnet'):
     
-    subnet = possiblevessel.node.last_known_ip.rpartition('.')[0]
-    if not subnet:
-      log.error("The vessel " + str(possiblevessel) + " has an invalid last_known_ip")
-      continue
-    
-    # For efficiency, includedsubnets should be a constant time lookup type.
     if subnet in includedsubnets:
       continue
     
-    includedsubnets.append(subnet)
-    vessellist.append(possiblevessel)
+    includedsubnets.add(subnet)
+    vesselidlist.append(vesselid)
     
-    if len(vessellist) == returnvesselcount:
+    if len(vesselidlist) == returnvesselcount:
       break 
 
-  if len(vessellist) < vesselcount:
+  if len(vesselidlist) < vesselcount:
     message = "Requested " + str(vesselcount) + " wan vessels, but we only have vessels with port "
     message += str(geniuser.usable_vessel_port) + " available on " + str(len(includedsubnets)) + " subnets." 
     raise UnableToAcquireResourcesError(message)
   
-  return vessellist
+  # Load the chosen vessels (and their nodes) with one query, keeping the
+  # random order.
+  vesseldict = Vessel.objects.select_related('node').in_bulk(vesselidlist)
+  
+  return [vesseldict[vesselid] for vesselid in vesselidlist]
 
 
 
@@ -1552,49 +1628,16 @@ def _get_subnet_list():
   Returns a randomly-ordered list of subnets that have at least one active
   non-nat node on the subnet.
   """
-  
-  # The commented out code only works on mysql but is more efficient. Leaving
-  # it out for now as it's harder to test, as our tests run on sqlite.
-  
-  # Get a list of subnets that have at least vesselcount active nodes in the subnet.
-  # This doesn't guarantee that there are available vessels for this user on
-  # those nodes, but it's a start. We'll narrow it down further after we get
-  # the list of possible subnets.
-  #
-  #  subnetsql = """SELECT COUNT(*) AS lansize,
-  #                        SUBSTRING_INDEX(last_known_ip, '.', 3) AS subnet
-  #                 FROM control_node
-  #                 WHERE is_active = TRUE AND
-  #                       is_broken = FALSE
-  #                 GROUP BY subnet
-  #                 HAVING lansize >= %s
-  #                 ORDER BY RAND()""" % (vesselcount)
-  #                 
-  #  cursor = django.db.connection.cursor()
-  #  cursor.execute(subnetsql)
-  #  return cursor.fetchall()
-  
-  # Get a queryset of all active nodes.
+  # Get the distinct subnets of all active nodes. The subnet of each node is
+  # stored in the database when the node is saved, so this is a single query
+  # on an indexed column.
   queryset = Node.objects.filter(is_active=True)
   queryset = queryset.filter(is_broken=False)
   queryset = queryset.exclude(last_known_ip__startswith=NAT_STRING_PREFIX)
-  queryset = queryset.order_by('last_known_ip')
-
-  previous_subnet = None
-  subnetlist = []
+  # Nodes whose last_known_ip isn't an ip address have an empty subnet.
+  queryset = queryset.exclude(subnet='')
   
-  # Look through the queryset and build a list of unique subnets.
-  for node in queryset:
-    
-    subnet = node.last_known_ip.rpartition('.')[0]
-    
-    if not subnet:
-      log.error("The node " + str(node) + " has an invalid last_known_ip")
-      continue
-    
-    if subnet != previous_subnet:
-      subnetlist.append(subnet)
-      previous_subnet = subnet
+  subnetlist = list(queryset.values_list('subnet', flat=True).distinct())
            
   # Randomize the order of the subnets.
   random.shuffle(subnetlist)
@@ -1605,6 +1648,52 @@ def _get_subnet_list():
 
 
 
+def _get_lan_vessel_lists(port, vesselcount, subnetcountdict):
+  """
+  Returns a list of up to GET_AVAILABLE_LAN_VESSELS_MAX_SUBNETS lists of
+  available vessels with a certain port, where each list has at least
+  vesselcount vessels that are all on the same subnet. Only the subnets that
+  subnetcountdict (see _get_available_vessel_counts_by_subnet()) has at least
+  vesselcount vessels for are looked at.
+  """
+  candidatesubnets = []
+  for subnet in subnetcountdict:
+    if subnetcountdict[subnet] >= vesselcount:
+      candidatesubnets.append(subnet)
+  
+  # Randomize the order of the subnets.
+  random.shuffle(candidatesubnets)
+  
+  subnets_vessels_list = []
+  
+  nonnatvesselsqueryset = _get_queryset_of_all_available_vessels_for_a_port_exclude_nat_nodes(port)
+  
+  while len(candidatesubnets) > 0 and len(subnets_vessels_list) < GET_AVAILABLE_LAN_VESSELS_MAX_SUBNETS:
+    # Get the vessels of as many subnets as are still needed in one query. 
+    subnetsneeded = GET_AVAILABLE_LAN_VESSELS_MAX_SUBNETS - len(subnets_vessels_list)
+    subnetbatch = candidatesubnets[:subnetsneeded]
+    del candidatesubnets[:subnetsneeded]
+    
+    lanvesselsqueryset = nonnatvesselsqueryset.filter(node__subnet__in=subnetbatch)
+    lanvesselsqueryset = lanvesselsqueryset.select_related('node')
+    
+    # We don't worry about too many vessels being in these lists, as there
+    # will be 255 at most in each.
+    vessels_by_subnet = {}
+    for vessel in lanvesselsqueryset:
+      vessels_by_subnet.setdefault(vessel.node.subnet, []).append(vessel)
+    
+    for subnet in subnetbatch:
+      # The counts may have been cached, so make sure there are still enough.
+      if len(vessels_by_subnet.get(subnet, [])) >= vesselcount:
+        subnets_vessels_list.append(vessels_by_subnet[subnet])
+  
+  return subnets_vessels_list
+
+
+
+
+
 @log_function_call
 def get_available_lan_vessels_by_subnet(geniuser, vesselcount):
   """
@@ -1635,24 +1724,16 @@ def get_available_lan_vessels_by_subnet(geniuser, vesselcount):
   assert_geniuser(geniuser)
   assert_positive_int(vesselcount)
   
-  subnetlist = _get_subnet_list()
-
-  if len(subnetlist) == 0:
-    raise UnableToAcquireResourcesError("No subnets exist with at least " + str(vesselcount) + " active nodes")
+  port = geniuser.usable_vessel_port
   
-  subnets_vessels_list = []
+  subnetcountdict = _get_available_vessel_counts_by_subnet(port)
+  subnets_vessels_list = _get_lan_vessel_lists(port, vesselcount, subnetcountdict)
   
-  nonnatvesselsqueryset = _get_queryset_of_all_available_vessels_for_a_port_exclude_nat_nodes(geniuser.usable_vessel_port)
-  
-  for subnet in subnetlist:
-    lanvesselsqueryset = nonnatvesselsqueryset.filter(node__last_known_ip__startswith=subnet + '.')
-    
-    if lanvesselsqueryset.count() >= vesselcount:
-      # We don't worry about too many vessels being in this list, as it will be 255 at most.
-      subnets_vessels_list.append(list(lanvesselsqueryset))
-
-    if len(subnets_vessels_list) >= GET_AVAILABLE_LAN_VESSELS_MAX_SUBNETS:
-      break
+  if len(subnets_vessels_list) == 0:
+    # The cached counts may be out of date, so check again with current ones
+    # before giving up.
+    subnetcountdict = _get_available_vessel_counts_by_subnet(port, use_cache=False)
+    subnets_vessels_list = _get_lan_vessel_lists(port, vesselcount, subnetcountdict)
 
   if len(subnets_vessels_list) == 0:
     message = "No subnets exist with at least " + str(vesselcount)
@@ -1812,6 +1893,8 @@ def record_acquired_vessel(geniuser, vessel):
   vessel.date_expires = vessel.date_acquired + DEFAULT_VESSEL_EXPIRATION_TIMEDELTA
   vessel.save()
   
+  _clear_subnet_vessel_count_cache()
+  
   # Update the database to reflect that this user has access to this vessel.
   add_vessel_access_user(vessel, geniuser)
 
@@ -1856,6 +1939,8 @@ def record_released_vessel(vessel):
   vessel.date_acquired = None
   vessel.date_expires = None
   vessel.save()
+  
+  _clear_subnet_vessel_count_cache()
 
 
 
@@ -1944,6 +2029,8 @@ def mark_vessel_as_clean(vessel):
   vessel.is_dirty = False
   vessel.user_keys_in_sync = True
   vessel.save()
+  
+  _clear_subnet_vessel_count_cache()
 
 
 
@@ -2156,6 +2243,8 @@ def delete_all_vessels_of_node(node):
   assert_node(node)
   
   Vessel.objects.filter(node=node).delete()
+  
+  _clear_subnet_vessel_count_cache()
 
 
 
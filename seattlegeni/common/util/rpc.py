@@ -0,0 +1,375 @@
+"""
+<Program>
+  rpc.py
+
+<Started>
+  18 October 2026
+
+<Purpose>
+  This module provides the transport used for the XML-RPC calls between
+  seattlegeni components (the website and the polling daemons calling the
+  lockserver and the backend).
+
+  On the server side, KeepAliveXMLRPCRequestHandler is the request handler
+  for the lockserver's and the backend's XML-RPC servers. It speaks HTTP/1.1,
+  so a client can make any number of calls over one connection (and the
+  threaded servers use one thread per connection rather than one per call).
+
+  On the client side, get_proxy() returns a proxy that is used like an
+  xmlrpclib.ServerProxy. The proxies for a server share a pool of open
+  connections to it, so that a call only opens a new connection if all of
+  the pooled ones are in use by other threads.
+
+  The calls can optionally be marshalled with python's marshal module rather
+  than as XML (see set_binary_marshalling()). This is only meant for the
+  internal servers, which only listen on the loopback interface. Values that
+  marshal can't handle (such as datetime objects) can't be sent this way.
+  Faults are raised as xmlrpclib.Fault either way and the values received
+  are the same as with XML, so code using the proxies doesn't need to know
+  which is used.
+"""
+
+import errno
+import httplib
+import inspect
+import marshal
+import socket
+import sys
+import threading
+import urllib
+import xmlrpclib
+
+import SimpleXMLRPCServer
+
+
+
+
+# The content type of calls and responses that are marshalled with marshal.
+BINARY_CONTENT_TYPE = "application/x-seattlegeni-marshal"
+
+# The number of seconds a server keeps an idle connection open.
+KEEPALIVE_TIMEOUT_SECONDS = 60
+
+# The most idle connections kept open to each server.
+MAX_IDLE_CONNECTIONS_PER_HOST = 16
+
+# Whether proxies returned by get_proxy() marshal calls with marshal rather
+# than as XML. See set_binary_marshalling().
+use_binary_marshalling = False
+
+# Whether HTTPConnection.getresponse() can buffer the response (as of python
+# 2.7). Otherwise the response is read from an unbuffered file.
+_getresponse_can_buffer = "buffering" in inspect.getargspec(httplib.HTTPConnection.getresponse)[0]
+
+# The connection pools, keyed by "host:port".
+connection_pool_dict = {}
+connection_pool_dict_lock = threading.Lock()
+
+
+
+
+
+def _as_xmlrpc_value(value):
+  """
+  Returns the value as xmlrpclib would have unmarshalled it: tuples become
+  lists and unicode strings that are ASCII become str's.
+  """
+  if isinstance(value, unicode):
+    try:
+      return value.encode("ascii")
+    except UnicodeError:
+      return value
+  elif isinstance(value, (list, tuple)):
+    return [_as_xmlrpc_value(item) for item in value]
+  elif isinstance(value, dict):
+    xmlrpcdict = {}
+    for key in value:
+      xmlrpcdict[_as_xmlrpc_value(key)] = _as_xmlrpc_value(value[key])
+    return xmlrpcdict
+  else:
+    return value
+
+
+
+
+
+class KeepAliveXMLRPCRequestHandler(SimpleXMLRPCServer.SimpleXMLRPCRequestHandler):
+  """
+  An XML-RPC request handler that keeps connections open between calls and
+  also accepts calls marshalled with marshal.
+  """
+
+  protocol_version = "HTTP/1.1"
+
+
+  def setup(self):
+    SimpleXMLRPCServer.SimpleXMLRPCRequestHandler.setup(self)
+    # Close connections that have been idle for too long. (This and the
+    # option below are set here rather than with the request handler's
+    # timeout and disable_nagle_algorithm, which python 2.5 doesn't have.)
+    self.connection.settimeout(KEEPALIVE_TIMEOUT_SECONDS)
+    # The headers and the body of a response are written separately, so don't
+    # let the body wait for the acknowledgement of the headers.
+    self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+  def handle(self):
+    try:
+      SimpleXMLRPCServer.SimpleXMLRPCRequestHandler.handle(self)
+    except socket.timeout:
+      # The connection was idle for too long.
+      self.close_connection = 1
+
+
+  def do_POST(self):
+    # This handles XML calls as well, since SimpleXMLRPCRequestHandler.do_POST
+    # shuts down the connection after each call in python 2.5.
+    if not self.is_rpc_path_valid():
+      self.report_404()
+      return
+
+    data = self.rfile.read(int(self.headers["content-length"]))
+
+    if self.headers.get("content-type") == BINARY_CONTENT_TYPE:
+      contenttype = BINARY_CONTENT_TYPE
+      try:
+        (method, params) = marshal.loads(data)
+        result = self.server._dispatch(method, _as_xmlrpc_value(params))
+        response = marshal.dumps(("result", result))
+      except xmlrpclib.Fault, fault:
+        response = marshal.dumps(("fault", fault.faultCode, fault.faultString))
+      except:
+        # Report other exceptions the same way SimpleXMLRPCServer does.
+        (exc_type, exc_value) = sys.exc_info()[:2]
+        response = marshal.dumps(("fault", 1, "%s:%s" % (exc_type, exc_value)))
+
+    else:
+      contenttype = "text/xml"
+      try:
+        # This returns a fault response for exceptions raised by the function.
+        response = self.server._marshaled_dispatch(data, getattr(self, "_dispatch", None))
+      except:
+        # The call couldn't be unmarshalled or the response marshalled.
+        self.send_response(500)
+        self.send_header("Content-length", "0")
+        self.end_headers()
+        return
+
+    self.send_response(200)
+    self.send_header("Content-type", contenttype)
+    self.send_header("Content-length", str(len(response)))
+    self.end_headers()
+    self.wfile.write(response)
+
+
+
+
+
+class ConnectionPool(object):
+  """
+  The idle HTTP connections to a server. A connection is taken out of the
+  pool for a call and put back afterwards, so each connection is only used
+  by one thread at a time.
+  """
+
+  def __init__(self, host):
+    self.host = host
+    self.idle_connections = []
+    self.lock = threading.Lock()
+
+
+  def _get_connection(self):
+    """
+    Returns (connection, whether it was used before).
+    """
+    self.lock.acquire()
+    try:
+      if self.idle_connections:
+        return (self.idle_connections.pop(), True)
+    finally:
+      self.lock.release()
+    return (httplib.HTTPConnection(self.host), False)
+
+
+  def _put_connection(self, connection):
+    self.lock.acquire()
+    try:
+      if len(self.idle_connections) < MAX_IDLE_CONNECTIONS_PER_HOST:
+        self.idle_connections.append(connection)
+        return
+    finally:
+      self.lock.release()
+    connection.close()
+
+
+  def _send(self, connection, handler, body, contenttype):
+    connection.putrequest("POST", handler, skip_accept_encoding=True)
+    connection.putheader("Content-Type", contenttype)
+    connection.putheader("Content-Length", str(len(body)))
+    connection.endheaders()
+    connection.send(body)
+    # Without buffering, the headers of the response are read a byte at a
+    # time.
+    if _getresponse_can_buffer:
+      return connection.getresponse(buffering=True)
+    return connection.getresponse()
+
+
+  def request(self, handler, body, contenttype):
+    """
+    <Purpose>
+      POSTs a call to the server and returns the body of the response.
+    <Arguments>
+      handler
+        The path to POST to.
+      body
+        The marshalled call.
+      contenttype
+        The content type of the marshalled call.
+    <Exceptions>
+      xmlrpclib.ProtocolError
+        If the server doesn't respond with 200 OK.
+      socket.error, httplib.HTTPException
+        If the server can't be communicated with.
+    <Side Effects>
+      May open a connection to the server, which is kept in the pool.
+    <Returns>
+      The body of the response.
+    """
+    (connection, reused) = self._get_connection()
+    try:
+      try:
+        response = self._send(connection, handler, body, contenttype)
+      except (socket.error, httplib.BadStatusLine), e:
+        # The server may have closed a connection that had been idle. The call
+        # hasn't been made in that case, so it is retried on a new connection
+        # (this is the same as what xmlrpclib does).
+        if not reused:
+          raise
+        if isinstance(e, socket.error) and e.args[0] not in (errno.ECONNRESET, errno.ECONNABORTED, errno.EPIPE):
+          raise
+        connection.close()
+        connection = httplib.HTTPConnection(self.host)
+        response = self._send(connection, handler, body, contenttype)
+
+      if response.status != 200:
+        raise xmlrpclib.ProtocolError(self.host + handler, response.status,
+                                      response.reason, response.msg)
+
+      data = response.read()
+
+    except:
+      connection.close()
+      raise
+
+    if response.will_close:
+      connection.close()
+    else:
+      self._put_connection(connection)
+
+    return data
+
+
+
+
+
+class PooledServerProxy(object):
+  """
+  A proxy for calling the functions of an XML-RPC server, used like an
+  xmlrpclib.ServerProxy. Use get_proxy() rather than creating these directly.
+  """
+
+  def __init__(self, handler, connection_pool, binary):
+    self.handler = handler
+    self.connection_pool = connection_pool
+    self.binary = binary
+
+
+  def call(self, methodname, params):
+    """
+    Calls the function methodname of the server with the params tuple and
+    returns what it returned. Raises xmlrpclib.Fault if the server returned a
+    fault.
+    """
+    if self.binary:
+      body = marshal.dumps((methodname, params))
+      data = self.connection_pool.request(self.handler, body, BINARY_CONTENT_TYPE)
+      response = marshal.loads(data)
+      if response[0] == "fault":
+        raise xmlrpclib.Fault(response[1], response[2])
+      return _as_xmlrpc_value(response[1])
+
+    else:
+      body = xmlrpclib.dumps(params, methodname, allow_none=True)
+      data = self.connection_pool.request(self.handler, body, "text/xml")
+      # This raises xmlrpclib.Fault if the response is a fault.
+      (result, method) = xmlrpclib.loads(data)
+      return result[0]
+
+
+  def __getattr__(self, methodname):
+    # Don't treat special attributes (e.g. ones copy or pickle look for) as
+    # server functions.
+    if methodname.startswith("_"):
+      raise AttributeError(methodname)
+    return lambda *params: self.call(methodname, params)
+
+
+
+
+
+def set_binary_marshalling(enabled):
+  """
+  <Purpose>
+    Sets whether the proxies returned by get_proxy() from now on marshal calls
+    with python's marshal module rather than as XML. The servers accept
+    either. This is an option for the internal servers (the lockserver and
+    the backend) only.
+  <Arguments>
+    enabled
+      True to use marshal, False to use XML.
+  <Exceptions>
+    None
+  <Side Effects>
+    The value of the global variable use_binary_marshalling has been changed.
+  <Returns>
+    None
+  """
+  global use_binary_marshalling
+  use_binary_marshalling = enabled
+
+
+
+
+
+def get_proxy(url):
+  """
+  <Purpose>
+    Returns a proxy for calling the functions of an XML-RPC server, which
+    is used like an xmlrpclib.ServerProxy. The calls are made over pooled
+    connections that are kept open.
+  <Arguments>
+    url
+      The url of the server, e.g. "http://127.0.0.1:8010".
+  <Exceptions>
+    IOError
+      If the url isn't an http url.
+  <Side Effects>
+    Creates the connection pool for the server if there isn't one yet.
+  <Returns>
+    A PooledServerProxy.
+  """
+  (scheme, rest) = urllib.splittype(url)
+  if scheme != "http":
+    raise IOError("Unsupported XML-RPC protocol: " + str(scheme))
+  (host, handler) = urllib.splithost(rest)
+
+  connection_pool_dict_lock.acquire()
+  try:
+    if host not in connection_pool_dict:
+      connection_pool_dict[host] = ConnectionPool(host)
+    connection_pool = connection_pool_dict[host]
+  finally:
+    connection_pool_dict_lock.release()
+
+  return PooledServerProxy(handler or "/RPC2", connection_pool, use_binary_marshalling)
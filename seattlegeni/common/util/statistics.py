@@ -104,11 +104,10 @@ def get_available_lan_vessel_counts():
 
   for port in maindb.ALLOWED_USER_PORTS:
     subnet_vessel_list_sizes = []
-    nonnatvesselsqueryset = maindb._get_queryset_of_all_available_vessels_for_a_port_exclude_nat_nodes(port)
+    subnetcountdict = maindb._get_available_vessel_counts_by_subnet(port)
   
     for subnet in subnetlist:
-      lanvesselsqueryset = nonnatvesselsqueryset.filter(node__last_known_ip__startswith=subnet + '.')
-      subnet_vessel_list_sizes.append(lanvesselsqueryset.count())
+      subnet_vessel_list_sizes.append(subnetcountdict.get(subnet, 0))
   
     subnet_vessel_list_sizes.sort(reverse=True)
     lan_sizes_by_port[port] = subnet_vessel_list_sizes
@@ -0,0 +1,196 @@
+"""
+Tests of the XML-RPC transport in seattlegeni.common.util.rpc: a server that
+uses the KeepAliveXMLRPCRequestHandler is run in this process and called
+through proxies from rpc.get_proxy().
+"""
+# unittest reports the results on stderr.
+#pragma error OK
+
+from seattlegeni.common.util import rpc
+
+import SimpleXMLRPCServer
+import SocketServer
+import socket
+import threading
+import time
+import unittest
+import xmlrpclib
+
+
+
+
+
+class ThreadedXMLRPCServer(SocketServer.ThreadingMixIn, SimpleXMLRPCServer.SimpleXMLRPCServer):
+  daemon_threads = True
+
+
+
+class TestServerError(Exception):
+  pass
+
+
+
+
+
+# The request handlers of the connections the server accepted.
+accepted_connections = []
+
+class CountingRequestHandler(rpc.KeepAliveXMLRPCRequestHandler):
+
+  def handle(self):
+    accepted_connections.append(self)
+    rpc.KeepAliveXMLRPCRequestHandler.handle(self)
+
+
+
+
+
+def echo(*args):
+  return list(args)
+
+
+def raise_fault():
+  raise xmlrpclib.Fault(100, "The fault string.")
+
+
+def raise_error():
+  raise TestServerError("The error message.")
+
+
+
+
+
+server = ThreadedXMLRPCServer(("127.0.0.1", 0), requestHandler=CountingRequestHandler,
+                              logRequests=False, allow_none=True)
+server.register_function(echo, "Echo")
+server.register_function(raise_fault, "RaiseFault")
+server.register_function(raise_error, "RaiseError")
+
+serverthread = threading.Thread(target=server.serve_forever)
+serverthread.setDaemon(True)
+serverthread.start()
+
+server_url = "http://127.0.0.1:" + str(server.server_address[1])
+
+
+
+
+
+def close_pooled_connections():
+  for pool in rpc.connection_pool_dict.values():
+    for connection in pool.idle_connections:
+      connection.close()
+    del pool.idle_connections[:]
+
+  # Let the server's threads for the connections finish.
+  for handler in accepted_connections:
+    while not handler.rfile.closed:
+      time.sleep(0.01)
+  del accepted_connections[:]
+
+
+
+
+
+class TheTestCase(unittest.TestCase):
+
+  def setUp(self):
+    rpc.set_binary_marshalling(False)
+    # Each test starts without any open connections.
+    close_pooled_connections()
+
+
+  def tearDown(self):
+    rpc.set_binary_marshalling(False)
+    close_pooled_connections()
+
+
+  def testCallsReuseTheConnection(self):
+    proxy = rpc.get_proxy(server_url)
+    for count in range(5):
+      self.assertEqual([count, "abc"], proxy.Echo(count, "abc"))
+
+    # A second proxy for the server uses the same pool.
+    self.assertEqual([], rpc.get_proxy(server_url).Echo())
+    self.assertEqual(1, len(accepted_connections))
+
+
+  def testReconnectAfterServerClosesIdleConnection(self):
+    proxy = rpc.get_proxy(server_url)
+    self.assertEqual([1], proxy.Echo(1))
+
+    # The server closes the connection, as it does when a connection has been
+    # idle for too long.
+    accepted_connections[0].connection.shutdown(socket.SHUT_RDWR)
+    time.sleep(0.1)
+
+    # Reconnecting closes the stale connection...
+    self.assertEqual([2], proxy.Echo(2))
+    self.assertEqual(2, len(accepted_connections))
+
+    # ... and the call is made once.
+    self.assertEqual([3], proxy.Echo(3))
+    self.assertEqual(2, len(accepted_connections))
+
+
+  def testFaultsArePropagated(self):
+    for binary in [False, True]:
+      rpc.set_binary_marshalling(binary)
+      proxy = rpc.get_proxy(server_url)
+
+      try:
+        proxy.RaiseFault()
+      except xmlrpclib.Fault, fault:
+        self.assertEqual(100, fault.faultCode)
+        self.assertEqual("The fault string.", fault.faultString)
+      else:
+        self.fail("No fault was raised.")
+
+      # Other exceptions are reported as faults with code 1.
+      try:
+        proxy.RaiseError()
+      except xmlrpclib.Fault, fault:
+        self.assertEqual(1, fault.faultCode)
+        self.assertTrue("TestServerError" in fault.faultString)
+        self.assertTrue("The error message." in fault.faultString)
+      else:
+        self.fail("No fault was raised.")
+
+      # The connection can still be used after a fault.
+      self.assertEqual([1], proxy.Echo(1))
+
+    self.assertEqual(1, len(accepted_connections))
+
+
+  def testBinaryMarshalling(self):
+    args = (1, "abc", u"def", [1, (2, 3)], {"key": [None, 1.5]}, True)
+
+    rpc.set_binary_marshalling(False)
+    xmlproxy = rpc.get_proxy(server_url)
+    rpc.set_binary_marshalling(True)
+    binaryproxy = rpc.get_proxy(server_url)
+
+    self.assertFalse(xmlproxy.binary)
+    self.assertTrue(binaryproxy.binary)
+
+    # The values received are the same either way.
+    xmlresult = xmlproxy.Echo(*args)
+    binaryresult = binaryproxy.Echo(*args)
+    self.assertEqual([1, "abc", "def", [1, [2, 3]], {"key": [None, 1.5]}, True], xmlresult)
+    self.assertEqual(xmlresult, binaryresult)
+    self.assertEqual(type(xmlresult[2]), type(binaryresult[2]))
+
+    # Both are made over the same connection.
+    self.assertEqual(1, len(accepted_connections))
+
+
+
+
+
+def run_test():
+  unittest.main()
+
+
+
+if __name__ == "__main__":
+  run_test()
@@ -106,6 +106,29 @@ ReleaseLocks(session_id_str, lockdict)
     lock.
   <Returns>
     None.
+
+ReleaseAndAcquireLocks(session_id_str, release_lockdict, acquire_lockdict)
+  <Purpose>
+    Release one or more locks and then obtain one or more locks of a given
+    type, in a single request. This lets a client that works through many
+    node locks in batches give up one batch and wait for the next in one
+    round trip. This is a blocking request.
+  <Arguments>
+    session_id_str: the session id
+    release_lockdict: a "lockdict" of the locks to release (see notes below)
+    acquire_lockdict: a "lockdict" of the locks to obtain (see notes below)
+  <Exceptions>
+    This will evoke an xmlrpclib.Fault exception on the client side if the
+    session does not hold one or more of the locks in release_lockdict or if
+    the locks in acquire_lockdict are locks the client shouldn't be requesting
+    once the released locks are no longer held. In either case, nothing is
+    released or acquired.
+  <Side Effects>
+    Releases the locks in release_lockdict (as ReleaseLocks does) and then
+    blocks until all of the locks in acquire_lockdict are obtained for the
+    specified session (as AcquireLocks does).
+  <Returns>
+    None.
  
 GetStatus()
   <Purpose>
@@ -119,11 +142,15 @@ GetStatus()
   <Side Effects>
     None.
   <Returns>
-    A dictionary with the keys, "heldlockdict",  "sessiondict", and
-    "locktimelist" is returned. The values of these keys are most of the
-    contents of the global variables by the same names used within the
-    lockserver itself. It excludes the Event objects from the sessiondict
-    data that is returned.
+    A dictionary with the keys, "heldlockdict",  "sessiondict",
+    "locktimelist", "waittimehistogram" and "holdtimehistogram" is returned.
+    The values of the first two keys are most of the contents of the global
+    variables by the same names used within the lockserver itself. It excludes
+    the Event objects from the sessiondict data that is returned. The
+    "locktimelist" is a list of ({locktype: lockname}, locktime) tuples for
+    every held lock, the longest-held lock first. The histograms count how
+    long locks were waited for before they were obtained and how long they
+    were held before they were released (see do_get_status() for the format).
 
  
 Details of the "lockdict" format:
@@ -200,11 +227,16 @@ Details of the "lockdict" format:
   TODO: Test that a blocked lock request will not disconnect if it
         is blocked for a very long time.
   TODO: Write more integration tests (at least to test invalid requests).
-  TODO: Write a simple benchmark script.
 """
 
 import datetime
 
+# The queues of sessions waiting for a lock are deques and the locks a session
+# holds or needs (and the acquisition times of held locks) are kept in
+# InsertionOrderedDicts, so that any lock can be found and removed in constant
+# time while the order they were added in is kept.
+import collections
+
 import time
 import sys
 
@@ -215,6 +247,8 @@ from seattlegeni.common.exceptions import *
 
 from seattlegeni.common.util import log
 
+from seattlegeni.common.util import rpc
+
 from seattlegeni.website import settings
 
 # Use threading.Lock directly instead of repy's getlock() to ease testing
@@ -251,6 +285,11 @@ MAX_EXPECTED_LOCK_HOLDING_TIMEDELTA = datetime.timedelta(minutes=5)
 # long.
 SECONDS_BETWEEN_LOCK_HOLDING_TIME_CHECKS = 30
 
+# The upper bounds (in seconds) of the buckets of the histograms of how long
+# locks were waited for and held. The last bucket of a histogram counts
+# everything longer than the last bound.
+LOCK_TIME_HISTOGRAM_BOUNDS = [0.001, 0.01, 0.1, 1.0, 10.0, 60.0, 300.0]
+
 
 
 
@@ -267,7 +306,7 @@ datalock = threading.Lock()
 #heldlockdict = {
 #                "user"
 #                  "bob" : {
-#                    "queue" : [list_of_session_ids],
+#                    "queue" : deque_of_session_ids,
 #                    "locked_by_session" : None
 #                  },
 #                  ... 
@@ -277,6 +316,8 @@ datalock = threading.Lock()
 #                   value is a dict containing keys "queue" and "locked_by_session"]
 #                },     
 #}
+# A lock only has an entry while it is held by a session. The entry is removed
+# when the lock is released and nobody is queued for it.
 # Note: This value is initialized by the call to init_globals()
 heldlockdict = None
 
@@ -287,10 +328,13 @@ heldlockdict = None
 #sessiondict = {
 #                "abc123" : {
 #                  "heldlocks" : {
-#                    "user" : [list_of_user_name_strings],
-#                    "node" : [list_of_node_name_strings]
+#                    "user" : InsertionOrderedDict_of_user_name_strings_to_None,
+#                    "node" : InsertionOrderedDict_of_node_name_strings_to_None
+#                  },
+#                  "neededlocks" : {
+#                    "user" : InsertionOrderedDict_of_user_name_strings_to_request_time,
+#                    "node" : InsertionOrderedDict_of_node_name_strings_to_request_time
 #                  },
-#                  "neededlocks" : lockdict only containing unfulfilled items,
 #                  "acquirelocksproceedevent" : Event object used to block an AcquireLocks request until it is fulfilled,
 #                  "acquirelocksinprogress" : boolean value to indicate whether an AcquireLocks request is in progress
 #                }
@@ -298,11 +342,11 @@ heldlockdict = None
 # Note: This value is initialized by the call to init_globals()
 sessiondict = None
 
-# This is a list of tuples of the format ({locktype: lockname}, locktime) 
-# containing an entry for every acquired lock. The locktime is a datetime
-# object representing the time when the lock was acquired. The list is in
-# order where the first item in the list is the longest-held lock and the
-# last item is the shortest-held lock. The reason this information is not
+# This is an InsertionOrderedDict that maps (locktype, lockname) to locktime and
+# contains an entry for every acquired lock. The locktime is a datetime
+# object representing the time when the lock was acquired. The entries are in
+# order where the first one is the longest-held lock and the last one is the
+# shortest-held lock. The reason this information is not
 # just kept in the heldlockdict is largely because we don't want to return
 # the time in with the GetStatus call because the tests would have to be
 # changed to expect a value there that is different with every run of the
@@ -310,8 +354,18 @@ sessiondict = None
 # of the point here is to be able to detect when any lock has been held
 # past a threshold that we consider reasonable. So, for that, we might
 # as well keep track of the order explicitly as we know that information
-# here in the lockserver daemon.
-locktimelist = []
+# here in the lockserver daemon. GetStatus returns it as the "locktimelist",
+# a list of tuples of the format ({locktype: lockname}, locktime).
+# Note: This value is initialized by the call to init_globals()
+locktimedict = None
+
+# Histograms of how long locks were waited for before they were acquired and
+# how long they were held before they were released. Each is a list with a
+# count for each of the buckets given by LOCK_TIME_HISTOGRAM_BOUNDS, plus one
+# for the times longer than the last bound.
+# Note: These values are initialized by the call to init_globals()
+waittimehistogram = None
+holdtimehistogram = None
 
 
 
@@ -319,11 +373,91 @@ locktimelist = []
 
 class ThreadedXMLRPCServer(SocketServer.ThreadingMixIn, SimpleXMLRPCServer.SimpleXMLRPCServer):
   """This is a threaded XMLRPC Server. """
+  
+  # Clients keep their connections open between calls, so don't let the
+  # threads of idle connections keep the lockserver from exiting.
+  daemon_threads = True
 
 
 
 
   
+class InsertionOrderedDict(object):
+  """
+  A dictionary whose keys are iterated over in the order they were added.
+  (collections.OrderedDict only exists as of python 2.7.) The keys are also
+  kept in a deque in the order they were added. Removed keys are left in the
+  deque until they reach its front or it is compacted, so adding and removing
+  a key take constant time (amortized), as does finding the first key.
+  """
+
+  def __init__(self):
+    # Maps each key to (the number of the key in the order, the value).
+    self._items = {}
+    # The (number, key) of the keys in the order they were added, including
+    # ones that have been removed since.
+    self._order = collections.deque()
+    self._next_number = 0
+
+
+  def _is_current(self, orderentry):
+    # Whether an entry of the order is for a key that hasn't been removed
+    # since (or that was added again).
+    (number, key) = orderentry
+    return key in self._items and self._items[key][0] == number
+
+
+  def __setitem__(self, key, value):
+    if key in self._items:
+      self._items[key] = (self._items[key][0], value)
+      return
+    self._items[key] = (self._next_number, value)
+    self._order.append((self._next_number, key))
+    self._next_number += 1
+
+
+  def __getitem__(self, key):
+    return self._items[key][1]
+
+
+  def __delitem__(self, key):
+    self.pop(key)
+
+
+  def pop(self, key):
+    value = self._items.pop(key)[1]
+    # Compact the order once most of it is removed keys.
+    if len(self._order) > 2 * len(self._items) + 16:
+      currententries = [entry for entry in self._order if self._is_current(entry)]
+      self._order = collections.deque(currententries)
+    return value
+
+
+  def __len__(self):
+    return len(self._items)
+
+
+  def __contains__(self, key):
+    return key in self._items
+
+
+  def __iter__(self):
+    # Drop the removed keys at the front so that they aren't skipped again.
+    while self._order and not self._is_current(self._order[0]):
+      self._order.popleft()
+    for entry in self._order:
+      if self._is_current(entry):
+        yield entry[1]
+
+
+  def iteritems(self):
+    for key in self:
+      yield (key, self._items[key][1])
+
+
+
+
+
 class LockserverInvalidRequestError(Exception):
   """Indicates that an invalid request was made by the client."""
 
@@ -361,10 +495,63 @@ def _is_lockdict_empty(lockdict):
 
 
 
+def _new_session_lockdict():
+  """
+  Returns an empty lockdict of the format used for the "heldlocks" and
+  "neededlocks" of a session in the sessiondict.
+  """
+  return {"user":InsertionOrderedDict(), "node":InsertionOrderedDict()}
+
+
+
+
+
+def _lockdict_to_lists(lockdict):
+  """
+  Returns a copy of a lockdict from the sessiondict in the format described
+  in the module comments, that is, with a list of locknames for each locktype.
+  """
+  listlockdict = {}
+  for locktype in lockdict:
+    listlockdict[locktype] = list(lockdict[locktype])
+  return listlockdict
+
+
+
+
+
+def _timedelta_to_seconds(timedelta):
+  """
+  Returns the number of seconds in a datetime.timedelta as a float.
+  (timedelta.total_seconds() only exists as of python 2.7.)
+  """
+  return timedelta.days * 86400 + timedelta.seconds + timedelta.microseconds / 1000000.0
+
+
+
+
+
+def _add_to_histogram(histogram, timedelta):
+  """
+  Counts a duration (a datetime.timedelta) in the bucket of the histogram
+  (waittimehistogram or holdtimehistogram) that it falls into.
+  """
+  seconds = _timedelta_to_seconds(timedelta)
+  for index in range(len(LOCK_TIME_HISTOGRAM_BOUNDS)):
+    if seconds <= LOCK_TIME_HISTOGRAM_BOUNDS[index]:
+      histogram[index] += 1
+      return
+  histogram[-1] += 1
+
+
+
+
+
 def init_globals():
   """
   <Purpose>
-    Prepares the global variables heldlockdict and sessiondict. They
+    Prepares the global variables heldlockdict, sessiondict, locktimedict,
+    waittimehistogram and holdtimehistogram. They
     are set this way rather than directly when declared as this this method is
     needed for unit tests that work directly with the lockserver_daemon module
     rather than starting and stopping the lockserver and using xmlrpc. This
@@ -374,17 +561,24 @@ def init_globals():
   <Exceptions>
     None.
   <Side Effects>
-    Resets the heldlockdict and sessiondict global variables, thus clearing
-    the state of the lockserver.
+    Resets the heldlockdict, sessiondict, locktimedict, waittimehistogram and
+    holdtimehistogram global variables, thus clearing the state of the
+    lockserver.
   <Returns>
     None.
   """
   
   global heldlockdict
   global sessiondict
+  global locktimedict
+  global waittimehistogram
+  global holdtimehistogram
 
   heldlockdict = {"user":{}, "node":{}}
   sessiondict = {}
+  locktimedict = InsertionOrderedDict()
+  waittimehistogram = [0] * (len(LOCK_TIME_HISTOGRAM_BOUNDS) + 1)
+  holdtimehistogram = [0] * (len(LOCK_TIME_HISTOGRAM_BOUNDS) + 1)
   
   
   
@@ -445,8 +639,8 @@ def do_start_session():
 
   # Create empty lockdicts with "user" and "node" keys for indicating the
   # locks the session holds and the locks the session is queued for.
-  sessiondict[session_id]["heldlocks"] = {"user":[], "node":[]}
-  sessiondict[session_id]["neededlocks"] = {"user":[], "node":[]}
+  sessiondict[session_id]["heldlocks"] = _new_session_lockdict()
+  sessiondict[session_id]["neededlocks"] = _new_session_lockdict()
   
   return session_id
 
@@ -525,9 +719,35 @@ def do_acquire_locks(session_id, requested_acquire_lockdict):
   # conflict with ones held by the same session.
   _assert_valid_locks_for_acquire(session_id, requested_acquire_lockdict)
   
+  _acquire_locks(session_id, requested_acquire_lockdict)
+
+
+
+
+
+def _acquire_locks(session_id, requested_acquire_lockdict):
+  """
+  <Purpose>
+    This is called by do_acquire_locks and do_release_and_acquire_locks once
+    the request has been checked. It acquires or queues the session for each
+    of the locks and sets or clears the session's Event accordingly.
+  <Arguments>
+    session_id:
+      The string that is the session id under which the locks should be acquired.
+    requested_acquire_lockdict:
+      The lockdict that contains the locks to be acquired.
+  <Exceptions>
+    None.
+  <Side Effects>
+    See do_acquire_locks.
+  <Returns>
+    None.
+  """
+  now = datetime.datetime.now()
+  
   for locktype in requested_acquire_lockdict:
     for lockname in requested_acquire_lockdict[locktype]:
-      _acquire_individual_lock(session_id, locktype, lockname)
+      _acquire_individual_lock(session_id, locktype, lockname, now)
       
   # Check if the request got all of the locks it asked for in order to
   # determine whether the request thread should block.
@@ -542,10 +762,10 @@ def do_acquire_locks(session_id, requested_acquire_lockdict):
 
 
 
-def _acquire_individual_lock(session_id, locktype, lockname):
+def _acquire_individual_lock(session_id, locktype, lockname, now):
   """
   <Purpose>
-    This is called by do_acquire_locks for each lock to be acquired. This will
+    This is called by _acquire_locks for each lock to be acquired. This will
     either mark the lock as being held by the specified session (if the lock
     is not already held) or will add this session the lock's queue (if the
     lock is already held).
@@ -556,6 +776,8 @@ def _acquire_individual_lock(session_id, locktype, lockname):
       The locktype of lock, either 'user' or 'node'.
     lockname:
       The lockname of the lock (a string).
+    now:
+      The datetime of the request.
   <Exceptions>
     None.
   <Side Effects>
@@ -565,34 +787,35 @@ def _acquire_individual_lock(session_id, locktype, lockname):
   <Returns>
     None.
   """
-  # Create the lock info if it didn't already exist in the global heldlockdict.
-  if not lockname in heldlockdict[locktype]:
-    heldlockdict[locktype][lockname] = {"queue":[], "locked_by_session":None}
-
-  heldlockinfo = heldlockdict[locktype][lockname]
+  heldlockinfo = heldlockdict[locktype].get(lockname)
   
-  if heldlockinfo["locked_by_session"] is None:
+  if heldlockinfo is None:
     # Nobody holds this lock, so give it to this session.
-    heldlockinfo["locked_by_session"] = session_id
+    heldlockdict[locktype][lockname] = {"queue":collections.deque(),
+                                        "locked_by_session":session_id}
     
     # Record in the sessiondict that the session holds this lock.
-    sessiondict[session_id]["heldlocks"][locktype].append(lockname)
+    sessiondict[session_id]["heldlocks"][locktype][lockname] = None
     
-    # Append to the locktimelist indicating when this lock was acquired.
-    locktimelist.append(({locktype: lockname}, datetime.datetime.now()))
+    # Record in the locktimedict when this lock was acquired. It was not
+    # waited for.
+    locktimedict[(locktype, lockname)] = now
+    _add_to_histogram(waittimehistogram, datetime.timedelta(0))
     
   else:
     # This lock is already held, so add the session to this lock's queue.
     heldlockinfo["queue"].append(session_id)
     
-    # Record in the sessiondict that this session is waiting on this lock.
-    sessiondict[session_id]["neededlocks"][locktype].append(lockname)
+    # Record in the sessiondict that this session is waiting on this lock
+    # and since when.
+    sessiondict[session_id]["neededlocks"][locktype][lockname] = now
 
 
 
 
 
-def _assert_valid_locks_for_acquire(session_id, requested_acquire_lockdict):
+def _assert_valid_locks_for_acquire(session_id, requested_acquire_lockdict,
+                                    requested_release_lockdict=None):
   """
   <Purpose>
     Ensures that the locks specified in requested_acquire_lockdict are locks
@@ -606,6 +829,10 @@ def _assert_valid_locks_for_acquire(session_id, requested_acquire_lockdict):
       The string that is the session id under which the locks should be acquired.
     requested_acquire_lockdict:
       The lockdict that contains the locks to be acquired.
+    requested_release_lockdict:
+      (optional) The lockdict that contains the locks the session releases
+      before acquiring the locks. These must already have been checked by
+      _assert_valid_locks_for_release.
   <Exceptions>
     Raises LockserverInvalidRequestError if requested_acquire_lockdict contains
     locks that would be invalid for this session to request acquisition of.
@@ -614,6 +841,14 @@ def _assert_valid_locks_for_acquire(session_id, requested_acquire_lockdict):
   <Returns>
     None.
   """
+  # The number of locks of each locktype the session will still hold when the
+  # requested locks are acquired.
+  heldlockcount = {}
+  for locktype in sessiondict[session_id]["heldlocks"]:
+    heldlockcount[locktype] = len(sessiondict[session_id]["heldlocks"][locktype])
+    if requested_release_lockdict is not None and locktype in requested_release_lockdict:
+      heldlockcount[locktype] -= len(requested_release_lockdict[locktype])
+  
   # Check if the session is requesting locks of both type "user" and type "node".
   if len(requested_acquire_lockdict.keys()) != 1:
     # Raise an error that will be returned over xmlrpc.
@@ -623,7 +858,7 @@ def _assert_valid_locks_for_acquire(session_id, requested_acquire_lockdict):
   # Locks of the same locktype as those already held cannot be requested.
   for locktype in requested_acquire_lockdict:
     # Check if the session already holds locks of this locktype.
-    if len(sessiondict[session_id]["heldlocks"][locktype]) > 0:
+    if heldlockcount[locktype] > 0:
       # Raise an error that will be returned over xmlrpc.
       message = "Requested acquisition of locks of same locktype ('" + locktype + "') as those already held by this session."
       _raise_lock_request_error(session_id, requested_acquire_lockdict, message)
@@ -631,7 +866,7 @@ def _assert_valid_locks_for_acquire(session_id, requested_acquire_lockdict):
   # User locks cannot be requested when a node lock is already held.
   if "user" in requested_acquire_lockdict:
     # Check if the session already holds locks of the 'node' locktype.
-    if len(sessiondict[session_id]["heldlocks"]["node"]) > 0:
+    if heldlockcount["node"] > 0:
       # Raise an error that will be returned over xmlrpc.
       message = "Requested acquisition of user lock when node locks already held by this session."
       _raise_lock_request_error(session_id, requested_acquire_lockdict, message)
@@ -674,18 +909,78 @@ def do_release_locks(session_id, requested_release_lockdict):
   # if they are not all held by this session.
   _assert_valid_locks_for_release(session_id, requested_release_lockdict)
   
+  _release_locks(session_id, requested_release_lockdict)
+
+
+
+
+
+def _release_locks(session_id, requested_release_lockdict):
+  """
+  This is called by do_release_locks and do_release_and_acquire_locks once
+  the request has been checked. It releases each of the locks.
+  """
+  now = datetime.datetime.now()
+  
   for locktype in requested_release_lockdict:
     for lockname in requested_release_lockdict[locktype]:
-      _release_individual_lock(session_id, locktype, lockname)
+      _release_individual_lock(session_id, locktype, lockname, now)
 
 
 
 
 
-def _release_individual_lock(session_id, locktype, lockname):
+def do_release_and_acquire_locks(session_id, requested_release_lockdict,
+                                 requested_acquire_lockdict):
   """
   <Purpose>
-    This is called by do_release_locks for each lock to be released. This will
+    This is the function that does the actual work for xmlrpc calls to
+    ReleaseAndAcquireLocks. Other than for testing, this should only be called
+    by the ReleaseAndAcquireLocks function registered with the xmlrpc server.
+    The caller of this function must hold the global datalock.
+  <Arguments>
+    session_id:
+      The string that is the session id under which the locks should be
+      released and acquired.
+    requested_release_lockdict:
+      The lockdict that contains the locks to be released.
+    requested_acquire_lockdict:
+      The lockdict that contains the locks to be acquired.
+  <Exceptions>
+    LockserverInvalidRequestError is raised if the specified session is
+    invalid, if any of the locks requested to be released are not held by
+    the session or if the locks requested to be acquired are invalid once the
+    released locks are no longer held. Nothing is released or acquired in
+    that case.
+  <Side Effects>
+    The same as calling do_release_locks and then do_acquire_locks.
+  <Returns>
+    None.
+  """
+  # Raises an exception if the session id doesn't exist.
+  _assert_valid_session(session_id)
+  
+  # Raises an exception if either lockdict format is invalid.
+  _assert_valid_lockdict(requested_release_lockdict)
+  _assert_valid_lockdict(requested_acquire_lockdict)
+  
+  # Raises an exception if the requested locks are invalid. All of the
+  # checks are done before anything is released.
+  _assert_valid_locks_for_release(session_id, requested_release_lockdict)
+  _assert_valid_locks_for_acquire(session_id, requested_acquire_lockdict,
+                                  requested_release_lockdict)
+  
+  _release_locks(session_id, requested_release_lockdict)
+  _acquire_locks(session_id, requested_acquire_lockdict)
+
+
+
+
+
+def _release_individual_lock(session_id, locktype, lockname, now):
+  """
+  <Purpose>
+    This is called by _release_locks for each lock to be released. This will
     mark the lock as not being held by the specified session and will take care
     of giving released locks to queued requests.
   <Arguments>
@@ -695,6 +990,8 @@ def _release_individual_lock(session_id, locktype, lockname):
       The locktype of lock, either 'user' or 'node'.
     lockname:
       The lockname of the lock (a string).
+    now:
+      The datetime of the request.
   <Exceptions>
     None.
   <Side Effects>
@@ -711,28 +1008,26 @@ def _release_individual_lock(session_id, locktype, lockname):
   heldlockinfo = heldlockdict[locktype][lockname]
   
   # Regardless of whether there are queued sessions waiting for this lock,
-  # it is removed from the list of locks this session holds.
-  sessiondict[session_id]["heldlocks"][locktype].remove(lockname)
-
-  # Remove this lock from the locktimelist.
-  for locktimeitem in locktimelist:
-    if locktimeitem[0] == {locktype: lockname}:
-      log.info("Lock " + str({locktype: lockname}) + " was held for " + 
-               str(datetime.datetime.now() - locktimeitem[1]))
-      locktimelist.remove(locktimeitem)
-      break
+  # it is removed from the locks this session holds.
+  del sessiondict[session_id]["heldlocks"][locktype][lockname]
+
+  # Remove this lock from the locktimedict.
+  held_timedelta = now - locktimedict.pop((locktype, lockname))
+  log.info("Lock " + str({locktype: lockname}) + " was held for " + str(held_timedelta))
+  _add_to_histogram(holdtimehistogram, held_timedelta)
   
   if len(heldlockinfo["queue"]) > 0:
     # Set the lock as held by the next queued session_id.
-    new_lock_holder = heldlockinfo["queue"].pop(0)
+    new_lock_holder = heldlockinfo["queue"].popleft()
     heldlockinfo["locked_by_session"] = new_lock_holder
     
     # Update the sessiondict to change this lock from a needed lock to a held lock.
-    sessiondict[new_lock_holder]["heldlocks"][locktype].append(lockname)
-    sessiondict[new_lock_holder]["neededlocks"][locktype].remove(lockname)
+    sessiondict[new_lock_holder]["heldlocks"][locktype][lockname] = None
+    requested_time = sessiondict[new_lock_holder]["neededlocks"][locktype].pop(lockname)
+    _add_to_histogram(waittimehistogram, now - requested_time)
     
-    # Append to the locktimelist indicating when this lock was acquired.
-    locktimelist.append(({locktype: lockname}, datetime.datetime.now()))
+    # Record in the locktimedict when this lock was acquired.
+    locktimedict[(locktype, lockname)] = now
     
     # If the session  now holding the lock isn't waiting on any more locks,
     # unblock the session's current AcquireLocks request thread.
@@ -740,8 +1035,9 @@ def _release_individual_lock(session_id, locktype, lockname):
       sessiondict[new_lock_holder]["acquirelocksproceedevent"].set()
     
   else:
-    # There are no sessions waiting on this lock, so the lock is now held by nobody.
-    heldlockinfo["locked_by_session"] = None
+    # There are no sessions waiting on this lock, so the lock is now held by
+    # nobody and its entry is removed.
+    del heldlockdict[locktype][lockname]
     
     
     
@@ -798,19 +1094,34 @@ def do_get_status():
   <Side Effects>
     None.
   <Returns>
-    A dictionary with the keys, "heldlockdict",  "sessiondict", and
-    "locktimelist" is returned. The values of these keys are most of the
-    contents of the global variables by the same names used within the
-    lockserver itself. It excludes the Event objects from the sessiondict
-    data that is returned.
+    A dictionary with the keys, "heldlockdict",  "sessiondict",
+    "locktimelist", "waittimehistogram" and "holdtimehistogram" is returned.
+    The values of the first two keys are most of the contents of the global
+    variables by the same names used within the lockserver itself, with lists
+    in place of the deques and InsertionOrderedDicts. It excludes the Event objects
+    from the sessiondict data that is returned. The "locktimelist" is a list
+    of ({locktype: lockname}, locktime) tuples made from the locktimedict.
+    The value of each histogram key is a dictionary with the keys "bounds"
+    (LOCK_TIME_HISTOGRAM_BOUNDS) and "counts" (the count of each bucket, the
+    last one being for times longer than the last bound).
   """
 
+  # We create a heldlockdict with lists rather than deques for the queues.
+  cleanheldlockdict = {}
+  for locktype in heldlockdict:
+    cleanheldlockdict[locktype] = {}
+    for lockname in heldlockdict[locktype]:
+      heldlockinfo = heldlockdict[locktype][lockname]
+      cleanheldlockdict[locktype][lockname] = {
+          "queue": list(heldlockinfo["queue"]),
+          "locked_by_session": heldlockinfo["locked_by_session"]}
+
   # We create a sessiondict that 
   cleansessiondict = {}
   for session_id in sessiondict:
     cleansessiondict[session_id] = {}
-    cleansessiondict[session_id]["heldlocks"] = sessiondict[session_id]["heldlocks"]
-    cleansessiondict[session_id]["neededlocks"] = sessiondict[session_id]["neededlocks"]
+    cleansessiondict[session_id]["heldlocks"] = _lockdict_to_lists(sessiondict[session_id]["heldlocks"])
+    cleansessiondict[session_id]["neededlocks"] = _lockdict_to_lists(sessiondict[session_id]["neededlocks"])
     
     # We include a acquirelocksproceedeventset value in the status info rather than the
     # boolean acquirelocksinprogress value because we want to be able to test without
@@ -824,10 +1135,18 @@ def do_get_status():
     acquirelocksproceedeventset = sessiondict[session_id]["acquirelocksproceedevent"].isSet()
     cleansessiondict[session_id]["acquirelocksproceedeventset"] = acquirelocksproceedeventset
   
+  locktimelist = []
+  for (locktype, lockname), locktime in locktimedict.iteritems():
+    locktimelist.append(({locktype: lockname}, locktime))
+  
   status = {}
-  status["heldlockdict"] = heldlockdict
+  status["heldlockdict"] = cleanheldlockdict
   status["sessiondict"] = cleansessiondict
   status["locktimelist"] = locktimelist
+  status["waittimehistogram"] = {"bounds": LOCK_TIME_HISTOGRAM_BOUNDS,
+                                 "counts": list(waittimehistogram)}
+  status["holdtimehistogram"] = {"bounds": LOCK_TIME_HISTOGRAM_BOUNDS,
+                                 "counts": list(holdtimehistogram)}
   return status
     
     
@@ -930,8 +1249,9 @@ def _assert_valid_lockdict(lockdict):
         raise LockserverInvalidRequestError("Invalid lockdict (all items in a list of locknames must be str's).")
       if len(lockname) == 0:
         raise LockserverInvalidRequestError("Invalid lockdict (lock names cannot be empty strings).")
-      if len(lockdict[locktype]) != len(set(lockdict[locktype])):
-        raise LockserverInvalidRequestError("Invalid lockdict (all items in a list of locknames must unique in that list).")
+    
+    if len(lockdict[locktype]) != len(set(lockdict[locktype])):
+      raise LockserverInvalidRequestError("Invalid lockdict (all items in a list of locknames must unique in that list).")
       
 
 
@@ -945,10 +1265,10 @@ def _raise_lock_request_error(session_id, lockdict_in_request, message):
   """
   requested_lock_str = str(lockdict_in_request)
   
-  sessionheldlockdict = sessiondict[session_id]["heldlocks"]
+  sessionheldlockdict = _lockdict_to_lists(sessiondict[session_id]["heldlocks"])
   held_locks_str = str(sessionheldlockdict)
   
-  sessionneededlockdict = sessiondict[session_id]["neededlocks"]
+  sessionneededlockdict = _lockdict_to_lists(sessiondict[session_id]["neededlocks"])
   needed_locks_str = str(sessionneededlockdict)
   
   info_str = "Session id: " + session_id + ". "
@@ -1135,6 +1455,48 @@ class LockserverPublicFunctions(object):
       
     finally:
       datalock.release()
+
+  
+  
+  # Using @staticmethod makes it so that 'self' doesn't get passed in as the first arg.
+  @staticmethod
+  def ReleaseAndAcquireLocks(*args):
+    """
+    This is a public function of the XMLRPC server. See the module comments at
+    the top of the file for a description of how it is used.
+    """
+    _assert_number_of_arguments('ReleaseAndAcquireLocks', args, 3)
+    (session_id, request_release_lockdict, request_acquire_lockdict) = args
+    
+    datalock.acquire()
+    try:
+      # Ensure it's a string before printing it like one.
+      _assert_valid_session(session_id)
+      
+      log.info("[session_id: " + session_id + "] ReleaseAndAcquireLocks called to release locks " +
+               str(request_release_lockdict) + " and acquire locks " + str(request_acquire_lockdict))
+      
+      # Check if this session has an outstanding AcquireLocks request. Clients
+      # should not be making concurrent AcquireLocks requests.
+      if sessiondict[session_id]["acquirelocksinprogress"]:
+        message = "[session_id: " + session_id + "] ReleaseAndAcquireLocks called while an earlier AcquireLocks call has not been completed."
+        raise LockserverInvalidRequestError(message)
+      
+      do_release_and_acquire_locks(session_id, request_release_lockdict, request_acquire_lockdict)
+      
+      # See the comments in AcquireLocks.
+      sessiondict[session_id]["acquirelocksinprogress"] = True
+      
+    finally:
+      datalock.release()
+    
+    # Wait for our event flag to signal that we have acquired the locks, as in
+    # AcquireLocks.
+    sessiondict[session_id]["acquirelocksproceedevent"].wait()
+    
+    sessiondict[session_id]["acquirelocksinprogress"] = False
+    
+    log.info("[session_id: " + session_id + "] ReleaseAndAcquireLocks fulfilled request for locks " + str(request_acquire_lockdict))
   
   
   
@@ -1180,21 +1542,23 @@ def monitor_held_lock_times():
       # Grab the datalock and get the oldest held lock, if there are any.
       datalock.acquire()
       try:
-        if len(locktimelist) == 0:
+        if len(locktimedict) == 0:
           # No locks are held.
           continue
         
-        oldestlock = locktimelist[0]
+        # The first entry is the longest-held lock.
+        (locktype, lockname) = iter(locktimedict).next()
+        oldestlocktime = locktimedict[(locktype, lockname)]
         
       finally:
         datalock.release()
         
-      held_timedelta = datetime.datetime.now() - oldestlock[1]
+      held_timedelta = datetime.datetime.now() - oldestlocktime
       
       # Check if the oldest lock has been held too long.
       if held_timedelta > MAX_EXPECTED_LOCK_HOLDING_TIMEDELTA:
-        message = "Lockserver lock " + str(oldestlock[0])
-        message += " has been held since " + str(oldestlock[1])
+        message = "Lockserver lock " + str({locktype: lockname})
+        message += " has been held since " + str(oldestlocktime)
         message += " (timedelta: " + str(held_timedelta) + ")"
         # Raise an exception which will cause an email to be sent from the
         # except clause below.
@@ -1224,7 +1588,10 @@ def main():
   init_globals()
 
   # Register the XMLRPCServer. Use allow_none to allow allow the python None value.
-  server = ThreadedXMLRPCServer(("127.0.0.1", LISTENPORT), allow_none=True)
+  # The request handler keeps connections open between calls.
+  server = ThreadedXMLRPCServer(("127.0.0.1", LISTENPORT),
+                                requestHandler=rpc.KeepAliveXMLRPCRequestHandler,
+                                allow_none=True)
 
   log.info("Listening on port " + str(LISTENPORT) + ".")
   
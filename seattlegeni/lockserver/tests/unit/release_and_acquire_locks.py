@@ -0,0 +1,86 @@
+import unittest
+
+import lockserver_daemon as lockserver
+
+
+class TheTestCase(unittest.TestCase):
+
+  def setUp(self):
+    # Reset the lockserver's global variables between each test.
+    lockserver.init_globals()
+
+
+  def testReleaseAndAcquireNodeLocks(self):
+    # Start two sessions.
+    sess = []
+    sess.append(lockserver.do_start_session())
+    sess.append(lockserver.do_start_session())
+
+    # First session gets the locks on the nodes '123' and '456'.
+    locks = {'node':['123','456']}
+    lockserver.do_acquire_locks(sess[0], locks)
+
+    # Second session is queued for the lock on node '456'.
+    locks = {'node':['456']}
+    lockserver.do_acquire_locks(sess[1], locks)
+
+    # First session releases its node locks and requests the next batch of
+    # node locks in a single request, one of which the second session will
+    # hold by then.
+    release_locks = {'node':['123','456']}
+    acquire_locks = {'node':['456','789']}
+    lockserver.do_release_and_acquire_locks(sess[0], release_locks, acquire_locks)
+
+    # The lock on '123' isn't held by anyone anymore, so it is gone.
+    expected_heldlockdict = {
+      'node': {'456': {'locked_by_session': sess[1],
+                       'queue': [sess[0]]},
+               '789': {'locked_by_session': sess[0],
+                       'queue': []}},
+      'user': {}}
+    expected_sessiondict = {
+      sess[0]: {'heldlocks': {'node': ['789'], 'user': []},
+                'neededlocks': {'node': ['456'], 'user': []},
+                'acquirelocksproceedeventset': False},
+      sess[1]: {'heldlocks': {'node': ['456'], 'user': []},
+                'neededlocks': {'node': [], 'user': []},
+                'acquirelocksproceedeventset': True}}
+
+    status = lockserver.do_get_status()
+    self.assertEqual(expected_heldlockdict, status["heldlockdict"])
+    self.assertEqual(expected_sessiondict, status["sessiondict"])
+
+    # The locks are listed longest-held first.
+    self.assertEqual([{'node':'456'}, {'node':'789'}],
+                     [locktimeitem[0] for locktimeitem in status["locktimelist"]])
+
+    # Four lock acquisitions were not waited for and two locks were released.
+    # The wait of the second session hasn't been counted yet.
+    self.assertEqual(4, sum(status["waittimehistogram"]["counts"]))
+    self.assertEqual(2, sum(status["holdtimehistogram"]["counts"]))
+
+
+  def testReleaseAndAcquireIsCheckedBeforeReleasing(self):
+    sess = []
+    sess.append(lockserver.do_start_session())
+
+    lockserver.do_acquire_locks(sess[0], {'user':['bob']})
+    lockserver.do_acquire_locks(sess[0], {'node':['123']})
+
+    # The session doesn't hold the lock on node '456'.
+    func = lockserver.do_release_and_acquire_locks
+    args = (sess[0], {'node':['123','456']}, {'node':['789']})
+    self.assertRaises(lockserver.LockserverInvalidRequestError, func, *args)
+
+    # The session would still hold a node lock, so it can't request more.
+    args = (sess[0], {'user':['bob']}, {'node':['789']})
+    self.assertRaises(lockserver.LockserverInvalidRequestError, func, *args)
+
+    # A user lock can't be requested while node locks are held.
+    args = (sess[0], {'user':['bob']}, {'user':['alice']})
+    self.assertRaises(lockserver.LockserverInvalidRequestError, func, *args)
+
+    # Nothing was released.
+    status = lockserver.do_get_status()
+    self.assertEqual({'node': ['123'], 'user': ['bob']},
+                     status["sessiondict"][sess[0]]["heldlocks"])
@@ -0,0 +1,71 @@
+
+
+import unittest
+
+import lockserver_daemon as lockserver
+
+
+class TheTestCase(unittest.TestCase):
+
+  def testKeysAreIteratedInTheOrderTheyWereAdded(self):
+    orderdict = lockserver.InsertionOrderedDict()
+    for key in ["c", "a", "d", "b"]:
+      orderdict[key] = key.upper()
+
+    self.assertEqual(["c", "a", "d", "b"], list(orderdict))
+    self.assertEqual([("c", "C"), ("a", "A"), ("d", "D"), ("b", "B")],
+                     list(orderdict.iteritems()))
+    self.assertEqual(4, len(orderdict))
+    self.assertTrue("d" in orderdict)
+    self.assertFalse("e" in orderdict)
+
+
+  def testSettingAnExistingKeyKeepsItsPlace(self):
+    orderdict = lockserver.InsertionOrderedDict()
+    orderdict["a"] = 1
+    orderdict["b"] = 2
+    orderdict["a"] = 3
+
+    self.assertEqual([("a", 3), ("b", 2)], list(orderdict.iteritems()))
+
+
+  def testRemovedKeys(self):
+    orderdict = lockserver.InsertionOrderedDict()
+    for key in range(5):
+      orderdict[key] = None
+
+    del orderdict[0]
+    self.assertEqual(None, orderdict.pop(3))
+    self.assertEqual([1, 2, 4], list(orderdict))
+    self.assertEqual(3, len(orderdict))
+    self.assertFalse(3 in orderdict)
+    self.assertRaises(KeyError, orderdict.pop, 3)
+
+    # A key that is added again goes to the end.
+    orderdict[1] = "again"
+    del orderdict[1]
+    orderdict[1] = "again"
+    self.assertEqual([2, 4, 1], list(orderdict))
+    self.assertEqual("again", orderdict[1])
+
+
+  def testOrderIsKeptWhenCompacted(self):
+    # Add and remove keys, as locks are acquired and released, keeping one
+    # key from each round.
+    orderdict = lockserver.InsertionOrderedDict()
+    for number in range(100):
+      for key in range(10):
+        orderdict[(number, key)] = number
+      for key in range(1, 10):
+        del orderdict[(number, key)]
+
+    self.assertEqual([(number, 0) for number in range(100)], list(orderdict))
+    # Removed keys aren't kept in the order indefinitely.
+    self.assertTrue(len(orderdict._order) <= 2 * len(orderdict) + 16)
+
+    # The first key is the one added first.
+    for number in range(100):
+      self.assertEqual((number, 0), iter(orderdict).next())
+      del orderdict[(number, 0)]
+    self.assertEqual(0, len(orderdict))
+    self.assertEqual([], list(orderdict))
@@ -134,6 +134,39 @@ rm utfutil.py
 
 popd
 
+##############################################################################
+# Run the rpc transport tests.
+##############################################################################
+echo "############# rpc transport tests #############"
+pushd common/util/tests
+
+
+cp $utf ./utf.py
+cp $utfutil ./utfutil.py
+
+
+if [ -e file.txt ]; then
+  echo "Filename 'file.txt' already exists, skipping rpc tests <ERROR>"
+  failure=1
+else 
+  python utf.py -m rpcunit > file.txt
+  retval=$?
+
+  cat file.txt
+  numErrors=`cat file.txt | egrep '(FAIL|ERROR)' | wc -l`
+  
+  if [ "$retval" != "0" -o $numErrors -gt 0 ]; then
+    failure=1
+  fi
+
+  rm file.txt
+fi 
+
+rm utf.py
+rm utfutil.py
+
+popd
+
 ##############################################################################
 # Run the lockserver tests.
 ##############################################################################
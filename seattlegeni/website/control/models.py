@@ -147,6 +147,13 @@ class Node(models.Model):
   # The IP address the nodemanager was last known to be accessible through.
   last_known_ip = models.CharField("Last known nodemanager IP address or NAT string", max_length=100, db_index=True)
 
+  # The subnet of last_known_ip (everything before its last '.'), or an empty
+  # string if last_known_ip has no '.' in it. This is set by save() so that
+  # vessels can be selected by subnet in the database.
+  # Databases created before this field was added need the column added with
+  # the sql in the file sql/node_subnet_upgrade.mysql.sql.
+  subnet = models.CharField("Subnet of the last known IP address", max_length=100, blank=True, db_index=True)
+
   # The port the nodemanager was last known to be accessible through. 
   last_known_port = models.IntegerField("Last known nodemanager port", db_index=True)
 
@@ -198,6 +205,15 @@ class Node(models.Model):
 
 
 
+  def save(self, *args, **kwargs):
+    """
+    Saves the Node instance, first setting its subnet from its last_known_ip.
+    """
+    self.subnet = self.last_known_ip.rpartition('.')[0]
+    models.Model.save(self, *args, **kwargs)
+
+
+
 
 
 class Donation(models.Model):
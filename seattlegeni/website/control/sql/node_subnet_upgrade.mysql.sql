@@ -0,0 +1,13 @@
+/* Adds the subnet field of the Node model to a database that was created
+ * before the field existed. Unlike node.mysql.sql, django doesn't run this
+ * after syncdb (a new database already has the column), so run it by hand:
+ * 
+ *   mysql seattlegeni < node_subnet_upgrade.mysql.sql
+ * 
+ * The subnet is everything before the last '.' of last_known_ip, or an empty
+ * string if there is no '.', as set by Node.save().
+ */
+ALTER TABLE `control_node` ADD COLUMN `subnet` varchar(100) NOT NULL DEFAULT '' AFTER `last_known_ip`;
+ALTER TABLE `control_node` ADD INDEX `control_node_subnet` (`subnet`);
+UPDATE `control_node` SET `subnet` = IF(LOCATE('.', `last_known_ip`) = 0, '',
+    LEFT(`last_known_ip`, LENGTH(`last_known_ip`) - LOCATE('.', REVERSE(`last_known_ip`))));
@@ -547,6 +547,46 @@ class SeattleGeniTestCase(unittest.TestCase):
 
 
 
+  def test_subnet_vessel_counts_change(self):
+    
+    # Create a user who will be doing the acquiring.
+    user = maindb.create_user("testuser", "password", "example@example.com", "affiliation", "1 2", "2 2 2", "3 4")
+    
+    userport = user.usable_vessel_port
+    
+    create_nodes_on_same_subnet(3, [userport])
+    create_nat_nodes(2, [userport])
+    
+    # The nat nodes have no subnet.
+    self.assertEqual({"ip = 127.0.0": 3}, maindb._get_available_vessel_counts_by_subnet(userport))
+    
+    node = create_node_and_vessels_with_one_port_each("127.1.0.1", [userport])
+    self.assertEqual({"ip = 127.0.0": 3, "127.1.0": 1}, maindb._get_available_vessel_counts_by_subnet(userport))
+    
+    # The cached counts change when a vessel is acquired or released and
+    # when the released vessel has been cleaned up.
+    vessel = maindb.get_vessels_on_node(node)[0]
+    maindb.record_acquired_vessel(user, vessel)
+    self.assertEqual({"ip = 127.0.0": 3}, maindb._get_available_vessel_counts_by_subnet(userport))
+    
+    maindb.record_released_vessel(vessel)
+    self.assertEqual({"ip = 127.0.0": 3}, maindb._get_available_vessel_counts_by_subnet(userport))
+    
+    maindb.mark_vessel_as_clean(vessel)
+    self.assertEqual({"ip = 127.0.0": 3, "127.1.0": 1}, maindb._get_available_vessel_counts_by_subnet(userport))
+    
+    # The node moves to the other subnet.
+    maindb.record_node_communication_success(node, "10.0test", "ip = 127.0.0.100", 1234)
+    self.assertEqual("ip = 127.0.0", node.subnet)
+    self.assertEqual({"ip = 127.0.0": 4}, maindb._get_available_vessel_counts_by_subnet(userport))
+    
+    subnet_vessel_list = maindb.get_available_lan_vessels_by_subnet(user, 4)
+    self.assertEqual(1, len(subnet_vessel_list))
+    self.assertEqual(4, len(subnet_vessel_list[0]))
+
+
+
+
 
 def run_test():
   unittest.main()
@@ -85,6 +85,11 @@ nmclient_handledictlock = getlock()
 # the result)...
 def nmclient_rawcommunicate(nmhandle, *args):
 
+  if nmclient_handledict[nmhandle].get('persistent'):
+    response = nmclient_sessioncommunicate(nmhandle, '|'.join(args))
+    if response != None:
+      return response
+
   # the node is behind a nat and using nat layer
   if 'natlayermac' in nmclient_handledict[nmhandle]:
     try:
@@ -176,6 +181,14 @@ def nmclient_signedcommunicate(nmhandle, *args):
     raise NMClientException, str(e)
 
 
+  if nmclient_handledict[nmhandle].get('persistent'):
+    try:
+      response = nmclient_sessioncommunicate(nmhandle, signeddata)
+    except NMClientException, e:
+      raise NMClientException, "signedcommunicate failed on the persistent session with error '"+str(e)+"'"
+    if response != None:
+      return response
+
   # the node is behind a nat
   if 'natlayermac' in nmclient_handledict[nmhandle]:
     try:
@@ -213,6 +226,109 @@ def nmclient_signedcommunicate(nmhandle, *args):
 
 
 
+# Opens a connection to the handle's node manager
+def nmclient_openconn(nmhandle):
+  try:
+    # the node is behind a nat
+    if 'natlayermac' in nmclient_handledict[nmhandle]:
+      # add 5 to timeout for nat delay
+      return nat_openconn(nmclient_handledict[nmhandle]['natlayermac'], nmclient_handledict[nmhandle]['port'],timeout=nmclient_handledict[nmhandle]['timeout']+5,usetimeoutsock=True) 
+    else:
+      return timeout_openconn(nmclient_handledict[nmhandle]['IP'], nmclient_handledict[nmhandle]['port'], timeout=nmclient_handledict[nmhandle]['timeout'])
+  except Exception, e:
+    raise NMClientException, str(e)
+
+
+
+# Sends a request over the handle's persistent session (starting one if 
+# needed) and returns the response.   Returns None if the node manager doesn't
+# support persistent sessions (the handle is changed to use a connection per 
+# request).   Only one request at a time uses the session.
+def nmclient_sessioncommunicate(nmhandle, request):
+  handleinfo = nmclient_handledict[nmhandle]
+
+  handleinfo['sessionlock'].acquire()
+  try:
+    # The node manager ends an idle session by sending the end of messages
+    # marker without reading any more requests.   So if an existing session
+    # fails while sending or with SessionEOF, the request wasn't handled and
+    # is sent again on a new session.
+    for attempt in range(2):
+      # If there's something to read before we've sent anything, the node 
+      # manager has ended the session.
+      if handleinfo['session'] != None and nmclient_sessionended(handleinfo['session']):
+        nmclient_endsession(handleinfo)
+
+      newsession = handleinfo['session'] == None
+      if newsession:
+        handleinfo['session'] = nmclient_startsession(nmhandle)
+        if handleinfo['session'] == None:
+          handleinfo['persistent'] = False
+          return None
+
+      sessionsock = handleinfo['session']
+      try:
+        sent = False
+        sessionsock.sendmessage(request)
+        sent = True
+        return sessionsock.recvmessage()
+
+      except SessionEOF, e:
+        nmclient_endsession(handleinfo)
+        if newsession:
+          raise NMClientException, str(e)
+
+      except Exception, e:
+        nmclient_endsession(handleinfo)
+        if newsession or sent:
+          raise NMClientException, str(e)
+
+  finally:
+    handleinfo['sessionlock'].release()
+
+
+
+# Has the node manager ended this (idle) session?
+def nmclient_sessionended(sessionsock):
+  try:
+    return sessionsock.hasbuffereddata() or not sessionsock.socket.willblock()[0]
+  except Exception:
+    # the socket is closed
+    return True
+
+
+
+# Opens a connection and asks for a persistent session.   Returns a 
+# SessionSocket or None if the node manager doesn't support them.
+def nmclient_startsession(nmhandle):
+  sessionsock = SessionSocket(nmclient_openconn(nmhandle))
+  try:
+    sessionsock.sendmessage('PersistentSession')
+    response = sessionsock.recvmessage()
+  except Exception, e:
+    sessionsock.socket.close()
+    raise NMClientException, str(e)
+  
+  if response.endswith('\nSuccess'):
+    return sessionsock
+
+  # an older node manager says this is an unknown call
+  sessionsock.socket.close()
+  return None
+
+
+
+# Closes the handle's persistent session (if it has one)
+def nmclient_endsession(handleinfo):
+  if handleinfo.get('session') != None:
+    try:
+      handleinfo['session'].close()
+    except Exception:
+      pass
+    handleinfo['session'] = None
+
+
+
 def nmclient_safelygethandle():
   # I lock to prevent a race when adding handles to the dictionary.   I don't
   # need a lock when removing because a race is benign (it prevents reuse)
@@ -241,7 +357,10 @@ def nmclient_safelygethandle():
 # create the handle and so are merely transfered to the created handle.
 # Per #537, the default timeout (15) should be greater than the wait period 
 # for starting a vessel.
-def nmclient_createhandle(nmIP, nmport, sequenceid = None, timestamp=True, identity = True, expirationtime = 60*60, publickey = None, privatekey = None, vesselid = None, timeout=15):
+# If persistent is True, requests are sent over one connection that is kept
+# open (if the node manager supports it).   Use nmclient_destroyhandle to close
+# it when done.
+def nmclient_createhandle(nmIP, nmport, sequenceid = None, timestamp=True, identity = True, expirationtime = 60*60, publickey = None, privatekey = None, vesselid = None, timeout=15, persistent=False):
 
   thisentry = {}
 
@@ -260,6 +379,9 @@ def nmclient_createhandle(nmIP, nmport, sequenceid = None, timestamp=True, ident
   thisentry['privatekey'] = privatekey
   thisentry['vesselid'] = vesselid
   thisentry['timeout'] = timeout
+  thisentry['persistent'] = persistent
+  thisentry['session'] = None
+  thisentry['sessionlock'] = getlock()
 
     
   newhandle = nmclient_safelygethandle()
@@ -271,7 +393,7 @@ def nmclient_createhandle(nmIP, nmport, sequenceid = None, timestamp=True, ident
     response = nmclient_rawsay(newhandle, 'GetVessels')
 
   except (ValueError, NMClientException, KeyError), e:
-    del nmclient_handledict[newhandle]
+    nmclient_destroyhandle(newhandle)
     raise NMClientException, e
 
 
@@ -284,7 +406,7 @@ def nmclient_createhandle(nmIP, nmport, sequenceid = None, timestamp=True, ident
         break
         
     else:
-      del nmclient_handledict[newhandle]
+      nmclient_destroyhandle(newhandle)
       raise NMClientException, "Do not understand node manager identity in identification"
 
   else:
@@ -298,14 +420,19 @@ def nmclient_createhandle(nmIP, nmport, sequenceid = None, timestamp=True, ident
 def nmclient_duplicatehandle(nmhandle):
   newhandle = nmclient_safelygethandle()
   nmclient_handledict[newhandle] = nmclient_handledict[nmhandle].copy()
+  # the new handle gets its own persistent session
+  nmclient_handledict[newhandle]['session'] = None
+  nmclient_handledict[newhandle]['sessionlock'] = getlock()
   return newhandle
 
-# public.   Use this to clean up a handle
+# public.   Use this to clean up a handle (and close its persistent session)
 def nmclient_destroyhandle(nmhandle):
   try:
+    handleinfo = nmclient_handledict[nmhandle]
     del nmclient_handledict[nmhandle]
   except KeyError:
     return False
+  nmclient_endsession(handleinfo)
   return True
   
 
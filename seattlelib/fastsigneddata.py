@@ -44,6 +44,10 @@ import sha as fastsha
 def sha_hash(data):
   return fastsha.new(data).digest()
 
+# to protect the caches below (the node manager checks signatures in several
+# threads)
+import threading
+
 
 from repyportability import *
 import repyhelper
@@ -52,6 +56,116 @@ repyhelper.translate_and_import("rsa.repy")
 repyhelper.translate_and_import("time.repy")
 
 
+# Checking a request parses the same public key and verifies the same
+# signature several times (signeddata_shouldtrust checks the signature, then
+# signeddata_getcomments checks it again...), and a client usually signs many
+# requests with one key.   So parsed public keys and the hashes recovered
+# from signatures are kept in small least recently used caches.   Both are
+# keyed by the exact strings from the signed data, so a cached result is
+# always the same as recomputing it.
+SIGNEDDATA_CACHE_SIZE = 256
+
+# raw public key string -> public key dict
+signeddata_publickey_cache = {}
+signeddata_publickey_cache_order = []
+
+# (signature, raw public key string) -> the hash from rsa_verify
+signeddata_verify_cache = {}
+signeddata_verify_cache_order = []
+
+signeddata_cache_lock = threading.Lock()
+
+
+
+def signeddata_cache_lookup(cache, cacheorder, key):
+  # Returns the cached value for key or None.   The caller must hold the lock.
+  if key not in cache:
+    return None
+
+  # move it to the end (most recently used)
+  cacheorder.remove(key)
+  cacheorder.append(key)
+  return cache[key]
+
+
+
+def signeddata_cache_add(cache, cacheorder, key, value):
+  # The caller must hold the lock.
+  if key in cache:
+    cacheorder.remove(key)
+  cache[key] = value
+  cacheorder.append(key)
+
+  # forget the least recently used entries
+  while len(cacheorder) > SIGNEDDATA_CACHE_SIZE:
+    del cache[cacheorder.pop(0)]
+
+
+
+def signeddata_string_to_publickey(rawpublickey):
+  """
+  <Purpose>
+    Like rsa_string_to_publickey but remembers recently parsed keys.
+
+  <Arguments>
+    rawpublickey: the public key string
+
+  <Exceptions>
+    ValueError if the string isn't a valid public key.
+
+  <Side Effects>
+    Adds the key to the cache.
+
+  <Returns>
+    A public key dict (a copy that the caller may change).
+  """
+  signeddata_cache_lock.acquire()
+  try:
+    publickey = signeddata_cache_lookup(signeddata_publickey_cache,
+        signeddata_publickey_cache_order, rawpublickey)
+  finally:
+    signeddata_cache_lock.release()
+
+  if publickey == None:
+    publickey = rsa_string_to_publickey(rawpublickey)
+
+    signeddata_cache_lock.acquire()
+    try:
+      signeddata_cache_add(signeddata_publickey_cache,
+          signeddata_publickey_cache_order, rawpublickey, publickey)
+    finally:
+      signeddata_cache_lock.release()
+
+  return publickey.copy()
+
+
+
+def signeddata_verify(signature, rawpublickey, publickey):
+  # Like rsa_verify(signature, publickey) but remembers recent results.
+  # rawpublickey is the string publickey was parsed from.
+  signeddata_cache_lock.acquire()
+  try:
+    signedhash = signeddata_cache_lookup(signeddata_verify_cache,
+        signeddata_verify_cache_order, (signature, rawpublickey))
+  finally:
+    signeddata_cache_lock.release()
+
+  if signedhash == None:
+    # may raise TypeError or OverflowError for a bad signature (which isn't
+    # cached)
+    signedhash = rsa_verify(signature, publickey)
+
+    signeddata_cache_lock.acquire()
+    try:
+      signeddata_cache_add(signeddata_verify_cache,
+          signeddata_verify_cache_order, (signature, rawpublickey), signedhash)
+    finally:
+      signeddata_cache_lock.release()
+
+  return signedhash
+
+
+
 # The signature for a piece of data is appended to the end and has the format:
 # \n!publickey!timestamp!expirationtime!sequencedata!destination!signature
 # The signature is actually the sha hash of the data (including the
@@ -191,14 +305,14 @@ def signeddata_issignedcorrectly(data, publickey=None):
     # error splitting the data means it isn't valid...
     return False
   
-  if publickey != None and rsa_string_to_publickey(rawpublickey) != publickey:
+  if publickey != None and signeddata_string_to_publickey(rawpublickey) != publickey:
     return False
 
-  publickey = rsa_string_to_publickey(rawpublickey)
+  publickey = signeddata_string_to_publickey(rawpublickey)
 
   try: 
     # extract the hash from the signature
-    signedhash = rsa_verify(signature, publickey)
+    signedhash = signeddata_verify(signature, rawpublickey, publickey)
   except TypeError, e:
     if 'RSA' not in str(e):
       raise
@@ -357,7 +471,7 @@ def signeddata_split(data):
   originaldata, rawpublickey, rawtimestamp, rawexpiration, rawsequenceno,rawdestination, junksignature = data.rsplit('!',6)
   
   # strip the '\n' off of the original data...
-  return originaldata[:-1], rsa_string_to_publickey(rawpublickey), signeddata_string_to_timestamp(rawtimestamp), signeddata_string_to_expiration(rawexpiration), signeddata_string_to_sequencenumber(rawsequenceno), signeddata_string_to_destination(rawdestination)
+  return originaldata[:-1], signeddata_string_to_publickey(rawpublickey), signeddata_string_to_timestamp(rawtimestamp), signeddata_string_to_expiration(rawexpiration), signeddata_string_to_sequencenumber(rawsequenceno), signeddata_string_to_destination(rawdestination)
 
 
 
@@ -436,7 +550,7 @@ def signeddata_shouldtrust(oldsigneddata, newsigneddata, publickey=None, oldsign
       oldjunk, oldpubkey, oldtime, oldexpire, oldsequence, olddestination = signeddata_split(oldsigneddata)
     else:
       oldrawpublickey, oldrawtimestamp, oldrawexpiration, oldrawsequenceno, oldrawdestination, oldjunksignature = oldsigneddata.rsplit('!',5)
-      oldpubkey, oldtime, oldexpire, oldsequence, olddestination = rsa_string_to_publickey(oldrawpublickey[1:]), signeddata_string_to_timestamp(oldrawtimestamp), signeddata_string_to_expiration(oldrawexpiration), signeddata_string_to_sequencenumber(oldrawsequenceno), signeddata_string_to_destination(oldrawdestination)
+      oldpubkey, oldtime, oldexpire, oldsequence, olddestination = signeddata_string_to_publickey(oldrawpublickey[1:]), signeddata_string_to_timestamp(oldrawtimestamp), signeddata_string_to_expiration(oldrawexpiration), signeddata_string_to_sequencenumber(oldrawsequenceno), signeddata_string_to_destination(oldrawdestination)
     
   
 